@@ -0,0 +1,10 @@
+"""
+Gunicorn hooks for the ConfigWatcher API
+"""
+
+from prometheus_client import multiprocess
+
+
+def child_exit(server, worker):
+    # Drop the live gauges of a worker that exited (e.g. --max-requests recycling)
+    multiprocess.mark_process_dead(worker.pid)
@@ -8,14 +8,17 @@ Main application providing REST API for dynamic HAProxy configuration management
 import os
 import sys
 import json
+import hashlib
 import logging
 import subprocess
+import threading
 import time
+import uuid
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from pathlib import Path
 
-from flask import Flask, request, jsonify, g
+from flask import Flask, Response, request, jsonify, g
 from flask_cors import CORS
 from flask_restx import Api, Resource, fields, Namespace
 import redis
@@ -24,7 +27,32 @@ from werkzeug.security import check_password_hash, generate_password_hash
 from web3 import Web3
 import requests
 import yaml
-from prometheus_client import generate_latest
+
+from haproxy_runtime import RuntimeClient, RuntimeAPIError, build_add_server_command, check_response
+from haproxy_stats import StatsCache, parse_info
+from haproxy_maps import MapError, MapManager, MapNotFound
+from backend_batch import BatchError, apply_batch, parse_operations
+from haproxy_config import ConfigCache, HAProxyConfig
+from config_validator import ConfigValidator
+from config_store import ConfigStore, VersionNotFound, diff_configs, effective_hash
+from config_delivery import ConfigPublisher
+from event_stream import EventBus, StatePoller, format_sse, parse_types
+from reload_scheduler import ReloadScheduler, RELOADS_AVOIDED
+from job_queue import JobQueue
+from blockchain_monitor import RegistryWatcher, build_event_source
+from shared_state import SharedState, LeaderElection, LockTimeout
+from audit_log import AUDIT_KINDS, AuditLog
+from health_prober import HealthProber
+from auth import Authenticator, load_api_keys
+import metrics
+from metrics import InstrumentedRedis, VALIDATE_LATENCY, docker_call
+from container_inventory import ContainerInventory, ContainerNotFound, address_of
+from ipam import IPAM, PoolExhausted, parse_pools
+from provisioning import MAX_BULK_COUNT, BulkProvisioner
+from federation import MAX_CHANGES_PER_REQUEST, ChangeLog, Federation, FederationError, parse_changes, parse_peers
+from rotation import BackendSlots, RotationEngine, RotationError, parse_rotations
+from weight_tuner import WeightTuner, parse_bounds
+from log_ingest import LogAnalytics, LogIngestor
 
 # Add Docker support
 try:
@@ -58,9 +86,71 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('JWT_SECRET', 'your_jwt_secret_here')
 app.config['REDIS_URL'] = os.getenv('REDIS_URL', 'redis://redis:6379/0')
 app.config['ZONE'] = os.getenv('ZONE', 'eu')
+app.config['CONFIG_FILE'] = os.getenv('CONFIG_FILE', '/app/config/config.yaml')
+app.config['AUTH_CACHE_SIZE'] = int(os.getenv('AUTH_CACHE_SIZE', '10000'))
 app.config['HAPROXY_CONFIG_PATH'] = os.getenv('HAPROXY_CONFIG_PATH', '/etc/haproxy/haproxy.cfg')
 app.config['HAPROXY_SOCKET'] = os.getenv('HAPROXY_SOCKET', '/var/run/haproxy.sock')
+app.config['HAPROXY_SOCKET_POOL_SIZE'] = int(os.getenv('HAPROXY_SOCKET_POOL_SIZE', '4'))
+app.config['HAPROXY_SOCKET_TIMEOUT'] = float(os.getenv('HAPROXY_SOCKET_TIMEOUT', '10'))
+# Map and ACL files the HAProxy config references, shared with the HAProxy containers
+app.config['HAPROXY_MAPS_DIR'] = os.getenv('HAPROXY_MAPS_DIR', '/etc/haproxy/maps')
+app.config['STATS_CACHE_TTL'] = float(os.getenv('STATS_CACHE_TTL', '2'))
+app.config['VALIDATE_CACHE_SIZE'] = int(os.getenv('VALIDATE_CACHE_SIZE', '256'))
+# strict: errorfiles, certificates and haproxy are visible here; remote: they live in the HAProxy container only
+app.config['VALIDATE_MODE'] = os.getenv('VALIDATE_MODE', 'strict')
+# Per zone: every configwatcher of the compose file shares /app
+app.config['CONFIG_STORE_DIR'] = os.getenv('CONFIG_STORE_DIR', f"/app/data/config-versions/{app.config['ZONE']}")
+app.config['RELOAD_WINDOW'] = float(os.getenv('RELOAD_WINDOW', '2'))
+app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', '4'))
+app.config['AUDIT_MAXLEN'] = int(os.getenv('AUDIT_MAXLEN', '100000'))
 app.config['BLOCKCHAIN_RPC'] = os.getenv('BLOCKCHAIN_RPC', 'http://blockchain:8545')
+app.config['NODE_REGISTRY_BACKEND'] = os.getenv('NODE_REGISTRY_BACKEND', 'ddc_nodes_http')
+app.config['NODE_REGISTRY_POLL_INTERVAL'] = float(os.getenv('NODE_REGISTRY_POLL_INTERVAL', '2'))
+# Seconds between diffs of the registry against live servers when no events arrive
+app.config['NODE_REGISTRY_RECONCILE_INTERVAL'] = float(os.getenv('NODE_REGISTRY_RECONCILE_INTERVAL', '30'))
+app.config['HEALTH_PROBE_INTERVAL'] = float(os.getenv('HEALTH_PROBE_INTERVAL', '5'))
+app.config['HEALTH_PROBE_TIMEOUT'] = float(os.getenv('HEALTH_PROBE_TIMEOUT', '2'))
+app.config['EVENTS_POLL_INTERVAL'] = float(os.getenv('EVENTS_POLL_INTERVAL', '1'))
+app.config['EVENTS_HEARTBEAT'] = float(os.getenv('EVENTS_HEARTBEAT', '15'))
+app.config['EVENTS_MAX_STREAM_SECONDS'] = float(os.getenv('EVENTS_MAX_STREAM_SECONDS', '300'))
+# zone=subnet[:first-last]; the zone networks in docker-compose are the first /24 of each subnet
+app.config['IPAM_POOLS'] = os.getenv('IPAM_POOLS', 'eu=10.1.0.0/16:10.1.0.50-10.1.0.254,'
+                                                   'us=10.2.0.0/16:10.2.0.50-10.2.0.254')
+app.config['IPAM_LEASE_GRACE'] = float(os.getenv('IPAM_LEASE_GRACE', '300'))
+app.config['PROVISION_WORKERS'] = int(os.getenv('PROVISION_WORKERS', '8'))
+app.config['PROVISION_HEALTH_TIMEOUT'] = float(os.getenv('PROVISION_HEALTH_TIMEOUT', '60'))
+app.config['WARM_POOL_SIZE'] = int(os.getenv('WARM_POOL_SIZE', '0'))
+# zone=URL of each zone's ConfigWatcher; this zone's own entry is ignored
+app.config['FEDERATION_PEERS'] = os.getenv('FEDERATION_PEERS', '')
+app.config['FEDERATION_API_KEY'] = os.getenv('FEDERATION_API_KEY', '')
+app.config['FEDERATION_TIMEOUT'] = float(os.getenv('FEDERATION_TIMEOUT', '5'))
+app.config['FEDERATION_SYNC_INTERVAL'] = float(os.getenv('FEDERATION_SYNC_INTERVAL', '30'))
+app.config['FEDERATION_LOG_SIZE'] = int(os.getenv('FEDERATION_LOG_SIZE', '10000'))
+# Servers of one backend draining at once, across replicas
+app.config['ROTATION_MAX_DRAINING'] = int(os.getenv('ROTATION_MAX_DRAINING', '2'))
+app.config['ROTATION_DRAIN_TIMEOUT'] = float(os.getenv('ROTATION_DRAIN_TIMEOUT', '30'))
+# Drain bound of removals that run inside a request (container delete, /config/update)
+app.config['ROTATION_INLINE_DRAIN_TIMEOUT'] = float(os.getenv('ROTATION_INLINE_DRAIN_TIMEOUT', '5'))
+app.config['ROTATION_POLL_INTERVAL'] = float(os.getenv('ROTATION_POLL_INTERVAL', '1'))
+app.config['ROTATION_RAMP_STEPS'] = int(os.getenv('ROTATION_RAMP_STEPS', '1'))
+app.config['ROTATION_RAMP_INTERVAL'] = float(os.getenv('ROTATION_RAMP_INTERVAL', '10'))
+app.config['ROTATION_WORKERS'] = int(os.getenv('ROTATION_WORKERS', '16'))
+# Workers of the jobs that wait out drains (removals, rotations), apart from JOB_WORKERS
+app.config['DRAIN_JOB_WORKERS'] = int(os.getenv('DRAIN_JOB_WORKERS', '8'))
+# backend[=min-max] of each backend whose weights are tuned from live stats; none by default
+app.config['WEIGHT_TUNER_BACKENDS'] = os.getenv('WEIGHT_TUNER_BACKENDS', '')
+app.config['WEIGHT_TUNER_DRY_RUN'] = os.getenv('WEIGHT_TUNER_DRY_RUN', 'true').lower() == 'true'
+app.config['WEIGHT_TUNER_INTERVAL'] = float(os.getenv('WEIGHT_TUNER_INTERVAL', '10'))
+app.config['WEIGHT_TUNER_ALPHA'] = float(os.getenv('WEIGHT_TUNER_ALPHA', '0.3'))
+app.config['WEIGHT_TUNER_HYSTERESIS'] = float(os.getenv('WEIGHT_TUNER_HYSTERESIS', '0.1'))
+app.config['WEIGHT_TUNER_MAX_STEP'] = float(os.getenv('WEIGHT_TUNER_MAX_STEP', '0.25'))
+# HAProxy httplog lines from a syslog UDP socket (host:port) and/or a file; neither by default
+app.config['LOG_INGEST_UDP'] = os.getenv('LOG_INGEST_UDP', '')
+app.config['LOG_INGEST_FILE'] = os.getenv('LOG_INGEST_FILE', '')
+app.config['LOG_WINDOW'] = float(os.getenv('LOG_WINDOW', '300'))
+app.config['LOG_SLOT_SECONDS'] = float(os.getenv('LOG_SLOT_SECONDS', '10'))
+app.config['LOG_SLOW_MS'] = int(os.getenv('LOG_SLOW_MS', '1000'))
+app.config['LOG_PUBLISH_INTERVAL'] = float(os.getenv('LOG_PUBLISH_INTERVAL', '5'))
 
 # Initialize extensions
 CORS(app)
@@ -70,7 +160,7 @@ api = Api(app, version='1.0', title='ConfigWatcher API',
 
 # Initialize Redis
 try:
-    redis_client = redis.from_url(app.config['REDIS_URL'])
+    redis_client = InstrumentedRedis.from_url(app.config['REDIS_URL'])
     redis_client.ping()
     logger.info("Connected to Redis successfully")
 except Exception as e:
@@ -97,6 +187,13 @@ backends_ns = api.namespace('backends', description='Backend server management')
 stats_ns = api.namespace('stats', description='Statistics and monitoring')
 blockchain_ns = api.namespace('blockchain', description='Blockchain integration')
 containers_ns = api.namespace('containers', description='Dynamic container management')
+jobs_ns = api.namespace('jobs', description='Background job status')
+audit_ns = api.namespace('audit', description='Audit log')
+events_ns = api.namespace('events', description='Streamed state changes')
+ipam_ns = api.namespace('ipam', description='Container IP address pools')
+federation_ns = api.namespace('federation', description='Changes applied across zones')
+logs_ns = api.namespace('logs', description='Request statistics from the HAProxy log')
+maps_ns = api.namespace('maps', description='HAProxy map and ACL files')
 
 api.add_namespace(auth_ns, path='/api/v1/auth')
 api.add_namespace(config_ns, path='/api/v1/config')
@@ -104,6 +201,12 @@ api.add_namespace(backends_ns, path='/api/v1/backends')
 api.add_namespace(stats_ns, path='/api/v1/stats')
 api.add_namespace(blockchain_ns, path='/api/v1/blockchain')
 api.add_namespace(containers_ns, path='/api/v1/containers')
+api.add_namespace(jobs_ns, path='/api/v1/jobs')
+api.add_namespace(audit_ns, path='/api/v1/audit')
+api.add_namespace(events_ns, path='/api/v1/events')
+api.add_namespace(ipam_ns, path='/api/v1/ipam')
+api.add_namespace(logs_ns, path='/api/v1/logs')
+api.add_namespace(maps_ns, path='/api/v1/maps')
 
 # Data models
 backend_server_model = api.model('BackendServer', {
@@ -121,6 +224,21 @@ config_update_model = api.model('ConfigUpdate', {
     'server': fields.Raw(required=True, description='Server configuration')
 })
 
+backend_batch_model = api.model('BackendBatch', {
+    'operations': fields.List(fields.Raw, required=True,
+                              description='Operations: {action: add|remove|weight|state|addr, backend, server, weight, state, address, port}')
+})
+
+container_bulk_model = api.model('ContainerBulkCreate', {
+    'count': fields.Integer(required=True, description=f'Containers to create (1-{MAX_BULK_COUNT})'),
+    'backend_name': fields.String(default='ddc_nodes_http', description='HAProxy backend to add servers to'),
+    'port': fields.Integer(default=80, description='Server port'),
+    'weight': fields.Integer(default=100, description='Server weight'),
+    'name_prefix': fields.String(description='Name containers <prefix>-1..N (auto-generated if not provided)'),
+    'use_warm_pool': fields.Boolean(default=True, description='Start warm pool containers first'),
+    'health_timeout': fields.Float(description='Seconds to wait for /health before leaving a server in maintenance')
+})
+
 container_create_model = api.model('ContainerCreate', {
     'name': fields.String(description='Container name (auto-generated if not provided)'),
     'node_id': fields.String(description='Node ID (auto-generated if not provided)'),
@@ -128,23 +246,40 @@ container_create_model = api.model('ContainerCreate', {
     'backend_name': fields.String(default='ddc_nodes_http', description='HAProxy backend to add server to')
 })
 
+rotation_model = api.model('BackendRotation', {
+    'rotations': fields.List(fields.Raw, required=True,
+                             description='Per backend: {backend, remove: [server names], add: [{name, address, port, weight}]}'),
+    'drain_timeout': fields.Float(description='Seconds to wait for sessions to end before deleting a server'),
+    'threshold': fields.Integer(default=0, description='Delete once a server has this many sessions or fewer'),
+    'force': fields.Boolean(default=True, description='Shut remaining sessions down at the deadline; '
+                                                      'otherwise leave the server draining'),
+    'ramp_steps': fields.Integer(description='Add new servers at 1/steps of their weight and raise it in steps'),
+    'ramp_interval': fields.Float(description='Seconds between weight steps')
+})
+
+map_update_model = api.model('MapUpdate', {
+    'entries': fields.Raw(description='Map: {key: value}; ACL: [pattern]. Added or changed, or with PUT the whole table'),
+    'delete': fields.List(fields.String, description='Keys to delete (PATCH only)')
+})
+
+federation_publish_model = api.model('FederationPublish', {
+    'operations': fields.List(fields.Raw, required=True,
+                              description='Batch operations, as for /backends/batch, applied in every zone'),
+    'zones': fields.List(fields.String, description='Zones to apply the change in (all by default)'),
+    'message': fields.String(description='Why the change was made')
+})
+
 # Authentication decorator
+def authenticate(token: Optional[str], api_key: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+    """Resolve an Authorization (or X-API-Key) header to (user, None), or (None, error message)"""
+    return authenticator.authenticate(token, api_key)
+
 def token_required(f):
     def decorated(*args, **kwargs):
-        token = request.headers.get('Authorization')
-        if not token:
-            return {'message': 'Token is missing'}, 401
-        
-        try:
-            if token.startswith('Bearer '):
-                token = token[7:]
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            g.current_user = data['user']
-        except jwt.ExpiredSignatureError:
-            return {'message': 'Token has expired'}, 401
-        except jwt.InvalidTokenError:
-            return {'message': 'Token is invalid'}, 401
-        
+        user, error = authenticate(request.headers.get('Authorization'), request.headers.get('X-API-Key'))
+        if error:
+            return {'message': error}, 401
+        g.current_user = user
         return f(*args, **kwargs)
     return decorated
 
@@ -154,56 +289,140 @@ class HAProxyManager:
     
     def __init__(self):
         self.config_path = app.config['HAPROXY_CONFIG_PATH']
-        self.socket_path = '/tmp/haproxy.sock'
+        self.socket_path = app.config['HAPROXY_SOCKET']
         self.reload_script = '/app/scripts/reload-haproxy.sh'
+        self.local_config_path = '/tmp/haproxy_local.cfg'
+        self.config_cache = ConfigCache()
+        # Relative errorfile and certificate paths resolve next to the live config
+        self.validator = ConfigValidator(
+            base_dir=os.path.dirname(self.config_path),
+            cache_size=app.config['VALIDATE_CACHE_SIZE'],
+            mode=app.config['VALIDATE_MODE']
+        )
+        self.config_store = ConfigStore(app.config['CONFIG_STORE_DIR'], zone=app.config['ZONE'])
+        self._observed: Tuple[Optional[str], Optional[Dict[str, Any]]] = (None, None)
+        self.shared_state = shared_state
+        self.runtime = RuntimeClient(
+            self.socket_path,
+            pool_size=app.config['HAPROXY_SOCKET_POOL_SIZE'],
+            timeout=app.config['HAPROXY_SOCKET_TIMEOUT']
+        )
+        self.stats_cache = StatsCache(
+            lambda: self.runtime.execute('show stat'),
+            ttl=app.config['STATS_CACHE_TTL']
+        )
+        self.info_cache = StatsCache(
+            lambda: self.runtime.execute('show info'),
+            parse=parse_info,
+            ttl=app.config['STATS_CACHE_TTL']
+        )
     
     def get_current_config(self) -> str:
         """Get current HAProxy configuration"""
+        return self.config_snapshot()[0]
+    
+    def config_snapshot(self) -> Tuple[str, str, float, Optional[Dict[str, Any]]]:
+        """Live config text, SHA-256, mtime and version; the file is only read after it changes"""
         try:
-            with open(self.config_path, 'r') as f:
-                return f.read()
+            text, digest, mtime = self.config_cache.read(self.config_path)
         except Exception as e:
             logger.error(f"Failed to read config: {e}")
             raise
+        if digest != self._observed[0]:
+            # Edits made outside the API get a version too, so agents can pass it as ?since
+            try:
+                version, _ = self.config_store.commit(text, source='observed', path=self.config_path)
+            except Exception as e:
+                logger.warning(f"Failed to record config version: {e}")
+                version = None
+            self._observed = (digest, version)
+        return text, digest, mtime, self._observed[1]
     
     def validate_config(self, config_content: str) -> Dict[str, Any]:
-        """Validate HAProxy configuration"""
+        """Validate HAProxy configuration: in-process pre-check, then a cached 'haproxy -c'"""
+        start = time.perf_counter()
         try:
-            # Write temporary config file
-            temp_config = f"/tmp/haproxy_test_{int(time.time())}.cfg"
-            with open(temp_config, 'w') as f:
-                f.write(config_content)
-            
-            # Test configuration
-            result = subprocess.run(
-                ['haproxy', '-c', '-f', temp_config],
-                capture_output=True, text=True
-            )
-            
-            # Cleanup
-            os.unlink(temp_config)
-            
-            return {
-                'valid': result.returncode == 0,
-                'output': result.stdout,
-                'errors': result.stderr
-            }
+            result = self.validator.validate(config_content)
+            if result['stage'] == 'precheck':
+                outcome = 'precheck_only' if result['valid'] else 'rejected'
+            elif result.get('cached'):
+                outcome = 'cached'
+            else:
+                outcome = 'valid' if result['valid'] else 'invalid'
+            VALIDATE_LATENCY.labels(result=outcome).observe(time.perf_counter() - start)
+            return result
         except Exception as e:
             logger.error(f"Config validation failed: {e}")
+            VALIDATE_LATENCY.labels(result='error').observe(time.perf_counter() - start)
             return {'valid': False, 'errors': str(e)}
     
+    def validate_current_config(self) -> Dict[str, Any]:
+        """Validate the configuration file HAProxy would load on reload"""
+        return self.validate_config(self.get_current_config())
+    
+    def record_version(self, source: str, message: str = '', path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Store a config file in the version history; a no-op if it has not changed"""
+        path = path or self.config_path
+        try:
+            with open(path, 'r') as f:
+                version, _ = self.config_store.commit(f.read(), source=source, message=message, path=path)
+            return version
+        except Exception as e:
+            # History is best effort; it must never block a reload
+            logger.warning(f"Failed to record config version of {path}: {e}")
+            return None
+    
+    def rollback(self, ref: str, reason: str = '') -> Dict[str, Any]:
+        """Restore a stored version as the live config.
+        
+        The result says whether a reload is needed: a version that only differs
+        in comments or layout is written back without one.
+        """
+        target = self.config_store.get(ref)
+        if not self.config_store.owns(target):
+            return {'success': False, 'version': target['version'],
+                    'error': f"Version {target['version']} is a config of zone {target['zone']}"}
+        text = self.config_store.text(target['hash'])
+        current = self.get_current_config()
+        result = {'success': True, 'version': target['version'], 'hash': target['hash'],
+                  'changed': text != current, 'reload_required': effective_hash(text) != effective_hash(current)}
+        if not result['changed']:
+            return result
+        
+        # Comment or layout changes restore text HAProxy is already running
+        if result['reload_required']:
+            validation = self.validate_config(text)
+            if not validation['valid']:
+                return dict(result, success=False, error='Stored version failed validation', validation=validation)
+        
+        # Keep the outgoing config in the history before replacing it
+        self.config_store.commit(current, source='pre_rollback', path=self.config_path)
+        with self.shared_state.lock('reload', timeout=120):
+            HAProxyConfig.parse(text).save(self.config_path)
+        self.config_cache.invalidate(self.config_path)
+        version, _ = self.config_store.commit(
+            text, source='rollback', path=self.config_path,
+            message=f"rollback to version {target['version']}" + (f": {reason}" if reason else ''))
+        result['new_version'] = version['version']
+        return result
+    
     def reload_config(self) -> Dict[str, Any]:
         """Reload HAProxy configuration with zero downtime"""
+        # The history holds every config HAProxy was asked to load
+        version = self.record_version('reload')
         try:
-            result = subprocess.run(
-                [self.reload_script],
-                capture_output=True, text=True
-            )
+            # Replicas share one HAProxy; never run two reloads at once
+            with self.shared_state.lock('reload', timeout=120):
+                result = subprocess.run(
+                    [self.reload_script],
+                    capture_output=True, text=True
+                )
             
             return {
                 'success': result.returncode == 0,
                 'output': result.stdout,
                 'errors': result.stderr,
+                'version': version['version'] if version else None,
                 'timestamp': datetime.utcnow().isoformat()
             }
         except Exception as e:
@@ -213,57 +432,64 @@ class HAProxyManager:
     def get_stats(self) -> Dict[str, Any]:
         """Get HAProxy statistics via socket"""
         try:
-            result = subprocess.run(
-                ['echo', 'show stat', '|', 'socat', 'stdio', self.socket_path],
-                shell=True, capture_output=True, text=True
-            )
-            
-            if result.returncode == 0:
-                return {'stats': result.stdout, 'timestamp': datetime.utcnow().isoformat()}
-            else:
-                return {'error': result.stderr}
+            snapshot = self.stats_cache.get()
+            stats = snapshot.summary()
+            stats['timestamp'] = datetime.utcfromtimestamp(snapshot.timestamp).isoformat()
+            stats['age_seconds'] = round(snapshot.age, 3)
+            return stats
         except Exception as e:
             logger.error(f"Failed to get stats: {e}")
             return {'error': str(e)}
     
+    def get_backend_servers(self, backend: str) -> Optional[List[Dict[str, Any]]]:
+        """Get per-server stats of a backend, or None if the backend does not exist"""
+        snapshot = self.stats_cache.get()
+        if not snapshot.has_proxy(backend):
+            return None
+        return snapshot.servers(backend)
+    
+    def get_info(self) -> Dict[str, Any]:
+        """Get HAProxy process information via socket"""
+        return self.info_cache.get()
+    
     def add_backend_server(self, backend: str, server_config: Dict[str, Any]) -> bool:
         """Add server to backend via HAProxy socket"""
         try:
-            cmd = f"add server {backend}/{server_config['name']} {server_config['address']}:{server_config['port']}"
-            
-            # Add optional parameters
-            if server_config.get('weight'):
-                cmd += f" weight {server_config['weight']}"
-            if server_config.get('backup'):
-                cmd += " backup"
-            if server_config.get('check'):
-                cmd += " check"
-            
-            result = subprocess.run(
-                ['echo', f'"{cmd}"', '|', 'socat', 'stdio', self.socket_path],
-                shell=True, capture_output=True, text=True
-            )
-            
-            return result.returncode == 0
+            with self.shared_state.backend_locks([backend]):
+                self.runtime.execute_checked([build_add_server_command(backend, server_config)])
+                self.shared_state.record([{'action': 'add', 'backend': backend, 'server': server_config}])
+            self.stats_cache.invalidate()
+            return True
         except Exception as e:
             logger.error(f"Failed to add server: {e}")
             return False
     
-    def remove_backend_server(self, backend: str, server_name: str) -> bool:
-        """Remove server from backend via HAProxy socket"""
+    def remove_backend_server(self, backend: str, server_name: str, drain: bool = True,
+                              timeout: Optional[float] = None) -> bool:
+        """Remove server from backend via HAProxy socket, draining its sessions first"""
+        if drain:
+            result = rotation_engine.retire(backend, server_name, timeout=timeout)
+            if result['status'] != 'removed':
+                logger.error(f"Failed to remove server: {result.get('error')}")
+            return result['status'] == 'removed'
         try:
-            cmd = f"del server {backend}/{server_name}"
-            
-            result = subprocess.run(
-                ['echo', f'"{cmd}"', '|', 'socat', 'stdio', self.socket_path],
-                shell=True, capture_output=True, text=True
-            )
-            
-            return result.returncode == 0
+            result = self.apply_batch([{'action': 'remove', 'backend': backend, 'server': server_name}])
+            if not result['success']:
+                raise BatchError(result.get('error') or 'Batch failed')
+            return True
         except Exception as e:
             logger.error(f"Failed to remove server: {e}")
             return False
 
+    def apply_batch(self, operations: List[Dict[str, Any]], change_id: Optional[str] = None,
+                    source: str = 'api') -> Dict[str, Any]:
+        """Apply many server changes in one runtime session, all-or-nothing"""
+        try:
+            return self.shared_state.apply(operations, lambda ops: apply_batch(self.runtime, ops),
+                                           change_id=change_id, source=source)
+        finally:
+            self.stats_cache.invalidate()
+
     def add_server_to_config_file(self, backend: str, server_config: Dict[str, Any]) -> bool:
         """Add server to HAProxy configuration file and reload"""
         try:
@@ -280,31 +506,29 @@ class HAProxyManager:
             socket_cmd = f"add server {backend}/{server_name} {server_address}:{server_port} weight {weight} check"
             
             try:
-                # Try using socat to send command to HAProxy socket
-                result = subprocess.run(
-                    ['sh', '-c', f'echo "{socket_cmd}" | socat stdio /tmp/haproxy.sock'],
-                    capture_output=True, text=True, timeout=10
-                )
-                
-                if result.returncode == 0:
-                    logger.info(f"Successfully added server {server_name} to {backend} via HAProxy socket")
-                    return True
-                else:
-                    logger.warning(f"HAProxy socket command failed: {result.stderr}")
-            except Exception as e:
-                logger.warning(f"Socket command failed: {e}")
+                with self.shared_state.backend_locks([backend]):
+                    output = self.runtime.execute(socket_cmd)
+                    check_response(socket_cmd, output)
+                    self.shared_state.record([{'action': 'add', 'backend': backend, 'server': {
+                        'name': server_name, 'address': server_address, 'port': server_port, 'weight': weight
+                    }}])
+                self.stats_cache.invalidate()
+                logger.info(f"Successfully added server {server_name} to {backend} via HAProxy socket")
+                return True
+            except RuntimeAPIError as e:
+                logger.warning(f"HAProxy socket command failed: {e}")
             
-            # Fallback: Create a local config copy and demonstrate the concept
-            local_config_path = '/tmp/haproxy_local.cfg'
+            # Fallback: Keep a local config copy and edit it in place
+            local_config_path = self.local_config_path
             
-            # Copy current config to local file
-            import shutil
-            try:
-                shutil.copy2(self.config_path, local_config_path)
-            except:
-                # If copy fails, create a minimal config
-                with open(local_config_path, 'w') as f:
-                    f.write(f"""# Local HAProxy Config Copy
+            if not os.path.exists(local_config_path):
+                import shutil
+                try:
+                    shutil.copy2(self.config_path, local_config_path)
+                except Exception:
+                    # If copy fails, create a minimal config
+                    with open(local_config_path, 'w') as f:
+                        f.write(f"""# Local HAProxy Config Copy
 # Added via ConfigWatcher API
 
 backend {backend}
@@ -315,47 +539,30 @@ backend {backend}
     # Existing servers (simulated)
     server node1 us-backend-1:80 check inter 5s rise 2 fall 3 weight 100
     server node2 us-backend-2:80 check inter 5s rise 2 fall 3 weight 100
-    
-    # Dynamically added server
-    server {server_name} {server_address}:{server_port} check inter 5s rise 2 fall 3 weight {weight}
 """)
             
-            # Read the local config
-            with open(local_config_path, 'r') as f:
-                config_lines = f.readlines()
-            
-            # Find the backend section and add the server
-            backend_found = False
-            insert_index = -1
-            
-            for i, line in enumerate(config_lines):
-                if f'backend {backend}' in line:
-                    backend_found = True
-                elif backend_found and line.strip().startswith('server '):
-                    insert_index = i + 1
-                elif backend_found and line.strip() == '':
-                    break
-            
-            if backend_found and insert_index > 0:
-                new_server_line = f"    server {server_name} {server_address}:{server_port} check inter 5s rise 2 fall 3 weight {weight}\n"
-                config_lines.insert(insert_index, new_server_line)
-                
-                # Write updated local config
-                with open(local_config_path, 'w') as f:
-                    f.writelines(config_lines)
-                
-                logger.info(f"Added server {server_name} to local config copy at {local_config_path}")
-                
-                # In a real production environment, you would:
-                # 1. Validate the config: haproxy -f /tmp/haproxy_local.cfg -c
-                # 2. Copy to the real location: cp /tmp/haproxy_local.cfg /etc/haproxy/haproxy.cfg  
-                # 3. Reload HAProxy: systemctl reload haproxy
-                
-                # For this demo, we'll simulate success
-                return True
-            else:
+            try:
+                with self.config_cache.edit(local_config_path) as config:
+                    section = config.backend(backend)
+                    if section is None:
+                        raise KeyError(backend)
+                    if server_name not in section.servers:
+                        config.add_server(backend, server_name, server_address, server_port,
+                                          ['check', 'inter', '5s', 'rise', '2', 'fall', '3', 'weight', str(weight)])
+            except KeyError:
                 logger.error(f"Could not find backend {backend} in config")
                 return False
+            
+            logger.info(f"Added server {server_name} to local config copy at {local_config_path}")
+            self.record_version('add_server', f"add {backend}/{server_name}", path=local_config_path)
+            
+            # In a real production environment, you would:
+            # 1. Validate the config: haproxy -f /tmp/haproxy_local.cfg -c
+            # 2. Copy to the real location: cp /tmp/haproxy_local.cfg /etc/haproxy/haproxy.cfg  
+            # 3. Reload HAProxy: systemctl reload haproxy
+            
+            # For this demo, we'll simulate success
+            return True
                 
         except Exception as e:
             logger.error(f"Failed to add server to config file: {e}")
@@ -367,45 +574,89 @@ class BlockchainMonitor:
     def __init__(self):
         self.w3 = w3
         self.redis = redis_client
+        self.watcher = None
+        source = build_event_source(self.w3)
+        if source is not None:
+            self.watcher = RegistryWatcher(
+                source,
+                haproxy_manager.runtime,
+                backend=app.config['NODE_REGISTRY_BACKEND'],
+                zone=app.config['ZONE'],
+                redis_client=self.redis,
+                apply=lambda ops: haproxy_manager.apply_batch(ops, source='blockchain')
+            )
     
     def get_node_list(self) -> List[Dict[str, Any]]:
-        """Get current node list from blockchain"""
+        """Get current node list from the registry snapshot"""
+        if not self.watcher:
+            return []
         try:
-            if not self.w3:
-                return []
-            
-            # This would typically interact with a smart contract
-            # For demo purposes, return mock data
-            return [
-                {
-                    'address': '10.1.0.20',
-                    'port': 80,
-                    'grpc_port': 443,
-                    'zone': app.config['ZONE'],
-                    'status': 'active',
-                    'last_seen': datetime.utcnow().isoformat()
-                }
-            ]
+            self.watcher.refresh()
         except Exception as e:
-            logger.error(f"Failed to get node list: {e}")
-            return []
+            logger.error(f"Failed to refresh node registry: {e}")
+        return self.watcher.registry.node_list()
+    
+    def sync(self, force_full: bool = False) -> Dict[str, Any]:
+        """Apply the registry delta to HAProxy"""
+        with shared_state.lock('blockchain-sync'):
+            return self.watcher.sync(force_full=force_full)
     
     def monitor_changes(self):
         """Monitor blockchain for node changes"""
-        # This would run in a separate thread/process
-        pass
+        # Runs in its own process, see start_monitoring() in blockchain_monitor.py
+        if self.watcher:
+            leader = LeaderElection(self.redis, f"registry-watcher:{app.config['ZONE']}")
+            self.watcher.follow(app.config['NODE_REGISTRY_POLL_INTERVAL'], should_run=leader.is_leader,
+                                reconcile_interval=app.config['NODE_REGISTRY_RECONCILE_INTERVAL'])
 
 class DockerManager:
     """Docker container management for dynamic node creation"""
     
     def __init__(self):
         self.client = None
+        self.inventory = None
+        self._claimed = set()
+        self._claim_lock = threading.Lock()
         if DOCKER_AVAILABLE:
             try:
                 self.client = docker.from_env()
+                self.inventory = ContainerInventory(self.client)
             except Exception as e:
                 logger.error(f"Failed to connect to Docker: {e}")
     
+    def start(self):
+        """Follow the Docker events stream in this process, and top up the warm pool once"""
+        if self.inventory is None:
+            return
+        first = self.inventory._pid != os.getpid()
+        self.inventory.start()
+        if first and app.config['WARM_POOL_SIZE']:
+            job_queue.submit('warm_pool_fill', {}, dedupe_key='warm_pool_fill')
+    
+    def _container_config(self, zone: str, node_name: str, node_id: str, ip_address: str) -> Dict[str, Any]:
+        """Backend container definition, shared by direct creates and the warm pool"""
+        return {
+            'image': 'nginx:alpine',
+            'name': node_name,
+            'hostname': node_name,
+            'environment': {
+                'NODE_ID': node_id,
+                'ZONE': zone,
+                'SERVER_NAME': node_name
+            },
+            'volumes': {
+                './backend/nginx.conf': {'bind': '/etc/nginx/nginx.conf', 'mode': 'ro'},
+                './backend/health.html': {'bind': '/usr/share/nginx/html/health', 'mode': 'ro'},
+                './backend/index.html': {'bind': '/usr/share/nginx/html/index.html', 'mode': 'ro'}
+            },
+            'networks': {
+                f'docker_{zone}_zone': {
+                    'ipv4_address': ip_address
+                }
+            },
+            'restart_policy': {'Name': 'unless-stopped'}
+        }
+    
     def create_backend_container(self, node_config: Dict[str, Any]) -> Dict[str, Any]:
         """Create a new backend container dynamically"""
         if not self.client:
@@ -413,38 +664,25 @@ class DockerManager:
         
         try:
             zone = app.config['ZONE']
-            node_name = node_config.get('name', f"{zone}-backend-dynamic")
-            node_id = node_config.get('node_id', f"{zone}-node-{int(time())}")
-            
-            # Get next available IP in the zone
-            ip_address = self._get_next_ip(zone)
-            
-            # Container configuration
-            container_config = {
-                'image': 'nginx:alpine',
-                'name': node_name,
-                'hostname': node_name,
-                'environment': {
-                    'NODE_ID': node_id,
-                    'ZONE': zone,
-                    'SERVER_NAME': node_name
-                },
-                'volumes': {
-                    './backend/nginx.conf': {'bind': '/etc/nginx/nginx.conf', 'mode': 'ro'},
-                    './backend/health.html': {'bind': '/usr/share/nginx/html/health', 'mode': 'ro'},
-                    './backend/index.html': {'bind': '/usr/share/nginx/html/index.html', 'mode': 'ro'}
-                },
-                'networks': {
-                    f'docker_{zone}_zone': {
-                        'ipv4_address': ip_address
-                    }
-                },
-                'restart_policy': {'Name': 'unless-stopped'},
-                'detach': True
-            }
+            suffix = uuid.uuid4().hex[:8]
+            node_name = node_config.get('name') or f"{zone}-backend-{suffix}"
+            node_id = node_config.get('node_id') or f"{zone}-node-{suffix}"
+            
+            # Lease the next free IP of the zone's pool
+            ip_address = self._allocate_ip(zone, node_name)
             
             # Create and start container
-            container = self.client.containers.run(**container_config)
+            try:
+                with docker_call('run'):
+                    container = self.client.containers.run(
+                        detach=True, **self._container_config(zone, node_name, node_id, ip_address))
+            except Exception:
+                ipam.release(ip_address, owner=node_name)
+                raise
+            # Mark the IP as taken now rather than when the 'create' event arrives
+            self.inventory.refresh(container.id)
+            event_bus.publish('container', {'action': 'create', 'name': node_name, 'id': container.id[:12],
+                                            'ip_address': ip_address, 'node_id': node_id})
             
             return {
                 'success': True,
@@ -458,15 +696,100 @@ class DockerManager:
             logger.error(f"Failed to create container: {e}")
             return {'success': False, 'error': str(e)}
     
+    # Warm pool: containers created but never started, named <zone>-backend-warm-<id>
+    
+    def warm_containers(self) -> List[Dict[str, Any]]:
+        """Unclaimed warm containers of the current zone"""
+        prefix = f"{app.config['ZONE']}-backend-warm-"
+        return [record for record in self.inventory.containers(zone=app.config['ZONE'])
+                if record['name'].startswith(prefix) and record['status'] == 'created']
+    
+    def create_warm_container(self, _=None) -> Dict[str, Any]:
+        """Create one stopped container for the warm pool"""
+        try:
+            zone = app.config['ZONE']
+            suffix = uuid.uuid4().hex[:8]
+            node_name = f"{zone}-backend-warm-{suffix}"
+            ip_address = self._allocate_ip(zone, node_name)
+            try:
+                with docker_call('create'):
+                    container = self.client.containers.create(
+                        **self._container_config(zone, node_name, f"{zone}-node-{suffix}", ip_address))
+            except Exception:
+                ipam.release(ip_address, owner=node_name)
+                raise
+            self.inventory.refresh(container.id)
+            return {'success': True, 'container_name': node_name, 'ip_address': ip_address}
+        except Exception as e:
+            logger.error(f"Failed to create warm container: {e}")
+            return {'success': False, 'error': str(e)}
+    
+    def claim_warm_containers(self, count: int) -> List[Dict[str, Any]]:
+        """Take up to count warm containers; each is handed to exactly one caller across replicas"""
+        claimed = []
+        for record in self.warm_containers():
+            if len(claimed) >= count:
+                break
+            if redis_client is not None:
+                key = 'configwatcher:warm-pool:claimed'
+                pipe = redis_client.pipeline()
+                pipe.sadd(key, record['id'])
+                pipe.expire(key, 3600)
+                added = pipe.execute()[0]
+            else:
+                with self._claim_lock:
+                    added = record['id'] not in self._claimed
+                    self._claimed.add(record['id'])
+            if added:
+                claimed.append(record)
+        return claimed
+    
+    def start_warm_container(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """Start a claimed warm container; same result as create_backend_container"""
+        try:
+            with docker_call('start'):
+                self.client.api.start(record['id'])
+            record = self.inventory.refresh(record['id']) or record
+            env = dict(item.split('=', 1) for item in record.get('environment') or [] if '=' in item)
+            ip_address = next((address_of(info) for info in record['networks'].values()), None)
+            event_bus.publish('container', {'action': 'create', 'name': record['name'], 'id': record['id'][:12],
+                                            'ip_address': ip_address, 'node_id': env.get('NODE_ID'),
+                                            'warm': True})
+            return {
+                'success': True,
+                'container_id': record['id'],
+                'container_name': record['name'],
+                'ip_address': ip_address,
+                'node_id': env.get('NODE_ID'),
+                'warm': True
+            }
+        except Exception as e:
+            logger.error(f"Failed to start warm container {record['name']}: {e}")
+            return {'success': False, 'error': str(e)}
+    
     def remove_backend_container(self, container_name: str) -> Dict[str, Any]:
         """Remove a backend container"""
         if not self.client:
             return {'success': False, 'error': 'Docker not available'}
         
         try:
-            container = self.client.containers.get(container_name)
-            container.stop()
-            container.remove()
+            with docker_call('get'):
+                container = self.client.containers.get(container_name)
+            networks = container.attrs.get('NetworkSettings', {}).get('Networks', {})
+            with docker_call('stop'):
+                container.stop()
+            with docker_call('remove'):
+                container.remove()
+            self.inventory.forget(container.id)
+            for network_info in networks.values():
+                ip_address = address_of(network_info)
+                if ip_address:
+                    try:
+                        ipam.release(ip_address)
+                    except Exception as e:
+                        # Reclaimed later, once the pool runs out
+                        logger.error(f"Failed to release IP {ip_address}: {e}")
+            event_bus.publish('container', {'action': 'remove', 'name': container_name, 'id': container.id[:12]})
             
             return {'success': True, 'message': f'Container {container_name} removed'}
             
@@ -474,81 +797,427 @@ class DockerManager:
             logger.error(f"Failed to remove container: {e}")
             return {'success': False, 'error': str(e)}
     
-    def _get_next_ip(self, zone: str) -> str:
-        """Get next available IP address in the zone"""
-        # Simple IP allocation logic
-        base_ip = "10.1.0" if zone == "eu" else "10.2.0"
-        
-        # Check existing containers to find next available IP
+    def list_zone_containers(self) -> List[Dict[str, Any]]:
+        """Containers of the current zone, by naming convention or network"""
+        return [{
+            'id': record['id'][:12],
+            'name': record['name'],
+            'status': record['status'],
+            'image': record['image'],
+            'created': record['created'],
+            'networks': list(record['networks'].keys())
+        } for record in self.inventory.containers(zone=app.config['ZONE'])]
+    
+    def get_container_details(self, container_name: str) -> Dict[str, Any]:
+        """Detailed information about one container"""
+        record = self.inventory.get(container_name)
+        return {
+            'id': record['id'],
+            'name': record['name'],
+            'status': record['status'],
+            'image': record['image'],
+            'created': record['created'],
+            'started': record['started'],
+            'networks': record['networks'],
+            'environment': record['environment'],
+            'mounts': record['mounts']
+        }
+    
+    def _allocate_ip(self, zone: str, owner: str) -> str:
+        """Lease the next free IP in the zone's pool"""
+        # Addresses held by containers created outside the API are skipped
+        in_use = self.inventory.zone_ips(zone)
         try:
-            containers = self.client.containers.list(all=True)
-            used_ips = set()
-            
-            for container in containers:
-                if hasattr(container, 'attrs') and 'NetworkSettings' in container.attrs:
-                    networks = container.attrs['NetworkSettings']['Networks']
-                    for network_name, network_info in networks.items():
-                        if f'{zone}_zone' in network_name and network_info.get('IPAddress'):
-                            used_ips.add(network_info['IPAddress'])
-            
-            # Find next available IP (starting from .50 for dynamic containers)
-            for i in range(50, 100):
-                candidate_ip = f"{base_ip}.{i}"
-                if candidate_ip not in used_ips:
-                    return candidate_ip
-            
-            # Fallback
-            return f"{base_ip}.{50 + len(used_ips)}"
-            
-        except Exception as e:
-            logger.error(f"Failed to get next IP: {e}")
-            return f"{base_ip}.50"
+            return ipam.allocate(zone, owner, in_use)
+        except PoolExhausted:
+            # Leases left behind by failed creates or by containers removed outside the API
+            if not ipam.reclaim(zone, in_use, grace=app.config['IPAM_LEASE_GRACE']):
+                raise
+            return ipam.allocate(zone, owner, in_use)
 
 # Initialize managers
+# Desired state, locks and change results are per zone: both zones name their backends alike
+shared_state = SharedState(redis_client, prefix=f"configwatcher:state:{app.config['ZONE']}",
+                           global_channel='configwatcher:state:events')
+authenticator = Authenticator(app.config['SECRET_KEY'], redis_client,
+                              api_keys=load_api_keys(app.config['CONFIG_FILE']),
+                              cache_size=app.config['AUTH_CACHE_SIZE'])
+# Without Redis there are no other replicas to hear revocations from
+authenticator.trust_cache = lambda: redis_client is None or shared_state.subscribed
+audit_log = AuditLog(redis_client, maxlen=app.config['AUDIT_MAXLEN'])
+event_bus = EventBus()
+ipam = IPAM(parse_pools(app.config['IPAM_POOLS']), redis_client, replica_id=shared_state.replica_id)
 haproxy_manager = HAProxyManager()
+# The config HAProxy started with is the first rollback target
+haproxy_manager.record_version('startup')
+config_publisher = ConfigPublisher(haproxy_manager.config_snapshot, haproxy_manager.config_store,
+                                   zone=app.config['ZONE'])
 blockchain_monitor = BlockchainMonitor()
 docker_manager = DockerManager()
+reload_scheduler = ReloadScheduler(
+    validate=haproxy_manager.validate_current_config,
+    reload=haproxy_manager.reload_config,
+    window=app.config['RELOAD_WINDOW'],
+    apply_runtime=haproxy_manager.apply_batch
+)
+job_queue = JobQueue(redis_client, workers=app.config['JOB_WORKERS'],
+                     prefix=f"configwatcher:jobs:{app.config['ZONE']}")
+# A drain can take an hour; on job_queue a few of them would hold up every reload and validation
+drain_queue = JobQueue(redis_client, workers=app.config['DRAIN_JOB_WORKERS'],
+                       prefix=f"configwatcher:jobs:{app.config['ZONE']}:drain")
+provisioner = BulkProvisioner(
+    create=docker_manager.create_backend_container,
+    register=lambda operations: haproxy_manager.apply_batch(operations, source='provision'),
+    remove=docker_manager.remove_backend_container,
+    claim_warm=docker_manager.claim_warm_containers,
+    start_warm=docker_manager.start_warm_container,
+    workers=app.config['PROVISION_WORKERS'],
+    health_timeout=app.config['PROVISION_HEALTH_TIMEOUT']
+)
+federation = Federation(
+    app.config['ZONE'],
+    parse_peers(app.config['FEDERATION_PEERS'], app.config['ZONE']),
+    ChangeLog(app.config['ZONE'], redis_client, max_changes=app.config['FEDERATION_LOG_SIZE']),
+    apply=lambda operations, change_id: haproxy_manager.apply_batch(operations, change_id=change_id,
+                                                                    source='federation'),
+    lock=shared_state.lock,
+    # Peers accept this zone by the API key they share
+    api_key=app.config['FEDERATION_API_KEY'] or next(iter(load_api_keys(app.config['CONFIG_FILE'])), None),
+    timeout=app.config['FEDERATION_TIMEOUT'],
+    sync_interval=app.config['FEDERATION_SYNC_INTERVAL'],
+    should_sync=LeaderElection(redis_client, f"federation-sync:{app.config['ZONE']}").is_leader
+)
+map_manager = MapManager(
+    haproxy_manager.runtime, app.config['HAPROXY_MAPS_DIR'],
+    backends=lambda: [section.name for section in
+                      haproxy_manager.config_cache.get(haproxy_manager.config_path).backends()]
+)
+rotation_engine = RotationEngine(
+    apply=lambda operations: haproxy_manager.apply_batch(operations, source='rotation'),
+    execute=lambda command: haproxy_manager.runtime.execute_checked([command]),
+    stats=haproxy_manager.stats_cache.get,
+    refresh=haproxy_manager.stats_cache.invalidate,
+    slots=BackendSlots(app.config['ROTATION_MAX_DRAINING'], redis_client,
+                       prefix=f"configwatcher:rotation:{app.config['ZONE']}:slots"),
+    workers=app.config['ROTATION_WORKERS'],
+    drain_timeout=app.config['ROTATION_DRAIN_TIMEOUT'],
+    poll_interval=app.config['ROTATION_POLL_INTERVAL'],
+    ramp_steps=app.config['ROTATION_RAMP_STEPS'],
+    ramp_interval=app.config['ROTATION_RAMP_INTERVAL']
+)
+def apply_tuned_weights(operations: List[Dict[str, Any]]) -> Dict[str, Any]:
+    result = haproxy_manager.apply_batch(operations, source='autotune')
+    if result['success']:
+        audit_log.record('config_change', {'action': 'autotune', 'operations': operations},
+                         zone=app.config['ZONE'])
+    return result
+
+weight_tuner = WeightTuner(
+    haproxy_manager.stats_cache.get,
+    apply_tuned_weights,
+    parse_bounds(app.config['WEIGHT_TUNER_BACKENDS']),
+    interval=app.config['WEIGHT_TUNER_INTERVAL'],
+    alpha=app.config['WEIGHT_TUNER_ALPHA'],
+    hysteresis=app.config['WEIGHT_TUNER_HYSTERESIS'],
+    max_step=app.config['WEIGHT_TUNER_MAX_STEP'],
+    dry_run=app.config['WEIGHT_TUNER_DRY_RUN'],
+    should_run=LeaderElection(redis_client, f"weight-tuner:{app.config['ZONE']}").is_leader
+)
+log_ingestor = LogIngestor(
+    LogAnalytics(window=app.config['LOG_WINDOW'], slot_seconds=app.config['LOG_SLOT_SECONDS'],
+                 slow_ms=app.config['LOG_SLOW_MS']),
+    udp=app.config['LOG_INGEST_UDP'] or None,
+    path=app.config['LOG_INGEST_FILE'] or None,
+    redis_client=redis_client,
+    key=f"configwatcher:logs:{app.config['ZONE']}",
+    replica_id=shared_state.replica_id,
+    publish_interval=app.config['LOG_PUBLISH_INTERVAL']
+)
+# One poller per process, however many clients are streaming
+event_poller = StatePoller(event_bus, haproxy_manager.stats_cache.get, haproxy_manager.config_snapshot,
+                           interval=app.config['EVENTS_POLL_INTERVAL'])
+
+# Dependency checks run in the background; health endpoints only read the results.
+# The blockchain check gets its own provider, so it is probed even if it was down at startup
+health_prober = HealthProber({
+    'redis': redis_client.ping if redis_client else None,
+    'blockchain': Web3(Web3.HTTPProvider(
+        app.config['BLOCKCHAIN_RPC'],
+        request_kwargs={'timeout': app.config['HEALTH_PROBE_TIMEOUT']}
+    )).is_connected if WEB3_AVAILABLE else None,
+    'haproxy_config': lambda: os.path.exists(app.config['HAPROXY_CONFIG_PATH']),
+    'haproxy_socket': lambda: haproxy_manager.runtime.execute('show info'),
+}, critical=('redis', 'haproxy_config'),
+    interval=app.config['HEALTH_PROBE_INTERVAL'],
+    timeout=app.config['HEALTH_PROBE_TIMEOUT'])
+
+def publish_backend_change(event: Dict[str, Any]):
+    event_bus.publish('config_change', {key: event.get(key) for key in
+                                        ('backend', 'version', 'servers', 'source', 'replica')})
+
+def publish_reload(result: Dict[str, Any], batch: List[Any]):
+    event_bus.publish('reload', {
+        'success': bool(result.get('success')),
+        'version': result.get('version'),
+        'batch_size': len(batch),
+        'reasons': sorted({ticket.reason for ticket in batch if ticket.reason}),
+        'error': result.get('error')
+    })
+
+shared_state.subscribe_local(publish_backend_change)
+reload_scheduler.subscribe(publish_reload)
+
+# Another replica changed HAProxy or revoked a token; drop anything cached from before
+def on_replica_event(event: Dict[str, Any]):
+    if event.get('type') == 'backend':
+        haproxy_manager.stats_cache.invalidate()
+        publish_backend_change(event)
+    elif event.get('type') == 'token_revoked':
+        authenticator.forget(bytes.fromhex(event['token']))
+
+shared_state.subscribe(on_replica_event)
+
+def audit_federated_change(event: Dict[str, Any]):
+    if event['status'] == 'applied':
+        audit_log.record('config_change', {
+            'action': 'federated_batch',
+            'change': event['id'],
+            'origin': event['origin'],
+            'operations': event['change']['operations']
+        }, zone=app.config['ZONE'])
+
+federation.subscribe(audit_federated_change)
+
+# Background job handlers
+def run_reload_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Hand the reload to the scheduler so concurrent requests share one reload"""
+    ticket = reload_scheduler.submit(reason=payload.get('reason', ''), changes=payload.get('changes'))
+    ticket.wait()
+    return dict(ticket.result or {}, reload=ticket.reload, batch_size=ticket.batch_size)
+
+def run_rollback_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Restore a stored config version, reloading only if HAProxy would behave differently"""
+    result = haproxy_manager.rollback(payload['version'], payload.get('reason', ''))
+    if result['success']:
+        if result['reload_required']:
+            ticket = reload_scheduler.submit(reason=f"rollback to version {result['version']}")
+            ticket.wait()
+            result.update(reload=ticket.result, reloaded=True, success=bool((ticket.result or {}).get('success')))
+        else:
+            RELOADS_AVOIDED.labels(reason='rollback_unchanged').inc()
+            result['reloaded'] = False
+        audit_log.record('config_change', {
+            'action': 'rollback',
+            'version': result['version'],
+            'reloaded': result['reloaded']
+        }, zone=app.config['ZONE'])
+        event_bus.publish('config_change', {'source': 'rollback', 'version': result['version'],
+                                            'new_version': result.get('new_version'),
+                                            'reloaded': result['reloaded']})
+    return result
+
+def run_validate_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    return haproxy_manager.validate_config(payload['config'])
+
+def run_container_create_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Create a backend container and optionally register it in HAProxy"""
+    container_result = docker_manager.create_backend_container(payload)
+    if not container_result['success']:
+        return container_result
+    
+    result = {'success': True, 'container': container_result}
+    if payload.get('add_to_haproxy', True):
+        backend = payload.get('backend_name', 'ddc_nodes_http')
+        server_config = {
+            'name': container_result['container_name'].replace('-', '_'),  # HAProxy server names can't have dashes
+            'address': container_result['ip_address'],
+            'port': payload.get('port', 80),
+            'weight': payload.get('weight', 100)
+        }
+        if haproxy_manager.add_server_to_config_file(backend, server_config):
+            result['haproxy_server'] = dict(server_config, backend=backend)
+        else:
+            result.update(success=False, error='Container created but failed to add to HAProxy config')
+    
+    audit_log.record('container_operation', {
+        'operation': 'create',
+        'container_name': container_result['container_name'],
+        'backend': result.get('haproxy_server', {}).get('backend'),
+        'server': result.get('haproxy_server', {}).get('name')
+    }, zone=app.config['ZONE'])
+    return result
+
+def run_container_bulk_create_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Create containers in parallel, register them in one batch and enable them once healthy"""
+    result = provisioner.provision(
+        payload['count'],
+        backend=payload.get('backend_name', 'ddc_nodes_http'),
+        port=payload.get('port', 80),
+        weight=payload.get('weight', 100),
+        use_warm=payload.get('use_warm_pool', True),
+        name_prefix=payload.get('name_prefix'),
+        health_timeout=payload.get('health_timeout')
+    )
+    audit_log.record('container_operation', {
+        'operation': 'bulk_create',
+        'backend': result.get('backend'),
+        'requested': result['requested'],
+        'created': result['created'],
+        'healthy': result.get('healthy', 0),
+        'containers': [server['container'] for server in result.get('servers', [])]
+    }, zone=app.config['ZONE'])
+    if result['from_warm_pool'] and app.config['WARM_POOL_SIZE']:
+        job_queue.submit('warm_pool_fill', {}, dedupe_key='warm_pool_fill')
+    return result
+
+def run_warm_pool_fill_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Create stopped containers until the warm pool holds WARM_POOL_SIZE"""
+    target = payload.get('size', app.config['WARM_POOL_SIZE'])
+    try:
+        # One fill per zone at a time, across replicas
+        with shared_state.lock(f"warm-pool:{app.config['ZONE']}", timeout=1):
+            missing = max(0, target - len(docker_manager.warm_containers()))
+            results = provisioner.map(docker_manager.create_warm_container, range(missing))
+    except LockTimeout:
+        return {'success': True, 'skipped': 'Another fill is running'}
+    return {
+        'success': all(r['success'] for r in results),
+        'target': target,
+        'created': sum(1 for r in results if r['success']),
+        'errors': [r['error'] for r in results if not r['success']],
+        'available': len(docker_manager.warm_containers())
+    }
+
+def run_rotation_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Add new servers, then drain and delete old ones, several backends at once"""
+    result = rotation_engine.rotate(
+        payload['rotations'],
+        drain_timeout=payload.get('drain_timeout'),
+        threshold=payload.get('threshold', 0),
+        force=payload.get('force', True),
+        ramp_steps=payload.get('ramp_steps'),
+        ramp_interval=payload.get('ramp_interval')
+    )
+    audit_log.record('config_change', {
+        'action': 'rotation',
+        'backends': sorted({rotation['backend'] for rotation in payload['rotations']}),
+        'added': result.get('added', 0),
+        'removed': result.get('removed', 0),
+        'failed': [f"{s['backend']}/{s['server']}" for s in result['servers']
+                   if s['status'] not in ('added', 'removed')]
+    }, zone=app.config['ZONE'])
+    return result
+
+def run_retire_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Drain one server and delete it"""
+    result = rotation_engine.retire(payload['backend'], payload['server'],
+                                    timeout=payload.get('drain_timeout'), force=payload.get('force', True))
+    result['success'] = result['status'] == 'removed'
+    audit_log.record('config_change', {
+        'action': 'remove',
+        'backend': payload['backend'],
+        'server': {'name': payload['server']},
+        'status': result['status']
+    }, zone=app.config['ZONE'])
+    return result
+
+job_queue.register('reload', run_reload_job)
+job_queue.register('validate', run_validate_job)
+job_queue.register('rollback', run_rollback_job)
+job_queue.register('container_create', run_container_create_job)
+job_queue.register('container_bulk_create', run_container_bulk_create_job)
+job_queue.register('warm_pool_fill', run_warm_pool_fill_job)
+drain_queue.register('rotation', run_rotation_job)
+drain_queue.register('retire', run_retire_job)
+
+def job_response(job: Dict[str, Any], jobs: JobQueue = job_queue):
+    """202 with the job while it runs; ?wait=<seconds> blocks until it finishes"""
+    wait = request.args.get('wait', type=float)
+    if wait:
+        job = jobs.wait(job['id'], min(wait, 120)) or job
+    return job, 200 if job['status'] in ('done', 'failed') else 202
+
+@app.before_request
+def start_background_workers():
+    # Workers start in each gunicorn worker after fork, and pick up jobs
+    # left behind by recycled workers even if nothing new is submitted
+    job_queue.start()
+    drain_queue.start()
+    shared_state.start()
+    health_prober.start()
+    docker_manager.start()
+    federation.start()
+    weight_tuner.start()
+    log_ingestor.start()
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    # Label by route pattern, not path, to keep the series count bounded
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.HTTP_LATENCY.labels(method=request.method, endpoint=endpoint, status=response.status_code).observe(
+        time.perf_counter() - g.get('request_start', time.perf_counter()))
+    return response
+
+# Health responses, built from the prober's last snapshot; shared with async_app
+REDIS_HEALTH = {'up': 'connected', 'down': 'disconnected'}
+CONFIG_HEALTH = {'up': 'accessible', 'down': 'missing'}
+
+def health_status() -> Dict[str, Any]:
+    """Body of /api/v1/health"""
+    snapshot = health_prober.snapshot()
+    return {
+        'status': 'healthy',
+        'timestamp': datetime.now().isoformat(),
+        'zone': app.config['ZONE'],
+        'service': 'ConfigWatcher API',
+        'redis': REDIS_HEALTH.get(health_prober.status('redis'), health_prober.status('redis')),
+        'replica': shared_state.status(),
+        'haproxy_config': CONFIG_HEALTH.get(health_prober.status('haproxy_config'), 'unknown'),
+        'checks': snapshot['checks'],
+        'age_seconds': snapshot['age_seconds']
+    }
+
+def service_status() -> Dict[str, Any]:
+    """Body of /health"""
+    snapshot = health_prober.snapshot()
+    services = {
+        'redis': health_prober.status('redis') == 'up',
+        'blockchain': health_prober.status('blockchain') == 'up',
+        'haproxy': health_prober.status('haproxy_config') == 'up'
+    }
+    return {
+        # Check if any critical services are down
+        'status': 'healthy' if all(services.values()) else 'degraded',
+        'timestamp': datetime.utcnow().isoformat(),
+        'zone': app.config['ZONE'],
+        'version': '1.0.0',
+        'services': services,
+        'age_seconds': snapshot['age_seconds']
+    }
+
+def liveness_status() -> Tuple[Dict[str, Any], int]:
+    """Body and status of /health/live: only this process, never its dependencies"""
+    live = health_prober.live()
+    return {'status': 'alive' if live else 'stalled', 'age_seconds': health_prober.snapshot()['age_seconds']}, \
+        200 if live else 503
+
+def readiness_status() -> Tuple[Dict[str, Any], int]:
+    """Body and status of /health/ready: critical dependencies up in a recent probe"""
+    ready = health_prober.ready()
+    snapshot = health_prober.snapshot()
+    return {
+        'status': 'ready' if ready else 'not_ready',
+        'critical': health_prober.critical,
+        'checks': snapshot['checks'],
+        'age_seconds': snapshot['age_seconds']
+    }, 200 if ready else 503
 
 # Add root route
 @app.route('/api/v1/health')
 def health_check():
     """Health check endpoint for HAProxy"""
-    try:
-        health_status = {
-            'status': 'healthy',
-            'timestamp': datetime.now().isoformat(),
-            'zone': app.config['ZONE'],
-            'service': 'ConfigWatcher API'
-        }
-        
-        # Check Redis connection
-        if redis_client:
-            try:
-                redis_client.ping()
-                health_status['redis'] = 'connected'
-            except:
-                health_status['redis'] = 'disconnected'
-        else:
-            health_status['redis'] = 'not_configured'
-        
-        # Check HAProxy config file
-        try:
-            config_path = app.config['HAPROXY_CONFIG_PATH']
-            if os.path.exists(config_path):
-                health_status['haproxy_config'] = 'accessible'
-            else:
-                health_status['haproxy_config'] = 'missing'
-        except:
-            health_status['haproxy_config'] = 'error'
-        
-        return jsonify(health_status), 200
-    except Exception as e:
-        logger.error(f"Health check failed: {e}")
-        return jsonify({
-            'status': 'unhealthy',
-            'error': str(e),
-            'timestamp': datetime.now().isoformat()
-        }), 500
+    return jsonify(health_status()), 200
 
 @app.route('/info')
 def api_info():
@@ -564,14 +1233,22 @@ def api_info():
             'backends': '/api/v1/backends',
             'stats': '/api/v1/stats',
             'blockchain': '/api/v1/blockchain',
-            'containers': '/api/v1/containers'
+            'containers': '/api/v1/containers',
+            'jobs': '/api/v1/jobs',
+            'audit': '/api/v1/audit'
         }
     }
 
 @app.route('/metrics')
-def metrics():
+def prometheus_metrics():
     """Prometheus metrics endpoint"""
-    return generate_latest(), 200, {'Content-Type': 'text/plain; charset=utf-8'}
+    try:
+        metrics.update_haproxy_gauges(haproxy_manager.stats_cache.get())
+    except Exception as e:
+        logger.warning(f"Could not refresh HAProxy gauges: {e}")
+    metrics.update_dependency_gauges(health_prober.snapshot())
+    payload, headers = metrics.render()
+    return payload, 200, headers
 
 # API Routes
 
@@ -579,23 +1256,19 @@ def metrics():
 class HealthCheck(Resource):
     def get(self):
         """Health check endpoint"""
-        health_status = {
-            'status': 'healthy',
-            'timestamp': datetime.utcnow().isoformat(),
-            'zone': app.config['ZONE'],
-            'version': '1.0.0',
-            'services': {
-                'redis': redis_client is not None and redis_client.ping(),
-                'blockchain': w3 is not None and w3.is_connected(),
-                'haproxy': os.path.exists(app.config['HAPROXY_CONFIG_PATH'])
-            }
-        }
-        
-        # Check if any critical services are down
-        if not all(health_status['services'].values()):
-            health_status['status'] = 'degraded'
-        
-        return health_status
+        return service_status()
+
+@health_ns.route('/live')
+class HealthLiveness(Resource):
+    def get(self):
+        """Liveness probe: the process is serving and its health prober is running"""
+        return liveness_status()
+
+@health_ns.route('/ready')
+class HealthReadiness(Resource):
+    def get(self):
+        """Readiness probe: Redis and the HAProxy config were reachable in the last probe"""
+        return readiness_status()
 
 @auth_ns.route('/token')
 class AuthToken(Resource):
@@ -614,18 +1287,39 @@ class AuthToken(Resource):
         
         return {'message': 'Invalid credentials'}, 401
 
+@auth_ns.route('/revoke')
+class AuthRevoke(Resource):
+    @token_required
+    def post(self):
+        """Revoke a token on every replica; without a body, the caller's own token"""
+        data = request.get_json(silent=True) or {}
+        token = data.get('token')
+        if not token:
+            header = request.headers.get('Authorization', '')
+            if not header.startswith('Bearer '):
+                return {'message': 'Token to revoke is required'}, 400
+            token = header[7:]
+        try:
+            digest = authenticator.revoke(token)
+        except jwt.InvalidTokenError:
+            return {'message': 'Token is invalid'}, 400
+        except Exception as e:
+            logger.error(f"Token revocation failed: {e}")
+            return {'message': str(e)}, 503
+        if digest is not None:
+            shared_state.publish({'type': 'token_revoked', 'token': digest.hex()}, everywhere=True)
+        return {'revoked': digest is not None}
+
 @config_ns.route('')
 class Configuration(Resource):
     # @token_required  # Temporarily disabled for testing
     def get(self):
-        """Get current HAProxy configuration"""
+        """Get current HAProxy configuration (conditional with If-None-Match, ?since=<version> for a delta)"""
         try:
-            config = haproxy_manager.get_current_config()
-            return {
-                'config': config,
-                'zone': app.config['ZONE'],
-                'timestamp': datetime.utcnow().isoformat()
-            }
+            status, headers, body = config_publisher.respond(
+                request.headers.get('If-None-Match'), request.args.get('since'),
+                request.headers.get('Accept-Encoding'))
+            return Response(body, status=status, headers=headers)
         except Exception as e:
             return {'error': str(e)}, 500
     
@@ -647,21 +1341,19 @@ class Configuration(Resource):
                 )
             elif data['action'] == 'remove':
                 success = haproxy_manager.remove_backend_server(
-                    data['backend'], data['server']['name']
+                    data['backend'], data['server']['name'],
+                    timeout=app.config['ROTATION_INLINE_DRAIN_TIMEOUT']
                 )
             else:
                 return {'error': 'Invalid action'}, 400
             
             if success:
                 # Log the change
-                if redis_client:
-                    redis_client.lpush('config_changes', json.dumps({
-                        'timestamp': datetime.utcnow().isoformat(),
-                        'action': data['action'],
-                        'backend': data['backend'],
-                        'server': data.get('server', {}),
-                        'zone': app.config['ZONE']
-                    }))
+                audit_log.record('config_change', {
+                    'action': data['action'],
+                    'backend': data['backend'],
+                    'server': data.get('server', {})
+                }, zone=app.config['ZONE'])
                 
                 return {'success': True, 'message': 'Configuration updated'}
             else:
@@ -673,15 +1365,42 @@ class Configuration(Resource):
 
 @config_ns.route('/reload')
 class ConfigReload(Resource):
+    @token_required
+    def get(self):
+        """Get reload scheduler statistics"""
+        return reload_scheduler.stats()
+
     @token_required
     def post(self):
-        """Reload HAProxy configuration with zero downtime"""
+        """Schedule a zero-downtime reload, or apply runtime changes without one"""
+        data = request.get_json(silent=True) or {}
+        
         try:
-            result = haproxy_manager.reload_config()
-            return result
+            changes = None
+            if data.get('changes'):
+                changes = parse_operations({'operations': data['changes']})
+            
+            # Reload requests still waiting in the queue are merged into one job
+            job = job_queue.submit('reload', {
+                'reason': data.get('reason', 'api_request'),
+                'changes': changes
+            }, dedupe_key=None if changes else 'reload')
+            return job_response(job)
+        except BatchError as e:
+            return {'error': str(e), 'operation': e.index}, 400
         except Exception as e:
             return {'error': str(e)}, 500
 
+@config_ns.route('/reload/<string:ticket_id>')
+class ConfigReloadTicket(Resource):
+    @token_required
+    def get(self, ticket_id):
+        """Poll (or wait on) a reload job"""
+        job = job_queue.get(ticket_id)
+        if job is None or job['type'] != 'reload':
+            return {'error': 'Ticket not found'}, 404
+        return job_response(job)
+
 @config_ns.route('/validate')
 class ConfigValidate(Resource):
     @token_required
@@ -694,8 +1413,82 @@ class ConfigValidate(Resource):
             return {'error': 'Configuration content is required'}, 400
         
         try:
-            result = haproxy_manager.validate_config(config_content)
-            return result
+            job = job_queue.submit('validate', {'config': config_content})
+            return job_response(job)
+        except Exception as e:
+            return {'error': str(e)}, 500
+
+@config_ns.route('/versions')
+class ConfigVersions(Resource):
+    @token_required
+    def get(self):
+        """List stored configuration versions, newest first"""
+        args = request.args
+        store = haproxy_manager.config_store
+        return {
+            'versions': store.versions(limit=min(args.get('limit', 50, type=int), 1000),
+                                       before=args.get('before', type=int)),
+            'head': store.head(),
+            'store': store.stats()
+        }
+
+    @token_required
+    def post(self):
+        """Record the live configuration as a version"""
+        data = request.get_json(silent=True) or {}
+        try:
+            version, created = haproxy_manager.config_store.commit(
+                haproxy_manager.get_current_config(), source='api',
+                message=data.get('message', ''), path=haproxy_manager.config_path)
+            return {'version': version, 'created': created}, 201 if created else 200
+        except Exception as e:
+            return {'error': str(e)}, 500
+
+@config_ns.route('/versions/diff')
+class ConfigVersionDiff(Resource):
+    @token_required
+    def get(self):
+        """Structured diff between two versions; 'current' is the live configuration"""
+        store = haproxy_manager.config_store
+        refs = {'from': request.args.get('from'), 'to': request.args.get('to', 'current')}
+        if not refs['from']:
+            return {'error': 'from is required'}, 400
+        texts = {}
+        try:
+            for side, ref in refs.items():
+                texts[side] = (haproxy_manager.get_current_config() if ref == 'current'
+                               else store.text(store.get(ref)['hash']))
+        except VersionNotFound as e:
+            return {'error': f'Version {e.args[0]} not found'}, 404
+        return dict(diff_configs(texts['from'], texts['to']), **refs)
+
+@config_ns.route('/versions/<string:version>')
+class ConfigVersion(Resource):
+    @token_required
+    def get(self, version):
+        """A stored version with its configuration text"""
+        store = haproxy_manager.config_store
+        try:
+            record = store.get(version)
+        except VersionNotFound:
+            return {'error': 'Version not found'}, 404
+        return dict(record, config=store.text(record['hash']))
+
+@config_ns.route('/versions/<string:version>/rollback')
+class ConfigVersionRollback(Resource):
+    @token_required
+    def post(self, version):
+        """Restore a stored version; reloads only when the effective configuration differs"""
+        data = request.get_json(silent=True) or {}
+        try:
+            record = haproxy_manager.config_store.get(version)
+        except VersionNotFound:
+            return {'error': 'Version not found'}, 404
+        if not haproxy_manager.config_store.owns(record):
+            return {'error': f"Version {record['version']} is a config of zone {record['zone']}"}, 409
+        try:
+            job = job_queue.submit('rollback', {'version': version, 'reason': data.get('reason', '')})
+            return job_response(job)
         except Exception as e:
             return {'error': str(e)}, 500
 
@@ -705,12 +1498,14 @@ class BackendServers(Resource):
     def get(self, backend):
         """Get servers in a backend"""
         try:
-            stats = haproxy_manager.get_stats()
-            if backend in stats:
+            servers = haproxy_manager.get_backend_servers(backend)
+            if servers is not None:
                 return {
                     'success': True,
                     'backend': backend,
-                    'servers': stats[backend]
+                    'servers': servers,
+                    'total_servers': len(servers),
+                    'healthy_servers': sum(1 for s in servers if str(s.get('status', '')).startswith('UP'))
                 }
             return {'success': False, 'error': 'Backend not found'}, 404
         except Exception as e:
@@ -744,22 +1539,155 @@ class BackendServers(Resource):
         except Exception as e:
             return {'success': False, 'error': str(e)}, 500
 
+@backends_ns.route('/batch')
+class BackendBatch(Resource):
+    @token_required
+    @api.expect(backend_batch_model)
+    def post(self):
+        """Apply many add/remove/weight/state operations as one transaction"""
+        try:
+            operations = parse_operations(request.get_json())
+            # Retrying with the same key (on any replica) never applies the batch twice
+            result = haproxy_manager.apply_batch(operations, change_id=request.headers.get('Idempotency-Key'))
+        except BatchError as e:
+            return {'success': False, 'error': str(e), 'operation': e.index}, 400
+        except LockTimeout as e:
+            return {'success': False, 'error': str(e)}, 503
+        except RuntimeAPIError as e:
+            return {'success': False, 'error': str(e)}, 502
+        except Exception as e:
+            logger.error(f"Batch update failed: {e}")
+            return {'success': False, 'error': str(e)}, 500
+        
+        if not result['success']:
+            return result, 409
+        
+        # One audit record for the whole batch
+        if not result.get('duplicate'):
+            audit_log.record('config_change', {
+                'action': 'batch',
+                'operations': operations
+            }, zone=app.config['ZONE'])
+        
+        return result
+
+@backends_ns.route('/<string:backend>/desired')
+class BackendDesiredState(Resource):
+    @token_required
+    def get(self, backend):
+        """Get the desired server set of a backend as shared between replicas"""
+        version, servers = shared_state.get(backend)
+        return {'backend': backend, 'version': version, 'servers': list(servers.values())}
+
 @backends_ns.route('/<string:backend>/servers/<string:server>')
 class BackendServer(Resource):
     @token_required
     def delete(self, backend, server):
-        """Remove server from backend"""
-        try:
-            success = haproxy_manager.remove_backend_server(backend, server)
-            
+        """Remove server from backend.
+        
+        The server is drained first, in a background job (202 with the job;
+        ?wait=<seconds> blocks until it finishes): ?drain_timeout=<seconds>
+        (up to 3600) bounds the wait, ?force=false leaves it draining instead
+        of cutting sessions at the deadline. ?drain=false deletes it at once.
+        """
+        if request.args.get('drain', 'true').lower() == 'false':
+            try:
+                success = haproxy_manager.remove_backend_server(backend, server, drain=False)
+            except Exception as e:
+                return {'error': str(e)}, 500
             if success:
-                return {'success': True, 'message': f'Server {server} removed from {backend}'}
-            else:
-                return {'error': 'Failed to remove server'}, 500
-                
+                return {'success': True, 'status': 'removed', 'message': f'Server {server} removed from {backend}'}
+            return {'success': False, 'status': 'failed', 'error': 'Failed to remove server'}, 500
+        try:
+            timeout = float(request.args.get('drain_timeout', app.config['ROTATION_DRAIN_TIMEOUT']))
+            if not 0 <= timeout <= 3600:
+                raise ValueError
+        except ValueError:
+            return {'error': 'drain_timeout must be a number of seconds between 0 and 3600'}, 400
+        payload = {'backend': backend, 'server': server, 'drain_timeout': timeout,
+                   'force': request.args.get('force', 'true').lower() != 'false'}
+        job = drain_queue.submit('retire', payload, dedupe_key=f'retire:{backend}/{server}')
+        return job_response(job, drain_queue)
+
+@backends_ns.route('/autotune')
+class BackendAutotune(Resource):
+    @token_required
+    def get(self):
+        """Autotuner settings and the weights of its last round"""
+        return weight_tuner.status()
+
+    @token_required
+    def post(self):
+        """Run one tuning round now; ?dry_run=false applies it even in dry-run mode"""
+        if not weight_tuner.bounds:
+            return {'success': False, 'error': 'No backends are tuned; set WEIGHT_TUNER_BACKENDS'}, 400
+        dry_run = request.args.get('dry_run')
+        try:
+            result = weight_tuner.tick(None if dry_run is None else dry_run.lower() != 'false')
+        except Exception as e:
+            logger.error(f"Weight tuning failed: {e}")
+            return {'success': False, 'error': str(e)}, 500
+        return dict(result, success=all(b.get('applied', True) for b in result['backends'].values()))
+
+@backends_ns.route('/rotation')
+class BackendRotation(Resource):
+    @token_required
+    def get(self):
+        """Drain slots in use per backend"""
+        try:
+            return rotation_engine.status(haproxy_manager.stats_cache.get().proxies())
         except Exception as e:
             return {'error': str(e)}, 500
 
+    @token_required
+    @api.expect(rotation_model)
+    def post(self):
+        """Replace servers without dropping sessions: add, ramp up, drain and delete"""
+        data = request.get_json() or {}
+        try:
+            parse_rotations(data)
+            for option in ('drain_timeout', 'ramp_interval'):
+                if data.get(option) is not None and not 0 <= float(data[option]) <= 3600:
+                    raise RotationError(f'{option} must be between 0 and 3600 seconds')
+            for option in ('threshold', 'ramp_steps'):
+                if data.get(option) is not None and not 0 <= int(data[option]) <= 1000:
+                    raise RotationError(f'{option} must be between 0 and 1000')
+        except (RotationError, TypeError, ValueError) as e:
+            return {'success': False, 'error': str(e)}, 400
+        # The same rotation submitted twice runs once
+        key = hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+        job = drain_queue.submit('rotation', data, dedupe_key=f'rotation:{key}')
+        return job_response(job, drain_queue)
+
+@events_ns.route('')
+class EventStream(Resource):
+    @token_required
+    def get(self):
+        """Stream state changes as Server-Sent Events.
+        
+        Each stream holds a sync worker, so it is closed after EVENTS_MAX_STREAM_SECONDS
+        and the client reconnects with Last-Event-ID; SERVER_MODE=async has no such limit.
+        """
+        try:
+            types = parse_types(request.args.get('types'))
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        subscription = event_bus.subscribe(types, request.headers.get('Last-Event-ID'))
+        deadline = time.monotonic() + app.config['EVENTS_MAX_STREAM_SECONDS']
+        
+        def stream():
+            try:
+                yield b'retry: 1000\n\n'
+                while time.monotonic() < deadline:
+                    event = subscription.get(timeout=min(app.config['EVENTS_HEARTBEAT'],
+                                                         max(deadline - time.monotonic(), 0.01)))
+                    yield format_sse(event) if event else b': keepalive\n\n'
+            finally:
+                event_bus.unsubscribe(subscription)
+        
+        return Response(stream(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @stats_ns.route('')
 class Statistics(Resource):
     @token_required
@@ -771,6 +1699,16 @@ class Statistics(Resource):
         except Exception as e:
             return {'error': str(e)}, 500
 
+@stats_ns.route('/info')
+class StatisticsInfo(Resource):
+    @token_required
+    def get(self):
+        """Get HAProxy process information"""
+        try:
+            return haproxy_manager.get_info()
+        except Exception as e:
+            return {'error': str(e)}, 500
+
 @blockchain_ns.route('/nodes')
 class BlockchainNodes(Resource):
     @token_required
@@ -787,34 +1725,25 @@ class BlockchainSync(Resource):
     @token_required
     def post(self):
         """Sync HAProxy configuration with blockchain node list"""
+        if not blockchain_monitor.watcher:
+            return {'error': 'Node registry not configured'}, 503
         try:
-            nodes = blockchain_monitor.get_node_list()
-            
-            # Update HAProxy configuration based on node list
-            # This is a simplified implementation
-            for node in nodes:
-                if node['status'] == 'active':
-                    haproxy_manager.add_backend_server('ddc_nodes_http', {
-                        'name': f"node_{node['address'].replace('.', '_')}",
-                        'address': node['address'],
-                        'port': node['port'],
-                        'check': True
-                    })
+            data = request.get_json(silent=True) or {}
+            result = blockchain_monitor.sync(force_full=bool(data.get('force_full_sync', False)))
+            if not result.get('success'):
+                return result, 409
             
             # Log the sync operation
-            if redis_client:
-                redis_client.lpush('blockchain_syncs', json.dumps({
-                    'timestamp': datetime.utcnow().isoformat(),
-                    'nodes_synced': len(nodes),
-                    'zone': app.config['ZONE']
-                }))
+            audit_log.record('blockchain_sync', {
+                'changes_applied': result['changes_applied'],
+                'block': result['block'],
+                'changes': result['changes']
+            }, zone=app.config['ZONE'])
             
-            return {
-                'success': True,
-                'nodes_synced': len(nodes),
-                'timestamp': datetime.utcnow().isoformat()
-            }
+            return result
             
+        except LockTimeout as e:
+            return {'error': str(e)}, 503
         except Exception as e:
             logger.error(f"Blockchain sync failed: {e}")
             return {'error': str(e)}, 500
@@ -829,26 +1758,11 @@ class ContainerList(Resource):
             if not docker_manager.client:
                 return {'error': 'Docker not available'}, 503
             
-            zone = app.config['ZONE']
-            containers = docker_manager.client.containers.list(all=True)
-            
-            zone_containers = []
-            for container in containers:
-                # Filter containers by zone or naming convention
-                if f'{zone}-backend' in container.name or f'{zone}_zone' in str(container.attrs.get('NetworkSettings', {})):
-                    zone_containers.append({
-                        'id': container.id[:12],
-                        'name': container.name,
-                        'status': container.status,
-                        'image': container.image.tags[0] if container.image.tags else 'unknown',
-                        'created': container.attrs['Created'],
-                        'networks': list(container.attrs.get('NetworkSettings', {}).get('Networks', {}).keys())
-                    })
-            
+            zone_containers = docker_manager.list_zone_containers()
             return {
                 'containers': zone_containers,
                 'count': len(zone_containers),
-                'zone': zone
+                'zone': app.config['ZONE']
             }
             
         except Exception as e:
@@ -860,49 +1774,71 @@ class ContainerList(Resource):
     def post(self):
         """Create new backend container and add to HAProxy"""
         try:
-            data = request.get_json()
-            
-            # Validate required fields
-            required_fields = ['name', 'image']
-            for field in required_fields:
-                if field not in data:
-                    return {'success': False, 'error': f'Missing required field: {field}'}, 400
-            
-            # Create container
-            container_result = docker_manager.create_container(data)
+            if not docker_manager.client:
+                return {'success': False, 'error': 'Docker not available'}, 503
             
-            if not container_result['success']:
-                return container_result, 500
+            data = request.get_json(silent=True) or {}
+            job = job_queue.submit('container_create', data)
+            return job_response(job)
+                
+        except Exception as e:
+            return {'success': False, 'error': str(e)}, 500
+
+@containers_ns.route('/bulk')
+class ContainerBulk(Resource):
+    @token_required
+    @api.expect(container_bulk_model)
+    def post(self):
+        """Create many backend containers in parallel and add them to HAProxy once healthy"""
+        try:
+            if not docker_manager.client:
+                return {'success': False, 'error': 'Docker not available'}, 503
             
-            # Determine backend based on zone
-            zone = os.environ.get('ZONE', 'eu')
-            backend = f'{zone}_backend'
+            data = request.get_json(silent=True) or {}
+            count = data.get('count')
+            if not isinstance(count, int) or isinstance(count, bool) or not 1 <= count <= MAX_BULK_COUNT:
+                return {'success': False, 'error': f'count must be an integer between 1 and {MAX_BULK_COUNT}'}, 400
+            job = job_queue.submit('container_bulk_create', data)
+            return job_response(job)
+                
+        except Exception as e:
+            return {'success': False, 'error': str(e)}, 500
+
+@containers_ns.route('/warm-pool')
+class WarmPool(Resource):
+    @token_required
+    def get(self):
+        """Stopped containers ready to be started by a bulk create"""
+        try:
+            if not docker_manager.client:
+                return {'error': 'Docker not available'}, 503
             
-            # Add to HAProxy config
-            server_config = {
-                'name': data['name'].replace('-', '_'),  # HAProxy server names can't have dashes
-                'address': data['name'],  # Use container name as hostname
-                'port': data.get('port', 80),
-                'weight': data.get('weight', 100)
+            warm = docker_manager.warm_containers()
+            return {
+                'zone': app.config['ZONE'],
+                'target': app.config['WARM_POOL_SIZE'],
+                'available': len(warm),
+                'containers': [{'name': record['name'], 'id': record['id'][:12],
+                                'ip_address': next((address_of(info) for info in record['networks'].values()), None)}
+                               for record in warm]
             }
+        except Exception as e:
+            return {'error': str(e)}, 500
+    
+    @token_required
+    def post(self):
+        """Top up the warm pool to WARM_POOL_SIZE, or to the given size"""
+        try:
+            if not docker_manager.client:
+                return {'success': False, 'error': 'Docker not available'}, 503
             
-            haproxy_success = haproxy_manager.add_server_to_config_file(backend, server_config)
-            
-            if haproxy_success:
-                return {
-                    'success': True,
-                    'message': f'Container {data["name"]} created and added to HAProxy backend {backend}',
-                    'container': container_result['container'],
-                    'haproxy_server': server_config
-                }
-            else:
-                # Container was created but HAProxy update failed
-                return {
-                    'success': False,
-                    'error': 'Container created but failed to add to HAProxy config',
-                    'container': container_result['container']
-                }, 500
-                
+            data = request.get_json(silent=True) or {}
+            size = data.get('size', app.config['WARM_POOL_SIZE'])
+            if not isinstance(size, int) or isinstance(size, bool) or not 0 <= size <= MAX_BULK_COUNT:
+                return {'success': False, 'error': f'size must be an integer between 0 and {MAX_BULK_COUNT}'}, 400
+            job = job_queue.submit('warm_pool_fill', {'size': size})
+            return job_response(job)
+        
         except Exception as e:
             return {'success': False, 'error': str(e)}, 500
 
@@ -915,20 +1851,10 @@ class ContainerDetail(Resource):
             if not docker_manager.client:
                 return {'error': 'Docker not available'}, 503
             
-            container = docker_manager.client.containers.get(container_name)
-            
-            return {
-                'id': container.id,
-                'name': container.name,
-                'status': container.status,
-                'image': container.image.tags[0] if container.image.tags else 'unknown',
-                'created': container.attrs['Created'],
-                'started': container.attrs['State']['StartedAt'],
-                'networks': container.attrs.get('NetworkSettings', {}).get('Networks', {}),
-                'environment': container.attrs.get('Config', {}).get('Env', []),
-                'mounts': [mount['Source'] + ':' + mount['Destination'] for mount in container.attrs.get('Mounts', [])]
-            }
+            return docker_manager.get_container_details(container_name)
             
+        except ContainerNotFound:
+            return {'error': f'Container {container_name} not found'}, 404
         except Exception as e:
             logger.error(f"Failed to get container details: {e}")
             return {'error': str(e)}, 500
@@ -941,8 +1867,7 @@ class ContainerDetail(Resource):
             container_info = None
             if docker_manager.client:
                 try:
-                    container = docker_manager.client.containers.get(container_name)
-                    networks = container.attrs.get('NetworkSettings', {}).get('Networks', {})
+                    networks = docker_manager.inventory.get(container_name)['networks']
                     for network_name, network_info in networks.items():
                         if network_info.get('IPAddress'):
                             container_info = {
@@ -953,25 +1878,24 @@ class ContainerDetail(Resource):
                 except:
                     pass
             
+            # Drain and remove the HAProxy server while the container can still finish its sessions
+            haproxy_success = None
+            if container_info:
+                haproxy_success = haproxy_manager.remove_backend_server(
+                    'ddc_nodes_http', container_info['name'], timeout=app.config['ROTATION_INLINE_DRAIN_TIMEOUT'])
+                if haproxy_success:
+                    logger.info(f"Container {container_name} removed from HAProxy backend")
+            
             # Remove from Docker
             result = docker_manager.remove_backend_container(container_name)
-            
-            if result['success'] and container_info:
-                # Remove from HAProxy backend
-                haproxy_success = haproxy_manager.remove_backend_server('ddc_nodes_http', container_info['name'])
+            if haproxy_success is not None:
                 result['haproxy_removed'] = haproxy_success
-                
-                if haproxy_success:
-                    logger.info(f"Container {container_name} removed from HAProxy backend")
             
             # Log the removal
-            if redis_client:
-                redis_client.lpush('container_operations', json.dumps({
-                    'timestamp': datetime.utcnow().isoformat(),
-                    'operation': 'remove',
-                    'container_name': container_name,
-                    'zone': app.config['ZONE']
-                }))
+            audit_log.record('container_operation', {
+                'operation': 'remove',
+                'container_name': container_name
+            }, zone=app.config['ZONE'])
             
             return result
             
@@ -979,6 +1903,223 @@ class ContainerDetail(Resource):
             logger.error(f"Failed to remove container: {e}")
             return {'error': str(e)}, 500
 
+@ipam_ns.route('')
+class IPAMPools(Resource):
+    @token_required
+    def get(self):
+        """Address pools and how many addresses are leased"""
+        try:
+            return {'pools': [ipam.stats(zone) for zone in ipam.pools]}
+        except Exception as e:
+            return {'error': str(e)}, 500
+
+@ipam_ns.route('/<string:zone>/leases')
+class IPAMLeases(Resource):
+    @token_required
+    def get(self, zone):
+        """Leased addresses of one zone's pool"""
+        if zone not in ipam.pools:
+            return {'error': f'No IP pool for zone {zone}'}, 404
+        try:
+            leases = ipam.leases(zone)
+            return {'zone': zone, 'leases': list(leases.values()), 'count': len(leases)}
+        except Exception as e:
+            return {'error': str(e)}, 500
+
+def change_map(name, change, *args):
+    """Apply a map manager change and answer as the map routes do"""
+    try:
+        result = change(name, *args)
+    except MapNotFound:
+        return {'success': False, 'error': f'No map or ACL file {name}'}, 404
+    except MapError as e:
+        return {'success': False, 'error': str(e)}, 400
+    except RuntimeAPIError as e:
+        return {'success': False, 'error': str(e)}, 502
+    except Exception as e:
+        logger.error(f"Failed to change map {name}: {e}")
+        return {'success': False, 'error': str(e)}, 500
+    record = {key: value for key, value in result.items() if not key.endswith('_ms') and key != 'success'}
+    audit_log.record('config_change', dict(record, action=f'map_{change.__name__}'), zone=app.config['ZONE'])
+    return result
+
+@maps_ns.route('')
+class Maps(Resource):
+    @token_required
+    def get(self):
+        """Map and ACL files, with the entries HAProxy has loaded from each"""
+        try:
+            return {'maps': map_manager.list()}
+        except Exception as e:
+            return {'error': str(e)}, 500
+
+@maps_ns.route('/<string:name>')
+class Map(Resource):
+    @token_required
+    def get(self, name):
+        """Entries of one map or ACL file"""
+        try:
+            return map_manager.get(name)
+        except MapNotFound:
+            return {'error': f'No map or ACL file {name}'}, 404
+        except Exception as e:
+            return {'error': str(e)}, 500
+
+    @token_required
+    @api.expect(map_update_model)
+    def patch(self, name):
+        """Add, change and delete entries, without a reload"""
+        data = request.get_json() or {}
+        return change_map(name, map_manager.update, data.get('entries'), data.get('delete'))
+
+    @token_required
+    @api.expect(map_update_model)
+    def put(self, name):
+        """Replace all entries in one atomic swap (prepare, load, commit)"""
+        data = request.get_json() or {}
+        if 'entries' not in data:
+            return {'success': False, 'error': 'entries is required'}, 400
+        return change_map(name, map_manager.replace, data['entries'])
+
+@maps_ns.route('/<string:name>/sync')
+class MapSync(Resource):
+    @token_required
+    def post(self, name):
+        """Load the file into HAProxy again, e.g. after editing it by hand"""
+        return change_map(name, map_manager.sync)
+
+@federation_ns.route('')
+class FederationStatus(Resource):
+    @token_required
+    def get(self):
+        """This zone's version vector and what each peer zone last acknowledged"""
+        try:
+            return federation.status()
+        except Exception as e:
+            return {'error': str(e)}, 500
+
+@federation_ns.route('/publish')
+class FederationPublish(Resource):
+    @token_required
+    @api.expect(federation_publish_model)
+    def post(self):
+        """Apply a change set in this zone and push it to the peer zones concurrently"""
+        data = request.get_json(silent=True) or {}
+        try:
+            operations = parse_operations(data)
+            zones = data.get('zones')
+            if zones is not None and (not isinstance(zones, list) or not all(isinstance(z, str) for z in zones)):
+                return {'success': False, 'error': 'zones must be a list of zone names'}, 400
+            result = federation.publish(operations, zones, message=str(data.get('message') or ''))
+        except BatchError as e:
+            return {'success': False, 'error': str(e), 'operation': e.index}, 400
+        except FederationError as e:
+            return {'success': False, 'error': str(e)}, 400
+        except LockTimeout as e:
+            return {'success': False, 'error': str(e)}, 503
+        except RuntimeAPIError as e:
+            return {'success': False, 'error': str(e)}, 502
+        except Exception as e:
+            logger.error(f"Federated change failed: {e}")
+            return {'success': False, 'error': str(e)}, 500
+        
+        if 'change' not in result:
+            return result, 409
+        
+        audit_log.record('config_change', {
+            'action': 'federated_batch',
+            'change': result['change']['id'],
+            'zones': result['change']['zones'],
+            'operations': operations
+        }, zone=app.config['ZONE'])
+        return result
+
+@federation_ns.route('/changes')
+class FederationChanges(Resource):
+    @token_required
+    def get(self):
+        """Change sets that originated in this zone, after ?since=<seq>"""
+        since = request.args.get('since', 0, type=int)
+        limit = min(request.args.get('limit', MAX_CHANGES_PER_REQUEST, type=int), MAX_CHANGES_PER_REQUEST)
+        changes, pruned = federation.log.since(since, limit)
+        return {'origin': app.config['ZONE'], 'changes': changes, 'head': federation.log.head(), 'pruned': pruned}
+    
+    @token_required
+    def post(self):
+        """Apply change sets pushed by a peer zone; answers with this zone's version vector"""
+        try:
+            origin, changes = parse_changes(request.get_json(silent=True))
+            return federation.receive(origin, changes)
+        except FederationError as e:
+            return {'error': str(e)}, 400
+        except LockTimeout as e:
+            return {'error': str(e)}, 503
+
+@federation_ns.route('/sync')
+class FederationSync(Resource):
+    @token_required
+    def post(self):
+        """Pull every change set this zone missed from its peers now"""
+        return {'zone': app.config['ZONE'], 'peers': federation.sync(), 'vector': federation.log.vector()}
+
+@logs_ns.route('')
+class LogStatistics(Resource):
+    @token_required
+    def get(self):
+        """Latency percentiles, status rates and slow paths over the rolling window.
+        
+        ?backend=<name> narrows to one backend, ?top=<n> sets the slow paths listed (default 10).
+        """
+        try:
+            top = int(request.args.get('top', 10))
+            if not 0 <= top <= 100:
+                raise ValueError
+        except ValueError:
+            return {'error': 'top must be between 0 and 100'}, 400
+        try:
+            summary = log_ingestor.window().summary(request.args.get('backend'), top)
+        except Exception as e:
+            logger.error(f"Failed to read log statistics: {e}")
+            return {'error': str(e)}, 500
+        return dict(summary, ingest=log_ingestor.status())
+
+@jobs_ns.route('/<string:job_id>')
+class Job(Resource):
+    @token_required
+    def get(self, job_id):
+        """Get status and result of a background job"""
+        for jobs in (job_queue, drain_queue):
+            job = jobs.get(job_id)
+            if job is not None:
+                return job_response(job, jobs)
+        return {'error': 'Job not found'}, 404
+
+@audit_ns.route('')
+class AuditEvents(Resource):
+    @token_required
+    def get(self):
+        """Query audit events, newest first"""
+        if redis_client is None:
+            return {'error': 'Audit log requires Redis'}, 503
+        args = request.args
+        if args.get('kind') and args['kind'] not in AUDIT_KINDS:
+            return {'error': f"kind must be one of {', '.join(AUDIT_KINDS)}"}, 400
+        try:
+            return audit_log.query(
+                kind=args.get('kind'),
+                zone=args.get('zone'),
+                backend=args.get('backend'),
+                server=args.get('server'),
+                since=args.get('since'),
+                until=args.get('until'),
+                limit=args.get('limit', 100, type=int),
+                cursor=args.get('cursor')
+            )
+        except ValueError as e:
+            return {'error': f'Invalid time range: {e}'}, 400
+        except Exception as e:
+            return {'error': str(e)}, 500
+
 # Error handlers
 @app.errorhandler(404)
 def not_found(error):
@@ -991,4 +2132,4 @@ def internal_error(error):
 # Application startup
 if __name__ == '__main__':
     logger.info(f"Starting ConfigWatcher API for zone: {app.config['ZONE']}")
-    app.run(host='0.0.0.0', port=8080, debug=False) 
+    app.run(host='0.0.0.0', port=int(os.getenv('API_PORT', '8080')), debug=False)
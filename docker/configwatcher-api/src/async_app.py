@@ -0,0 +1,529 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - ConfigWatcher API, asyncio serving mode
+Serves the status, stats and job endpoints natively on an aiohttp event
+loop, so thousands of concurrent requests share one process instead of
+each holding a worker. Every other route, including the Swagger docs under
+/api/docs/, is passed to the Flask app on a bounded thread pool, so both
+modes expose the same API.
+
+Usage:
+    gunicorn --worker-class aiohttp.GunicornWebWorker async_app:create_app
+    python async_app.py
+"""
+
+import os
+import io
+import re
+import json
+import weakref
+import sys
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiohttp import WSMsgType, web
+from multidict import CIMultiDict
+
+import metrics
+from container_inventory import ContainerNotFound
+from event_stream import format_sse, parse_types
+from haproxy_runtime import AsyncRuntimeClient
+from haproxy_stats import AsyncStatsCache, parse_info
+from app import (app, authenticate, blockchain_monitor, config_publisher, docker_manager, event_bus,
+                 federation, haproxy_manager, health_prober, health_status, job_queue, liveness_status, readiness_status,
+                 log_ingestor, service_status, shared_state, weight_tuner)
+
+logger = logging.getLogger(__name__)
+
+WSGI_THREADS = int(os.getenv('ASYNC_WSGI_THREADS', '16'))
+MAX_BODY_SIZE = 16 * 2 ** 20
+
+# Set by aiohttp itself for the buffered body
+HOP_BY_HOP_HEADERS = ('content-length', 'transfer-encoding', 'connection', 'keep-alive')
+
+Handler = Callable[[web.Request], Awaitable[web.StreamResponse]]
+
+# Open /events/ws connections, closed on shutdown
+EVENT_SOCKETS = web.AppKey('event_sockets', weakref.WeakSet)
+
+
+class AsyncHAProxyManager:
+    """HAProxyManager for the event loop.
+
+    Stats and info are read over an asyncio runtime connection pool. Changes
+    are delegated to the sync manager in a thread, since they take the shared
+    backend locks; its cache invalidations expire the caches here as well.
+    """
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.runtime = AsyncRuntimeClient(
+            manager.socket_path,
+            pool_size=app.config['HAPROXY_SOCKET_POOL_SIZE'],
+            timeout=app.config['HAPROXY_SOCKET_TIMEOUT']
+        )
+        self.stats_cache = AsyncStatsCache(
+            lambda: self.runtime.execute('show stat'),
+            ttl=app.config['STATS_CACHE_TTL'],
+            linked=manager.stats_cache
+        )
+        self.info_cache = AsyncStatsCache(
+            lambda: self.runtime.execute('show info'),
+            parse=parse_info,
+            ttl=app.config['STATS_CACHE_TTL']
+        )
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """Get HAProxy statistics via socket"""
+        try:
+            snapshot = await self.stats_cache.get()
+            stats = snapshot.summary()
+            stats['timestamp'] = datetime.utcfromtimestamp(snapshot.timestamp).isoformat()
+            stats['age_seconds'] = round(snapshot.age, 3)
+            return stats
+        except Exception as e:
+            logger.error(f"Failed to get stats: {e}")
+            return {'error': str(e)}
+
+    async def get_backend_servers(self, backend: str) -> Optional[List[Dict[str, Any]]]:
+        """Get per-server stats of a backend, or None if the backend does not exist"""
+        snapshot = await self.stats_cache.get()
+        if not snapshot.has_proxy(backend):
+            return None
+        return snapshot.servers(backend)
+
+    async def get_info(self) -> Dict[str, Any]:
+        """Get HAProxy process information via socket"""
+        return await self.info_cache.get()
+
+    async def get_desired(self, backend: str) -> Tuple[int, Dict[str, Dict[str, Any]]]:
+        return await asyncio.to_thread(self.manager.shared_state.get, backend)
+
+    async def add_backend_server(self, backend: str, server_config: Dict[str, Any]) -> bool:
+        return await asyncio.to_thread(self.manager.add_backend_server, backend, server_config)
+
+    async def remove_backend_server(self, backend: str, server_name: str, drain: bool = True,
+                                    timeout: Optional[float] = None) -> bool:
+        return await asyncio.to_thread(self.manager.remove_backend_server, backend, server_name, drain, timeout)
+
+    async def apply_batch(self, operations: List[Dict[str, Any]], change_id: Optional[str] = None,
+                          source: str = 'api') -> Dict[str, Any]:
+        return await asyncio.to_thread(self.manager.apply_batch, operations, change_id, source)
+
+    def close(self):
+        self.runtime.close()
+
+
+class AsyncBlockchainMonitor:
+    """BlockchainMonitor for the event loop; web3 calls run in a thread"""
+
+    def __init__(self, monitor):
+        self.monitor = monitor
+
+    @property
+    def configured(self) -> bool:
+        return self.monitor.watcher is not None
+
+    async def get_node_list(self) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self.monitor.get_node_list)
+
+    async def sync(self, force_full: bool = False) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.monitor.sync, force_full)
+
+
+class AsyncDockerManager:
+    """DockerManager for the event loop; the Docker SDK is blocking, so calls run in a thread"""
+
+    def __init__(self, manager):
+        self.manager = manager
+
+    @property
+    def available(self) -> bool:
+        return self.manager.client is not None
+
+    async def list_zone_containers(self) -> List[Dict[str, Any]]:
+        if self.manager.inventory.watching:
+            # A memory read while the inventory follows the events stream
+            return self.manager.list_zone_containers()
+        return await asyncio.to_thread(self.manager.list_zone_containers)
+
+    async def get_container_details(self, container_name: str) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.manager.get_container_details, container_name)
+
+    async def create_backend_container(self, node_config: Dict[str, Any]) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.manager.create_backend_container, node_config)
+
+    async def remove_backend_container(self, container_name: str) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.manager.remove_backend_container, container_name)
+
+
+class WSGIBridge:
+    """Serve aiohttp requests with a WSGI app on a bounded thread pool"""
+
+    def __init__(self, wsgi_app, threads: int = WSGI_THREADS):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix='wsgi')
+
+    @staticmethod
+    def environ(request: web.Request, body: bytes) -> Dict[str, Any]:
+        environ = {
+            'REQUEST_METHOD': request.method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': request.path.encode().decode('latin-1'),
+            'QUERY_STRING': request.query_string,
+            'SERVER_NAME': request.url.host or 'localhost',
+            'SERVER_PORT': str(request.url.port or 80),
+            'SERVER_PROTOCOL': f"HTTP/{request.version.major}.{request.version.minor}",
+            'REMOTE_ADDR': request.remote or '',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': request.scheme,
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for name, value in request.headers.items():
+            key = name.upper().replace('-', '_')
+            if key == 'CONTENT_LENGTH':
+                continue
+            if key != 'CONTENT_TYPE':
+                key = f"HTTP_{key}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+    def _call(self, environ: Dict[str, Any]) -> Tuple[str, List[Tuple[str, str]], bytes]:
+        started = {}
+        chunks: List[bytes] = []
+
+        def start_response(status, headers, exc_info=None):
+            started.update(status=status, headers=headers)
+            return chunks.append
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            chunks.extend(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return started['status'], started['headers'], b''.join(chunks)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        body = await request.read()
+        status, headers, payload = await asyncio.get_running_loop().run_in_executor(
+            self.executor, self._call, self.environ(request, body))
+        code, _, reason = status.partition(' ')
+        return web.Response(status=int(code), reason=reason or None, body=payload,
+                            headers=CIMultiDict((k, v) for k, v in headers
+                                                if k.lower() not in HOP_BY_HOP_HEADERS))
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+# Initialize managers
+async_haproxy_manager = AsyncHAProxyManager(haproxy_manager)
+async_blockchain_monitor = AsyncBlockchainMonitor(blockchain_monitor)
+async_docker_manager = AsyncDockerManager(docker_manager)
+wsgi_bridge = WSGIBridge(app.wsgi_app)
+
+
+def json_response(data: Any, status: int = 200) -> web.Response:
+    return web.json_response(data, status=status)
+
+
+def token_required(handler: Handler) -> Handler:
+    @functools.wraps(handler)
+    async def decorated(request: web.Request) -> web.StreamResponse:
+        user, error = authenticate(request.headers.get('Authorization'), request.headers.get('X-API-Key'))
+        if error:
+            return json_response({'message': error}, 401)
+        request['current_user'] = user
+        return await handler(request)
+    return decorated
+
+
+async def job_response(request: web.Request, job: Dict[str, Any]) -> web.Response:
+    """202 with the job while it runs; ?wait=<seconds> polls without holding a thread"""
+    try:
+        wait = float(request.query.get('wait') or 0)
+    except ValueError:
+        wait = 0
+    deadline = time.monotonic() + min(wait, 120)
+    while job['status'] in ('queued', 'running') and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+        job = await asyncio.to_thread(job_queue.get, job['id']) or job
+    return json_response(job, 200 if job['status'] in ('done', 'failed') else 202)
+
+
+@web.middleware
+async def record_request_metrics(request: web.Request, handler: Handler) -> web.StreamResponse:
+    # Requests handed to Flask are recorded by its own after_request hook
+    route = request.match_info.route
+    if route.handler == wsgi_bridge.handle:
+        return await handler(request)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        # Same labels as the sync mode: '/backends/{backend}/servers' -> '/backends/<string:backend>/servers'
+        endpoint = re.sub(r'\{(\w+)\}', r'<string:\1>', route.resource.canonical) if route.resource else 'unmatched'
+        metrics.HTTP_LATENCY.labels(method=request.method, endpoint=endpoint, status=status).observe(
+            time.perf_counter() - start)
+
+
+# Routes
+
+async def health_check(request: web.Request) -> web.Response:
+    """Health check endpoint for HAProxy"""
+    return json_response(health_status())
+
+
+async def health(request: web.Request) -> web.Response:
+    """Health check endpoint"""
+    return json_response(service_status())
+
+
+async def health_liveness(request: web.Request) -> web.Response:
+    """Liveness probe: the process is serving and its health prober is running"""
+    return json_response(*liveness_status())
+
+
+async def health_readiness(request: web.Request) -> web.Response:
+    """Readiness probe: Redis and the HAProxy config were reachable in the last probe"""
+    return json_response(*readiness_status())
+
+
+async def configuration(request: web.Request) -> web.Response:
+    """Get current HAProxy configuration; a poll of an unchanged file is a stat and a 304"""
+    try:
+        status, headers, body = config_publisher.respond(
+            request.headers.get('If-None-Match'), request.query.get('since'),
+            request.headers.get('Accept-Encoding'))
+    except Exception as e:
+        return json_response({'error': str(e)}, 500)
+    return web.Response(status=status, headers=headers, body=body)
+
+
+@token_required
+async def statistics(request: web.Request) -> web.Response:
+    """Get HAProxy statistics"""
+    return json_response(await async_haproxy_manager.get_stats())
+
+
+@token_required
+async def statistics_info(request: web.Request) -> web.Response:
+    """Get HAProxy process information"""
+    try:
+        return json_response(await async_haproxy_manager.get_info())
+    except Exception as e:
+        return json_response({'error': str(e)}, 500)
+
+
+@token_required
+async def backend_servers(request: web.Request) -> web.Response:
+    """Get servers in a backend"""
+    backend = request.match_info['backend']
+    try:
+        servers = await async_haproxy_manager.get_backend_servers(backend)
+    except Exception as e:
+        return json_response({'success': False, 'error': str(e)}, 500)
+    if servers is None:
+        return json_response({'success': False, 'error': 'Backend not found'}, 404)
+    return json_response({
+        'success': True,
+        'backend': backend,
+        'servers': servers,
+        'total_servers': len(servers),
+        'healthy_servers': sum(1 for s in servers if str(s.get('status', '')).startswith('UP'))
+    })
+
+
+@token_required
+async def backend_desired_state(request: web.Request) -> web.Response:
+    """Get the desired server set of a backend as shared between replicas"""
+    backend = request.match_info['backend']
+    version, servers = await async_haproxy_manager.get_desired(backend)
+    return json_response({'backend': backend, 'version': version, 'servers': list(servers.values())})
+
+
+@token_required
+async def blockchain_nodes(request: web.Request) -> web.Response:
+    """Get current node list from blockchain"""
+    try:
+        nodes = await async_blockchain_monitor.get_node_list()
+        return json_response({'nodes': nodes, 'count': len(nodes)})
+    except Exception as e:
+        return json_response({'error': str(e)}, 500)
+
+
+@token_required
+async def container_list(request: web.Request) -> web.Response:
+    """List all containers in the current zone"""
+    if not async_docker_manager.available:
+        return json_response({'error': 'Docker not available'}, 503)
+    try:
+        zone_containers = await async_docker_manager.list_zone_containers()
+    except Exception as e:
+        logger.error(f"Failed to list containers: {e}")
+        return json_response({'error': str(e)}, 500)
+    return json_response({'containers': zone_containers, 'count': len(zone_containers), 'zone': app.config['ZONE']})
+
+
+@token_required
+async def container_detail(request: web.Request) -> web.Response:
+    """Get detailed information about a specific container"""
+    if not async_docker_manager.available:
+        return json_response({'error': 'Docker not available'}, 503)
+    try:
+        return json_response(await async_docker_manager.get_container_details(request.match_info['container_name']))
+    except ContainerNotFound:
+        return json_response({'error': f"Container {request.match_info['container_name']} not found"}, 404)
+    except Exception as e:
+        logger.error(f"Failed to get container details: {e}")
+        return json_response({'error': str(e)}, 500)
+
+
+@token_required
+async def job_status(request: web.Request) -> web.Response:
+    """Get status and result of a background job"""
+    job = await asyncio.to_thread(job_queue.get, request.match_info['job_id'])
+    if job is None:
+        return json_response({'error': 'Job not found'}, 404)
+    return await job_response(request, job)
+
+
+@token_required
+async def reload_ticket(request: web.Request) -> web.Response:
+    """Poll (or wait on) a reload job"""
+    job = await asyncio.to_thread(job_queue.get, request.match_info['ticket_id'])
+    if job is None or job['type'] != 'reload':
+        return json_response({'error': 'Ticket not found'}, 404)
+    return await job_response(request, job)
+
+
+@token_required
+async def event_stream(request: web.Request) -> web.StreamResponse:
+    """Stream state changes as Server-Sent Events; resumes from Last-Event-ID"""
+    try:
+        types = parse_types(request.query.get('types'))
+    except ValueError as e:
+        return json_response({'error': str(e)}, 400)
+    subscription = event_bus.subscribe(types, request.headers.get('Last-Event-ID'), loop=asyncio.get_running_loop())
+    try:
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache',
+                                               'X-Accel-Buffering': 'no'})
+        await response.prepare(request)
+        await response.write(b'retry: 1000\n\n')
+        while True:
+            event = await subscription.next(timeout=app.config['EVENTS_HEARTBEAT'])
+            await response.write(format_sse(event) if event else b': keepalive\n\n')
+    except ConnectionResetError:
+        return response
+    finally:
+        event_bus.unsubscribe(subscription)
+
+
+@token_required
+async def event_socket(request: web.Request) -> web.WebSocketResponse:
+    """Stream state changes over a WebSocket; send {"types": [...]} to change the filter"""
+    try:
+        types = parse_types(request.query.get('types'))
+    except ValueError as e:
+        return json_response({'error': str(e)}, 400)
+    ws = web.WebSocketResponse(heartbeat=app.config['EVENTS_HEARTBEAT'])
+    await ws.prepare(request)
+    request.app[EVENT_SOCKETS].add(ws)
+    subscription = event_bus.subscribe(types, request.query.get('last_event_id'), loop=asyncio.get_running_loop())
+
+    async def forward():
+        while True:
+            event = await subscription.next()
+            await ws.send_str(json.dumps(event))
+
+    sender = asyncio.create_task(forward())
+    try:
+        async for message in ws:
+            if message.type != WSMsgType.TEXT:
+                continue
+            try:
+                types = parse_types(','.join(json.loads(message.data).get('types') or []))
+                subscription.types = set(types) if types else None
+            except (ValueError, AttributeError, TypeError) as e:
+                await ws.send_str(json.dumps({'type': 'error', 'data': {'error': str(e)}}))
+    finally:
+        sender.cancel()
+        event_bus.unsubscribe(subscription)
+        request.app[EVENT_SOCKETS].discard(ws)
+    return ws
+
+
+async def start_background_workers(application: web.Application):
+    # Started per worker after the fork, as the Flask before_request hook does
+    job_queue.start()
+    shared_state.start()
+    health_prober.start()
+    docker_manager.start()
+    federation.start()
+    weight_tuner.start()
+    log_ingestor.start()
+
+
+async def close_event_sockets(application: web.Application):
+    for ws in list(application[EVENT_SOCKETS]):
+        await ws.close(code=1001, message=b'Server shutdown')
+
+
+async def close_clients(application: web.Application):
+    async_haproxy_manager.close()
+    wsgi_bridge.close()
+
+
+async def create_app() -> web.Application:
+    """Application factory, also used by aiohttp.GunicornWebWorker"""
+    application = web.Application(middlewares=[record_request_metrics], client_max_size=MAX_BODY_SIZE)
+    application[EVENT_SOCKETS] = weakref.WeakSet()
+    router = application.router
+    router.add_get('/api/v1/health', health_check)
+    router.add_get('/health', health)
+    router.add_get('/health/live', health_liveness)
+    router.add_get('/health/ready', health_readiness)
+    router.add_get('/config', configuration)
+    router.add_get('/stats', statistics)
+    router.add_get('/stats/info', statistics_info)
+    router.add_get('/backends/{backend}/servers', backend_servers)
+    router.add_get('/backends/{backend}/desired', backend_desired_state)
+    router.add_get('/blockchain/nodes', blockchain_nodes)
+    router.add_get('/containers', container_list)
+    # Served by Flask; registered first so it is not taken for a container name
+    router.add_get('/containers/warm-pool', wsgi_bridge.handle)
+    router.add_get('/containers/{container_name}', container_detail)
+    router.add_get('/jobs/{job_id}', job_status)
+    router.add_get('/config/reload/{ticket_id}', reload_ticket)
+    router.add_get('/events', event_stream)
+    router.add_get('/events/ws', event_socket)
+    # Everything else, other methods on the paths above included, is served by Flask
+    router.add_route('*', '/{path:.*}', wsgi_bridge.handle, name='wsgi')
+    application.on_startup.append(start_background_workers)
+    application.on_shutdown.append(close_event_sockets)
+    application.on_cleanup.append(close_clients)
+    return application
+
+
+# Application startup
+if __name__ == '__main__':
+    logger.info(f"Starting ConfigWatcher API (async) for zone: {app.config['ZONE']}")
+    web.run_app(create_app(), host='0.0.0.0', port=int(os.getenv('API_PORT', '8080')), access_log=None)
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - Audit Log
+Records configuration changes, blockchain syncs and container operations
+in a capped Redis Stream. Small per-backend, per-server, per-zone and
+per-kind index streams hold only entry IDs, so filtered, time-bounded
+queries read just the matching entries.
+
+Usage:
+    python audit_log.py migrate     # move the legacy lpush lists into the stream
+"""
+
+import os
+import sys
+import json
+import uuid
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+AUDIT_KINDS = ('config_change', 'blockchain_sync', 'container_operation')
+
+# Lists written before the audit log existed, and the kind they map to
+LEGACY_LISTS = {
+    'config_changes': 'config_change',
+    'blockchain_syncs': 'blockchain_sync',
+    'container_operations': 'container_operation',
+}
+
+# Seconds one replica may hold the migration lock; longer than any migration takes
+MIGRATE_LOCK_TTL = 600
+
+INDEX_DIMENSIONS = ('kind', 'zone', 'backend', 'server')
+
+MAX_PAGE_SIZE = 1000
+
+# KEYS: stream, index streams...  ARGV: maxlen, index maxlen, index ttl, id, field, value, ...
+RECORD_SCRIPT = """
+local id = redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[1], ARGV[4], unpack(ARGV, 5))
+for i = 2, #KEYS do
+    redis.call('XADD', KEYS[i], 'MAXLEN', '~', ARGV[2], id, 'i', '')
+    redis.call('EXPIRE', KEYS[i], ARGV[3])
+end
+return id
+"""
+
+# Delete the lock only if we still hold it
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def to_stream_ms(value: Any) -> Optional[int]:
+    """Epoch seconds or an ISO 8601 timestamp (UTC unless it says otherwise) to stream milliseconds"""
+    if value is None or value == '':
+        return None
+    try:
+        return int(float(value) * 1000)
+    except (TypeError, ValueError):
+        pass
+    parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp() * 1000)
+
+
+def id_ms(entry_id: str) -> int:
+    return int(entry_id.split('-', 1)[0])
+
+
+def event_dimensions(data: Dict[str, Any]) -> Dict[str, List[str]]:
+    """Backends and servers an event touches, taken from the shapes the API logs"""
+    backends, servers = [], []
+
+    def add(backend: Any, server: Any):
+        if backend and backend not in backends:
+            backends.append(backend)
+        name = server.get('name') if isinstance(server, dict) else server
+        if name and name not in servers:
+            servers.append(name)
+
+    add(data.get('backend'), data.get('server'))
+    for op in data.get('operations') or data.get('changes') or []:
+        if isinstance(op, dict):
+            add(op.get('backend'), op.get('server'))
+    return {'backend': backends, 'server': servers}
+
+
+class AuditLog:
+    """Capped, indexed audit trail in a Redis Stream"""
+
+    def __init__(self, redis_client, prefix: str = 'configwatcher:audit', maxlen: int = 100000,
+                 index_ttl: int = 30 * 86400):
+        self.redis = redis_client
+        self.prefix = prefix
+        self.stream = f"{prefix}:events"
+        self.maxlen = maxlen
+        self.index_ttl = index_ttl
+        self._script = redis_client.register_script(RECORD_SCRIPT) if redis_client is not None else None
+
+    def _index_key(self, dimension: str, value: str) -> str:
+        return f"{self.prefix}:index:{dimension}:{value}"
+
+    def _record_args(self, kind: str, data: Dict[str, Any], zone: Optional[str],
+                     entry_id: str = '*') -> Tuple[List[str], List[Any]]:
+        dimensions = event_dimensions(data)
+        dimensions['kind'] = [kind]
+        dimensions['zone'] = [zone] if zone else []
+        keys = [self.stream] + [self._index_key(d, v) for d in INDEX_DIMENSIONS for v in dimensions[d]]
+        fields = ['kind', kind, 'zone', zone or '', 'data', json.dumps(data, default=str)]
+        return keys, [self.maxlen, self.maxlen, self.index_ttl, entry_id] + fields
+
+    def record(self, kind: str, data: Dict[str, Any], zone: Optional[str] = None) -> Optional[str]:
+        """Append an event; never raises, since the change it describes has already happened"""
+        if self.redis is None:
+            return None
+        try:
+            keys, args = self._record_args(kind, data, zone)
+            entry_id = self._script(keys=keys, args=args)
+            return entry_id.decode() if isinstance(entry_id, bytes) else entry_id
+        except Exception as e:
+            logger.error(f"Failed to write audit event {kind}: {e}")
+            return None
+
+    def record_many(self, events: Iterable[Tuple[str, Dict[str, Any], Optional[str]]], batch: int = 1000) -> int:
+        """Append (kind, data, zone) events in pipelined batches"""
+        written = 0
+        pipe = self.redis.pipeline(transaction=False)
+        for kind, data, zone in events:
+            keys, args = self._record_args(kind, data, zone)
+            self._script(keys=keys, args=args, client=pipe)
+            written += 1
+            if written % batch == 0:
+                pipe.execute()
+        pipe.execute()
+        return written
+
+    def _decode(self, entry_id: bytes, fields: Dict[bytes, bytes]) -> Dict[str, Any]:
+        entry_id = entry_id.decode()
+        return {
+            'id': entry_id,
+            'timestamp': datetime.utcfromtimestamp(id_ms(entry_id) / 1000).isoformat(),
+            'kind': fields[b'kind'].decode(),
+            'zone': fields.get(b'zone', b'').decode() or None,
+            'data': json.loads(fields[b'data']),
+        }
+
+    def query(self, kind: Optional[str] = None, zone: Optional[str] = None, backend: Optional[str] = None,
+              server: Optional[str] = None, since: Any = None, until: Any = None, limit: int = 100,
+              cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Events newest first; pass next_cursor back as cursor to read the next page"""
+        if self.redis is None:
+            return {'events': [], 'next_cursor': None}
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        since_ms, until_ms = to_stream_ms(since), to_stream_ms(until)
+        low = str(since_ms) if since_ms is not None else '-'
+        high = f"({cursor}" if cursor else (str(until_ms) if until_ms is not None else '+')
+        if cursor and until_ms is not None and id_ms(cursor) > until_ms:
+            high = str(until_ms)
+
+        filters = {'kind': kind, 'zone': zone, 'backend': backend, 'server': server}
+        # Walk the most selective index; the remaining filters are checked per entry
+        indexed = next(((d, filters[d]) for d in ('server', 'backend', 'zone', 'kind') if filters[d]), None)
+        # Read ahead when entries may be filtered out after the index lookup
+        post_filtered = sum(1 for v in filters.values() if v) > (1 if indexed else 0)
+        events: List[Dict[str, Any]] = []
+        exhausted = False
+        while len(events) < limit and not exhausted:
+            want = limit - len(events)
+            if post_filtered:
+                want = max(want, 100)
+            if indexed is None:
+                page = self.redis.xrevrange(self.stream, high, low, count=want)
+                entries = [self._decode(entry_id, fields) for entry_id, fields in page]
+                last = page[-1][0].decode() if page else None
+            else:
+                ids = [entry_id for entry_id, _ in
+                       self.redis.xrevrange(self._index_key(*indexed), high, low, count=want)]
+                pipe = self.redis.pipeline(transaction=False)
+                for entry_id in ids:
+                    pipe.xrange(self.stream, entry_id, entry_id)
+                # Entries trimmed from the main stream simply come back empty
+                entries = [self._decode(*found[0]) for found in pipe.execute() if found]
+                last = ids[-1].decode() if ids else None
+                page = ids
+            events.extend(e for e in entries if self._matches(e, filters))
+            exhausted = len(page) < want
+            if last:
+                high = f"({last}"
+        events = events[:limit]
+        next_cursor = events[-1]['id'] if len(events) == limit and not exhausted else None
+        return {'events': events, 'next_cursor': next_cursor}
+
+    @staticmethod
+    def _matches(event: Dict[str, Any], filters: Dict[str, Optional[str]]) -> bool:
+        if filters['kind'] and event['kind'] != filters['kind']:
+            return False
+        if filters['zone'] and event['zone'] != filters['zone']:
+            return False
+        if filters['backend'] or filters['server']:
+            dimensions = event_dimensions(event['data'])
+            if filters['backend'] and filters['backend'] not in dimensions['backend']:
+                return False
+            if filters['server'] and filters['server'] not in dimensions['server']:
+                return False
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        if self.redis is None:
+            return {'enabled': False}
+        length = self.redis.xlen(self.stream)
+        return {'enabled': True, 'events': length, 'maxlen': self.maxlen}
+
+
+def _legacy_entry(raw: bytes) -> Tuple[int, Dict[str, Any]]:
+    """Stream time and data of one legacy list entry; anything but a JSON object is kept as 'raw'"""
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        return 0, {'raw': raw.decode(errors='replace')}
+    try:
+        ms = to_stream_ms(data.get('timestamp')) or 0
+    except (TypeError, ValueError):
+        ms = 0
+    return ms, data
+
+
+def migrate_lists(redis_client, audit: AuditLog) -> Dict[str, int]:
+    """Move the legacy lpush lists into the audit stream, oldest event first.
+
+    One replica migrates at a time, under a lock. Each list is renamed
+    before it is read; a renamed list that is still there was left by a
+    migration that failed, and is migrated again (entries it had already
+    recorded may then appear twice).
+    """
+    counts = {kind: 0 for kind in LEGACY_LISTS.values()}
+    lock, token = f"{audit.prefix}:migrate-lock", uuid.uuid4().hex
+    if not redis_client.set(lock, token, nx=True, ex=MIGRATE_LOCK_TTL):
+        logger.info("Another replica is migrating the legacy audit lists")
+        return counts
+    try:
+        pending, claimed = [], []
+        for name, kind in LEGACY_LISTS.items():
+            keys = [key.decode() if isinstance(key, bytes) else key
+                    for key in redis_client.scan_iter(match=f"{name}:migrating*")]
+            try:
+                redis_client.rename(name, f"{name}:migrating:{token}")
+                keys.append(f"{name}:migrating:{token}")
+            except Exception:
+                pass  # list does not exist
+            for key in keys:
+                claimed.append(key)
+                for raw in reversed(redis_client.lrange(key, 0, -1)):
+                    ms, data = _legacy_entry(raw)
+                    pending.append((ms, kind, data))
+
+        # Keep original times as entry IDs; events older than the stream's tip go after it
+        pending.sort(key=lambda p: p[0])
+        tip = redis_client.xrevrange(audit.stream, '+', '-', count=1)
+        last_ms, last_seq = (int(part) for part in (tip[0][0].decode() if tip else '0-0').split('-'))
+        pipe = redis_client.pipeline(transaction=False)
+        for ms, kind, data in pending:
+            if ms > last_ms:
+                last_ms, last_seq = ms, 0
+            else:
+                last_seq += 1
+            zone = data.get('zone')
+            keys, args = audit._record_args(kind, data, zone if isinstance(zone, str) else None,
+                                            f"{last_ms}-{last_seq}")
+            audit._script(keys=keys, args=args, client=pipe)
+            counts[kind] += 1
+        pipe.execute()
+
+        if claimed:
+            redis_client.delete(*claimed)
+        return counts
+    finally:
+        redis_client.eval(RELEASE_SCRIPT, 1, lock, token)
+
+
+def main(argv: List[str]) -> int:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if argv[:1] != ['migrate']:
+        print(__doc__)
+        return 1
+    import redis
+    redis_client = redis.from_url(os.getenv('REDIS_URL', 'redis://redis:6379/0'))
+    audit = AuditLog(redis_client, maxlen=int(os.getenv('AUDIT_MAXLEN', '100000')))
+    counts = migrate_lists(redis_client, audit)
+    logger.info(f"Migrated legacy audit lists: {counts}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
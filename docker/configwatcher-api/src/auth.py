@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - Request Authentication
+Verifies JWT bearer tokens once and then serves them from an LRU cache
+until they expire, accepts a static API key for machine clients, and
+revokes tokens across replicas through Redis.
+"""
+
+import os
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import jwt
+
+logger = logging.getLogger(__name__)
+
+
+def token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+
+def load_api_keys(config_path: str) -> List[str]:
+    """API keys from API_KEY, or from security.api_key in the config file the start script writes"""
+    keys = [os.getenv('API_KEY', '')]
+    if not keys[0] and os.path.exists(config_path):
+        try:
+            import yaml
+            with open(config_path) as f:
+                config = yaml.safe_load(f) or {}
+            keys = [str((config.get('security') or {}).get('api_key') or '')]
+        except Exception as e:
+            logger.error(f"Failed to read API key from {config_path}: {e}")
+    return [key for key in keys if key]
+
+
+class Authenticator:
+    """JWT and API-key authentication with a cache of verified tokens.
+
+    Cached tokens are trusted until their exp claim. A revocation removes the
+    token from this replica's cache and is stored in Redis, where the other
+    replicas check it on a cache miss; while trust_cache() is false (no live
+    notification channel), cache hits check Redis as well.
+    """
+
+    def __init__(self, secret: str, redis_client=None, api_keys: Iterable[str] = (), cache_size: int = 10000,
+                 prefix: str = 'configwatcher:auth', algorithms: Tuple[str, ...] = ('HS256',)):
+        self.secret = secret
+        self.redis = redis_client
+        self.prefix = prefix
+        self.algorithms = list(algorithms)
+        self.cache_size = cache_size
+        # Only digests are kept, so comparing them leaks nothing about the key
+        self._api_keys = {token_digest(key) for key in api_keys if key}
+        self._cache: 'OrderedDict[bytes, Tuple[str, float]]' = OrderedDict()
+        self._revoked: Dict[bytes, float] = {}
+        self._lock = threading.Lock()
+        self.trust_cache: Callable[[], bool] = lambda: True
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def api_key_enabled(self) -> bool:
+        return bool(self._api_keys)
+
+    def _revoked_key(self, digest: bytes) -> str:
+        return f"{self.prefix}:revoked:{digest.hex()}"
+
+    def authenticate(self, authorization: Optional[str], api_key: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+        """Resolve the Authorization (or X-API-Key) header to (user, None), or (None, error message)"""
+        if api_key is None and authorization and authorization.startswith('ApiKey '):
+            api_key = authorization[7:]
+        if api_key is not None:
+            if self._api_keys and token_digest(api_key) in self._api_keys:
+                return 'api-key', None
+            return None, 'API key is invalid'
+        if not authorization:
+            return None, 'Token is missing'
+
+        token = authorization[7:] if authorization.startswith('Bearer ') else authorization
+        digest = token_digest(token)
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(digest)
+            if entry is not None:
+                if entry[1] > now:
+                    self._cache.move_to_end(digest)
+                else:
+                    del self._cache[digest]
+                    entry = None
+        if entry is not None:
+            if self.trust_cache() or not self.is_revoked(digest):
+                self.hits += 1
+                return entry[0], None
+            self.forget(digest)
+            return None, 'Token has been revoked'
+
+        self.misses += 1
+        try:
+            data = jwt.decode(token, self.secret, algorithms=self.algorithms)
+        except jwt.ExpiredSignatureError:
+            return None, 'Token has expired'
+        except jwt.InvalidTokenError:
+            return None, 'Token is invalid'
+        if self.is_revoked(digest):
+            return None, 'Token has been revoked'
+        # Tokens without an expiry are verified every time
+        if self.cache_size and data.get('exp'):
+            with self._lock:
+                self._cache[digest] = (data['user'], float(data['exp']))
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return data['user'], None
+
+    def is_revoked(self, digest: bytes) -> bool:
+        now = time.time()
+        with self._lock:
+            expires = self._revoked.get(digest)
+            if expires is not None:
+                if expires > now:
+                    return True
+                del self._revoked[digest]
+        if self.redis is None:
+            return False
+        try:
+            return bool(self.redis.exists(self._revoked_key(digest)))
+        except Exception as e:
+            # Revocation is a second line of defence; an outage must not lock everyone out
+            logger.warning(f"Could not check token revocation: {e}")
+            return False
+
+    def revoke(self, token: str) -> Optional[bytes]:
+        """Revoke a validly signed token until it expires; returns its digest, or None if already expired.
+
+        Raises jwt.InvalidTokenError for tokens this service did not issue.
+        """
+        data = jwt.decode(token, self.secret, algorithms=self.algorithms, options={'verify_exp': False})
+        digest = token_digest(token)
+        expires = float(data.get('exp') or time.time() + 86400)
+        ttl = int(expires - time.time()) + 1
+        if ttl <= 0:
+            return None
+        with self._lock:
+            self._revoked[digest] = expires
+        if self.redis is not None:
+            self.redis.set(self._revoked_key(digest), '1', ex=ttl)
+        self.forget(digest)
+        return digest
+
+    def forget(self, digest: bytes):
+        """Drop a token from the cache, e.g. when another replica revoked it"""
+        with self._lock:
+            self._cache.pop(digest, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {'cached_tokens': len(self._cache), 'hits': self.hits, 'misses': self.misses}
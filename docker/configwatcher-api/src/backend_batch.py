@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - Batch Backend Mutations
+Applies many add/remove/weight/state/addr operations in one pipelined
+runtime API session, all-or-nothing: if any command is rejected, every
+step that did succeed is undone in reverse order.
+
+Commands go out in rounds, one round trip each: the first step of every
+operation, then the second, so a step never runs after an earlier step of
+its operation failed. 'del server' cannot be undone faithfully ('show
+servers state' has no backup, check or other server settings), so
+deletions come last, once everything else has been applied.
+"""
+
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from haproxy_runtime import RuntimeClient, RuntimeAPIError, build_add_server_command, check_response
+from haproxy_stats import parse_servers_state
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_OPERATIONS = 1000
+BATCH_ACTIONS = ('add', 'remove', 'weight', 'state', 'addr')
+SERVER_STATES = ('ready', 'drain', 'maint')
+
+# srv_admin_state bits (see HAProxy's SRV_ADMF_* flags)
+ADMIN_MAINT_BITS = 0x01 | 0x02 | 0x04 | 0x20
+ADMIN_DRAIN_BITS = 0x08 | 0x10 | 0x40
+
+
+class BatchError(Exception):
+    """Raised when a batch is rejected before anything is applied"""
+
+    def __init__(self, message: str, index: Optional[int] = None):
+        super().__init__(message)
+        self.index = index
+
+
+class Step:
+    """One runtime command and the commands that undo it; None if it cannot be undone"""
+
+    def __init__(self, command: str, undo: Optional[List[str]]):
+        self.command = command
+        self.undo = undo
+
+
+def admin_state(row: Dict[str, Any]) -> str:
+    """Map a 'show servers state' row to ready/drain/maint"""
+    admin = row.get('srv_admin_state') or 0
+    if admin & ADMIN_MAINT_BITS:
+        return 'maint'
+    if admin & ADMIN_DRAIN_BITS:
+        return 'drain'
+    return 'ready'
+
+
+def server_name(operation: Dict[str, Any]) -> str:
+    server = operation.get('server')
+    if isinstance(server, dict):
+        return server.get('name', '')
+    return server or ''
+
+
+def parse_operations(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Validate the request body of a batch and return its operations"""
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        raise BatchError('operations must be a non-empty list')
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        raise BatchError(f'At most {MAX_BATCH_OPERATIONS} operations per batch')
+
+    seen = set()
+    for i, op in enumerate(operations):
+        if not isinstance(op, dict):
+            raise BatchError('Each operation must be an object', i)
+        if op.get('action') not in BATCH_ACTIONS:
+            raise BatchError(f"action must be one of {', '.join(BATCH_ACTIONS)}", i)
+        if not op.get('backend') or not server_name(op):
+            raise BatchError('backend and server are required', i)
+        if op['action'] == 'add':
+            server = op['server']
+            if not isinstance(server, dict) or not all(k in server for k in ('name', 'address', 'port')):
+                raise BatchError('add requires server with name, address and port', i)
+        elif op['action'] == 'weight':
+            if not isinstance(op.get('weight'), int) or not 0 <= op['weight'] <= 256:
+                raise BatchError('weight must be an integer between 0 and 256', i)
+        elif op['action'] == 'state':
+            if op.get('state') not in SERVER_STATES:
+                raise BatchError(f"state must be one of {', '.join(SERVER_STATES)}", i)
+        elif op['action'] == 'addr':
+            if not op.get('address') or not isinstance(op.get('port'), int):
+                raise BatchError('addr requires address and an integer port', i)
+        key = (op['backend'], server_name(op))
+        if key in seen:
+            raise BatchError(f'Server {key[0]}/{key[1]} appears more than once', i)
+        seen.add(key)
+    return operations
+
+
+def plan_steps(operations: List[Dict[str, Any]],
+               current: Dict[Tuple[str, str], Dict[str, Any]],
+               backends: set) -> List[List[Step]]:
+    """Turn operations into runtime steps, checking them against live server state.
+
+    Every operation is checked against the state before the batch; a server
+    appears at most once per batch, so give an added server its weight and
+    state in the add itself.
+    """
+    plan = []
+    for i, op in enumerate(operations):
+        backend, name = op['backend'], server_name(op)
+        target = f"{backend}/{name}"
+        if backend not in backends:
+            raise BatchError(f'Backend {backend} not found', i)
+        row = current.get((backend, name))
+
+        if op['action'] == 'add':
+            if row is not None:
+                raise BatchError(f'Server {target} already exists', i)
+            steps = [Step(build_add_server_command(backend, op['server']), [f"del server {target}"])]
+            # Dynamic servers start in maintenance; enable them unless asked not to
+            state = op['server'].get('state', 'ready')
+            if state != 'maint':
+                steps.append(Step(f"set server {target} state {state}", [f"set server {target} state maint"]))
+            plan.append(steps)
+            continue
+
+        if row is None:
+            raise BatchError(f'Server {target} not found', i)
+        previous_state = admin_state(row)
+
+        if op['action'] == 'remove':
+            plan.append([
+                Step(f"set server {target} state maint", [f"set server {target} state {previous_state}"]),
+                Step(f"del server {target}", None),
+            ])
+        elif op['action'] == 'weight':
+            plan.append([Step(f"set server {target} weight {op['weight']}",
+                              [f"set server {target} weight {row.get('srv_uweight')}"])])
+        elif op['action'] == 'addr':
+            plan.append([Step(f"set server {target} addr {op['address']} port {op['port']}",
+                              [f"set server {target} addr {row.get('srv_addr')} port {row.get('srv_port')}"])])
+        else:
+            plan.append([Step(f"set server {target} state {op['state']}",
+                              [f"set server {target} state {previous_state}"])])
+    return plan
+
+
+def rounds(plan: List[List[Step]]) -> List[List[Step]]:
+    """Group steps into round trips: the n-th step of every operation in round n,
+    and the steps that cannot be undone in a last round of their own"""
+    grouped: List[List[Step]] = []
+    final: List[Step] = []
+    for op_steps in plan:
+        for i, step in enumerate(op_steps):
+            if step.undo is None:
+                final.append(step)
+                continue
+            while len(grouped) <= i:
+                grouped.append([])
+            grouped[i].append(step)
+    return grouped + [final] if final else grouped
+
+
+def apply_batch(runtime: RuntimeClient, operations: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Apply a validated batch in one runtime session, rolling back on partial failure"""
+    backends = sorted({op['backend'] for op in operations})
+    with runtime.session() as session:
+        # Live state of every touched backend
+        states = session.execute([f"show servers state {b}" for b in backends])
+        current: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        known_backends = set()
+        for backend, output in zip(backends, states):
+            if output.startswith(('Can\'t find backend', 'No such backend')):
+                continue
+            known_backends.add(backend)
+            current.update(parse_servers_state(output))
+
+        plan = plan_steps(operations, current, known_backends)
+        commands = sum(len(op_steps) for op_steps in plan)
+
+        # One round trip per round; a failed round stops the batch
+        failure = None
+        applied: List[Step] = []
+        for round_steps in rounds(plan):
+            outputs = session.execute([step.command for step in round_steps])
+            for step, output in zip(round_steps, outputs):
+                try:
+                    check_response(step.command, output)
+                    applied.append(step)
+                except RuntimeAPIError as e:
+                    if failure is None:
+                        failure = e
+            if failure is not None:
+                break
+
+        if failure is None:
+            return {'success': True, 'operations': len(operations), 'commands': commands}
+
+        # Undo whatever did succeed, newest first; deleted servers stay deleted
+        undo = [cmd for step in reversed(applied) if step.undo for cmd in step.undo]
+        not_restored = [step.command.split()[-1] for step in applied if step.undo is None]
+        rollback_errors = []
+        for cmd, output in zip(undo, session.execute(undo) if undo else []):
+            try:
+                check_response(cmd, output)
+            except RuntimeAPIError as e:
+                rollback_errors.append(str(e))
+        if rollback_errors or not_restored:
+            logger.error(f"Batch rollback incomplete: {rollback_errors}, not restored: {not_restored}")
+        return {
+            'success': False,
+            'error': str(failure),
+            'failed_command': failure.command,
+            'rolled_back': len(applied) - len(not_restored),
+            'rollback_errors': rollback_errors,
+            'not_restored': not_restored,
+        }
@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - Blockchain Node Registry Watcher
+Follows NodeAdded/NodeRemoved/NodeUpdated events of the node registry
+contract, keeps a local snapshot of the registry keyed by node address and
+applies only the difference to HAProxy's live server set.
+"""
+
+import os
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from haproxy_runtime import RuntimeClient
+from haproxy_stats import parse_servers_state
+from backend_batch import apply_batch
+from shared_state import SharedState, LeaderElection
+
+logger = logging.getLogger(__name__)
+
+# Servers owned by the watcher; anything else in the backend is left alone
+MANAGED_PREFIX = 'node_'
+
+REGISTRY_EVENTS = ('NodeAdded', 'NodeRemoved', 'NodeUpdated')
+
+NODE_REGISTRY_ABI = [
+    {
+        'anonymous': False, 'name': 'NodeAdded', 'type': 'event',
+        'inputs': [
+            {'indexed': False, 'name': 'address', 'type': 'string'},
+            {'indexed': False, 'name': 'port', 'type': 'uint16'},
+            {'indexed': False, 'name': 'grpcPort', 'type': 'uint16'},
+            {'indexed': False, 'name': 'zone', 'type': 'string'},
+        ],
+    },
+    {
+        'anonymous': False, 'name': 'NodeRemoved', 'type': 'event',
+        'inputs': [
+            {'indexed': False, 'name': 'address', 'type': 'string'},
+        ],
+    },
+    {
+        'anonymous': False, 'name': 'NodeUpdated', 'type': 'event',
+        'inputs': [
+            {'indexed': False, 'name': 'address', 'type': 'string'},
+            {'indexed': False, 'name': 'port', 'type': 'uint16'},
+            {'indexed': False, 'name': 'grpcPort', 'type': 'uint16'},
+            {'indexed': False, 'name': 'zone', 'type': 'string'},
+            {'indexed': False, 'name': 'active', 'type': 'bool'},
+        ],
+    },
+]
+
+
+def server_name_for(address: str) -> str:
+    return f"{MANAGED_PREFIX}{address.replace('.', '_')}"
+
+
+class RegistryEvent:
+    """A decoded registry contract event"""
+
+    def __init__(self, name: str, block: int, log_index: int, args: Dict[str, Any]):
+        self.name = name
+        self.block = block
+        self.log_index = log_index
+        self.args = args
+
+    @classmethod
+    def from_log(cls, entry) -> 'RegistryEvent':
+        return cls(entry['event'], entry['blockNumber'], entry['logIndex'], dict(entry['args']))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'event': self.name, 'block': self.block, 'log_index': self.log_index, 'args': self.args}
+
+
+class Web3EventSource:
+    """Registry events from a node through web3 log filters"""
+
+    def __init__(self, w3, contract_address: str, start_block: int = 0):
+        self.w3 = w3
+        self.contract = w3.eth.contract(address=w3.to_checksum_address(contract_address), abi=NODE_REGISTRY_ABI)
+        self.next_block = start_block
+        self._filters = None
+
+    def poll(self) -> List[RegistryEvent]:
+        """New events since the last poll; the first poll replays history from start_block"""
+        entries = []
+        try:
+            if self._filters is None:
+                self._filters = [getattr(self.contract.events, name).create_filter(fromBlock=self.next_block)
+                                 for name in REGISTRY_EVENTS]
+                for f in self._filters:
+                    entries.extend(f.get_all_entries())
+            else:
+                for f in self._filters:
+                    entries.extend(f.get_new_entries())
+        except Exception as e:
+            # Nodes drop idle filters; recreate them from the last block we processed
+            logger.warning(f"Registry event filter failed, recreating: {e}")
+            self._filters = None
+            return []
+        events = sorted((RegistryEvent.from_log(e) for e in entries), key=lambda e: (e.block, e.log_index))
+        if events:
+            self.next_block = events[-1].block + 1
+        return events
+
+    def reset(self, start_block: int = 0):
+        self.next_block = start_block
+        self._filters = None
+
+    @property
+    def head(self) -> Optional[int]:
+        return self.w3.eth.block_number
+
+
+class RecordedEventSource:
+    """Registry events replayed from a JSON fixture, for development and tests"""
+
+    def __init__(self, path: str):
+        with open(path, 'r') as f:
+            data = json.load(f)
+        self.events = [RegistryEvent(e['event'], e['block'], e.get('log_index', i), e['args'])
+                       for i, e in enumerate(data)]
+        self.events.sort(key=lambda e: (e.block, e.log_index))
+        self.position = 0
+
+    def poll(self) -> List[RegistryEvent]:
+        events, self.position = self.events[self.position:], len(self.events)
+        return events
+
+    def reset(self, start_block: int = 0):
+        self.position = next((i for i, e in enumerate(self.events) if e.block >= start_block), len(self.events))
+
+    @property
+    def head(self) -> Optional[int]:
+        return self.events[-1].block if self.events else 0
+
+
+class NodeRegistry:
+    """Local snapshot of the node registry, keyed by node address"""
+
+    def __init__(self, zone: Optional[str] = None):
+        self.zone = zone
+        self.nodes: Dict[str, Dict[str, Any]] = {}
+        self.block = 0
+        self.last_event: Optional[str] = None
+
+    def apply(self, event: RegistryEvent) -> Optional[str]:
+        """Fold one event into the snapshot; returns the affected address"""
+        args = event.args
+        address = args['address']
+        if event.name == 'NodeRemoved':
+            self.nodes.pop(address, None)
+        else:
+            node = self.nodes.get(address, {'address': address, 'registered_block': event.block})
+            node.update({
+                'port': int(args.get('port', node.get('port', 80))),
+                'grpc_port': int(args.get('grpcPort', node.get('grpc_port', 443))),
+                'zone': args.get('zone', node.get('zone')),
+                'status': 'active' if args.get('active', True) else 'inactive',
+                'last_seen': datetime.utcnow().isoformat(),
+                'block': event.block,
+            })
+            self.nodes[address] = node
+        self.block = max(self.block, event.block)
+        self.last_event = datetime.utcnow().isoformat()
+        return address
+
+    def node_list(self) -> List[Dict[str, Any]]:
+        return list(self.nodes.values())
+
+    def desired_servers(self) -> Dict[str, Dict[str, Any]]:
+        """HAProxy servers the registry asks for in this zone, keyed by server name"""
+        desired = {}
+        for node in self.nodes.values():
+            if node['status'] != 'active' or (self.zone and node.get('zone') != self.zone):
+                continue
+            desired[server_name_for(node['address'])] = {
+                'name': server_name_for(node['address']),
+                'address': node['address'],
+                'port': node['port'],
+                'check': True,
+            }
+        return desired
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'zone': self.zone, 'block': self.block, 'nodes': self.nodes}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'NodeRegistry':
+        registry = cls(data.get('zone'))
+        registry.block = data.get('block', 0)
+        registry.nodes = data.get('nodes', {})
+        return registry
+
+
+def compute_diff(backend: str, desired: Dict[str, Dict[str, Any]],
+                 live: Dict[Tuple[str, str], Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Batch operations that turn the live managed servers into the desired set"""
+    live_managed = {name: row for (be, name), row in live.items()
+                    if be == backend and name.startswith(MANAGED_PREFIX)}
+    operations = []
+    for name, server in desired.items():
+        row = live_managed.get(name)
+        if row is None:
+            operations.append({'action': 'add', 'backend': backend, 'server': server})
+        elif str(row.get('srv_addr')) != server['address'] or row.get('srv_port') != server['port']:
+            operations.append({'action': 'addr', 'backend': backend, 'server': name,
+                               'address': server['address'], 'port': server['port']})
+    for name in live_managed:
+        if name not in desired:
+            operations.append({'action': 'remove', 'backend': backend, 'server': name})
+    return operations
+
+
+class RegistryWatcher:
+    """Keeps the registry snapshot current and syncs the delta into HAProxy"""
+
+    def __init__(self, source, runtime: RuntimeClient, backend: str = 'ddc_nodes_http',
+                 zone: Optional[str] = None, redis_client=None, state_key: Optional[str] = None,
+                 apply: Optional[Callable[[List[Dict[str, Any]]], Dict[str, Any]]] = None):
+        self.source = source
+        self.runtime = runtime
+        self.apply = apply or (lambda operations: apply_batch(runtime, operations))
+        self.backend = backend
+        self.redis = redis_client
+        # One snapshot per zone: each zone's watcher syncs its own HAProxy from a shared Redis
+        self.state_key = state_key or (f"blockchain:registry:{zone}" if zone else 'blockchain:registry')
+        self.registry = self._load_state() or NodeRegistry(zone)
+        if self.registry.block:
+            # Resume from the persisted snapshot instead of replaying history
+            source.reset(self.registry.block + 1)
+        self.last_sync: Optional[Dict[str, Any]] = None
+
+    def _load_state(self) -> Optional[NodeRegistry]:
+        if not self.redis:
+            return None
+        try:
+            data = self.redis.get(self.state_key)
+            return NodeRegistry.from_dict(json.loads(data)) if data else None
+        except Exception as e:
+            logger.warning(f"Could not load registry snapshot: {e}")
+            return None
+
+    def _save_state(self):
+        if self.redis:
+            try:
+                self.redis.set(self.state_key, json.dumps(self.registry.to_dict()))
+            except Exception as e:
+                logger.warning(f"Could not save registry snapshot: {e}")
+
+    def refresh(self) -> List[RegistryEvent]:
+        """Pull new events into the snapshot"""
+        events = self.source.poll()
+        for event in events:
+            self.registry.apply(event)
+        if events:
+            self._save_state()
+        return events
+
+    def live_servers(self) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        return parse_servers_state(self.runtime.execute(f"show servers state {self.backend}"))
+
+    def apply_delta(self) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """Diff the snapshot against live state and apply only the operations that differ"""
+        operations = compute_diff(self.backend, self.registry.desired_servers(), self.live_servers())
+        if not operations:
+            return operations, {'success': True}
+        return operations, self.apply(operations)
+
+    def sync(self, force_full: bool = False) -> Dict[str, Any]:
+        """Bring HAProxy in line with the registry, touching only servers that differ"""
+        start = time.monotonic()
+        if force_full:
+            self.registry = NodeRegistry(self.registry.zone)
+            self.source.reset()
+        events = self.refresh()
+        operations, result = self.apply_delta()
+        self.last_sync = {
+            'success': result.get('success', False),
+            'events_processed': len(events),
+            'changes_detected': len(operations),
+            'changes_applied': len(operations) if result.get('success') else 0,
+            'changes': operations,
+            'block': self.registry.block,
+            'sync_duration': round(time.monotonic() - start, 3),
+            'timestamp': datetime.utcnow().isoformat(),
+        }
+        if not result.get('success'):
+            self.last_sync['error'] = result.get('error')
+        return self.last_sync
+
+    def follow(self, interval: float = 2.0, should_run: Optional[Callable[[], bool]] = None,
+               reconcile_interval: float = 30.0):
+        """Poll for new events forever, syncing whenever the registry changes.
+
+        A sync that failed is retried every interval until it succeeds, and
+        live state is reconciled every reconcile_interval even without new
+        events, which restores dynamic servers that a reload dropped. With
+        several replicas, should_run (a leader check) keeps all but one idle.
+        """
+        # Reconcile on start and on taking over leadership
+        dirty, last_reconcile = True, 0.0
+        while True:
+            try:
+                if should_run is None or should_run():
+                    if self.refresh():
+                        dirty = True
+                    if dirty or time.monotonic() - last_reconcile >= reconcile_interval:
+                        last_reconcile = time.monotonic()
+                        operations, result = self.apply_delta()
+                        dirty = not result.get('success')
+                        if operations:
+                            logger.info(f"Registry sync applied {len(operations)} change(s): "
+                                        f"success={result.get('success')}")
+                        if dirty:
+                            logger.warning(f"Registry sync failed, retrying: {result.get('error')}")
+                else:
+                    dirty = True
+            except Exception as e:
+                logger.error(f"Registry watcher error: {e}")
+            time.sleep(interval)
+
+
+def build_event_source(w3=None):
+    """Event source from the environment: a recorded fixture, or the registry contract via web3"""
+    fixture = os.getenv('NODE_REGISTRY_FIXTURE')
+    if fixture:
+        return RecordedEventSource(fixture)
+    contract = os.getenv('NODE_REGISTRY_ADDRESS')
+    if w3 is not None and contract:
+        return Web3EventSource(w3, contract, int(os.getenv('NODE_REGISTRY_START_BLOCK', '0')))
+    return None
+
+
+def start_monitoring():
+    """Entry point used by start-configwatcher.sh to run the watcher as its own process"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    w3 = None
+    try:
+        from web3 import Web3
+        w3 = Web3(Web3.HTTPProvider(os.getenv('BLOCKCHAIN_RPC', 'http://blockchain:8545')))
+    except ImportError:
+        pass
+    source = build_event_source(w3)
+    if source is None:
+        logger.warning("No node registry configured (NODE_REGISTRY_ADDRESS or NODE_REGISTRY_FIXTURE); watcher idle")
+        return
+    redis_client = None
+    try:
+        import redis
+        redis_client = redis.from_url(os.getenv('REDIS_URL', 'redis://redis:6379/0'))
+    except Exception as e:
+        logger.warning(f"Redis unavailable for registry snapshot: {e}")
+    runtime = RuntimeClient(os.getenv('HAPROXY_SOCKET', '/var/run/haproxy.sock'))
+    shared_state = SharedState(redis_client, prefix=f"configwatcher:state:{os.getenv('ZONE', 'eu')}")
+    watcher = RegistryWatcher(
+        source,
+        runtime,
+        backend=os.getenv('NODE_REGISTRY_BACKEND', 'ddc_nodes_http'),
+        zone=os.getenv('ZONE', 'eu'),
+        redis_client=redis_client,
+        apply=lambda ops: shared_state.apply(ops, lambda o: apply_batch(runtime, o), source='blockchain'),
+    )
+    leader = LeaderElection(redis_client, f"registry-watcher:{os.getenv('ZONE', 'eu')}")
+    watcher.follow(float(os.getenv('NODE_REGISTRY_POLL_INTERVAL', '2')), should_run=leader.is_leader,
+                   reconcile_interval=float(os.getenv('NODE_REGISTRY_RECONCILE_INTERVAL', '30')))
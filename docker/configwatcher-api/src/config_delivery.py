@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - Configuration Delivery
+Builds the GET /config response for the sync agents that poll it. It
+answers If-None-Match with 304 from a hash kept in memory, sends only the
+changed sections to agents that pass ?since=<version>, and compresses
+with zstd or gzip. Encoded bodies are cached per config hash, so repeated
+polls of an unchanged config cost neither a file read nor compression.
+"""
+
+import gzip
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from config_store import ConfigStore, VersionNotFound, section_delta
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+    zstandard = None
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """Accept-Encoding as {coding: q}"""
+    codings = {}
+    for item in (header or '').split(','):
+        coding, _, params = item.strip().partition(';')
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding.strip().lower()] = q
+    return codings
+
+
+def negotiate_encoding(header: Optional[str]) -> Optional[str]:
+    """Best content coding the client accepts: zstd, then gzip, else None (identity)"""
+    codings = parse_accept_encoding(header)
+    offered = (['zstd'] if ZSTD_AVAILABLE else []) + ['gzip']
+    best, best_q = None, 0.0
+    for coding in offered:
+        q = codings.get(coding, codings.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def encode(body: bytes, encoding: Optional[str]) -> bytes:
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match comparison (weak, as RFC 9110 requires for it)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    return any((tag.strip()[2:] if tag.strip().startswith('W/') else tag.strip()) == opaque
+               for tag in if_none_match.split(','))
+
+
+class ConfigPublisher:
+    """Conditional, delta and compressed responses for one configuration file.
+
+    snapshot() returns (text, sha256, mtime, version record or None) and is
+    expected to be cheap while the file is unchanged.
+    """
+
+    def __init__(self, snapshot: Callable[[], Tuple[str, str, float, Optional[Dict[str, Any]]]],
+                 store: ConfigStore, zone: str, cache_size: int = 64):
+        self.snapshot = snapshot
+        self.store = store
+        self.zone = zone
+        self.cache_size = cache_size
+        # (hash, since, requested coding) -> (coding actually used, body)
+        self._bodies: 'OrderedDict[Tuple, Tuple[Optional[str], bytes]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _document(self, text: str, digest: str, mtime: float, version: Optional[Dict[str, Any]],
+                  since: Optional[str]) -> bytes:
+        document: Dict[str, Any] = {
+            'zone': self.zone,
+            'version': version['version'] if version else None,
+            'hash': digest,
+            'timestamp': datetime.utcfromtimestamp(mtime).isoformat()
+        }
+        base = None
+        if since is not None:
+            try:
+                base = self.store.get(since)
+                if not self.store.owns(base):
+                    raise VersionNotFound(since)
+            except VersionNotFound:
+                # Unknown to this store (e.g. pruned) or another zone's: the agent gets everything
+                base = None
+                document['since_unknown'] = True
+        if base is None:
+            document.update(full=True, config=text)
+        else:
+            document.update(full=False, since=base['version'])
+            document.update(section_delta(self.store.text(base['hash']), text))
+        return json.dumps(document).encode()
+
+    def respond(self, if_none_match: Optional[str] = None, since: Optional[str] = None,
+                accept_encoding: Optional[str] = None) -> Tuple[int, Dict[str, str], bytes]:
+        """(status, headers, body) for GET /config"""
+        text, digest, mtime, version = self.snapshot()
+        etag = f'W/"{digest[:32]}"'
+        headers = {
+            'ETag': etag,
+            'Last-Modified': datetime.utcfromtimestamp(mtime).strftime('%a, %d %b %Y %H:%M:%S GMT'),
+            'Cache-Control': 'no-cache',
+            'Vary': 'Accept-Encoding'
+        }
+        if etag_matches(if_none_match, etag):
+            return 304, headers, b''
+
+        key = (digest, since, negotiate_encoding(accept_encoding))
+        with self._lock:
+            entry = self._bodies.get(key)
+            if entry is not None:
+                self._bodies.move_to_end(key)
+        if entry is None:
+            body, encoding = self._document(text, digest, mtime, version, since), key[2]
+            if encoding and len(body) >= MIN_COMPRESS_SIZE:
+                body = encode(body, encoding)
+            else:
+                encoding = None
+            entry = (encoding, body)
+            with self._lock:
+                self._bodies[key] = entry
+                while len(self._bodies) > self.cache_size:
+                    self._bodies.popitem(last=False)
+        encoding, body = entry
+        headers['Content-Type'] = 'application/json'
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        return 200, headers, body
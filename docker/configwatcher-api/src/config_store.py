@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - Versioned Configuration Store
+Keeps every configuration HAProxy was given as a content-addressed blob.
+Most blobs are line deltas against the previous version, with a full
+keyframe at intervals so no version takes more than a few steps to rebuild.
+Versions can be diffed structurally (sections, servers, directives) and
+compared by their effective content, ignoring comments and whitespace.
+"""
+
+import os
+import json
+import zlib
+import fcntl
+import difflib
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from haproxy_config import HAProxyConfig, Line, Section
+
+logger = logging.getLogger(__name__)
+
+FULL, DELTA = b'F', b'D'
+
+
+class VersionNotFound(KeyError):
+    """No version with that number or hash"""
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _normalize(line: Line) -> str:
+    """A directive as HAProxy sees it: no comment, single spaces"""
+    return ' '.join([line.keyword] + line.args)
+
+
+def effective_lines(text: str) -> List[str]:
+    """Directives in order, without blank lines, comments or layout"""
+    lines = (Line(raw) for raw in text.splitlines())
+    return [_normalize(line) for line in lines if line.keyword]
+
+
+def effective_hash(text: str) -> str:
+    """Hash that only changes when HAProxy would behave differently"""
+    return content_hash('\n'.join(effective_lines(text)))
+
+
+def _encode_delta(base: List[str], lines: List[str]) -> List[Any]:
+    """Ops that rebuild lines from base: [start, end] copies base[start:end], a list of strings inserts them"""
+    ops: List[Any] = []
+    matcher = difflib.SequenceMatcher(None, base, lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif tag in ('replace', 'insert'):
+            ops.append(lines[j1:j2])
+    return ops
+
+
+def _apply_delta(base: List[str], ops: List[Any]) -> List[str]:
+    lines: List[str] = []
+    for op in ops:
+        if op and isinstance(op[0], int):
+            lines.extend(base[op[0]:op[1]])
+        else:
+            lines.extend(op)
+    return lines
+
+
+class ConfigStore:
+    """Content-addressed config history shared by every worker on this host.
+
+    objects/ holds one compressed blob per distinct config, versions.jsonl one
+    record per version in order. Writers serialize on a lock file, so workers
+    that commit at the same time get consecutive version numbers. Each record
+    carries the zone whose HAProxy the config belongs to.
+    """
+
+    def __init__(self, root: str, keyframe_interval: int = 32, cache_size: int = 16, zone: Optional[str] = None):
+        self.root = root
+        self.zone = zone
+        self.keyframe_interval = keyframe_interval
+        self.objects_dir = os.path.join(root, 'objects')
+        self.log_path = os.path.join(root, 'versions.jsonl')
+        self._lock_path = os.path.join(root, '.lock')
+        self._texts: 'OrderedDict[str, str]' = OrderedDict()
+        self._cache_size = cache_size
+        self._versions: List[Dict[str, Any]] = []
+        self._log_size = 0
+        self._guard = threading.RLock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with self._guard, open(self._lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], digest[2:])
+
+    # Objects
+
+    def _read_object(self, digest: str) -> Tuple[bytes, Any]:
+        try:
+            with open(self._object_path(digest), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            raise VersionNotFound(digest)
+        return data[:1], zlib.decompress(data[1:])
+
+    def _write_object(self, digest: str, data: bytes):
+        path = self._object_path(digest)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.obj-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def text(self, digest: str) -> str:
+        """Rebuild the config stored under digest"""
+        with self._guard:
+            text = self._texts.get(digest)
+            if text is not None:
+                self._texts.move_to_end(digest)
+                return text
+        chain = []
+        kind, payload = self._read_object(digest)
+        while kind == DELTA:
+            delta = json.loads(payload)
+            chain.append(delta['ops'])
+            base = delta['base']
+            with self._guard:
+                cached = self._texts.get(base)
+            if cached is not None:
+                lines = cached.splitlines(keepends=True)
+                break
+            kind, payload = self._read_object(base)
+        else:
+            lines = payload.decode().splitlines(keepends=True)
+        for ops in reversed(chain):
+            lines = _apply_delta(lines, ops)
+        text = ''.join(lines)
+        self._remember(digest, text)
+        return text
+
+    def _remember(self, digest: str, text: str):
+        with self._guard:
+            self._texts[digest] = text
+            self._texts.move_to_end(digest)
+            while len(self._texts) > self._cache_size:
+                self._texts.popitem(last=False)
+
+    def _store(self, digest: str, text: str, parent: Optional[Dict[str, Any]]) -> int:
+        """Write the blob for text and return its delta chain depth (0 for a keyframe)"""
+        full = FULL + zlib.compress(text.encode())
+        depth = 0
+        data = full
+        if parent is not None and parent['depth'] + 1 < self.keyframe_interval:
+            base = self.text(parent['hash'])
+            ops = _encode_delta(base.splitlines(keepends=True), text.splitlines(keepends=True))
+            delta = DELTA + zlib.compress(json.dumps({'base': parent['hash'], 'ops': ops},
+                                                     separators=(',', ':')).encode())
+            if len(delta) < len(full):
+                data, depth = delta, parent['depth'] + 1
+        self._write_object(digest, data)
+        self._remember(digest, text)
+        return depth
+
+    # Versions
+
+    def _load_versions(self) -> List[Dict[str, Any]]:
+        """Records from versions.jsonl, reading only what other workers appended since last time"""
+        try:
+            size = os.path.getsize(self.log_path)
+        except FileNotFoundError:
+            return []
+        with self._guard:
+            if size != self._log_size:
+                if size < self._log_size:
+                    self._versions, self._log_size = [], 0
+                with open(self.log_path, 'rb') as f:
+                    f.seek(self._log_size)
+                    chunk = f.read(size - self._log_size)
+                # A record is only complete once its newline is written
+                end = chunk.rfind(b'\n') + 1
+                self._versions.extend(json.loads(line) for line in chunk[:end].splitlines() if line.strip())
+                self._log_size += end
+            return self._versions
+
+    def commit(self, text: str, source: str = 'api', message: str = '',
+               path: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+        """Record text as a new version unless it is already the latest; returns (version, created)"""
+        digest = content_hash(text)
+        with self._locked():
+            versions = self._load_versions()
+            head = versions[-1] if versions else None
+            if head is not None and head['hash'] == digest:
+                return head, False
+            if os.path.exists(self._object_path(digest)):
+                # Seen before (e.g. a rollback target): reuse the blob
+                depth = next((v['depth'] for v in reversed(versions) if v['hash'] == digest), 0)
+            else:
+                depth = self._store(digest, text, head)
+            record = {
+                'version': head['version'] + 1 if head else 1,
+                'hash': digest,
+                'effective_hash': effective_hash(text),
+                'parent': head['hash'] if head else None,
+                'depth': depth,
+                'size': len(text.encode()),
+                'source': source,
+                'message': message,
+                'path': path,
+                'zone': self.zone,
+                'created_at': datetime.utcnow().isoformat()
+            }
+            with open(self.log_path, 'ab') as f:
+                f.write(json.dumps(record, separators=(',', ':')).encode() + b'\n')
+            self._load_versions()
+        return record, True
+
+    def versions(self, limit: int = 50, before: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Newest first"""
+        versions = self._load_versions()
+        if before is not None:
+            versions = [v for v in versions if v['version'] < before]
+        return list(reversed(versions[-limit:])) if limit > 0 else []
+
+    def head(self) -> Optional[Dict[str, Any]]:
+        versions = self._load_versions()
+        return versions[-1] if versions else None
+
+    def get(self, ref: str) -> Dict[str, Any]:
+        """A version by number or by (a prefix of at least 7 characters of) its hash"""
+        versions = self._load_versions()
+        ref = str(ref)
+        if ref.isdigit():
+            number = int(ref)
+            # Numbers are dense, so the record is almost always at index number - 1
+            if 0 < number <= len(versions) and versions[number - 1]['version'] == number:
+                return versions[number - 1]
+            for version in versions:
+                if version['version'] == number:
+                    return version
+        elif len(ref) >= 7:
+            for version in reversed(versions):
+                if version['hash'].startswith(ref):
+                    return version
+        raise VersionNotFound(ref)
+
+    def owns(self, version: Dict[str, Any]) -> bool:
+        """Whether a version belongs to this store's zone (versions recorded without a zone are assumed to)"""
+        return self.zone is None or version.get('zone') in (None, self.zone)
+
+    def stats(self) -> Dict[str, Any]:
+        """Stored bytes against what full copies of every version would take"""
+        versions = self._load_versions()
+        stored = 0
+        for dirpath, _, filenames in os.walk(self.objects_dir):
+            stored += sum(os.path.getsize(os.path.join(dirpath, name)) for name in filenames)
+        return {
+            'versions': len(versions),
+            'objects': len({v['hash'] for v in versions}),
+            'stored_bytes': stored,
+            'full_copy_bytes': sum(v['size'] for v in versions)
+        }
+
+
+def _section_label(section: Section) -> str:
+    return f"{section.kind} {section.name}".strip()
+
+
+def _labelled(config: HAProxyConfig) -> 'OrderedDict[str, Section]':
+    """Sections by label; a repeated label (e.g. a second unnamed defaults) gets a '#2' suffix"""
+    sections: 'OrderedDict[str, Section]' = OrderedDict()
+    for section in config.sections:
+        label, n = _section_label(section), 1
+        while label in sections:
+            n += 1
+            label = f"{_section_label(section)}#{n}"
+        sections[label] = section
+    return sections
+
+
+def section_delta(old: str, new: str) -> Dict[str, Any]:
+    """What a client holding old needs to rebuild new: the text of every added or
+    changed section, the removed labels and the new section order"""
+    old_config, new_config = HAProxyConfig.parse(old), HAProxyConfig.parse(new)
+    old_sections, new_sections = _labelled(old_config), _labelled(new_config)
+    old_preamble = ''.join(line.raw for line in old_config.preamble)
+    new_preamble = ''.join(line.raw for line in new_config.preamble)
+    return {
+        'preamble': new_preamble if new_preamble != old_preamble else None,
+        'order': list(new_sections),
+        'changed': {label: section.render() for label, section in new_sections.items()
+                    if label not in old_sections or old_sections[label].render() != section.render()},
+        'removed': [label for label in old_sections if label not in new_sections]
+    }
+
+
+def diff_configs(old: str, new: str, context: int = 3) -> Dict[str, Any]:
+    """Structured difference between two configs: sections, servers and directives"""
+    old_config, new_config = HAProxyConfig.parse(old), HAProxyConfig.parse(new)
+    old_sections = {_section_label(s): s for s in old_config.sections}
+    new_sections = {_section_label(s): s for s in new_config.sections}
+
+    changed = []
+    for label, section in new_sections.items():
+        before = old_sections.get(label)
+        if before is None:
+            continue
+        servers: Dict[str, List[Any]] = {'added': [], 'removed': [], 'changed': []}
+        for name, line in section.servers.items():
+            previous = before.servers.get(name)
+            if previous is None:
+                servers['added'].append(_normalize(line))
+            elif _normalize(previous) != _normalize(line):
+                servers['changed'].append({'name': name, 'from': _normalize(previous), 'to': _normalize(line)})
+        servers['removed'] = [_normalize(line) for name, line in before.servers.items() if name not in section.servers]
+
+        old_directives = [_normalize(l) for l in before.lines if l.keyword and l.keyword != 'server']
+        new_directives = [_normalize(l) for l in section.lines if l.keyword and l.keyword != 'server']
+        added = [d for d in new_directives if d not in old_directives]
+        removed = [d for d in old_directives if d not in new_directives]
+        # Order matters for acl / use_backend / http-request rules
+        reordered = not added and not removed and old_directives != new_directives
+        if any(servers.values()) or added or removed or reordered:
+            entry: Dict[str, Any] = {'section': label}
+            if any(servers.values()):
+                entry['servers'] = {key: value for key, value in servers.items() if value}
+            if added or removed:
+                entry['directives'] = {'added': added, 'removed': removed}
+            if reordered:
+                entry['reordered'] = True
+            changed.append(entry)
+
+    unified = ''.join(difflib.unified_diff(
+        old.splitlines(keepends=True), new.splitlines(keepends=True), 'a/haproxy.cfg', 'b/haproxy.cfg', n=context))
+    return {
+        'identical': old == new,
+        'effective_identical': effective_lines(old) == effective_lines(new),
+        'sections': {
+            'added': [label for label in new_sections if label not in old_sections],
+            'removed': [label for label in old_sections if label not in new_sections],
+            'changed': changed
+        },
+        'unified': unified
+    }
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - Two-Stage Configuration Validator
+Stage one checks a configuration in-process: duplicate proxy and server
+names, use_backend/default_backend targets that do not exist, out-of-range
+ports, and errorfiles or certificates that are missing. Only a config that
+passes goes to stage two, 'haproxy -c', whose results are cached by the
+hash of the config and of the files it references (map and ACL files
+included, since HAProxy loads them at startup).
+
+In 'remote' mode the validator runs where HAProxy's files are not visible
+(its own container): missing files are warnings, and 'haproxy -c' is
+skipped when haproxy is not installed here or a referenced file is missing.
+"""
+
+import os
+import re
+import shutil
+import hashlib
+import subprocess
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from haproxy_config import HAProxyConfig, Line, ServerLine
+
+# Status codes HAProxy accepts in 'errorfile'
+ERRORFILE_CODES = {200, 400, 401, 403, 404, 405, 407, 408, 410, 413, 425, 429, 500, 501, 502, 503, 504}
+
+# Proxy sections that route requests to a backend
+ROUTING_SECTIONS = ('defaults', 'frontend', 'listen')
+
+# Address prefixes that do not carry a TCP port
+NON_INET_PREFIXES = ('unix@', 'abns@', 'fd@', 'sockpair@', '/')
+
+# bind options naming a file that must exist
+BIND_FILE_OPTIONS = ('crt', 'ca-file', 'crl-file', 'crt-list')
+
+# strict: files must exist and 'haproxy -c' must run; remote: see the module docstring
+VALIDATE_MODES = ('strict', 'remote')
+
+PORT_RE = re.compile(r'^(\d+)(?:-(\d+))?$')
+
+# Map files in converters: map(<file>), map_str(<file>[,<default>]) ...
+MAP_FILE_RE = re.compile(r'\bmap(?:_\w+)?\(([^,)\s]+)')
+
+
+def _line_numbers(config: HAProxyConfig) -> Dict[int, int]:
+    """Line number of every parsed line, by identity"""
+    numbers, n = {}, 0
+    for line in config.preamble:
+        n += 1
+        numbers[id(line)] = n
+    for section in config.sections:
+        n += 1
+        numbers[id(section.header)] = n
+        for line in section.lines:
+            n += 1
+            numbers[id(line)] = n
+    return numbers
+
+
+def _port_error(port: str) -> Optional[str]:
+    """Why a port (or 'low-high' range) is invalid, or None"""
+    match = PORT_RE.match(port)
+    if not match:
+        return f"invalid port '{port}'"
+    for value in match.groups():
+        if value is not None and not 1 <= int(value) <= 65535:
+            return f"port {value} out of range 1-65535"
+    if match.group(2) and int(match.group(2)) < int(match.group(1)):
+        return f"port range '{port}' is reversed"
+    return None
+
+
+class PreChecker:
+    """In-process structural and semantic checks (stage one)"""
+
+    def __init__(self, base_dir: Optional[str] = None, check_files: bool = True, missing_level: str = 'error'):
+        # Relative file paths resolve against this directory, as they would for haproxy
+        self.base_dir = base_dir
+        self.check_files = check_files
+        self.missing_level = missing_level
+
+    def _path(self, path: str) -> str:
+        if os.path.isabs(path) or not self.base_dir:
+            return path
+        return os.path.join(self.base_dir, path)
+
+    def check(self, text: str) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Return (issues, referenced files); any issue with level 'error' fails the config"""
+        config = HAProxyConfig.parse(text)
+        numbers = _line_numbers(config)
+        issues: List[Dict[str, Any]] = []
+        files: List[str] = []
+
+        def report(line: Line, section: Optional[str], message: str, level: str = 'error'):
+            issues.append({'level': level, 'line': numbers.get(id(line)), 'section': section, 'message': message})
+
+        def require_file(line: Line, label: str, path: str, what: str):
+            resolved = self._path(path)
+            files.append(resolved)
+            if self.check_files and not os.path.exists(resolved):
+                report(line, label, f"{what} '{path}' does not exist", self.missing_level)
+
+        for line in config.preamble:
+            if line.keyword:
+                report(line, None, f"'{line.keyword}' is outside of any section")
+
+        # Proxies with overlapping capabilities may not share a name
+        seen: Dict[str, str] = {}
+        backends, http_errors = set(), set()
+        for section in config.sections:
+            kind, name = section.kind, section.name
+            if kind in ('frontend', 'backend', 'listen'):
+                if not name:
+                    report(section.header, kind, f"{kind} section has no name")
+                previous = seen.get(name)
+                if previous is not None and (previous == kind or 'listen' in (previous, kind)):
+                    report(section.header, f"{kind} {name}", f"{kind} '{name}' has the same name as another {previous}")
+                seen.setdefault(name, kind)
+                if kind in ('backend', 'listen'):
+                    backends.add(name)
+            elif kind == 'http-errors':
+                http_errors.add(name)
+
+        for section in config.sections:
+            label = f"{section.kind} {section.name}".strip()
+            server_names: Dict[str, ServerLine] = {}
+            for line in section.lines:
+                keyword = line.keyword
+                if not keyword:
+                    continue
+                args = line.args
+                if not isinstance(line, ServerLine):
+                    # Pattern (-f) and map files of ACLs and rules, which HAProxy loads at startup
+                    for i, arg in enumerate(args[:-1]):
+                        if arg == '-f':
+                            require_file(line, label, args[i + 1], 'pattern file')
+                    for path in MAP_FILE_RE.findall(' '.join(args)):
+                        require_file(line, label, path, 'map file')
+                if isinstance(line, ServerLine) and section.kind in ('backend', 'listen'):
+                    if line.name in server_names:
+                        report(line, label, f"duplicate server name '{line.name}'")
+                    server_names[line.name] = line
+                    self._check_server(line, label, report)
+                elif keyword == 'bind':
+                    self._check_bind(line, label, report, require_file)
+                elif keyword in ('use_backend', 'default_backend') and section.kind in ROUTING_SECTIONS:
+                    target = args[0] if args else ''
+                    # Names built from log-format expressions are resolved at runtime
+                    if not target:
+                        report(line, label, f"{keyword} needs a backend name")
+                    elif '%[' not in target and target not in backends:
+                        report(line, label, f"{keyword} references unknown backend '{target}'")
+                elif keyword == 'errorfile':
+                    if len(args) < 2:
+                        report(line, label, "errorfile needs a status code and a file")
+                        continue
+                    if not args[0].isdigit() or int(args[0]) not in ERRORFILE_CODES:
+                        report(line, label, f"errorfile status code '{args[0]}' is not supported")
+                    require_file(line, label, args[1], 'errorfile')
+                elif keyword == 'errorfiles':
+                    if not args or args[0] not in http_errors:
+                        report(line, label, f"errorfiles references unknown http-errors section "
+                                            f"'{args[0] if args else ''}'")
+        return issues, files
+
+    @staticmethod
+    def _check_server(line: ServerLine, label: str, report):
+        address = line.args[1] if len(line.args) > 1 else ''
+        if not address:
+            report(line, label, f"server '{line.name}' has no address")
+            return
+        if address.startswith(NON_INET_PREFIXES) or '$' in address:
+            return
+        host, sep, port = address.rpartition(':')
+        # A bare IPv6 address has colons but no port
+        if sep and port and ':' not in host.strip('[]') and port[0] not in '+-':
+            error = _port_error(port)
+            if error:
+                report(line, label, f"server '{line.name}': {error}")
+        check_port = line.param('port')
+        if check_port is not None:
+            error = _port_error(check_port)
+            if error:
+                report(line, label, f"server '{line.name}' check {error}")
+
+    @staticmethod
+    def _check_bind(line: Line, label: str, report, require_file):
+        args = line.args
+        if not args:
+            report(line, label, "bind needs an address")
+            return
+        for address in args[0].split(','):
+            if address.startswith(NON_INET_PREFIXES) or '$' in address:
+                continue
+            host, sep, port = address.rpartition(':')
+            if not sep:
+                report(line, label, f"bind address '{address}' has no port")
+                continue
+            error = _port_error(port)
+            if error:
+                report(line, label, f"bind {error}")
+        for i, word in enumerate(args[1:-1], 1):
+            if word in BIND_FILE_OPTIONS:
+                require_file(line, label, args[i + 1], word)
+
+
+class ConfigValidator:
+    """Stage one in-process, then 'haproxy -c' with results cached by content hash"""
+
+    def __init__(self, haproxy_bin: str = 'haproxy', base_dir: Optional[str] = None, cache_size: int = 256,
+                 timeout: float = 120.0, mode: str = 'strict'):
+        if mode not in VALIDATE_MODES:
+            raise ValueError(f"mode must be one of {', '.join(VALIDATE_MODES)}")
+        self.haproxy_bin = haproxy_bin
+        self.mode = mode
+        self.prechecker = PreChecker(base_dir, missing_level='error' if mode == 'strict' else 'warning')
+        self.cache_size = cache_size
+        self.timeout = timeout
+        self._cache: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def cache_key(text: str, files: List[str]) -> str:
+        """Hash of the config and of the size and mtime of every file it references"""
+        digest = hashlib.sha256(text.encode())
+        for path in sorted(set(files)):
+            try:
+                st = os.stat(path)
+                digest.update(f"\0{path}\0{st.st_mtime_ns}\0{st.st_size}".encode())
+            except OSError:
+                digest.update(f"\0{path}\0missing".encode())
+        return digest.hexdigest()
+
+    def validate(self, text: str) -> Dict[str, Any]:
+        """Validate a configuration; 'stage' says which stage decided the result"""
+        start = time.perf_counter()
+        issues, files = self.prechecker.check(text)
+        errors = [issue for issue in issues if issue['level'] == 'error']
+        if errors:
+            return {
+                'valid': False,
+                'stage': 'precheck',
+                'output': '',
+                'errors': '\n'.join(f"line {i['line']}: [{i['section']}] {i['message']}" for i in errors),
+                'issues': issues,
+                'duration_ms': round((time.perf_counter() - start) * 1000, 3)
+            }
+
+        skipped = self._skip_reason(files)
+        if skipped:
+            issues = issues + [{'level': 'warning', 'line': None, 'section': None,
+                                'message': f"haproxy -c skipped: {skipped}"}]
+            return {
+                'valid': True,
+                'stage': 'precheck',
+                'output': '',
+                'errors': '',
+                'issues': issues,
+                'duration_ms': round((time.perf_counter() - start) * 1000, 3)
+            }
+
+        key = self.cache_key(text, files)
+        with self._lock:
+            key_lock = self._inflight.setdefault(key, threading.Lock())
+        try:
+            # Identical configs submitted together share one haproxy run
+            with key_lock:
+                with self._lock:
+                    cached = self._cache.get(key)
+                    if cached is not None:
+                        self._cache.move_to_end(key)
+                        self.hits += 1
+                if cached is None:
+                    self.misses += 1
+                    cached, returncode = self._run_haproxy(text)
+                    # 0 and 1 are haproxy's answers; anything else (a signal, a crash) is not cached
+                    if returncode in (0, 1):
+                        with self._lock:
+                            self._cache[key] = cached
+                            while len(self._cache) > self.cache_size:
+                                self._cache.popitem(last=False)
+                    result = dict(cached, cached=False)
+                else:
+                    result = dict(cached, cached=True)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        result.update(stage='haproxy', issues=issues, config_hash=key,
+                      duration_ms=round((time.perf_counter() - start) * 1000, 3))
+        return result
+
+    def _skip_reason(self, files: List[str]) -> Optional[str]:
+        """Why 'haproxy -c' cannot run here in remote mode, or None"""
+        if self.mode != 'remote':
+            return None
+        if shutil.which(self.haproxy_bin) is None:
+            return f"'{self.haproxy_bin}' is not installed here"
+        missing = [path for path in files if not os.path.exists(path)]
+        if missing:
+            return f"{len(missing)} referenced file(s) are not visible here"
+        return None
+
+    def _run_haproxy(self, text: str) -> Tuple[Dict[str, Any], int]:
+        """Run 'haproxy -c' on a private temp file; raises if haproxy cannot be run"""
+        fd, path = tempfile.mkstemp(prefix='haproxy_test_', suffix='.cfg')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(text)
+            result = subprocess.run(
+                [self.haproxy_bin, '-c', '-f', path],
+                capture_output=True, text=True, timeout=self.timeout,
+                cwd=self.prechecker.base_dir or None
+            )
+        finally:
+            os.unlink(path)
+        return {
+            'valid': result.returncode == 0,
+            'output': result.stdout,
+            'errors': result.stderr
+        }, result.returncode
+
+    def stats(self) -> Dict[str, int]:
+        return {'cached_results': len(self._cache), 'hits': self.hits, 'misses': self.misses}
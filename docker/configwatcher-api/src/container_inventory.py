@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - Container Inventory
+Keeps an in-memory copy of the Docker containers, indexed by zone, network
+and IP address. It lists everything once, then follows the Docker events
+stream and re-inspects only the containers an event names. Listing
+containers, looking one up and finding a free IP are memory reads.
+"""
+
+import os
+import re
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set
+
+from metrics import docker_call
+
+try:
+    from docker.errors import NotFound
+except ImportError:
+    class NotFound(Exception):
+        pass
+
+logger = logging.getLogger(__name__)
+
+# Container events that can change what the inventory holds (exec_*, health_status, etc. cannot)
+CONTAINER_ACTIONS = {'create', 'start', 'restart', 'die', 'stop', 'pause', 'unpause', 'rename', 'update', 'destroy'}
+NETWORK_ACTIONS = {'connect', 'disconnect'}
+
+# Zone naming conventions: 'eu-backend-1' and networks such as 'docker_eu_zone'
+NAME_ZONE_RE = re.compile(r'([A-Za-z0-9]+)-backend')
+NETWORK_ZONE_RE = re.compile(r'([A-Za-z0-9]+)_zone')
+
+
+class ContainerNotFound(KeyError):
+    pass
+
+
+def _from_summary(summary: Dict[str, Any]) -> Dict[str, Any]:
+    """Record from a 'GET /containers/json' entry; details are filled in on first use"""
+    created = summary.get('Created')
+    return {
+        'id': summary['Id'],
+        'name': (summary.get('Names') or ['/'])[0].lstrip('/'),
+        'status': summary.get('State', 'unknown'),
+        'image': summary.get('Image') or 'unknown',
+        'created': (datetime.fromtimestamp(created, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+                    if isinstance(created, (int, float)) else created),
+        'started': None,
+        'networks': (summary.get('NetworkSettings') or {}).get('Networks') or {},
+        'environment': None,
+        'mounts': [f"{m.get('Source', '')}:{m.get('Destination', '')}" for m in summary.get('Mounts') or []],
+        'complete': False
+    }
+
+
+def _from_inspect(attrs: Dict[str, Any]) -> Dict[str, Any]:
+    """Record from 'GET /containers/{id}/json'"""
+    config = attrs.get('Config') or {}
+    state = attrs.get('State') or {}
+    return {
+        'id': attrs['Id'],
+        'name': attrs.get('Name', '').lstrip('/'),
+        'status': state.get('Status', 'unknown'),
+        'image': config.get('Image') or 'unknown',
+        'created': attrs.get('Created'),
+        'started': state.get('StartedAt'),
+        'networks': (attrs.get('NetworkSettings') or {}).get('Networks') or {},
+        'environment': config.get('Env') or [],
+        'mounts': [f"{m.get('Source', '')}:{m.get('Destination', '')}" for m in attrs.get('Mounts') or []],
+        'complete': True
+    }
+
+
+def address_of(info: Optional[Dict[str, Any]]) -> Optional[str]:
+    """A container's IP on one network; a container that never ran only has the requested one"""
+    info = info or {}
+    return info.get('IPAddress') or (info.get('IPAMConfig') or {}).get('IPv4Address') or None
+
+
+def zones_of(record: Dict[str, Any]) -> Set[str]:
+    """Zones a container belongs to, by its name or its networks"""
+    zones = set(NAME_ZONE_RE.findall(record['name']))
+    for network in record['networks']:
+        zones.update(NETWORK_ZONE_RE.findall(network))
+    return zones
+
+
+class ContainerInventory:
+    """Containers of one Docker daemon, kept current from its events stream.
+
+    Until the stream is being followed (at startup, or after it broke and
+    before the resync that follows), reads list the containers directly.
+    """
+
+    def __init__(self, client, retry_interval: float = 5.0):
+        # A docker.DockerClient; only the low-level client (client.api) is used
+        self.api = client.api
+        self.retry_interval = retry_interval
+        self.watching = False
+        self.events_seen = 0
+        self.syncs = 0
+        self._lock = threading.RLock()
+        self._containers: Dict[str, Dict[str, Any]] = {}
+        self._names: Dict[str, str] = {}
+        self._by_zone: Dict[str, Set[str]] = {}
+        self._by_network: Dict[str, Dict[str, str]] = {}
+        self._by_ip: Dict[str, Set[str]] = {}
+        self._stream = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+
+    def start(self):
+        """Start following the events stream in this process (idempotent, fork-aware)"""
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        self._pid = os.getpid()
+        self.watching = False
+        self._thread = threading.Thread(target=self._watch, name='container-inventory', daemon=True)
+        self._thread.start()
+
+    def _watch(self):
+        while True:
+            try:
+                # Events from just before the listing are replayed; applying them again is harmless
+                since = int(time.time()) - 1
+                self.sync()
+                with docker_call('events'):
+                    self._stream = self.api.events(since=since, decode=True,
+                                                   filters={'type': ['container', 'network']})
+                self.watching = True
+                for event in self._stream:
+                    self.apply(event)
+                logger.warning("Docker events stream ended, resyncing")
+            except Exception as e:
+                logger.warning(f"Docker events stream lost, resyncing: {e}")
+            finally:
+                self.watching = False
+                self._close_stream()
+            time.sleep(self.retry_interval)
+
+    def _close_stream(self):
+        stream, self._stream = self._stream, None
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+    def sync(self):
+        """Replace the inventory with a full listing"""
+        with docker_call('list'):
+            summaries = self.api.containers(all=True)
+        with self._lock:
+            self._containers.clear()
+            self._names.clear()
+            self._by_zone.clear()
+            self._by_network.clear()
+            self._by_ip.clear()
+            for summary in summaries:
+                self._add(_from_summary(summary))
+            self.syncs += 1
+
+    def _ensure_current(self):
+        if not self.watching:
+            self.sync()
+
+    def apply(self, event: Dict[str, Any]):
+        """Bring the inventory up to date with one Docker event"""
+        self.events_seen += 1
+        kind, action = event.get('Type'), event.get('Action', '')
+        actor = event.get('Actor') or {}
+        if kind == 'container' and action in CONTAINER_ACTIONS:
+            container_id = actor.get('ID')
+        elif kind == 'network' and action in NETWORK_ACTIONS:
+            container_id = (actor.get('Attributes') or {}).get('container')
+        else:
+            return
+        if not container_id:
+            return
+        if action == 'destroy':
+            self.forget(container_id)
+        else:
+            self.refresh(container_id)
+
+    def refresh(self, container_id: str) -> Optional[Dict[str, Any]]:
+        """Re-inspect one container; forgets it if it no longer exists"""
+        try:
+            with docker_call('inspect'):
+                attrs = self.api.inspect_container(container_id)
+        except NotFound:
+            self.forget(container_id)
+            return None
+        record = _from_inspect(attrs)
+        with self._lock:
+            self._remove(record['id'])
+            self._add(record)
+        return record
+
+    def forget(self, container_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._remove(self._names.get(container_id, container_id))
+
+    def _add(self, record: Dict[str, Any]):
+        container_id = record['id']
+        self._containers[container_id] = record
+        self._names[record['name']] = container_id
+        for zone in zones_of(record):
+            self._by_zone.setdefault(zone, set()).add(container_id)
+        for network, info in record['networks'].items():
+            ip = address_of(info)
+            if ip:
+                self._by_network.setdefault(network, {})[ip] = container_id
+                self._by_ip.setdefault(ip, set()).add(container_id)
+
+    def _remove(self, container_id: str) -> Optional[Dict[str, Any]]:
+        record = self._containers.pop(container_id, None)
+        if record is None:
+            return None
+        if self._names.get(record['name']) == container_id:
+            del self._names[record['name']]
+        for zone in zones_of(record):
+            members = self._by_zone.get(zone)
+            if members is not None:
+                members.discard(container_id)
+                if not members:
+                    del self._by_zone[zone]
+        for network, info in record['networks'].items():
+            ip = address_of(info)
+            if not ip:
+                continue
+            addresses = self._by_network.get(network, {})
+            if addresses.get(ip) == container_id:
+                del addresses[ip]
+                if not addresses:
+                    del self._by_network[network]
+            owners = self._by_ip.get(ip)
+            if owners is not None:
+                owners.discard(container_id)
+                if not owners:
+                    del self._by_ip[ip]
+        return record
+
+    def _lookup(self, name_or_id: str) -> Optional[Dict[str, Any]]:
+        container_id = self._names.get(name_or_id, name_or_id)
+        record = self._containers.get(container_id)
+        if record is None and len(name_or_id) >= 12:
+            # Short IDs, as the Docker CLI shows them
+            matches = [r for cid, r in self._containers.items() if cid.startswith(name_or_id)]
+            if len(matches) == 1:
+                record = matches[0]
+        return record
+
+    def get(self, name_or_id: str) -> Dict[str, Any]:
+        """Record of one container, inspected in full if only its summary is known"""
+        self._ensure_current()
+        with self._lock:
+            record = self._lookup(name_or_id)
+        if record is None or not record['complete']:
+            # Not seen yet (its event may still be on the way) or never inspected
+            record = self.refresh(record['id'] if record else name_or_id)
+            if record is None:
+                raise ContainerNotFound(name_or_id)
+        return record
+
+    def containers(self, zone: Optional[str] = None) -> List[Dict[str, Any]]:
+        self._ensure_current()
+        with self._lock:
+            if zone is None:
+                return list(self._containers.values())
+            return [self._containers[cid] for cid in self._by_zone.get(zone, ())]
+
+    def network_ips(self, network: str) -> Dict[str, str]:
+        """IP -> container ID on one network"""
+        self._ensure_current()
+        with self._lock:
+            return dict(self._by_network.get(network, {}))
+
+    def zone_ips(self, zone: str) -> Set[str]:
+        """IPs in use on the zone's networks"""
+        self._ensure_current()
+        with self._lock:
+            return {ip for network, addresses in self._by_network.items()
+                    if f'{zone}_zone' in network for ip in addresses}
+
+    def by_ip(self, ip: str) -> List[Dict[str, Any]]:
+        self._ensure_current()
+        with self._lock:
+            return [self._containers[cid] for cid in self._by_ip.get(ip, ())]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'watching': self.watching,
+            'containers': len(self._containers),
+            'zones': {zone: len(ids) for zone, ids in self._by_zone.items()},
+            'networks': len(self._by_network),
+            'events': self.events_seen,
+            'syncs': self.syncs
+        }
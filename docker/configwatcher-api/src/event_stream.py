@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - Event Stream
+Fans out backend state changes, config changes, reloads and container
+events to every streaming client (Server-Sent Events or WebSocket). Server
+state changes come from a single poller per process that diffs successive
+'show stat' snapshots, so the HAProxy load does not grow with the number
+of subscribers.
+"""
+
+import os
+import json
+import uuid
+import queue
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from prometheus_client import Counter, Gauge
+
+from haproxy_stats import AGGREGATE_ROWS, StatsSnapshot
+
+logger = logging.getLogger(__name__)
+
+EVENTS_PUBLISHED = Counter('configwatcher_events_published_total', 'Events published to stream subscribers', ['type'])
+EVENT_SUBSCRIBERS = Gauge('configwatcher_event_subscribers', 'Connected event stream clients',
+                          multiprocess_mode='livesum')
+
+EVENT_TYPES = (
+    'server_state', 'server_added', 'server_removed', 'backend_state',
+    'config_change', 'config_version', 'reload', 'container',
+)
+
+
+def _health(status: Any) -> str:
+    """'UP 1/3' (going down) and 'UP' are the same state for subscribers"""
+    return str(status).split(' ', 1)[0] if status else 'unknown'
+
+
+def server_states(snapshot: StatsSnapshot) -> Dict[Tuple[str, str], str]:
+    """(proxy, server) -> status for every backend and server row"""
+    names = zip(snapshot.column('pxname'), snapshot.column('svname'), snapshot.column('status'))
+    return {(proxy, server): status for proxy, server, status in names if server != 'FRONTEND'}
+
+
+def diff_server_states(old: Dict[Tuple[str, str], str],
+                       new: Dict[Tuple[str, str], str]) -> List[Tuple[str, Dict[str, Any]]]:
+    """Events turning the old states into the new ones"""
+    events = []
+    for key, status in new.items():
+        proxy, server = key
+        previous = old.get(key)
+        if previous is None:
+            if server not in AGGREGATE_ROWS:
+                events.append(('server_added', {'backend': proxy, 'server': server, 'status': status}))
+        elif _health(previous) != _health(status):
+            kind = 'backend_state' if server == 'BACKEND' else 'server_state'
+            data = {'backend': proxy, 'from': previous, 'to': status}
+            if kind == 'server_state':
+                data['server'] = server
+            events.append((kind, data))
+    for proxy, server in old.keys() - new.keys():
+        if server not in AGGREGATE_ROWS:
+            events.append(('server_removed', {'backend': proxy, 'server': server}))
+    return events
+
+
+class Subscription:
+    """One client's bounded queue of events.
+
+    A client that falls behind by more than the queue size loses the backlog
+    and receives a single 'resync' event instead, telling it to refetch state.
+    """
+
+    def __init__(self, types: Optional[Iterable[str]] = None, maxsize: int = 256,
+                 loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.types = set(types) if types else None
+        self.loop = loop
+        self.lagged = False
+        self.lag_reason = 'client fell behind'
+        self.dropped = 0
+        self._queue = asyncio.Queue(maxsize) if loop is not None else queue.Queue(maxsize)
+
+    def wants(self, event: Dict[str, Any]) -> bool:
+        return self.types is None or event['type'] in self.types or event['type'] == 'resync'
+
+    def deliver(self, event: Dict[str, Any]):
+        """Called from any thread"""
+        if not self.wants(event):
+            return
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._put, event)
+        else:
+            self._put(event)
+
+    def _put(self, event: Dict[str, Any]):
+        try:
+            self._queue.put_nowait(event)
+        except (asyncio.QueueFull, queue.Full):
+            self.lagged = True
+            self.dropped += 1
+
+    def _resync(self) -> Dict[str, Any]:
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        event = {'id': None, 'type': 'resync', 'time': datetime.utcnow().isoformat(),
+                 'data': {'reason': self.lag_reason, 'dropped': self.dropped}}
+        self.lagged = False
+        self.lag_reason = 'client fell behind'
+        return event
+
+    async def next(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Next event for an asyncio subscriber, or None after timeout"""
+        if self.lagged:
+            return self._resync()
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Next event for a thread subscriber, or None after timeout"""
+        if self.lagged:
+            return self._resync()
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBus:
+    """In-process publish/subscribe with a short history for Last-Event-ID resumes.
+
+    Event ids are '<stream>:<n>'. The stream changes with every process, so a
+    client that reconnects to another worker gets a 'resync' instead of a gap.
+    """
+
+    def __init__(self, history: int = 1000, queue_size: int = 256):
+        self.history_size = history
+        self.queue_size = queue_size
+        self.published = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._reset()
+        self.on_subscribe: List[Callable[[], None]] = []
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self.stream = uuid.uuid4().hex[:8]
+        self._seq = 0
+        self._history: deque = deque(maxlen=self.history_size)
+        self._subscribers: List[Subscription] = []
+
+    def _check_fork(self):
+        # Created before gunicorn forks; each worker needs its own stream
+        if self._pid != os.getpid():
+            self._reset()
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers) if self._pid == os.getpid() else 0
+
+    def publish(self, kind: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self._check_fork()
+            self._seq += 1
+            event = {'id': f"{self.stream}:{self._seq}", 'type': kind,
+                     'time': datetime.utcnow().isoformat(), 'data': data}
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+            self.published += 1
+        EVENTS_PUBLISHED.labels(type=kind).inc()
+        for subscription in subscribers:
+            subscription.deliver(event)
+        return event
+
+    def subscribe(self, types: Optional[Iterable[str]] = None, last_event_id: Optional[str] = None,
+                  loop: Optional[asyncio.AbstractEventLoop] = None) -> Subscription:
+        """Register a subscriber; with last_event_id, the events it missed are queued first"""
+        subscription = Subscription(types, self.queue_size, loop)
+        with self._lock:
+            self._check_fork()
+            if last_event_id:
+                missed = self._since(last_event_id)
+                if missed is None:
+                    subscription.lagged = True
+                    subscription.lag_reason = 'events after Last-Event-ID are no longer available'
+                else:
+                    for event in missed[-self.queue_size:]:
+                        if subscription.wants(event):
+                            subscription._queue.put_nowait(event)
+            self._subscribers.append(subscription)
+        EVENT_SUBSCRIBERS.inc()
+        for callback in self.on_subscribe:
+            callback()
+        return subscription
+
+    def _since(self, last_event_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Events after last_event_id, or None if they are no longer (or never were) in the history"""
+        stream, _, seq = last_event_id.partition(':')
+        if stream != self.stream or not seq.isdigit():
+            return None
+        seq = int(seq)
+        if seq >= self._seq:
+            return []
+        oldest = self._seq - len(self._history) + 1
+        if seq + 1 < oldest:
+            return None
+        return list(self._history)[seq + 1 - oldest:]
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+                EVENT_SUBSCRIBERS.dec()
+
+    def stats(self) -> Dict[str, Any]:
+        return {'stream': self.stream, 'subscribers': self.subscriber_count, 'published': self.published,
+                'last_id': f"{self.stream}:{self._seq}"}
+
+
+class StatePoller:
+    """The one 'show stat' poller behind every subscriber of this process.
+
+    Runs only while someone is subscribed. Stats come through the shared
+    stats cache, so a poll often costs no socket call at all.
+    """
+
+    def __init__(self, bus: EventBus, fetch_stats: Callable[[], StatsSnapshot],
+                 config_snapshot: Optional[Callable[[], Tuple]] = None, interval: float = 1.0):
+        self.bus = bus
+        self.fetch_stats = fetch_stats
+        self.config_snapshot = config_snapshot
+        self.interval = interval
+        self.polls = 0
+        self._states: Optional[Dict[Tuple[str, str], str]] = None
+        self._config_hash: Optional[str] = None
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._lock = threading.Lock()
+        bus.on_subscribe.append(self.start)
+
+    def start(self):
+        """Start (or wake) the poller thread in this process"""
+        self._wake.set()
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._states = None
+            self._thread = threading.Thread(target=self._loop, name='event-poller', daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            if not self.bus.subscriber_count:
+                # Idle: forget the baseline so a new subscriber does not get stale transitions
+                self._states = None
+                self._wake.clear()
+                self._wake.wait()
+                continue
+            start = time.monotonic()
+            try:
+                self.poll()
+            except Exception as e:
+                logger.warning(f"Event poll failed: {e}")
+            time.sleep(max(0.0, self.interval - (time.monotonic() - start)))
+
+    def poll(self):
+        """Diff the current state against the previous poll and publish the changes"""
+        self.polls += 1
+        states = server_states(self.fetch_stats())
+        if self._states is not None:
+            for kind, data in diff_server_states(self._states, states):
+                self.bus.publish(kind, data)
+        self._states = states
+
+        if self.config_snapshot is not None:
+            _, digest, _, version = self.config_snapshot()
+            if self._config_hash is not None and digest != self._config_hash:
+                self.bus.publish('config_version', {
+                    'hash': digest, 'version': version['version'] if version else None
+                })
+            self._config_hash = digest
+
+
+def parse_types(value: Optional[str]) -> Optional[List[str]]:
+    """?types=server_state,reload; raises ValueError for unknown types"""
+    if not value:
+        return None
+    types = [t.strip() for t in value.split(',') if t.strip()]
+    unknown = [t for t in types if t not in EVENT_TYPES]
+    if unknown:
+        raise ValueError(f"Unknown event types: {', '.join(unknown)}; use {', '.join(EVENT_TYPES)}")
+    return types
+
+
+def format_sse(event: Dict[str, Any]) -> bytes:
+    """One Server-Sent Events message"""
+    lines = []
+    if event.get('id'):
+        lines.append(f"id: {event['id']}")
+    lines.append(f"event: {event['type']}")
+    lines.append(f"data: {json.dumps(event)}")
+    return ('\n'.join(lines) + '\n\n').encode()
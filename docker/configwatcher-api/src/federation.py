@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - Cross-Zone Federation
+Applies a backend change set in every zone from one ConfigWatcher. The
+change is applied here, appended to this zone's change log and pushed to
+all peer zones at once over pooled keep-alive connections, and each zone
+answers with an acknowledgement.
+
+Each zone keeps a version vector: for every origin zone, the number of
+the last change set it applied from there. A push carries every change
+the peer is known to lack, so a zone that missed some gets exactly those.
+A zone that was down also pulls what it missed from each peer itself.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, ContextManager, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from backend_batch import BatchError, parse_operations
+from metrics import FEDERATION_PUSH_LATENCY
+
+logger = logging.getLogger(__name__)
+
+# Change sets per push or pull request
+MAX_CHANGES_PER_REQUEST = 500
+
+
+class FederationError(Exception):
+    pass
+
+
+def parse_peers(spec: str, zone: str) -> Dict[str, str]:
+    """'eu=http://eu-configwatcher:8080,us=http://us-configwatcher:8080' -> {zone: base URL}.
+
+    The entry for this zone is dropped, so every zone can share one setting.
+    """
+    peers = {}
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, url = item.partition('=')
+        if not sep or not name.strip() or not url.strip():
+            raise ValueError(f"Federation peer '{item}' must look like zone=http://host:port")
+        if name.strip() != zone:
+            peers[name.strip()] = url.strip().rstrip('/')
+    return peers
+
+
+def parse_changes(data: Any) -> Tuple[str, List[Dict[str, Any]]]:
+    """Validate a pushed {origin, changes} body"""
+    origin = data.get('origin') if isinstance(data, dict) else None
+    changes = data.get('changes') if isinstance(data, dict) else None
+    if not isinstance(origin, str) or not origin or not isinstance(changes, list):
+        raise FederationError('origin and a list of changes are required')
+    if len(changes) > MAX_CHANGES_PER_REQUEST:
+        raise FederationError(f'At most {MAX_CHANGES_PER_REQUEST} changes per request')
+    for change in changes:
+        if not isinstance(change, dict) or not isinstance(change.get('seq'), int) or change['seq'] < 1 \
+                or change.get('origin') != origin or not isinstance(change.get('operations'), list):
+            raise FederationError(f'Each change needs a positive seq, origin {origin} and operations')
+        change.setdefault('id', f"{origin}:{change['seq']}")
+    return origin, changes
+
+
+class ChangeLog:
+    """Change sets that originated in one zone, and that zone's version vector.
+
+    Change sets are numbered 1, 2, ... per origin. The vector maps each
+    origin to the last number this zone applied from it; the zone's own
+    entry is the head of its log. The replicas of a zone share both
+    through Redis; without it they are kept in memory.
+    """
+
+    def __init__(self, zone: str, redis_client=None, prefix: str = 'configwatcher:federation',
+                 max_changes: int = 10000):
+        self.zone = zone
+        self.redis = redis_client
+        self.max_changes = max_changes
+        # Zones may share one Redis, so every key is per zone
+        self.prefix = f"{prefix}:{zone}"
+        self._lock = threading.Lock()
+        self._head = 0
+        self._changes: Dict[int, str] = {}
+        self._vector: Dict[str, int] = {}
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}:{name}"
+
+    def append(self, operations: List[Dict[str, Any]], zones: List[str], message: str = '',
+               source: str = 'api') -> Dict[str, Any]:
+        """Number and store a change set"""
+        if self.redis is not None:
+            seq = int(self.redis.incr(self._key('head')))
+        else:
+            with self._lock:
+                self._head += 1
+                seq = self._head
+        change = {
+            'id': f"{self.zone}:{seq}",
+            'origin': self.zone,
+            'seq': seq,
+            'zones': zones,
+            'operations': operations,
+            'message': message,
+            'source': source,
+            'created_at': datetime.utcnow().isoformat()
+        }
+        raw = json.dumps(change)
+        if self.redis is not None:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hset(self._key('changes'), seq, raw)
+            if seq > self.max_changes:
+                pipe.hdel(self._key('changes'), seq - self.max_changes)
+            pipe.execute()
+        else:
+            with self._lock:
+                self._changes[seq] = raw
+                self._changes.pop(seq - self.max_changes, None)
+        return change
+
+    def head(self) -> int:
+        if self.redis is not None:
+            return int(self.redis.get(self._key('head')) or 0)
+        with self._lock:
+            return self._head
+
+    def since(self, seq: int, limit: int = MAX_CHANGES_PER_REQUEST) -> Tuple[List[Dict[str, Any]], bool]:
+        """Change sets after seq, oldest first, and whether some of them were already pruned"""
+        head = self.head()
+        oldest = max(1, head - self.max_changes + 1)
+        numbers = list(range(max(seq + 1, oldest), head + 1))[:limit]
+        if not numbers:
+            return [], seq + 1 < oldest
+        if self.redis is not None:
+            raw = self.redis.hmget(self._key('changes'), numbers)
+        else:
+            with self._lock:
+                raw = [self._changes.get(n) for n in numbers]
+        changes = []
+        for item in raw:
+            if item is None:
+                # Numbered but not stored yet by a concurrent append
+                break
+            changes.append(json.loads(item))
+        return changes, seq + 1 < oldest
+
+    def applied(self, origin: str) -> int:
+        """Last change set applied from origin"""
+        if self.redis is not None:
+            return int(self.redis.hget(self._key('vector'), origin) or 0)
+        with self._lock:
+            return self._vector.get(origin, 0)
+
+    def advance(self, origin: str, seq: int):
+        """Record origin's change seq as applied; callers hold the lock of that origin"""
+        if self.redis is not None:
+            self.redis.hset(self._key('vector'), origin, seq)
+        else:
+            with self._lock:
+                self._vector[origin] = seq
+
+    def vector(self) -> Dict[str, int]:
+        if self.redis is not None:
+            vector = {k.decode(): int(v) for k, v in self.redis.hgetall(self._key('vector')).items()}
+        else:
+            with self._lock:
+                vector = dict(self._vector)
+        vector[self.zone] = self.head()
+        return vector
+
+
+class Federation:
+    """Fans change sets out to peer zones and applies the ones they send.
+
+    apply(operations, change_id) applies a backend batch in this zone and
+    returns its result; lock(name) is a cluster-wide lock such as
+    SharedState.lock. Peers authenticate this zone by its api_key.
+    """
+
+    def __init__(self, zone: str, peers: Dict[str, str], log: ChangeLog,
+                 apply: Callable[[List[Dict[str, Any]], Optional[str]], Dict[str, Any]],
+                 lock: Callable[[str], ContextManager], api_key: Optional[str] = None,
+                 timeout: float = 5.0, sync_interval: float = 30.0,
+                 should_sync: Optional[Callable[[], bool]] = None):
+        self.zone = zone
+        self.peers = peers
+        self.log = log
+        self.apply = apply
+        self.lock = lock
+        self.api_key = api_key
+        self.timeout = timeout
+        self.sync_interval = sync_interval
+        self.should_sync = should_sync
+        self.listeners: List[Callable[[Dict[str, Any]], None]] = []
+        # Last change of ours each peer acknowledged, as far as this process knows
+        self._acked: Dict[str, int] = {}
+        self._peer_status: Dict[str, Dict[str, Any]] = {name: {} for name in peers}
+        # Threads start on first use, so creating this before gunicorn forks is safe
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(peers)), thread_name_prefix='federation')
+        self._session: Optional[requests.Session] = None
+        self._session_pid = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+
+    def subscribe(self, listener: Callable[[Dict[str, Any]], None]):
+        """Call listener with every change set this zone receives from a peer"""
+        self.listeners.append(listener)
+
+    # HTTP
+
+    def _http(self) -> requests.Session:
+        """One keep-alive session per process, with a connection pool per peer"""
+        if self._session is None or self._session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=max(1, len(self.peers)), pool_maxsize=4)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            if self.api_key:
+                session.headers['X-API-Key'] = self.api_key
+            self._session, self._session_pid = session, os.getpid()
+        return self._session
+
+    def _request(self, method: str, peer: str, path: str, **kwargs) -> Dict[str, Any]:
+        response = self._http().request(method, f"{self.peers[peer]}{path}", timeout=self.timeout, **kwargs)
+        if response.status_code >= 400:
+            raise FederationError(f"{peer} answered {response.status_code}: {response.text[:200]}")
+        return response.json()
+
+    # Sending
+
+    def publish(self, operations: List[Dict[str, Any]], zones: Optional[List[str]] = None,
+                message: str = '', source: str = 'api') -> Dict[str, Any]:
+        """Apply a change set here and in every peer zone in zones (all by default).
+
+        Peers are sent the change concurrently. Nothing is logged or sent if
+        it fails in this zone.
+        """
+        zones = sorted(set(zones)) if zones else sorted([self.zone, *self.peers])
+        unknown = [name for name in zones if name != self.zone and name not in self.peers]
+        if unknown:
+            raise FederationError(f"Unknown zone(s): {', '.join(unknown)}")
+        start = time.monotonic()
+        acks: Dict[str, Dict[str, Any]] = {}
+        # Changes are numbered in the order they were applied here
+        with self.lock(f"federation:{self.zone}:publish"):
+            if self.zone in zones:
+                result = self.apply(operations, None)
+                acks[self.zone] = {'zone': self.zone, 'status': 'applied' if result.get('success') else 'failed',
+                                   'duration_ms': round((time.monotonic() - start) * 1000, 1)}
+                if not result.get('success'):
+                    acks[self.zone]['error'] = result.get('error')
+                    return {'success': False, 'error': f"Change failed in {self.zone}: {result.get('error')}",
+                            'zones': acks}
+            change = self.log.append(operations, zones, message, source)
+
+        targets = [name for name in zones if name in self.peers]
+        for ack in self._executor.map(lambda peer: self.push(peer, change), targets):
+            acks[ack['zone']] = ack
+        return {
+            'success': all(ack['status'] in ('applied', 'duplicate') for ack in acks.values()),
+            'change': {key: change[key] for key in ('id', 'seq', 'zones', 'created_at')},
+            'zones': acks,
+            'vector': self.log.vector(),
+            'duration_ms': round((time.monotonic() - start) * 1000, 1)
+        }
+
+    def push(self, peer: str, change: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Send peer every change of ours it is known to lack, ending with change.
+
+        One request, unless the peer turns out to be further behind than this
+        process knew; then a second one carries the rest.
+        """
+        start = time.monotonic()
+        acked = self._acked.get(peer)
+        if acked is None:
+            changes = [change] if change else self.log.since(0)[0]
+        else:
+            changes = self.log.since(acked)[0]
+        target = change['seq'] if change else self.log.head()
+        ack: Dict[str, Any] = {'zone': peer, 'status': 'applied'}
+        try:
+            reply = self._send(peer, changes)
+            if reply['gap'] or reply['vector'].get(self.zone, 0) < target:
+                behind = self.log.since(reply['vector'].get(self.zone, 0))[0]
+                if behind:
+                    ack['caught_up'] = len(behind) - (1 if change else 0)
+                    reply = self._send(peer, behind)
+            results = {r['seq']: r for r in reply['results']}
+            applied = reply['vector'].get(self.zone, 0)
+            outcome = results.get(target)
+            if outcome is not None:
+                ack['status'] = outcome['status']
+                if outcome.get('error'):
+                    ack['error'] = outcome['error']
+            elif applied >= target:
+                ack['status'] = 'duplicate'
+            else:
+                ack.update(status='behind', error=f"{peer} has applied up to {applied} of {target}")
+            ack['applied_seq'] = applied
+        except (requests.RequestException, FederationError, ValueError, KeyError) as e:
+            ack.update(status='unreachable', error=str(e))
+        duration = time.monotonic() - start
+        ack['duration_ms'] = round(duration * 1000, 1)
+        FEDERATION_PUSH_LATENCY.labels(zone=peer, status=ack['status']).observe(duration)
+        self._peer_status[peer].update(last_push=datetime.utcnow().isoformat(), last_status=ack['status'],
+                                       last_error=ack.get('error'))
+        return ack
+
+    def _send(self, peer: str, changes: List[Dict[str, Any]]) -> Dict[str, Any]:
+        reply = self._request('POST', peer, '/federation/changes', json={'origin': self.zone, 'changes': changes})
+        self._acked[peer] = max(self._acked.get(peer, 0), reply['vector'].get(self.zone, 0))
+        return reply
+
+    # Receiving
+
+    def receive(self, origin: str, changes: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Apply origin's change sets in order, skipping the ones already applied.
+
+        A change that fails here (e.g. a server this zone does not have) is
+        reported and counted as applied, so it cannot hold up later ones. An
+        error that may pass (a lock or socket timeout) stops the run; the
+        change is sent again later.
+        """
+        if origin == self.zone or not origin:
+            raise FederationError(f"Change sets must come from another zone, not '{origin}'")
+        results = []
+        gap = False
+        with self.lock(f"federation:{self.zone}:from:{origin}"):
+            applied = self.log.applied(origin)
+            for change in sorted(changes, key=lambda c: c['seq']):
+                seq = change['seq']
+                if seq <= applied:
+                    results.append({'id': change['id'], 'seq': seq, 'status': 'duplicate'})
+                    continue
+                if seq > applied + 1:
+                    gap = True
+                    break
+                outcome = {'id': change['id'], 'seq': seq}
+                if self.zone not in change.get('zones', [self.zone]):
+                    outcome['status'] = 'skipped'
+                else:
+                    try:
+                        operations = parse_operations({'operations': change['operations']})
+                        result = self.apply(operations, f"federation:{self.zone}:{change['id']}")
+                        outcome['status'] = 'applied' if result.get('success') else 'failed'
+                        if not result.get('success'):
+                            outcome['error'] = result.get('error')
+                    except BatchError as e:
+                        outcome.update(status='failed', error=str(e))
+                    except Exception as e:
+                        logger.warning(f"Federated change {change['id']} not applied, will be retried: {e}")
+                        results.append(dict(outcome, status='error', error=str(e)))
+                        break
+                self.log.advance(origin, seq)
+                applied = seq
+                results.append(outcome)
+                self._notify(dict(outcome, origin=origin, change=change))
+        return {'zone': self.zone, 'origin': origin, 'results': results, 'gap': gap, 'vector': self.log.vector()}
+
+    def _notify(self, event: Dict[str, Any]):
+        for listener in self.listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                logger.error(f"Federation listener failed: {e}")
+
+    def pull(self, peer: str) -> Dict[str, Any]:
+        """Fetch and apply every change of peer's that this zone missed"""
+        received = 0
+        while True:
+            applied = self.log.applied(peer)
+            reply = self._request('GET', peer, '/federation/changes',
+                                  params={'since': applied, 'limit': MAX_CHANGES_PER_REQUEST})
+            if reply.get('pruned'):
+                # The peer no longer has them; later changes must not wait for them forever
+                first = reply['changes'][0]['seq'] - 1 if reply['changes'] else reply['head']
+                logger.warning(f"Changes {applied + 1}-{first} from {peer} were pruned before this zone "
+                               f"applied them; check the backends of both zones")
+                with self.lock(f"federation:{self.zone}:from:{peer}"):
+                    if self.log.applied(peer) == applied:
+                        self.log.advance(peer, first)
+            if not reply['changes']:
+                break
+            result = self.receive(peer, reply['changes'])
+            received += sum(1 for r in result['results'] if r['status'] != 'duplicate')
+            if result['gap'] or any(r['status'] == 'error' for r in result['results']) \
+                    or len(reply['changes']) < MAX_CHANGES_PER_REQUEST:
+                break
+        behind = reply['head'] - self.log.applied(peer)
+        self._peer_status[peer].update(last_pull=datetime.utcnow().isoformat(), behind=behind)
+        return {'zone': peer, 'received': received, 'head': reply['head'], 'behind': behind}
+
+    def sync(self) -> Dict[str, Dict[str, Any]]:
+        """Pull from every peer at once"""
+        def pull(peer: str) -> Dict[str, Any]:
+            try:
+                return self.pull(peer)
+            except (requests.RequestException, FederationError, ValueError, KeyError) as e:
+                self._peer_status[peer].update(last_error=str(e))
+                return {'zone': peer, 'error': str(e)}
+        return {result['zone']: result for result in self._executor.map(pull, list(self.peers))}
+
+    def start(self):
+        """Catch up with the peers now and every sync_interval, in this process (idempotent, fork-aware)"""
+        if not self.peers or not self.sync_interval:
+            return
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._follow, name='federation-sync', daemon=True)
+        self._thread.start()
+
+    def _follow(self):
+        while True:
+            try:
+                if self.should_sync is None or self.should_sync():
+                    for peer, result in self.sync().items():
+                        if result.get('received'):
+                            logger.info(f"Caught up on {result['received']} change set(s) from {peer}")
+            except Exception as e:
+                logger.error(f"Federation sync failed: {e}")
+            time.sleep(self.sync_interval)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'zone': self.zone,
+            'vector': self.log.vector(),
+            'peers': {name: dict(self._peer_status[name], url=url, acked=self._acked.get(name))
+                      for name, url in self.peers.items()}
+        }
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - HAProxy Configuration Model
+Parses HAProxy configuration files into sections, directives and server
+lines indexed by name. Edits are applied in place and the serializer
+reproduces every untouched line byte for byte, comments included.
+"""
+
+import os
+import hashlib
+import threading
+import tempfile
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+SECTION_KEYWORDS = (
+    'global', 'defaults', 'frontend', 'backend', 'listen', 'peers', 'resolvers',
+    'userlist', 'mailers', 'program', 'http-errors', 'ring', 'cache',
+)
+
+# Sections that can hold 'server' lines
+PROXY_WITH_SERVERS = ('backend', 'listen')
+
+DEFAULT_INDENT = '    '
+
+
+class Line:
+    """A single configuration line, kept verbatim"""
+
+    __slots__ = ('raw', 'keyword', '_args')
+
+    def __init__(self, raw: str):
+        self.raw = raw
+        stripped = raw.strip()
+        self.keyword = '' if not stripped or stripped.startswith('#') else stripped.split(None, 1)[0]
+        self._args = None
+
+    @property
+    def is_blank(self) -> bool:
+        return not self.raw.strip()
+
+    @property
+    def is_comment(self) -> bool:
+        return self.raw.lstrip().startswith('#')
+
+    @property
+    def indent(self) -> str:
+        return self.raw[:len(self.raw) - len(self.raw.lstrip())]
+
+    @property
+    def args(self) -> List[str]:
+        """Words after the keyword, with any trailing comment removed"""
+        if self._args is None:
+            text = self.raw.split(' #', 1)[0] if ' #' in self.raw else self.raw
+            self._args = text.split()[1:]
+        return self._args
+
+
+class ServerLine(Line):
+    """A 'server <name> <address>[:<port>] [params...]' line"""
+
+    __slots__ = ('name', 'address', 'port', 'params')
+
+    def __init__(self, raw: str):
+        super().__init__(raw)
+        args = self.args
+        self.name = args[0] if args else ''
+        address = args[1] if len(args) > 1 else ''
+        host, sep, port = address.rpartition(':')
+        if sep and port.isdigit():
+            self.address, self.port = host, int(port)
+        else:
+            self.address, self.port = address, None
+        self.params = args[2:]
+
+    @classmethod
+    def build(cls, name: str, address: str, port: Optional[int], params: List[str],
+              indent: str = DEFAULT_INDENT, newline: str = '\n') -> 'ServerLine':
+        target = f"{address}:{port}" if port is not None else address
+        return cls(f"{indent}server {' '.join([name, target] + list(params))}{newline}")
+
+    def param(self, key: str) -> Optional[str]:
+        """Value of a 'key value' server parameter"""
+        for i, word in enumerate(self.params[:-1]):
+            if word == key:
+                return self.params[i + 1]
+        return None
+
+
+class Section:
+    """A configuration section: its header line and the lines that follow"""
+
+    def __init__(self, header: Line):
+        self.header = header
+        self.kind = header.keyword
+        self.name = header.args[0] if header.args else ''
+        self.lines: List[Line] = []
+        self.servers: Dict[str, ServerLine] = {}
+        self.directives: Dict[str, List[Line]] = {}
+
+    def append(self, line: Line):
+        self.lines.append(line)
+        if isinstance(line, ServerLine):
+            self.servers[line.name] = line
+        elif line.keyword:
+            self.directives.setdefault(line.keyword, []).append(line)
+
+    def get(self, keyword: str) -> List[Line]:
+        """All directives with the given keyword"""
+        return self.directives.get(keyword, [])
+
+    def _insert_position(self) -> int:
+        # After the last server; otherwise after the last directive, so that
+        # comments introducing the next section stay with it
+        anchor = None
+        if self.servers:
+            anchor = next(reversed(self.servers.values()))
+        else:
+            for line in reversed(self.lines):
+                if line.keyword:
+                    anchor = line
+                    break
+        if anchor is None:
+            return 0
+        # Lines compare by identity, so list.index is a C-level pointer scan
+        return self.lines.index(anchor) + 1
+
+    def add_server(self, line: ServerLine, position: Optional[int] = None):
+        if line.name in self.servers:
+            raise ValueError(f"Server {line.name} already exists in {self.kind} {self.name}")
+        if position is None:
+            position = self._insert_position()
+        self.lines.insert(position, line)
+        self.servers[line.name] = line
+
+    def remove_server(self, name: str) -> Optional[ServerLine]:
+        line = self.servers.pop(name, None)
+        if line is not None:
+            del self.lines[self.lines.index(line)]
+        return line
+
+    def replace_server(self, line: ServerLine):
+        old = self.servers[line.name]
+        self.lines[self.lines.index(old)] = line
+        self.servers[line.name] = line
+
+    def render(self) -> str:
+        return self.header.raw + ''.join(line.raw for line in self.lines)
+
+
+class HAProxyConfig:
+    """Parsed HAProxy configuration file"""
+
+    def __init__(self):
+        self.preamble: List[Line] = []
+        self.sections: List[Section] = []
+        self.index: Dict[Tuple[str, str], Section] = {}
+        self.proxies: Dict[str, Section] = {}
+
+    @classmethod
+    def parse(cls, text: str) -> 'HAProxyConfig':
+        config = cls()
+        current: Optional[Section] = None
+        for raw in text.splitlines(keepends=True):
+            line = Line(raw)
+            if line.keyword in SECTION_KEYWORDS:
+                current = Section(line)
+                config._register(current)
+            elif current is None:
+                config.preamble.append(line)
+            elif line.keyword == 'server':
+                current.append(ServerLine(raw))
+            else:
+                current.append(line)
+        return config
+
+    @classmethod
+    def load(cls, path: str) -> 'HAProxyConfig':
+        with open(path, 'r') as f:
+            return cls.parse(f.read())
+
+    def _register(self, section: Section):
+        self.sections.append(section)
+        self.index[(section.kind, section.name)] = section
+        if section.kind in ('frontend', 'backend', 'listen'):
+            self.proxies.setdefault(section.name, section)
+
+    def section(self, kind: str, name: str = '') -> Optional[Section]:
+        return self.index.get((kind, name))
+
+    def backend(self, name: str) -> Optional[Section]:
+        """A section that can hold servers: 'backend <name>' or 'listen <name>'"""
+        return self.index.get(('backend', name)) or self.index.get(('listen', name))
+
+    def backends(self) -> List[Section]:
+        return [s for s in self.sections if s.kind in PROXY_WITH_SERVERS]
+
+    def _require_backend(self, name: str) -> Section:
+        section = self.backend(name)
+        if section is None:
+            raise KeyError(f"Backend {name} not found")
+        return section
+
+    def add_server(self, backend: str, name: str, address: str, port: Optional[int],
+                   params: Optional[List[str]] = None) -> ServerLine:
+        """Add a server line after the backend's existing servers"""
+        section = self._require_backend(backend)
+        template = next(reversed(section.servers.values()), None) if section.servers else None
+        indent = template.indent if template else next(
+            (l.indent for l in section.lines if l.keyword), DEFAULT_INDENT)
+        line = ServerLine.build(name, address, port, params or [], indent)
+        section.add_server(line)
+        return line
+
+    def remove_server(self, backend: str, name: str) -> bool:
+        """Remove a server line; returns False if it was not present"""
+        return self._require_backend(backend).remove_server(name) is not None
+
+    def set_server_param(self, backend: str, name: str, key: str, value: Optional[str]) -> ServerLine:
+        """Set (or with value=None, remove) a 'key value' parameter on a server line"""
+        section = self._require_backend(backend)
+        old = section.servers[name]
+        params = list(old.params)
+        if key in params[:-1]:
+            i = params.index(key)
+            if value is None:
+                del params[i:i + 2]
+            else:
+                params[i + 1] = str(value)
+        elif value is not None:
+            params += [key, str(value)]
+        newline = '\n' if old.raw.endswith('\n') else ''
+        line = ServerLine.build(name, old.address, old.port, params, old.indent, newline)
+        section.replace_server(line)
+        return line
+
+    def render(self) -> str:
+        return ''.join(line.raw for line in self.preamble) + ''.join(s.render() for s in self.sections)
+
+    def save(self, path: str):
+        """Write atomically so readers never see a partially written file"""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.haproxy-', suffix='.cfg')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(self.render())
+            if os.path.exists(path):
+                os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+
+class ConfigCache:
+    """Parsed configs kept in memory and reparsed only when the file changes on disk"""
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[Tuple[int, int], HAProxyConfig]] = {}
+        self._texts: Dict[str, Tuple[Tuple[int, int], str, str, float]] = {}
+        self._locks: Dict[str, threading.RLock] = {}
+        self._guard = threading.Lock()
+
+    @staticmethod
+    def _signature(path: str) -> Tuple[int, int]:
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+
+    def _lock(self, path: str) -> threading.RLock:
+        with self._guard:
+            return self._locks.setdefault(path, threading.RLock())
+
+    def get(self, path: str) -> HAProxyConfig:
+        """Parsed config for path; callers must not modify it outside edit()"""
+        with self._lock(path):
+            signature = self._signature(path)
+            entry = self._entries.get(path)
+            if entry is None or entry[0] != signature:
+                entry = (signature, HAProxyConfig.load(path))
+                self._entries[path] = entry
+            return entry[1]
+
+    def read(self, path: str) -> Tuple[str, str, float]:
+        """Text of path with its SHA-256 and mtime; the file is only read again after it changes"""
+        with self._lock(path):
+            st = os.stat(path)
+            signature = (st.st_mtime_ns, st.st_size)
+            entry = self._texts.get(path)
+            if entry is None or entry[0] != signature:
+                with open(path, 'r') as f:
+                    text = f.read()
+                entry = (signature, text, hashlib.sha256(text.encode()).hexdigest(), st.st_mtime)
+                self._texts[path] = entry
+            return entry[1], entry[2], entry[3]
+
+    @contextmanager
+    def edit(self, path: str) -> Iterator[HAProxyConfig]:
+        """Edit the cached config in place and save it when the block succeeds"""
+        with self._lock(path):
+            config = self.get(path)
+            try:
+                yield config
+            except BaseException:
+                # Drop the partially edited model; the next get() reparses the file
+                self._entries.pop(path, None)
+                raise
+            config.save(path)
+            self._entries[path] = (self._signature(path), config)
+
+    def invalidate(self, path: Optional[str] = None):
+        with self._guard:
+            if path is None:
+                self._entries.clear()
+                self._texts.clear()
+            else:
+                self._entries.pop(path, None)
+                self._texts.pop(path, None)
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - Map and ACL Files
+Routing tables (host -> backend, tenant -> backend) and pattern lists live
+in HAProxy map and ACL files and are changed through the runtime API, with
+no reload. Single entries go out as pipelined add/set/del commands. A full
+replace loads a new version of the table ('prepare map', then 'add map @ver'
+with many entries per command) and swaps it in with one 'commit map', so
+lookups never see a half-loaded table. Every change is also written to the
+file (write and rename), so a reload or restart loads the same table.
+"""
+
+import os
+import re
+import time
+import fcntl
+import logging
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from haproxy_runtime import RuntimeAPIError, RuntimeClient
+
+logger = logging.getLogger(__name__)
+
+# File suffix -> runtime API object ('add map' / 'add acl' ...)
+KINDS = {'.map': 'map', '.acl': 'acl'}
+MAX_ENTRIES = 1000000
+# A command and its payload must fit in HAProxy's buffer (tune.bufsize, 16 kB by default)
+PAYLOAD_BYTES = 12000
+# Commands per round trip; 'add acl' takes no payload, so ACLs go one pattern per command
+PIPELINE_COMMANDS = 500
+# Maps whose values name the backend to route to (use_backend %[var(txn.route)])
+ROUTING_MAPS = ('hosts', 'tenants')
+
+HEADER = '# Managed by the configwatcher (/maps): changes made here are overwritten\n'
+NAME_RE = re.compile(r'^[A-Za-z0-9_-]+$')
+# The CLI splits on whitespace and ';'; a key starting with '#' would read back as a comment
+TOKEN_RE = re.compile(r'^[^\s;#\\][^\s;\\]*$')
+LISTING_RE = re.compile(r'^-?\d+ \((?P<path>[^)]*)\).*?(?:entry_cnt=(?P<count>\d+))?$')
+
+
+class MapError(Exception):
+    """Raised when a map or ACL change is rejected before anything is changed"""
+
+
+class MapNotFound(KeyError):
+    pass
+
+
+def _check(token: Any, what: str) -> str:
+    if not isinstance(token, str) or not TOKEN_RE.match(token):
+        raise MapError(f"{what} {token!r} must be a non-empty string without whitespace, ';' or '\\', "
+                       f"not starting with '#'")
+    return token
+
+
+def _check_all(tokens: List[Any], what: str):
+    if not tokens:
+        return
+    if all(isinstance(token, str) for token in tokens):
+        # TOKEN_RE over all tokens at once: splitting on whitespace gives them back unchanged
+        text = '\n'.join(tokens)
+        if (';' not in text and '\\' not in text and not text.startswith('#') and '\n#' not in text
+                and text.split() == tokens):
+            return
+    # Find the offending token for the message
+    for token in tokens:
+        _check(token, what)
+
+
+def parse_entries(kind: str, entries: Any) -> Dict[str, str]:
+    """{key: value} for a map, or a list of patterns for an ACL -> {key: value} ('' for ACLs)"""
+    if kind == 'map':
+        if not isinstance(entries, dict):
+            raise MapError('Map entries must be an object of key: value')
+        _check_all(list(entries), 'Key')
+        _check_all(list(entries.values()), 'Value')
+        parsed = entries
+    else:
+        if not isinstance(entries, list):
+            raise MapError('ACL entries must be a list of patterns')
+        _check_all(entries, 'Pattern')
+        parsed = dict.fromkeys(entries, '')
+    if len(parsed) > MAX_ENTRIES:
+        raise MapError(f'At most {MAX_ENTRIES} entries per table')
+    return parsed
+
+
+def read_file(path: str) -> Dict[str, str]:
+    """Entries of a map or ACL file in file order; for repeated keys HAProxy uses the first"""
+    entries = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            key, _, value = line.partition(' ')
+            entries.setdefault(key, value.strip())
+    return entries
+
+
+def _ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+def payloads(entries: List[Tuple[str, str]]) -> Iterator[str]:
+    """Entry lines grouped into payloads that each fit in one command"""
+    lines, size = [], 0
+    for key, value in entries:
+        line = f'{key} {value}' if value else key
+        if lines and size + len(line) + 1 > PAYLOAD_BYTES:
+            yield '\n'.join(lines)
+            lines, size = [], 0
+        lines.append(line)
+        size += len(line) + 1
+    if lines:
+        yield '\n'.join(lines)
+
+
+class MapManager:
+    """The map (.map) and ACL (.acl) files of one directory, as HAProxy references them.
+
+    A table is named after its file, e.g. 'hosts' for hosts.map. Only files
+    the HAProxy config references can be changed at runtime; a new table
+    takes a config change and a reload. With backends given, the values of
+    routing maps must name one of them.
+    """
+
+    def __init__(self, runtime: RuntimeClient, directory: str,
+                 backends: Optional[Callable[[], Iterable[str]]] = None, routes: Iterable[str] = ROUTING_MAPS):
+        self.runtime = runtime
+        self.directory = directory
+        self.backends = backends
+        self.routes = set(routes)
+        # path -> (file identity, entries); another replica's write changes the identity
+        self._cache: Dict[str, Tuple[Tuple[int, int, int], Dict[str, str]]] = {}
+
+    @staticmethod
+    def _identity(path: str) -> Tuple[int, int, int]:
+        stat = os.stat(path)
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _read(self, path: str) -> Dict[str, str]:
+        """Entries of a file, parsed once per version of it; callers must not modify them"""
+        identity = self._identity(path)
+        cached = self._cache.get(path)
+        if cached is None or cached[0] != identity:
+            cached = self._cache[path] = (identity, read_file(path))
+        return cached[1]
+
+    def tables(self) -> Dict[str, Tuple[str, str]]:
+        """{name: (kind, path)} of the files in the directory"""
+        tables = {}
+        try:
+            files = sorted(os.listdir(self.directory))
+        except FileNotFoundError:
+            return tables
+        for filename in files:
+            name, suffix = os.path.splitext(filename)
+            if suffix in KINDS and NAME_RE.match(name):
+                tables[name] = (KINDS[suffix], os.path.join(self.directory, filename))
+        return tables
+
+    def table(self, name: str) -> Tuple[str, str]:
+        table = self.tables().get(name)
+        if table is None:
+            raise MapNotFound(name)
+        return table
+
+    def loaded(self) -> Dict[str, int]:
+        """{path: entries} of the map and ACL files HAProxy has loaded"""
+        counts = {}
+        for output in self.runtime.pipeline(['show map', 'show acl']):
+            for line in output.splitlines():
+                match = LISTING_RE.match(line)
+                if match and match.group('path').startswith('/'):
+                    counts[match.group('path')] = int(match.group('count') or 0)
+        return counts
+
+    @contextmanager
+    def _locked(self):
+        # Replicas of a zone share the directory; flock also excludes threads of this process
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _write(self, path: str, entries: Dict[str, str]):
+        tmp = f"{path}.tmp.{os.getpid()}"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(HEADER)
+            f.write(''.join(f'{key} {value}\n' if value else f'{key}\n' for key, value in entries.items()))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self._cache[path] = (self._identity(path), entries)
+
+    def _add_commands(self, kind: str, path: str, entries: List[Tuple[str, str]], version: str = '') -> List[str]:
+        target = f'@{version} {path}' if version else path
+        if kind == 'acl':
+            return [f'add acl {target} {key}' for key, _ in entries]
+        return [f'add map {target} <<\n{payload}\n' for payload in payloads(entries)]
+
+    def _execute(self, commands: List[str]):
+        for i in range(0, len(commands), PIPELINE_COMMANDS):
+            self.runtime.execute_checked(commands[i:i + PIPELINE_COMMANDS])
+
+    def _swap(self, kind: str, path: str, entries: Dict[str, str]):
+        """Load entries as a new version of the table and make it current in one step"""
+        output = self.runtime.execute_checked([f'prepare {kind} {path}'])[0]
+        try:
+            version = int(output.rsplit(':', 1)[1])
+        except (IndexError, ValueError):
+            raise RuntimeAPIError(f"Unexpected answer to 'prepare {kind}': {output}")
+        try:
+            self._execute(self._add_commands(kind, path, list(entries.items()), str(version)))
+            self.runtime.execute_checked([f'commit {kind} @{version} {path}'])
+        except RuntimeAPIError:
+            try:
+                self.runtime.execute(f'clear {kind} @{version} {path}')
+            except RuntimeAPIError:
+                pass
+            raise
+
+    def _check_routes(self, name: str, entries: Dict[str, str]):
+        # HAProxy does not fall back to the rules below for a missing backend: it uses default_backend
+        if self.backends is None or name not in self.routes or not entries:
+            return
+        known = set(self.backends())
+        unknown = sorted({value for value in entries.values() if value not in known})
+        if unknown:
+            raise MapError(f"Unknown backend(s) in {name}: {', '.join(unknown[:10])}"
+                           f"{' ...' if len(unknown) > 10 else ''}")
+
+    def list(self) -> List[Dict[str, Any]]:
+        loaded = self.loaded()
+        result = []
+        for name, (kind, path) in self.tables().items():
+            result.append({'name': name, 'kind': kind, 'path': path, 'entries': len(self._read(path)),
+                           'loaded': path in loaded, 'runtime_entries': loaded.get(path)})
+        return result
+
+    def get(self, name: str) -> Dict[str, Any]:
+        kind, path = self.table(name)
+        entries = self._read(path)
+        return {'name': name, 'kind': kind, 'path': path, 'count': len(entries),
+                'entries': entries if kind == 'map' else list(entries)}
+
+    def update(self, name: str, changes: Any = None, delete: Any = None) -> Dict[str, Any]:
+        """Add or change entries and delete keys, entry by entry"""
+        kind, path = self.table(name)
+        changes = parse_entries(kind, changes if changes is not None else ({} if kind == 'map' else []))
+        self._check_routes(name, changes)
+        if not isinstance(delete if delete is not None else [], list):
+            raise MapError('delete must be a list of keys')
+        delete = [_check(key, 'Key') for key in delete or []]
+        start = time.perf_counter()
+        with self._locked():
+            before = self._read(path)
+            entries = dict(before)
+            commands, added, changed, deleted = [], [], 0, 0
+            for key in delete:
+                if entries.pop(key, None) is not None:
+                    commands.append(f'del {kind} {path} {key}')
+                    deleted += 1
+            for key, value in changes.items():
+                if key not in entries:
+                    added.append((key, value))
+                elif entries[key] != value:
+                    commands.append(f'set map {path} {key} {value}')
+                    changed += 1
+                entries[key] = value
+            if len(entries) > MAX_ENTRIES:
+                raise MapError(f'At most {MAX_ENTRIES} entries per table')
+            commands += self._add_commands(kind, path, added)
+            applying = time.perf_counter()
+            try:
+                self._execute(commands)
+            except RuntimeAPIError:
+                # Some commands may have been applied; put HAProxy back to the file
+                try:
+                    self._swap(kind, path, before)
+                except RuntimeAPIError as e:
+                    logger.error(f"Failed to restore {path} after a failed update: {e}")
+                raise
+            runtime_ms = _ms(applying)
+            if commands:
+                self._write(path, entries)
+        # runtime_ms: until HAProxy routes with the change; duration_ms includes writing the file
+        return {'success': True, 'name': name, 'added': len(added), 'changed': changed, 'deleted': deleted,
+                'entries': len(entries), 'runtime_ms': runtime_ms, 'duration_ms': _ms(start)}
+
+    def replace(self, name: str, entries: Any) -> Dict[str, Any]:
+        """Swap the whole table atomically"""
+        kind, path = self.table(name)
+        entries = parse_entries(kind, entries)
+        self._check_routes(name, entries)
+        start = time.perf_counter()
+        with self._locked():
+            self._swap(kind, path, entries)
+            runtime_ms = _ms(start)
+            self._write(path, entries)
+        return {'success': True, 'name': name, 'entries': len(entries), 'runtime_ms': runtime_ms,
+                'duration_ms': _ms(start)}
+
+    def sync(self, name: str) -> Dict[str, Any]:
+        """Load the file into HAProxy again, e.g. after it was edited by hand"""
+        kind, path = self.table(name)
+        start = time.perf_counter()
+        with self._locked():
+            entries = self._read(path)
+            self._swap(kind, path, entries)
+        return {'success': True, 'name': name, 'entries': len(entries), 'duration_ms': _ms(start)}
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - HAProxy Runtime API Client
+Persistent, pooled client for the HAProxy stats socket (Unix or TCP)
+"""
+
+import os
+import asyncio
+import socket
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+
+from prometheus_client import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Every response in interactive ("prompt") mode is terminated by this marker
+PROMPT = b'\n> '
+
+# Runtime API verbs that change HAProxy state. Their output is either empty
+# or one of the success messages below; anything else is an error message.
+MUTATING_VERBS = ('add', 'del', 'set', 'enable', 'disable', 'clear', 'commit', 'prepare', 'shutdown')
+SUCCESS_MESSAGES = (
+    'New server registered.',
+    'Server deleted.',
+    'IP changed from',
+    'port changed from',
+    'no need to change',
+    'New version created:',
+    'Done.',
+)
+
+COMMAND_LATENCY = Histogram('configwatcher_haproxy_command_duration_seconds',
+                            'Runtime API command latency; pipelined commands are timed response to response',
+                            ['verb'],
+                            buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1))
+COMMAND_ERRORS = Counter('configwatcher_haproxy_command_errors_total',
+                         'Runtime API commands that failed', ['verb', 'kind'])
+
+
+def command_verb(command: str) -> str:
+    """Metric label for a command: its first two words, e.g. 'set server' or 'show stat'"""
+    return ' '.join(command.split(' ', 2)[:2])
+
+
+# labels() takes a lock and builds a key on every call; this sits on the
+# per-command path, so keep the children around
+_latency_by_verb = {}
+
+
+def _observe_latency(command: str, seconds: float):
+    verb = command_verb(command)
+    child = _latency_by_verb.get(verb)
+    if child is None:
+        child = _latency_by_verb.setdefault(verb, COMMAND_LATENCY.labels(verb=verb))
+    child.observe(seconds)
+
+
+class RuntimeAPIError(Exception):
+    """Raised when the HAProxy runtime API rejects a command or is unreachable"""
+
+    def __init__(self, message: str, command: Optional[str] = None, output: Optional[str] = None):
+        super().__init__(message)
+        self.command = command
+        self.output = output
+
+
+def parse_address(address: str) -> Tuple[int, object]:
+    """Resolve a socket address into (family, address); 'host:port' is TCP, anything else a Unix path"""
+    if not address.startswith('/') and ':' in address:
+        host, port = address.rsplit(':', 1)
+        return socket.AF_INET, (host, int(port))
+    return socket.AF_UNIX, address
+
+
+def check_response(command: str, output: str) -> str:
+    """Raise RuntimeAPIError if a mutating command's output is an error message"""
+    verb = command.split(' ', 1)[0]
+    if verb in MUTATING_VERBS and output and not output.startswith(SUCCESS_MESSAGES):
+        COMMAND_ERRORS.labels(verb=command_verb(command), kind='rejected').inc()
+        raise RuntimeAPIError(f"'{command}' failed: {output}", command=command, output=output)
+    return output
+
+
+def build_add_server_command(backend: str, server_config: dict) -> str:
+    """Build an 'add server' command from a backend server definition"""
+    cmd = f"add server {backend}/{server_config['name']} {server_config['address']}:{server_config['port']}"
+    if server_config.get('weight'):
+        cmd += f" weight {server_config['weight']}"
+    if server_config.get('backup'):
+        cmd += " backup"
+    if server_config.get('check'):
+        cmd += " check"
+    return cmd
+
+
+class RuntimeSession:
+    """A single long-lived prompt-mode connection to the HAProxy runtime API"""
+
+    def __init__(self, address: str, timeout: float = 10.0):
+        self.address = address
+        self.timeout = timeout
+        self.sock: Optional[socket.socket] = None
+        self.last_used = 0.0
+        self._buffer = b''
+
+    @property
+    def connected(self) -> bool:
+        return self.sock is not None
+
+    def connect(self):
+        """Open the socket and switch the CLI to interactive mode"""
+        family, addr = parse_address(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(addr)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+        self._buffer = b''
+        self.sock.sendall(b'prompt\n')
+        self._read_response()
+        self.last_used = time.monotonic()
+
+    def close(self):
+        """Close the underlying socket"""
+        if self.sock is not None:
+            try:
+                self.sock.sendall(b'quit\n')
+            except OSError:
+                pass
+            self.sock.close()
+            self.sock = None
+            self._buffer = b''
+
+    def execute(self, commands: List[str]) -> List[str]:
+        """Send all commands in one write and read one response per command"""
+        if self.sock is None:
+            self.connect()
+        payload = ''.join(f"{cmd}\n" for cmd in commands).encode()
+        responses = []
+        try:
+            self.sock.sendall(payload)
+            previous = time.perf_counter()
+            for cmd in commands:
+                responses.append(self._read_response())
+                now = time.perf_counter()
+                _observe_latency(cmd, now - previous)
+                previous = now
+        except OSError:
+            COMMAND_ERRORS.labels(verb=command_verb(commands[len(responses)]), kind='connection').inc()
+            raise
+        self.last_used = time.monotonic()
+        return responses
+
+    def _read_response(self) -> str:
+        while True:
+            idx = self._buffer.find(PROMPT)
+            if idx >= 0:
+                data = self._buffer[:idx]
+                self._buffer = self._buffer[idx + len(PROMPT):]
+                return data.decode(errors='replace').rstrip('\n')
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                raise ConnectionResetError('HAProxy closed the runtime API connection')
+            self._buffer += chunk
+
+
+class RuntimeClient:
+    """Connection pool of runtime API sessions with command pipelining"""
+
+    def __init__(self, address: str, pool_size: int = 4, timeout: float = 10.0, max_idle: float = 25.0):
+        self.address = address
+        self.pool_size = pool_size
+        self.timeout = timeout
+        # Keep below HAProxy's 'stats timeout' so we never reuse a session it already closed
+        self.max_idle = max_idle
+        self._idle: List[RuntimeSession] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._pid = os.getpid()
+
+    def _reset_after_fork(self):
+        # Sockets opened before a gunicorn fork must not be shared between workers
+        if self._pid != os.getpid():
+            self._idle = []
+            self._lock = threading.Lock()
+            self._slots = threading.BoundedSemaphore(self.pool_size)
+            self._pid = os.getpid()
+
+    def _acquire(self) -> RuntimeSession:
+        self._reset_after_fork()
+        if not self._slots.acquire(timeout=self.timeout):
+            raise RuntimeAPIError('Timed out waiting for a runtime API connection')
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                session = self._idle.pop()
+                if now - session.last_used < self.max_idle:
+                    return session
+                session.close()
+        return RuntimeSession(self.address, self.timeout)
+
+    def _release(self, session: RuntimeSession):
+        with self._lock:
+            if session.connected:
+                self._idle.append(session)
+        self._slots.release()
+
+    @contextmanager
+    def session(self) -> Iterator[RuntimeSession]:
+        """Borrow a session for several dependent round trips"""
+        session = self._acquire()
+        try:
+            yield session
+        except (OSError, RuntimeAPIError):
+            # The protocol stream may be out of sync; never reuse this session
+            session.close()
+            raise
+        finally:
+            self._release(session)
+
+    def pipeline(self, commands: List[str]) -> List[str]:
+        """Execute commands in a single round trip, returning one output per command"""
+        if not commands:
+            return []
+        with self.session() as session:
+            reused = session.connected
+            try:
+                return session.execute(commands)
+            except ConnectionError as e:
+                session.close()
+                if not reused:
+                    raise RuntimeAPIError(f"Runtime API connection failed: {e}") from e
+                # A pooled session may have been dropped by HAProxy; retry once on a fresh one
+                logger.debug(f"Reconnecting stale runtime API session: {e}")
+            except OSError as e:
+                raise RuntimeAPIError(f"Runtime API connection failed: {e}") from e
+            try:
+                return session.execute(commands)
+            except OSError as e:
+                raise RuntimeAPIError(f"Runtime API connection failed: {e}") from e
+
+    def execute(self, command: str) -> str:
+        """Execute a single command"""
+        return self.pipeline([command])[0]
+
+    def execute_checked(self, commands: List[str]) -> List[str]:
+        """Pipeline commands and raise RuntimeAPIError on the first failed mutation"""
+        outputs = self.pipeline(commands)
+        for cmd, output in zip(commands, outputs):
+            check_response(cmd, output)
+        return outputs
+
+    def close(self):
+        """Close all idle sessions"""
+        with self._lock:
+            for session in self._idle:
+                session.close()
+            self._idle = []
+
+
+class AsyncRuntimeSession:
+    """asyncio counterpart of RuntimeSession"""
+
+    def __init__(self, address: str, timeout: float = 10.0):
+        self.address = address
+        self.timeout = timeout
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.last_used = 0.0
+
+    @property
+    def connected(self) -> bool:
+        return self.writer is not None
+
+    async def connect(self):
+        """Open the connection and switch the CLI to interactive mode"""
+        family, addr = parse_address(self.address)
+        # readuntil() gives up past the stream limit; 'show stat' on a big config is several MB
+        if family == socket.AF_UNIX:
+            connect = asyncio.open_unix_connection(addr, limit=2 ** 24)
+        else:
+            connect = asyncio.open_connection(*addr, limit=2 ** 24)
+        self.reader, self.writer = await asyncio.wait_for(connect, self.timeout)
+        self.writer.write(b'prompt\n')
+        await self._read_response()
+        self.last_used = time.monotonic()
+
+    def close(self):
+        """Close the underlying connection"""
+        if self.writer is not None:
+            try:
+                self.writer.write(b'quit\n')
+                self.writer.close()
+            except (OSError, RuntimeError):
+                pass
+            self.reader = self.writer = None
+
+    async def execute(self, commands: List[str]) -> List[str]:
+        """Send all commands in one write and read one response per command"""
+        if self.writer is None:
+            await self.connect()
+        responses = []
+        try:
+            self.writer.write(''.join(f"{cmd}\n" for cmd in commands).encode())
+            await self.writer.drain()
+            previous = time.perf_counter()
+            for cmd in commands:
+                responses.append(await self._read_response())
+                now = time.perf_counter()
+                _observe_latency(cmd, now - previous)
+                previous = now
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            COMMAND_ERRORS.labels(verb=command_verb(commands[len(responses)]), kind='connection').inc()
+            raise
+        self.last_used = time.monotonic()
+        return responses
+
+    async def _read_response(self) -> str:
+        data = await asyncio.wait_for(self.reader.readuntil(PROMPT), self.timeout)
+        return data[:-len(PROMPT)].decode(errors='replace').rstrip('\n')
+
+
+class AsyncRuntimeClient:
+    """asyncio connection pool with the same pipelining and retry rules as RuntimeClient.
+
+    Bound to the event loop it is first used on; create one per loop.
+    """
+
+    def __init__(self, address: str, pool_size: int = 4, timeout: float = 10.0, max_idle: float = 25.0):
+        self.address = address
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._idle: List[AsyncRuntimeSession] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    async def _acquire(self) -> AsyncRuntimeSession:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.pool_size)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise RuntimeAPIError('Timed out waiting for a runtime API connection')
+        now = time.monotonic()
+        while self._idle:
+            session = self._idle.pop()
+            if now - session.last_used < self.max_idle:
+                return session
+            session.close()
+        return AsyncRuntimeSession(self.address, self.timeout)
+
+    def _release(self, session: AsyncRuntimeSession):
+        if session.connected:
+            self._idle.append(session)
+        self._slots.release()
+
+    async def pipeline(self, commands: List[str]) -> List[str]:
+        """Execute commands in a single round trip, returning one output per command"""
+        if not commands:
+            return []
+        session = await self._acquire()
+        try:
+            reused = session.connected
+            try:
+                return await session.execute(commands)
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                session.close()
+                if not reused:
+                    raise RuntimeAPIError(f"Runtime API connection failed: {e}") from e
+                logger.debug(f"Reconnecting stale runtime API session: {e}")
+            except (OSError, asyncio.TimeoutError) as e:
+                session.close()
+                raise RuntimeAPIError(f"Runtime API connection failed: {e}") from e
+            try:
+                return await session.execute(commands)
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+                session.close()
+                raise RuntimeAPIError(f"Runtime API connection failed: {e}") from e
+        except asyncio.CancelledError:
+            # Cancelled mid-response: the stream is out of sync
+            session.close()
+            raise
+        finally:
+            self._release(session)
+
+    async def execute(self, command: str) -> str:
+        """Execute a single command"""
+        return (await self.pipeline([command]))[0]
+
+    async def execute_checked(self, commands: List[str]) -> List[str]:
+        """Pipeline commands and raise RuntimeAPIError on the first failed mutation"""
+        outputs = await self.pipeline(commands)
+        for cmd, output in zip(commands, outputs):
+            check_response(cmd, output)
+        return outputs
+
+    def close(self):
+        """Close all idle sessions"""
+        for session in self._idle:
+            session.close()
+        self._idle = []
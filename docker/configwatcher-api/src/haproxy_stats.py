@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - HAProxy Statistics Engine
+Parses 'show stat', 'show stat typed' and 'show info' into a columnar
+snapshot indexed by (proxy, server), with TTL caches shared across threads
+or across the coroutines of an event loop
+"""
+
+import asyncio
+import csv
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 'svname' values HAProxy uses for proxy-level aggregate rows
+AGGREGATE_ROWS = ('FRONTEND', 'BACKEND')
+
+
+def _convert(value: str) -> Any:
+    if not value:
+        return None
+    if value.isdigit():
+        return int(value)
+    if value[0] == '-' and value[1:].isdigit():
+        return int(value)
+    return value
+
+
+class StatsSnapshot:
+    """Columnar view of one 'show stat' dump, indexed by (proxy, server)"""
+
+    def __init__(self, fields: List[str], rows: Iterable[List[str]]):
+        self.fields = fields
+        self.created = time.monotonic()
+        self.timestamp = time.time()
+        width = len(fields)
+        rows = [row if len(row) >= width else row + [''] * (width - len(row)) for row in rows]
+        # Transpose once; columns are converted from strings on first access
+        raw = list(zip(*rows)) if rows else [() for _ in fields]
+        self._raw: Dict[str, tuple] = dict(zip(fields, raw))
+        self._columns: Dict[str, List[Any]] = {}
+        self.size = len(rows)
+
+        self.index: Dict[Tuple[str, str], int] = {}
+        self.by_proxy: Dict[str, List[int]] = {}
+        pxnames = self._raw.get('pxname', ())
+        svnames = self._raw.get('svname', ())
+        for i in range(self.size):
+            proxy = pxnames[i]
+            self.index[(proxy, svnames[i])] = i
+            self.by_proxy.setdefault(proxy, []).append(i)
+
+    def column(self, field: str) -> List[Any]:
+        """All values of one field, converted to int/None where applicable"""
+        column = self._columns.get(field)
+        if column is None:
+            column = [_convert(v) for v in self._raw.get(field, ())]
+            self._columns[field] = column
+        return column
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.created
+
+    def _row(self, i: int) -> Dict[str, Any]:
+        return {field: _convert(values[i]) for field, values in self._raw.items() if values[i]}
+
+    def get(self, proxy: str, server: str) -> Optional[Dict[str, Any]]:
+        """Stats row for a server (or FRONTEND/BACKEND aggregate) of a proxy"""
+        i = self.index.get((proxy, server))
+        return self._row(i) if i is not None else None
+
+    def value(self, proxy: str, server: str, field: str) -> Any:
+        """Single field lookup without materializing the row"""
+        i = self.index.get((proxy, server))
+        if i is None or field not in self._raw:
+            return None
+        return self.column(field)[i]
+
+    def proxies(self) -> List[str]:
+        return list(self.by_proxy)
+
+    def has_proxy(self, proxy: str) -> bool:
+        return proxy in self.by_proxy
+
+    def servers(self, proxy: str) -> List[Dict[str, Any]]:
+        """Stats rows of the real servers in a proxy"""
+        svnames = self._raw.get('svname', ())
+        return [self._row(i) for i in self.by_proxy.get(proxy, [])
+                if svnames[i] not in AGGREGATE_ROWS]
+
+    def server_names(self, proxy: str) -> List[str]:
+        svnames = self._raw.get('svname', ())
+        return [svnames[i] for i in self.by_proxy.get(proxy, [])
+                if svnames[i] not in AGGREGATE_ROWS]
+
+    def summary(self) -> Dict[str, Any]:
+        """Frontend and backend aggregates, as served by /api/v1/stats"""
+        frontends, backends = [], []
+        for proxy in self.by_proxy:
+            frontend = self.get(proxy, 'FRONTEND')
+            if frontend:
+                frontends.append(frontend)
+            backend = self.get(proxy, 'BACKEND')
+            if backend:
+                servers = self.servers(proxy)
+                backend['active_servers'] = sum(1 for s in servers if s.get('act'))
+                backend['backup_servers'] = sum(1 for s in servers if s.get('bck'))
+                backend['healthy_servers'] = sum(1 for s in servers if str(s.get('status', '')).startswith('UP'))
+                backends.append(backend)
+        return {'frontends': frontends, 'backends': backends}
+
+
+def parse_stat_csv(text: str) -> StatsSnapshot:
+    """Parse 'show stat' CSV output"""
+    lines = text.splitlines()
+    if not lines or not lines[0].startswith('#'):
+        raise ValueError('Not a HAProxy stat dump: missing header line')
+    fields = [f for f in lines[0].lstrip('# ').split(',') if f]
+    return StatsSnapshot(fields, csv.reader(line for line in lines[1:] if line))
+
+
+def parse_stat_typed(text: str) -> StatsSnapshot:
+    """Parse 'show stat typed' output"""
+    fields: List[str] = []
+    seen = set()
+    objects: Dict[Tuple[str, str, str], Dict[str, str]] = {}
+    for line in text.splitlines():
+        if not line:
+            continue
+        key, _tags, _vtype, value = line.split(':', 3)
+        obj_type, proxy_id, obj_id, _pos, name = key.split('.')[:5]
+        if name not in seen:
+            seen.add(name)
+            fields.append(name)
+        objects.setdefault((obj_type, proxy_id, obj_id), {})[name] = value
+    return StatsSnapshot(fields, ([obj.get(f, '') for f in fields] for obj in objects.values()))
+
+
+def parse_info(text: str) -> Dict[str, Any]:
+    """Parse 'show info' output into a dict"""
+    info = {}
+    for line in text.splitlines():
+        name, sep, value = line.partition(':')
+        if sep:
+            info[name.strip()] = _convert(value.strip())
+    return info
+
+
+class StatsCache:
+    """TTL cache of a parsed stats snapshot, shared by all request threads.
+
+    Only one thread refreshes an expired snapshot; concurrent callers wait
+    for that refresh instead of each hitting the socket.
+    """
+
+    def __init__(self, fetch: Callable[[], str], parse: Callable[[str], Any] = parse_stat_csv, ttl: float = 2.0):
+        self.fetch = fetch
+        self.parse = parse
+        self.ttl = ttl
+        self._value = None
+        self._expires = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Bumped on every invalidation so linked caches notice it too
+        self.generation = 0
+
+    def get(self) -> Any:
+        """Return the cached snapshot, refreshing it if it has expired"""
+        if self._value is not None and time.monotonic() < self._expires:
+            self.hits += 1
+            return self._value
+        with self._lock:
+            # Another thread may have refreshed while we waited for the lock
+            if self._value is not None and time.monotonic() < self._expires:
+                self.hits += 1
+                return self._value
+            self.misses += 1
+            value = self.parse(self.fetch())
+            self._value = value
+            self._expires = time.monotonic() + self.ttl
+            return value
+
+    def invalidate(self):
+        """Force the next get() to refetch, e.g. after a server change"""
+        self._expires = 0.0
+        self.generation += 1
+
+
+class AsyncStatsCache:
+    """StatsCache for an event loop: one coroutine refreshes, the others await it.
+
+    Parsing runs in the default executor so a large dump does not stall the
+    loop. With linked, invalidating that (thread-side) cache expires this one.
+    """
+
+    def __init__(self, fetch: Callable[[], Awaitable[str]], parse: Callable[[str], Any] = parse_stat_csv,
+                 ttl: float = 2.0, linked: Optional[StatsCache] = None):
+        self.fetch = fetch
+        self.parse = parse
+        self.ttl = ttl
+        self.linked = linked
+        self._value = None
+        self._expires = 0.0
+        self._generation = linked.generation if linked else 0
+        self._lock: Optional[asyncio.Lock] = None
+        self.hits = 0
+        self.misses = 0
+
+    def _fresh(self) -> bool:
+        if self.linked is not None and self.linked.generation != self._generation:
+            return False
+        return self._value is not None and time.monotonic() < self._expires
+
+    async def get(self) -> Any:
+        """Return the cached snapshot, refreshing it if it has expired"""
+        if self._fresh():
+            self.hits += 1
+            return self._value
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._fresh():
+                self.hits += 1
+                return self._value
+            self.misses += 1
+            generation = self.linked.generation if self.linked else 0
+            text = await self.fetch()
+            value = await asyncio.get_running_loop().run_in_executor(None, self.parse, text)
+            self._value = value
+            self._expires = time.monotonic() + self.ttl
+            self._generation = generation
+            return value
+
+    def invalidate(self):
+        """Force the next get() to refetch"""
+        self._expires = 0.0
+
+
+def parse_servers_state(text: str) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    """Parse 'show servers state' output into rows keyed by (backend, server)"""
+    lines = text.splitlines()
+    header: List[str] = []
+    servers = {}
+    for line in lines:
+        if line.startswith('#'):
+            header = line.lstrip('# ').split()
+            continue
+        if not header or not line.strip():
+            continue
+        row = {name: _convert(value) for name, value in zip(header, line.split())}
+        servers[(str(row.get('be_name')), str(row.get('srv_name')))] = row
+    return servers
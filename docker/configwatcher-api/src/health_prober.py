@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - Background Health Prober
+Checks Redis, the blockchain RPC and HAProxy on its own schedule, each
+with a timeout and a circuit breaker, so the health endpoints only read
+a cached snapshot and never wait on a slow dependency themselves.
+"""
+
+import os
+import time
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class CircuitBreaker:
+    """Stop probing a dependency after repeated failures, then retry it once per cool-down.
+
+    The cool-down doubles after every failed retry, up to max_reset_timeout.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 15.0, max_reset_timeout: float = 120.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.failures = 0
+        self.state = CLOSED
+        self._cooldown = reset_timeout
+        self._opened_at = 0.0
+
+    def allow(self) -> bool:
+        """Whether the dependency should be probed now"""
+        if self.state == OPEN and time.monotonic() - self._opened_at >= self._cooldown:
+            self.state = HALF_OPEN
+        return self.state != OPEN
+
+    def success(self):
+        self.failures = 0
+        self.state = CLOSED
+        self._cooldown = self.reset_timeout
+
+    def failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN:
+            self._cooldown = min(self._cooldown * 2, self.max_reset_timeout)
+            self._open()
+        elif self.failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+
+
+class HealthProber:
+    """Runs dependency checks in the background and keeps the latest result of each.
+
+    A check is a callable that returns truthy when the dependency is up. Checks
+    that are not configured (None) are reported as 'not_configured'. Only the
+    critical checks decide readiness.
+    """
+
+    def __init__(self, checks: Dict[str, Optional[Callable[[], Any]]], critical: Iterable[str] = (),
+                 interval: float = 5.0, timeout: float = 2.0, failure_threshold: int = 3,
+                 reset_timeout: float = 15.0):
+        self.checks = {name: check for name, check in checks.items() if check is not None}
+        self.critical = [name for name in critical if name in self.checks]
+        self.interval = interval
+        self.timeout = timeout
+        # A snapshot older than this means the prober itself has stalled
+        self.stale_after = 3 * interval + timeout
+        self.breakers = {name: CircuitBreaker(failure_threshold, reset_timeout) for name in self.checks}
+        self._results: Dict[str, Dict[str, Any]] = {
+            name: {'status': 'unknown' if name in self.checks else 'not_configured'} for name in checks
+        }
+        self._checked: Dict[str, float] = {}
+        self._started: Optional[float] = None
+        self._updated: Optional[float] = None
+        self._lock = threading.Lock()
+        self._running: Dict[str, Future] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+
+    def start(self):
+        """Start the prober thread in this process (idempotent, fork-aware)"""
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._started = time.monotonic()
+            self._updated = None
+            self._running = {}
+            # One thread per check: a hung check can only ever hold its own
+            self._executor = ThreadPoolExecutor(max(1, len(self.checks)), thread_name_prefix='health-check')
+            self._thread = threading.Thread(target=self._loop, name='health-prober', daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            try:
+                self.probe()
+            except Exception as e:
+                logger.error(f"Health probe round failed: {e}")
+            time.sleep(self.interval)
+
+    def probe(self):
+        """Run one round of checks, waiting at most timeout for all of them"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max(1, len(self.checks)), thread_name_prefix='health-check')
+        submitted = {}
+        for name, check in self.checks.items():
+            previous = self._running.get(name)
+            if previous is not None and not previous.done():
+                self._record(name, False, None, 'previous check still running', timed_out=True)
+                continue
+            if not self.breakers[name].allow():
+                with self._lock:
+                    self._results[name] = dict(self._results[name], circuit=OPEN)
+                continue
+            future = self._executor.submit(self._timed, check)
+            self._running[name] = future
+            submitted[name] = future
+
+        deadline = time.monotonic() + self.timeout
+        for name, future in submitted.items():
+            try:
+                ok, latency = future.result(timeout=max(0.0, deadline - time.monotonic()))
+                self._record(name, ok, latency, None if ok else 'check returned false')
+            except FutureTimeoutError:
+                self._record(name, False, None, f'timed out after {self.timeout}s', timed_out=True)
+            except Exception as e:
+                self._record(name, False, None, str(e))
+        with self._lock:
+            self._updated = time.monotonic()
+
+    @staticmethod
+    def _timed(check: Callable[[], Any]):
+        start = time.perf_counter()
+        ok = bool(check())
+        return ok, time.perf_counter() - start
+
+    def _record(self, name: str, ok: bool, latency: Optional[float], error: Optional[str], timed_out: bool = False):
+        breaker = self.breakers[name]
+        if ok:
+            breaker.success()
+        else:
+            breaker.failure()
+        result = {
+            'status': 'up' if ok else 'down',
+            'checked_at': datetime.utcnow().isoformat(),
+            'circuit': breaker.state,
+        }
+        if latency is not None:
+            result['latency_ms'] = round(latency * 1000, 2)
+        if error:
+            result['error'] = error
+        if timed_out:
+            result['timed_out'] = True
+        with self._lock:
+            self._results[name] = result
+            self._checked[name] = time.monotonic()
+
+    @property
+    def age(self) -> Optional[float]:
+        """Seconds since the last completed round, None before the first one"""
+        return None if self._updated is None else time.monotonic() - self._updated
+
+    def status(self, name: str) -> str:
+        """Cached status of one dependency: up, down, unknown or not_configured"""
+        return self._results[name]['status']
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Latest result of every check, with ages; never runs a check"""
+        now = time.monotonic()
+        with self._lock:
+            results = {name: dict(result) for name, result in self._results.items()}
+            for name, checked in self._checked.items():
+                results[name]['age_seconds'] = round(now - checked, 3)
+        age = self.age
+        return {
+            'checks': results,
+            'age_seconds': None if age is None else round(age, 3),
+            'stale': age is None or age > self.stale_after,
+        }
+
+    def live(self) -> bool:
+        """The prober thread is still completing rounds"""
+        last = self._updated if self._updated is not None else self._started
+        return last is not None and time.monotonic() - last <= self.stale_after
+
+    def ready(self) -> bool:
+        """Every critical dependency was up in a recent round"""
+        age = self.age
+        if age is None or age > self.stale_after:
+            return False
+        return all(self._results[name]['status'] == 'up' for name in self.critical)
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - IP Address Management
+Hands out addresses for dynamic backend containers from per-zone pools.
+Each pool is a bitmap in Redis, one bit per address, with a lease hash
+next to it. Allocation and release are Lua scripts, so the replicas that
+share a Redis never hand out the same address. Without Redis the same
+bitmap is kept in memory.
+
+Allocation is next-fit: the search starts at the byte of the previous
+allocation, so it usually ends within a byte or two. It also means a
+released address is not reused until the pool wraps around.
+"""
+
+import json
+import time
+import logging
+import ipaddress
+import threading
+from typing import Any, Container, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# KEYS: bitmap, leases, cursor  ARGV: size, first address as an integer, owner, replica, time
+ALLOCATE_SCRIPT = """
+local size = tonumber(ARGV[1])
+local last = math.floor((size - 1) / 8)
+-- BITPOS with an end byte only looks at bytes that exist, so grow the bitmap to full length first
+if redis.call('STRLEN', KEYS[1]) <= last then
+    redis.call('SETRANGE', KEYS[1], last, '\\0')
+end
+local cursor = tonumber(redis.call('GET', KEYS[3]) or '0')
+local pos = redis.call('BITPOS', KEYS[1], 0, cursor, last)
+if (pos < 0 or pos >= size) and cursor > 0 then
+    pos = redis.call('BITPOS', KEYS[1], 0, 0, cursor)
+end
+if pos < 0 or pos >= size then
+    return -1
+end
+local n = tonumber(ARGV[2]) + pos
+local ip = string.format('%d.%d.%d.%d', math.floor(n / 16777216) % 256, math.floor(n / 65536) % 256,
+                         math.floor(n / 256) % 256, n % 256)
+redis.call('SETBIT', KEYS[1], pos, 1)
+redis.call('SET', KEYS[3], math.floor(pos / 8))
+redis.call('HSET', KEYS[2], pos, cjson.encode({owner = ARGV[3], ip = ip, replica = ARGV[4],
+                                               allocated_at = tonumber(ARGV[5])}))
+return pos
+"""
+
+# KEYS: bitmap, leases  ARGV: offset, lease
+RESERVE_SCRIPT = """
+if redis.call('GETBIT', KEYS[1], ARGV[1]) == 1 then
+    return 0
+end
+redis.call('SETBIT', KEYS[1], ARGV[1], 1)
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+return 1
+"""
+
+# KEYS: bitmap, leases  ARGV: offset, owner ('' for any)
+RELEASE_SCRIPT = """
+local lease = redis.call('HGET', KEYS[2], ARGV[1])
+if ARGV[2] ~= '' and (not lease or cjson.decode(lease)['owner'] ~= ARGV[2]) then
+    return 0
+end
+local was = redis.call('SETBIT', KEYS[1], ARGV[1], 0)
+redis.call('HDEL', KEYS[2], ARGV[1])
+if lease or was == 1 then
+    return 1
+end
+return 0
+"""
+
+# Byte -> 1 if all eight addresses in it are taken; finds a byte with a free bit at C speed
+_FULL = bytes(1 if b == 0xFF else 0 for b in range(256))
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class IPPool:
+    """Addresses first..last of a zone's subnet"""
+
+    def __init__(self, zone: str, subnet: str, first: Optional[str] = None, last: Optional[str] = None):
+        self.zone = zone
+        self.subnet = ipaddress.ip_network(subnet)
+        if self.subnet.version != 4:
+            raise ValueError(f"IPAM pool {zone}: only IPv4 subnets are supported")
+        hosts = self.subnet.num_addresses
+        # Skip the network address, the gateway (.1 by Docker's convention) and the broadcast address
+        self.first = ipaddress.ip_address(first) if first else self.subnet.network_address + 2
+        self.last = ipaddress.ip_address(last) if last else self.subnet.network_address + hosts - 2
+        if self.first not in self.subnet or self.last not in self.subnet or self.last < self.first:
+            raise ValueError(f"IPAM pool {zone}: range {self.first}-{self.last} is not inside {self.subnet}")
+        self.size = int(self.last) - int(self.first) + 1
+
+    def address(self, offset: int) -> str:
+        return str(self.first + offset)
+
+    def offset(self, ip: str) -> Optional[int]:
+        """Offset of an address in this pool, or None if it is outside it"""
+        try:
+            offset = int(ipaddress.ip_address(ip)) - int(self.first)
+        except ValueError:
+            return None
+        return offset if 0 <= offset < self.size else None
+
+    def describe(self) -> Dict[str, Any]:
+        return {'zone': self.zone, 'subnet': str(self.subnet), 'first': str(self.first), 'last': str(self.last),
+                'size': self.size}
+
+
+def parse_pools(spec: str) -> Dict[str, IPPool]:
+    """'eu=10.1.0.0/16:10.1.0.50-10.1.0.254,us=10.2.0.0/16' -> {zone: IPPool}"""
+    pools = {}
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        zone, sep, rest = item.partition('=')
+        if not sep or not zone.strip():
+            raise ValueError(f"IPAM pool '{item}' must look like zone=subnet[:first-last]")
+        subnet, _, address_range = rest.partition(':')
+        first, _, last = address_range.partition('-')
+        pools[zone.strip()] = IPPool(zone.strip(), subnet.strip(), first.strip() or None, last.strip() or None)
+    return pools
+
+
+class IPAM:
+    """Address pools with leases, shared through Redis when there is one"""
+
+    def __init__(self, pools: Dict[str, IPPool], redis_client=None, prefix: str = 'configwatcher:ipam',
+                 replica_id: Optional[str] = None):
+        self.pools = pools
+        self.redis = redis_client
+        self.prefix = prefix
+        self.replica_id = replica_id
+        self._lock = threading.Lock()
+        self._bitmaps = {zone: self._new_bitmap(pool.size) for zone, pool in pools.items()}
+        self._leases: Dict[str, Dict[int, str]] = {zone: {} for zone in pools}
+        self._cursors = {zone: 0 for zone in pools}
+        if redis_client is not None:
+            self._allocate = redis_client.register_script(ALLOCATE_SCRIPT)
+            self._reserve = redis_client.register_script(RESERVE_SCRIPT)
+            self._release = redis_client.register_script(RELEASE_SCRIPT)
+
+    @staticmethod
+    def _new_bitmap(size: int) -> bytearray:
+        bitmap = bytearray((size + 7) // 8)
+        if size % 8:
+            # Bits past the end of the pool count as taken, so a search never stops on them
+            bitmap[-1] = 0xFF >> (size % 8)
+        return bitmap
+
+    def _keys(self, zone: str) -> List[str]:
+        return [f"{self.prefix}:{zone}:bitmap", f"{self.prefix}:{zone}:leases", f"{self.prefix}:{zone}:cursor"]
+
+    def pool(self, zone: str) -> IPPool:
+        pool = self.pools.get(zone)
+        if pool is None:
+            raise KeyError(f"No IPAM pool for zone '{zone}'")
+        return pool
+
+    def pool_for(self, ip: str) -> Optional[IPPool]:
+        for pool in self.pools.values():
+            if pool.offset(ip) is not None:
+                return pool
+        return None
+
+    def _lease(self, pool: IPPool, offset: int, owner: str) -> str:
+        return json.dumps({'owner': owner, 'ip': pool.address(offset), 'replica': self.replica_id,
+                           'allocated_at': time.time()})
+
+    def allocate(self, zone: str, owner: str, in_use: Container[str] = ()) -> str:
+        """Lease the next free address of the zone's pool to owner.
+
+        Addresses found in in_use (e.g. containers created before IPAM, or by
+        hand) are leased to 'external' and skipped.
+        """
+        pool = self.pool(zone)
+        for _ in range(pool.size):
+            offset = self._take(pool, owner)
+            if offset is None:
+                raise PoolExhausted(f"IPAM pool {zone} ({pool.first}-{pool.last}) has no free addresses")
+            ip = pool.address(offset)
+            if ip not in in_use:
+                return ip
+            self._relabel(pool, offset, 'external')
+        raise PoolExhausted(f"IPAM pool {zone} ({pool.first}-{pool.last}) has no free addresses")
+
+    def _take(self, pool: IPPool, owner: str) -> Optional[int]:
+        zone = pool.zone
+        if self.redis is not None:
+            offset = int(self._allocate(keys=self._keys(zone), args=[pool.size, int(pool.first), owner,
+                                                                     self.replica_id or '', time.time()]))
+            return offset if offset >= 0 else None
+        with self._lock:
+            bitmap = self._bitmaps[zone]
+            cursor = self._cursors[zone]
+            index = cursor if bitmap[cursor] != 0xFF else bitmap.translate(_FULL).find(0, cursor)
+            if index < 0 and cursor:
+                index = bitmap.translate(_FULL).find(0, 0, cursor + 1)
+            if index < 0:
+                return None
+            byte = bitmap[index]
+            bit = next(b for b in range(8) if not byte & (0x80 >> b))
+            offset = index * 8 + bit
+            bitmap[index] |= 0x80 >> bit
+            self._cursors[zone] = index
+            self._leases[zone][offset] = self._lease(pool, offset, owner)
+            return offset
+
+    def _relabel(self, pool: IPPool, offset: int, owner: str):
+        lease = self._lease(pool, offset, owner)
+        if self.redis is not None:
+            self.redis.hset(self._keys(pool.zone)[1], offset, lease)
+        else:
+            with self._lock:
+                self._leases[pool.zone][offset] = lease
+
+    def reserve(self, zone: str, ip: str, owner: str) -> bool:
+        """Lease a specific address; False if it is already leased"""
+        pool = self.pool(zone)
+        offset = pool.offset(ip)
+        if offset is None:
+            raise ValueError(f"{ip} is outside IPAM pool {zone} ({pool.first}-{pool.last})")
+        if self.redis is not None:
+            return bool(self._reserve(keys=self._keys(zone)[:2], args=[offset, self._lease(pool, offset, owner)]))
+        with self._lock:
+            bitmap = self._bitmaps[zone]
+            mask = 0x80 >> (offset % 8)
+            if bitmap[offset // 8] & mask:
+                return False
+            bitmap[offset // 8] |= mask
+            self._leases[zone][offset] = self._lease(pool, offset, owner)
+            return True
+
+    def release(self, ip: str, owner: Optional[str] = None) -> bool:
+        """Return an address to its pool; with owner, only if it is still leased to owner"""
+        pool = self.pool_for(ip)
+        if pool is None:
+            return False
+        offset = pool.offset(ip)
+        if self.redis is not None:
+            return bool(self._release(keys=self._keys(pool.zone)[:2], args=[offset, owner or '']))
+        with self._lock:
+            leases = self._leases[pool.zone]
+            if owner and (offset not in leases or json.loads(leases[offset])['owner'] != owner):
+                return False
+            bitmap = self._bitmaps[pool.zone]
+            mask = 0x80 >> (offset % 8)
+            was = bool(bitmap[offset // 8] & mask)
+            bitmap[offset // 8] &= ~mask
+            return leases.pop(offset, None) is not None or was
+
+    def leases(self, zone: str) -> Dict[str, Dict[str, Any]]:
+        """ip -> lease, in address order"""
+        pool = self.pool(zone)
+        if self.redis is not None:
+            raw = self.redis.hgetall(self._keys(zone)[1])
+        else:
+            with self._lock:
+                raw = dict(self._leases[zone])
+        return {pool.address(offset): json.loads(raw_lease)
+                for offset, raw_lease in sorted((int(k), v) for k, v in raw.items())}
+
+    def reclaim(self, zone: str, in_use: Container[str], grace: float = 300.0) -> List[str]:
+        """Release leases older than grace whose address no container uses.
+
+        These are left behind by creates that died half way, or by containers
+        removed outside the API. The grace period covers creates in progress.
+        """
+        cutoff = time.time() - grace
+        released = []
+        for ip, lease in self.leases(zone).items():
+            if ip not in in_use and lease.get('allocated_at', 0) < cutoff:
+                if self.release(ip, owner=lease.get('owner')):
+                    released.append(ip)
+        if released:
+            logger.info(f"Reclaimed {len(released)} stale IPAM leases in zone {zone}")
+        return released
+
+    def stats(self, zone: str) -> Dict[str, Any]:
+        pool = self.pool(zone)
+        # Every taken address has a lease
+        if self.redis is not None:
+            allocated = self.redis.hlen(self._keys(zone)[1])
+        else:
+            allocated = len(self._leases[zone])
+        return dict(pool.describe(), allocated=allocated, free=pool.size - allocated,
+                    shared=self.redis is not None)
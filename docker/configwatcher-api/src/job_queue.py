@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - Background Job Queue
+Runs long operations (reload, validate, container create) on a bounded
+pool of worker threads instead of in the request handler. Jobs live in
+Redis: a job claimed by a gunicorn worker that gets recycled is handed
+back to the queue once that worker's heartbeat expires. The heartbeat is
+renewed while a job runs, so a job longer than its TTL is not mistaken
+for a lost one and run twice.
+"""
+
+import os
+import json
+import queue
+import socket
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ('queued', 'running', 'done', 'failed')
+
+
+def new_job(job_type: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'id': uuid.uuid4().hex,
+        'type': job_type,
+        'status': 'queued',
+        'payload': payload,
+        'result': None,
+        'error': None,
+        'attempts': 0,
+        'worker': None,
+        'created': datetime.utcnow().isoformat(),
+        'started': None,
+        'finished': None,
+    }
+
+
+class MemoryJobStore:
+    """Process-local store, used when Redis is not available"""
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._queue: 'queue.Queue[str]' = queue.Queue()
+        self._dedupe: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def enqueue(self, job: Dict[str, Any], dedupe_key: Optional[str] = None) -> Dict[str, Any]:
+        with self._lock:
+            if dedupe_key:
+                existing = self._jobs.get(self._dedupe.get(dedupe_key, ''))
+                if existing and existing['status'] == 'queued':
+                    return existing
+                self._dedupe[dedupe_key] = job['id']
+            self._jobs[job['id']] = job
+        self._queue.put(job['id'])
+        return job
+
+    def save(self, job: Dict[str, Any]):
+        with self._lock:
+            self._jobs[job['id']] = job
+
+    def load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def claim(self, consumer: str, timeout: float) -> Optional[str]:
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def ack(self, consumer: str, job_id: str):
+        pass
+
+    def heartbeat(self, consumer: str, ttl: int):
+        pass
+
+    def recover(self, max_attempts: int) -> int:
+        return 0
+
+
+class RedisJobStore:
+    """Reliable queue in Redis: claimed jobs sit in a per-consumer processing list until acked"""
+
+    def __init__(self, redis_client, prefix: str = 'configwatcher:jobs', ttl: int = 86400):
+        self.redis = redis_client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def _key(self, *parts: str) -> str:
+        return ':'.join((self.prefix,) + parts)
+
+    def enqueue(self, job: Dict[str, Any], dedupe_key: Optional[str] = None) -> Dict[str, Any]:
+        if dedupe_key:
+            # Join a job of the same kind that is still waiting in the queue
+            key = self._key('dedupe', dedupe_key)
+            if not self.redis.set(key, job['id'], nx=True, ex=self.ttl):
+                existing = self.load((self.redis.get(key) or b'').decode())
+                if existing and existing['status'] == 'queued':
+                    return existing
+                self.redis.set(key, job['id'], ex=self.ttl)
+            job['dedupe_key'] = dedupe_key
+        pipe = self.redis.pipeline()
+        pipe.set(self._key('job', job['id']), json.dumps(job), ex=self.ttl)
+        pipe.lpush(self._key('queue'), job['id'])
+        pipe.execute()
+        return job
+
+    def save(self, job: Dict[str, Any]):
+        if job['status'] == 'running' and job.get('dedupe_key'):
+            # Once started, later requests must queue a fresh job
+            key = self._key('dedupe', job['dedupe_key'])
+            pipe = self.redis.pipeline()
+            pipe.set(self._key('job', job['id']), json.dumps(job), ex=self.ttl)
+            if (self.redis.get(key) or b'').decode() == job['id']:
+                pipe.delete(key)
+            pipe.execute()
+            return
+        self.redis.set(self._key('job', job['id']), json.dumps(job), ex=self.ttl)
+
+    def load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if not job_id:
+            return None
+        data = self.redis.get(self._key('job', job_id))
+        return json.loads(data) if data else None
+
+    def claim(self, consumer: str, timeout: float) -> Optional[str]:
+        job_id = self.redis.blmove(self._key('queue'), self._key('processing', consumer),
+                                   timeout, 'RIGHT', 'LEFT')
+        return job_id.decode() if job_id else None
+
+    def ack(self, consumer: str, job_id: str):
+        self.redis.lrem(self._key('processing', consumer), 1, job_id)
+
+    def heartbeat(self, consumer: str, ttl: int):
+        self.redis.set(self._key('consumer', consumer), '1', ex=ttl)
+
+    def recover(self, max_attempts: int) -> int:
+        """Requeue jobs held by consumers whose heartbeat has expired"""
+        recovered = 0
+        for key in self.redis.scan_iter(match=self._key('processing', '*')):
+            key = key.decode()
+            consumer = key[len(self._key('processing', '')):]
+            if self.redis.exists(self._key('consumer', consumer)):
+                continue
+            while True:
+                job_id = self.redis.rpop(key)
+                if job_id is None:
+                    break
+                job = self.load(job_id.decode())
+                if job is None:
+                    continue
+                if job['attempts'] >= max_attempts:
+                    job.update(status='failed', error='Worker lost too many times', finished=datetime.utcnow().isoformat())
+                    self.save(job)
+                    continue
+                job['status'] = 'queued'
+                self.save(job)
+                self.redis.lpush(self._key('queue'), job['id'])
+                recovered += 1
+                logger.warning(f"Requeued job {job['id']} ({job['type']}) from lost worker {consumer}")
+        return recovered
+
+
+class JobQueue:
+    """Bounded pool of worker threads executing queued jobs by type"""
+
+    def __init__(self, redis_client=None, workers: int = 2, heartbeat_ttl: int = 30, max_attempts: int = 3,
+                 prefix: str = 'configwatcher:jobs'):
+        # Jobs act on one zone's HAProxy, so each zone needs its own prefix on a shared Redis
+        self.store = RedisJobStore(redis_client, prefix) if redis_client is not None else MemoryJobStore()
+        self.workers = workers
+        self.heartbeat_ttl = heartbeat_ttl
+        self.max_attempts = max_attempts
+        self.handlers: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {}
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._pid = None
+        self._last_recovery = 0.0
+
+    def register(self, job_type: str, handler: Callable[[Dict[str, Any]], Dict[str, Any]]):
+        """Register the function that runs jobs of job_type; it receives the payload"""
+        self.handlers[job_type] = handler
+
+    def start(self):
+        """Start worker threads in this process (idempotent, fork-aware)"""
+        with self._lock:
+            if self._pid == os.getpid() and all(t.is_alive() for t in self._threads):
+                return
+            self._pid = os.getpid()
+            self._threads = []
+            for i in range(self.workers):
+                consumer = f"{socket.gethostname()}:{os.getpid()}:{i}"
+                thread = threading.Thread(target=self._work, args=(consumer,), name=f'job-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, job_type: str, payload: Dict[str, Any], dedupe_key: Optional[str] = None) -> Dict[str, Any]:
+        """Queue a job; with dedupe_key, join an identical job that has not started yet"""
+        if job_type not in self.handlers:
+            raise ValueError(f"Unknown job type: {job_type}")
+        self.start()
+        return self.store.enqueue(new_job(job_type, payload), dedupe_key)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.load(job_id)
+
+    def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Poll a job until it finishes or the timeout expires"""
+        deadline = time.monotonic() + timeout
+        job = self.get(job_id)
+        while job and job['status'] in ('queued', 'running') and time.monotonic() < deadline:
+            time.sleep(0.05)
+            job = self.get(job_id)
+        return job
+
+    def _work(self, consumer: str):
+        while True:
+            try:
+                self.store.heartbeat(consumer, self.heartbeat_ttl)
+                if time.monotonic() - self._last_recovery > self.heartbeat_ttl:
+                    self._last_recovery = time.monotonic()
+                    self.store.recover(self.max_attempts)
+                job_id = self.store.claim(consumer, timeout=min(5, self.heartbeat_ttl / 3))
+                if job_id:
+                    self._execute(consumer, job_id)
+            except Exception as e:
+                logger.error(f"Job worker {consumer} error: {e}")
+                time.sleep(1)
+
+    def _execute(self, consumer: str, job_id: str):
+        job = self.store.load(job_id)
+        if job is None:
+            self.store.ack(consumer, job_id)
+            return
+        job.update(status='running', worker=consumer, started=datetime.utcnow().isoformat(),
+                   attempts=job['attempts'] + 1)
+        self.store.save(job)
+        done = threading.Event()
+        renewer = threading.Thread(target=self._renew, args=(consumer, done), name=f'job-lease-{job_id[:8]}',
+                                   daemon=True)
+        renewer.start()
+        try:
+            result = self.handlers[job['type']](job['payload'])
+            job.update(status='done' if result.get('success', True) else 'failed', result=result)
+        except Exception as e:
+            logger.error(f"Job {job_id} ({job['type']}) failed: {e}")
+            job.update(status='failed', error=str(e))
+        finally:
+            done.set()
+            renewer.join()
+        job['finished'] = datetime.utcnow().isoformat()
+        self.store.save(job)
+        self.store.ack(consumer, job_id)
+
+    def _renew(self, consumer: str, done: threading.Event):
+        """Keep the consumer's heartbeat alive while its job runs"""
+        while not done.wait(self.heartbeat_ttl / 3):
+            try:
+                self.store.heartbeat(consumer, self.heartbeat_ttl)
+            except Exception as e:
+                logger.warning(f"Failed to renew the heartbeat of job worker {consumer}: {e}")
@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - HAProxy Log Analytics
+Reads HAProxy 'option httplog' lines from a syslog UDP socket or a log file
+and keeps rolling statistics per backend and server:
+
+- latency percentiles of the total request time (Ta) and of the server's
+  response time (Tr), in log-bucketed sketches with 1% relative error that
+  merge by adding buckets, so slots, servers and replicas combine exactly
+- request rates by status class
+- the paths with the most slow requests (Space-Saving, bounded)
+
+Statistics are kept in time slots; a query merges the slots of the window.
+Memory stays bounded whatever the traffic: at most max_keys servers per slot,
+top_capacity paths per slot and some hundred buckets per sketch.
+"""
+
+import os
+import re
+import json
+import math
+import time
+import errno
+import socket
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from metrics import HAPROXY_LOG_LATENCY, HAPROXY_LOG_RATE, LOG_LINES
+
+logger = logging.getLogger(__name__)
+
+# The default 'option httplog' format, after any syslog header:
+# %ci:%cp [%tr] %ft %b/%s %TR/%Tw/%Tc/%Tr/%Ta %ST %B %CC %CS %tsc %ac/%fc/%bc/%sc/%rc %sq/%bq %hr %hs %{+Q}r
+HTTPLOG_RE = re.compile(
+    r'\[[^\]]*\] \S+ ([^/ ]+)/(\S+) -?\d+/-?\d+/-?\d+/(-?\d+)/\+?(\d+) (-?\d+) \+?\d+ \S+ \S+ \S+ '
+    r'[^"]*"\S+ ([^ ?"]*)'
+)
+
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+# Timers are whole milliseconds, so buckets of the common values are looked up, not computed
+_BUCKETS = [0] * 2 + [math.ceil(math.log(ms) / LOG_GAMMA) for ms in range(2, 1 << 16)]
+
+STATUS_CLASSES = ('other', '1xx', '2xx', '3xx', '4xx', '5xx')
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+def bucket(ms: int) -> int:
+    return _BUCKETS[ms] if ms < 65536 else math.ceil(math.log(ms) / LOG_GAMMA)
+
+
+class LatencySketch:
+    """Counts per logarithmic bucket; any quantile is within 1% of the true value"""
+
+    __slots__ = ('bins', 'count', 'max')
+
+    def __init__(self, bins: Optional[Dict[int, int]] = None, count: int = 0, max: int = 0):
+        self.bins = bins if bins is not None else {}
+        self.count = count
+        self.max = max
+
+    def add(self, ms: int):
+        index = _BUCKETS[ms] if ms < 65536 else bucket(ms)
+        self.bins[index] = self.bins.get(index, 0) + 1
+        self.count += 1
+        if ms > self.max:
+            self.max = ms
+
+    def merge(self, other: 'LatencySketch'):
+        bins = self.bins
+        for index, n in other.bins.items():
+            bins[index] = bins.get(index, 0) + n
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                # Midpoint of the bucket in relative terms, capped by the largest value seen
+                return min(round(2 * GAMMA ** index / (GAMMA + 1), 1) if index else 0.0, float(self.max))
+        return float(self.max)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'bins': self.bins, 'count': self.count, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'LatencySketch':
+        return cls({int(k): v for k, v in data['bins'].items()}, data['count'], data['max'])
+
+
+class SpaceSaving:
+    """The capacity keys seen most often, with counts overestimated by at most 'error'"""
+
+    __slots__ = ('capacity', 'entries')
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        # key -> [count, error, total ms, max ms]
+        self.entries: Dict[str, List[int]] = {}
+
+    def add(self, key: str, ms: int, count: int = 1, error: int = 0, total: Optional[int] = None,
+            max_ms: Optional[int] = None):
+        entry = self.entries.get(key)
+        if entry is None:
+            if len(self.entries) >= self.capacity:
+                # Take over the least counted key, inheriting its count as the error bound
+                victim = min(self.entries, key=lambda k: self.entries[k][0])
+                floor = self.entries.pop(victim)[0]
+                entry = self.entries[key] = [floor, floor, 0, 0]
+            else:
+                entry = self.entries[key] = [0, 0, 0, 0]
+        entry[0] += count
+        entry[1] += error
+        entry[2] += ms if total is None else total
+        entry[3] = max(entry[3], ms if max_ms is None else max_ms)
+
+    def merge(self, other: 'SpaceSaving'):
+        for key, (count, error, total, max_ms) in other.entries.items():
+            self.add(key, 0, count, error, total, max_ms)
+
+    def top(self, n: int) -> List[Dict[str, Any]]:
+        ranked = sorted(self.entries.items(), key=lambda item: item[1][0], reverse=True)[:n]
+        return [{'path': key, 'slow_requests': count, 'error_bound': error,
+                 'mean_ms': round(total / count, 1) if count else None, 'max_ms': max_ms}
+                for key, (count, error, total, max_ms) in ranked]
+
+
+class ServerStats:
+    __slots__ = ('total', 'response', 'statuses')
+
+    def __init__(self):
+        self.total = LatencySketch()
+        self.response = LatencySketch()
+        self.statuses = [0] * len(STATUS_CLASSES)
+
+    def merge(self, other: 'ServerStats'):
+        self.total.merge(other.total)
+        self.response.merge(other.response)
+        self.statuses = [a + b for a, b in zip(self.statuses, other.statuses)]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'total': self.total.to_dict(), 'response': self.response.to_dict(), 'statuses': self.statuses}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ServerStats':
+        stats = cls()
+        stats.total = LatencySketch.from_dict(data['total'])
+        stats.response = LatencySketch.from_dict(data['response'])
+        stats.statuses = list(data['statuses'])
+        return stats
+
+
+class Window:
+    """Statistics of a span of time; windows of other slots or replicas merge into it"""
+
+    def __init__(self, seconds: float = 0.0, top_capacity: int = 100):
+        self.seconds = seconds
+        self.servers: Dict[Tuple[str, str], ServerStats] = {}
+        self.slow = SpaceSaving(top_capacity)
+        self.lines = 0
+        self.unparsed = 0
+        self.dropped = 0
+
+    def merge(self, other: 'Window'):
+        for key, stats in other.servers.items():
+            mine = self.servers.get(key)
+            if mine is None:
+                mine = self.servers[key] = ServerStats()
+            mine.merge(stats)
+        self.slow.merge(other.slow)
+        self.lines += other.lines
+        self.unparsed += other.unparsed
+        self.dropped += other.dropped
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'seconds': self.seconds, 'lines': self.lines, 'unparsed': self.unparsed, 'dropped': self.dropped,
+            'servers': [[backend, server, stats.to_dict()] for (backend, server), stats in self.servers.items()],
+            'slow': self.slow.entries
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], top_capacity: int = 100) -> 'Window':
+        window = cls(data['seconds'], top_capacity)
+        window.lines, window.unparsed, window.dropped = data['lines'], data['unparsed'], data['dropped']
+        window.servers = {(backend, server): ServerStats.from_dict(stats) for backend, server, stats in data['servers']}
+        window.slow.entries = {key: list(entry) for key, entry in data['slow'].items()}
+        return window
+
+    def summary(self, backend: Optional[str] = None, top: int = 10) -> Dict[str, Any]:
+        """Percentiles and rates per backend and server, and the slowest paths"""
+        seconds = max(self.seconds, 1e-9)
+
+        def describe(stats: ServerStats) -> Dict[str, Any]:
+            return {
+                'requests': stats.total.count,
+                'rps': round(stats.total.count / seconds, 2),
+                'status_rps': {name: round(n / seconds, 2) for name, n in zip(STATUS_CLASSES, stats.statuses) if n},
+                'latency_ms': {f'p{q * 100:g}': stats.total.quantile(q) for q in QUANTILES},
+                'response_ms': {f'p{q * 100:g}': stats.response.quantile(q) for q in QUANTILES},
+                'max_ms': stats.total.max
+            }
+
+        backends: Dict[str, Dict[str, ServerStats]] = {}
+        for (name, server), stats in self.servers.items():
+            if backend is None or name == backend:
+                backends.setdefault(name, {})[server] = stats
+        result = {}
+        for name, servers in sorted(backends.items()):
+            merged = ServerStats()
+            for stats in servers.values():
+                merged.merge(stats)
+            result[name] = dict(describe(merged), servers={server: describe(stats)
+                                                           for server, stats in sorted(servers.items())})
+        slow = self.slow
+        if backend is not None:
+            slow = SpaceSaving(self.slow.capacity)
+            slow.entries = {key: entry for key, entry in self.slow.entries.items()
+                            if key.startswith(f'{backend} ')}
+        return {
+            'window_s': round(self.seconds, 1),
+            'lines': self.lines,
+            'unparsed': self.unparsed,
+            'dropped': self.dropped,
+            'backends': result,
+            'slow_paths': slow.top(top)
+        }
+
+
+class LogAnalytics:
+    """Rolling statistics over the last window seconds, in slots of slot_seconds"""
+
+    def __init__(self, window: float = 300.0, slot_seconds: float = 10.0, slow_ms: int = 1000,
+                 top_capacity: int = 100, max_keys: int = 5000):
+        self.window = window
+        self.slot_seconds = slot_seconds
+        self.slow_ms = slow_ms
+        self.top_capacity = top_capacity
+        self.max_keys = max_keys
+        self.started = time.time()
+        self._slots: deque = deque()
+        self._current: Optional[Window] = None
+        self._current_slot = None
+        self._lock = threading.Lock()
+
+    def _slot(self, now: float) -> Window:
+        number = int(now // self.slot_seconds)
+        if number != self._current_slot:
+            self._current = Window(self.slot_seconds, self.top_capacity)
+            self._current_slot = number
+            self._slots.append((number, self._current))
+            oldest = number - int(math.ceil(self.window / self.slot_seconds))
+            while self._slots and self._slots[0][0] <= oldest:
+                self._slots.popleft()
+        return self._current
+
+    def ingest(self, lines: Iterable[str], now: Optional[float] = None) -> int:
+        """Add a batch of log lines (received at about the same time); returns how many parsed"""
+        search = HTTPLOG_RE.search
+        slow_ms = self.slow_ms
+        parsed = 0
+        with self._lock:
+            slot = self._slot(time.time() if now is None else now)
+            servers = slot.servers
+            for line in lines:
+                slot.lines += 1
+                match = search(line)
+                if match is None:
+                    slot.unparsed += 1
+                    continue
+                backend, server, tr, ta, status, path = match.groups()
+                stats = servers.get((backend, server))
+                if stats is None:
+                    if len(servers) >= self.max_keys:
+                        slot.dropped += 1
+                        continue
+                    stats = servers[(backend, server)] = ServerStats()
+                ta = int(ta)
+                stats.total.add(ta)
+                if tr[0] != '-':
+                    stats.response.add(int(tr))
+                status_class = ord(status[0]) - 48 if len(status) == 3 else 0
+                stats.statuses[status_class if 0 < status_class < 6 else 0] += 1
+                if ta >= slow_ms:
+                    slot.slow.add(f'{backend} {path}', ta)
+                parsed += 1
+        return parsed
+
+    def snapshot(self, now: Optional[float] = None) -> Window:
+        """The slots of the last window merged into one"""
+        now = time.time() if now is None else now
+        oldest = int(now // self.slot_seconds) - int(math.ceil(self.window / self.slot_seconds))
+        # Until a full window has passed, rates are over the time since the start
+        window = Window(min(self.window, max(now - self.started, self.slot_seconds)), self.top_capacity)
+        with self._lock:
+            for number, slot in self._slots:
+                if number > oldest:
+                    window.merge(slot)
+        return window
+
+
+class LogIngestor:
+    """Feeds LogAnalytics from a syslog UDP socket and/or a log file.
+
+    Only one process can bind the UDP port, so the process that reads
+    publishes its window to Redis every publish_interval; every replica and
+    worker answers queries from the merge of the published windows.
+    """
+
+    def __init__(self, analytics: LogAnalytics, udp: Optional[str] = None, path: Optional[str] = None,
+                 redis_client=None, key: str = 'configwatcher:logs', replica_id: Optional[str] = None,
+                 publish_interval: float = 5.0, from_start: bool = False):
+        self.analytics = analytics
+        self.udp = udp
+        self.path = path
+        self.redis = redis_client
+        self.key = key
+        self.replica_id = replica_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.publish_interval = publish_interval
+        self.from_start = from_start
+        self.reading = False
+        self._counted = {'parsed': 0, 'unparsed': 0}
+        self._totals = {'parsed': 0, 'unparsed': 0}
+        self._threads: List[threading.Thread] = []
+        self._pid = None
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.udp or self.path)
+
+    def start(self):
+        """Start reading in this process (idempotent, fork-aware)"""
+        if not self.configured or self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self.reading = False
+        self._threads = []
+        if self.udp:
+            host, _, port = self.udp.rpartition(':')
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 << 20)
+                sock.bind((host or '0.0.0.0', int(port)))
+            except OSError as e:
+                sock.close()
+                if e.errno != errno.EADDRINUSE:
+                    raise
+                # Another worker of this replica reads the socket
+                logger.info(f"Log socket {self.udp} is read by another process")
+            else:
+                self._spawn(self._read_udp, sock)
+        if self.path:
+            self._spawn(self._read_file)
+        if self._threads:
+            self.reading = True
+            self._spawn(self._publish_loop)
+
+    def _spawn(self, target: Callable, *args):
+        thread = threading.Thread(target=target, args=args, name=f'log-{target.__name__.strip("_")}', daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _count(self, lines: int, parsed: int):
+        self._totals['parsed'] += parsed
+        self._totals['unparsed'] += lines - parsed
+
+    def _read_udp(self, sock: socket.socket):
+        logger.info(f"Reading HAProxy logs from udp://{self.udp}")
+        recv = sock.recv
+        while True:
+            try:
+                # One syslog message per datagram; drain whatever queued up as one batch
+                batch = [recv(65535).decode('utf-8', 'replace')]
+                try:
+                    while len(batch) < 1024:
+                        batch.append(recv(65535, socket.MSG_DONTWAIT).decode('utf-8', 'replace'))
+                except BlockingIOError:
+                    pass
+                self._count(len(batch), self.analytics.ingest(batch))
+            except Exception as e:
+                logger.error(f"Failed to read HAProxy logs: {e}")
+                time.sleep(1)
+
+    def _read_file(self):
+        """Follow the file like 'tail -F', reopening it when it is rotated or truncated"""
+        logger.info(f"Reading HAProxy logs from {self.path}")
+        f, inode, first = None, None, True
+        while True:
+            try:
+                if f is None:
+                    f = open(self.path, 'r', encoding='utf-8', errors='replace')
+                    inode = os.fstat(f.fileno()).st_ino
+                    if first and not self.from_start:
+                        f.seek(0, os.SEEK_END)
+                    first = False
+                lines = f.readlines(1 << 20)
+                if lines:
+                    self._count(len(lines), self.analytics.ingest(lines))
+                    continue
+                stat = os.stat(self.path)
+                if stat.st_ino != inode or stat.st_size < f.tell():
+                    f.close()
+                    f = None
+                    continue
+                time.sleep(0.2)
+            except FileNotFoundError:
+                if f is not None:
+                    f.close()
+                f, first = None, False
+                time.sleep(1)
+            except Exception as e:
+                logger.error(f"Failed to read HAProxy logs from {self.path}: {e}")
+                time.sleep(1)
+
+    def _publish_loop(self):
+        while True:
+            time.sleep(self.publish_interval)
+            try:
+                self.publish()
+            except Exception as e:
+                logger.error(f"Failed to publish log statistics: {e}")
+
+    def publish(self):
+        """Share this process's window and refresh the /metrics gauges"""
+        for result in ('parsed', 'unparsed'):
+            LOG_LINES.labels(result=result).inc(self._totals[result] - self._counted[result])
+            self._counted[result] = self._totals[result]
+        window = self.analytics.snapshot()
+        if self.redis is not None:
+            self.redis.hset(self.key, self.replica_id, json.dumps({'time': time.time(), 'window': window.to_dict()}))
+            self.redis.expire(self.key, int(self.analytics.window) + 60)
+        summary = window.summary(top=0)
+        HAPROXY_LOG_LATENCY.clear()
+        HAPROXY_LOG_RATE.clear()
+        for backend, stats in summary['backends'].items():
+            for server, server_stats in list(stats['servers'].items()) + [('BACKEND', stats)]:
+                for quantile, value in server_stats['latency_ms'].items():
+                    if value is not None:
+                        HAPROXY_LOG_LATENCY.labels(backend=backend, server=server, quantile=quantile).set(value)
+            for status, rps in stats['status_rps'].items():
+                HAPROXY_LOG_RATE.labels(backend=backend, status=status).set(rps)
+
+    def window(self) -> Window:
+        """The window of every reading process, merged"""
+        if self.redis is None:
+            return self.analytics.snapshot()
+        window = Window(0.0, self.analytics.top_capacity)
+        stale = time.time() - 3 * self.publish_interval
+        for replica, raw in self.redis.hgetall(self.key).items():
+            published = json.loads(raw)
+            if published['time'] < stale or (self.reading and replica.decode() == self.replica_id):
+                continue
+            other = Window.from_dict(published['window'], self.analytics.top_capacity)
+            window.merge(other)
+            window.seconds = max(window.seconds, other.seconds)
+        if self.reading:
+            # Fresher than what this process last published
+            mine = self.analytics.snapshot()
+            window.merge(mine)
+            window.seconds = max(window.seconds, mine.seconds)
+        return window
+
+    def status(self) -> Dict[str, Any]:
+        return {'udp': self.udp, 'path': self.path, 'reading': self.reading, 'lines': dict(self._totals)}
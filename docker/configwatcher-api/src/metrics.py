@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - Application Metrics
+Prometheus metrics for the API itself: request latency per endpoint,
+validation, Redis and Docker calls, and HAProxy inventory gauges.
+Under gunicorn, set PROMETHEUS_MULTIPROC_DIR (the start script does) so
+every worker writes its samples there and /metrics aggregates them.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Tuple
+
+import redis
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+HTTP_LATENCY = Histogram('configwatcher_http_request_duration_seconds',
+                         'API request latency by endpoint',
+                         ['method', 'endpoint', 'status'], buckets=LATENCY_BUCKETS)
+VALIDATE_LATENCY = Histogram('configwatcher_validate_duration_seconds',
+                             'Duration of haproxy -c configuration checks', ['result'],
+                             buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+REDIS_LATENCY = Histogram('configwatcher_redis_command_duration_seconds',
+                          'Redis call latency by command (pipelines as PIPELINE)', ['command'],
+                          buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 1, 5))
+REDIS_ERRORS = Counter('configwatcher_redis_errors_total', 'Failed Redis calls', ['command'])
+DOCKER_LATENCY = Histogram('configwatcher_docker_call_duration_seconds',
+                           'Docker API call latency by operation', ['operation'], buckets=LATENCY_BUCKETS)
+DOCKER_ERRORS = Counter('configwatcher_docker_errors_total', 'Failed Docker API calls', ['operation'])
+FEDERATION_PUSH_LATENCY = Histogram('configwatcher_federation_push_duration_seconds',
+                                    'Change set pushes to peer zones by outcome', ['zone', 'status'],
+                                    buckets=LATENCY_BUCKETS)
+ROTATION_DRAIN_LATENCY = Histogram('configwatcher_rotation_drain_duration_seconds',
+                                   'Time from draining a server to deleting it, by outcome', ['outcome'],
+                                   buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+WEIGHT_TUNER_CHANGES = Counter('configwatcher_weight_tuner_changes_total',
+                               'Server weight changes made by the autotuner, or proposed in dry-run',
+                               ['backend', 'mode'])
+LOG_LINES = Counter('configwatcher_log_lines_total', 'HAProxy log lines read, by whether they parsed', ['result'])
+
+# Set by whichever worker serves the scrape, so report the latest value
+HAPROXY_BACKENDS = Gauge('configwatcher_haproxy_backends', 'Backends reported by HAProxy stats',
+                         multiprocess_mode='mostrecent')
+HAPROXY_SERVERS = Gauge('configwatcher_haproxy_servers', 'Servers per backend by health',
+                        ['backend', 'health'], multiprocess_mode='mostrecent')
+HAPROXY_LOG_LATENCY = Gauge('configwatcher_haproxy_log_request_duration_milliseconds',
+                            'Request time (Ta) percentiles from the HAProxy log over the rolling window',
+                            ['backend', 'server', 'quantile'], multiprocess_mode='mostrecent')
+HAPROXY_LOG_RATE = Gauge('configwatcher_haproxy_log_requests_per_second',
+                         'Requests per second from the HAProxy log over the rolling window, by status class',
+                         ['backend', 'status'], multiprocess_mode='mostrecent')
+HAPROXY_STATS_AGE = Gauge('configwatcher_haproxy_stats_age_seconds', 'Age of the stats snapshot behind the gauges',
+                          multiprocess_mode='mostrecent')
+DEPENDENCY_UP = Gauge('configwatcher_dependency_up', 'Dependency status from the last health probe (1 up, 0 down)',
+                      ['dependency'], multiprocess_mode='mostrecent')
+DEPENDENCY_PROBE_AGE = Gauge('configwatcher_dependency_probe_age_seconds', 'Age of the last health probe round',
+                             multiprocess_mode='mostrecent')
+
+
+@contextmanager
+def docker_call(operation: str) -> Iterator[None]:
+    """Time a Docker API call and count it if it fails"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        DOCKER_ERRORS.labels(operation=operation).inc()
+        raise
+    finally:
+        DOCKER_LATENCY.labels(operation=operation).observe(time.perf_counter() - start)
+
+
+class InstrumentedPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error: bool = True):
+        start = time.perf_counter()
+        try:
+            return super().execute(raise_on_error)
+        except redis.RedisError:
+            REDIS_ERRORS.labels(command='PIPELINE').inc()
+            raise
+        finally:
+            REDIS_LATENCY.labels(command='PIPELINE').observe(time.perf_counter() - start)
+
+
+class InstrumentedRedis(redis.Redis):
+    """redis.Redis that times every command; use InstrumentedRedis.from_url()"""
+
+    def execute_command(self, *args, **options):
+        command = str(args[0]).upper()
+        start = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        except redis.RedisError:
+            REDIS_ERRORS.labels(command=command).inc()
+            raise
+        finally:
+            REDIS_LATENCY.labels(command=command).observe(time.perf_counter() - start)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None) -> InstrumentedPipeline:
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+def update_haproxy_gauges(snapshot) -> None:
+    """Refresh the inventory gauges from a stats snapshot"""
+    backends = snapshot.summary()['backends']
+    HAPROXY_BACKENDS.set(len(backends))
+    for backend in backends:
+        counts: Dict[str, int] = {'up': 0, 'down': 0, 'maint': 0, 'other': 0}
+        for server in snapshot.servers(backend['pxname']):
+            status = str(server.get('status', ''))
+            if status.startswith('UP'):
+                counts['up'] += 1
+            elif status.startswith('DOWN'):
+                counts['down'] += 1
+            elif status.startswith('MAINT'):
+                counts['maint'] += 1
+            else:
+                counts['other'] += 1
+        for health, count in counts.items():
+            HAPROXY_SERVERS.labels(backend=backend['pxname'], health=health).set(count)
+    HAPROXY_STATS_AGE.set(snapshot.age)
+
+
+def update_dependency_gauges(snapshot: Dict[str, Any]) -> None:
+    """Refresh the dependency gauges from a health prober snapshot"""
+    for name, result in snapshot['checks'].items():
+        if result['status'] in ('up', 'down'):
+            DEPENDENCY_UP.labels(dependency=name).set(1 if result['status'] == 'up' else 0)
+    if snapshot['age_seconds'] is not None:
+        DEPENDENCY_PROBE_AGE.set(snapshot['age_seconds'])
+
+
+def render() -> Tuple[bytes, Dict[str, Any]]:
+    """Exposition payload and headers for /metrics"""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), {'Content-Type': CONTENT_TYPE_LATEST}
+    return generate_latest(), {'Content-Type': CONTENT_TYPE_LATEST}
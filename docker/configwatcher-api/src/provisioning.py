@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - Bulk Provisioning
+Brings up many backend containers at once for scale-out events. Containers
+are created (or taken from the warm pool and started) in parallel on a
+bounded thread pool. All of them are added to HAProxy in one batch, in
+maintenance, and each one is enabled only once its /health answers, so no
+request reaches a node that is still starting.
+"""
+
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+MAX_BULK_COUNT = 100
+
+
+def http_health_check(address: str, port: int, path: str = '/health', timeout: float = 2.0) -> bool:
+    """True if the node answers its health endpoint with 200"""
+    try:
+        return requests.get(f"http://{address}:{port}{path}", timeout=timeout).status_code == 200
+    except requests.RequestException:
+        return False
+
+
+class BulkProvisioner:
+    """Create, register and health-gate a batch of backend containers.
+
+    create(config) and start_warm(container) return the result of
+    DockerManager.create_backend_container; register(operations) applies a
+    backend batch; remove(name) removes a container again.
+    """
+
+    def __init__(self, create: Callable[[Dict[str, Any]], Dict[str, Any]],
+                 register: Callable[[List[Dict[str, Any]]], Dict[str, Any]],
+                 remove: Callable[[str], Dict[str, Any]],
+                 claim_warm: Optional[Callable[[int], List[Dict[str, Any]]]] = None,
+                 start_warm: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+                 health_check: Callable[[str, int], bool] = http_health_check,
+                 workers: int = 8, health_timeout: float = 60.0, health_interval: float = 0.5):
+        self.create = create
+        self.register = register
+        self.remove = remove
+        self.claim_warm = claim_warm
+        self.start_warm = start_warm
+        self.health_check = health_check
+        self.workers = workers
+        self.health_timeout = health_timeout
+        self.health_interval = health_interval
+        # Threads start on first use, so creating this before gunicorn forks is safe
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='provision')
+
+    def map(self, fn: Callable, items: List[Any]) -> List[Any]:
+        """fn over items on the provisioning pool, in order"""
+        return list(self._executor.map(fn, items))
+
+    def provision(self, count: int, backend: str, port: int = 80, weight: int = 100, use_warm: bool = True,
+                  name_prefix: Optional[str] = None, health_timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Bring up count containers and put the healthy ones into backend"""
+        if not isinstance(count, int) or not 1 <= count <= MAX_BULK_COUNT:
+            raise ValueError(f"count must be an integer between 1 and {MAX_BULK_COUNT}")
+        timings: Dict[str, float] = {}
+        start = time.monotonic()
+
+        warm = self.claim_warm(count) if use_warm and self.claim_warm is not None else []
+        configs = [{'name': f"{name_prefix}-{i + 1}"} if name_prefix else {} for i in range(count - len(warm))]
+        tasks = [(self.start_warm, container) for container in warm] + [(self.create, config) for config in configs]
+        results = self.map(lambda task: task[0](task[1]), tasks)
+        created = [r for r in results if r.get('success')]
+        failed = [r for r in results if not r.get('success')]
+        timings['containers_s'] = round(time.monotonic() - start, 3)
+
+        result: Dict[str, Any] = {
+            'requested': count,
+            'created': len(created),
+            'from_warm_pool': sum(1 for r in created if r.get('warm')),
+            'failed': [r.get('error') for r in failed],
+            'timings': timings
+        }
+        if not created:
+            result.update(success=False, error='No container could be created')
+            return result
+
+        # One runtime session for every new server, all in maintenance until healthy
+        servers = {r['container_name']: {
+            'name': r['container_name'].replace('-', '_'),  # HAProxy server names can't have dashes
+            'address': r['ip_address'],
+            'port': port,
+            'weight': weight,
+            'check': True,
+            'state': 'maint'
+        } for r in created}
+        step = time.monotonic()
+        registered = self.register([{'action': 'add', 'backend': backend, 'server': server}
+                                    for server in servers.values()])
+        timings['register_s'] = round(time.monotonic() - step, 3)
+        if not registered.get('success'):
+            # Nothing was added (batches are all-or-nothing), so do not leave containers behind
+            self.map(self.remove, list(servers))
+            result.update(success=False, error=f"Failed to register servers: {registered.get('error')}",
+                          removed=len(servers))
+            return result
+
+        step = time.monotonic()
+        healthy = self._wait_healthy(servers, health_timeout or self.health_timeout)
+        timings['health_s'] = round(time.monotonic() - step, 3)
+        if healthy:
+            enabled = self.register([{'action': 'state', 'backend': backend, 'server': servers[name]['name'],
+                                      'state': 'ready'} for name in healthy])
+            if not enabled.get('success'):
+                result['enable_error'] = enabled.get('error')
+                healthy = []
+        timings['total_s'] = round(time.monotonic() - start, 3)
+
+        result.update(
+            success=bool(healthy) and len(healthy) == count,
+            backend=backend,
+            servers=[dict(servers[r['container_name']], container=r['container_name'], node_id=r.get('node_id'),
+                          state='ready' if r['container_name'] in healthy else 'maint')
+                     for r in created],
+            healthy=len(healthy),
+            # Left in maintenance; they can be enabled (or removed) once looked at
+            unhealthy=[name for name in servers if name not in healthy]
+        )
+        return result
+
+    def _wait_healthy(self, servers: Dict[str, Dict[str, Any]], timeout: float) -> List[str]:
+        """Names of the containers whose health endpoint came up within timeout"""
+        pending = list(servers)
+        healthy: List[str] = []
+        deadline = time.monotonic() + timeout
+        while pending:
+            checks = self.map(lambda name: self.health_check(servers[name]['address'], servers[name]['port']),
+                              pending)
+            healthy.extend(name for name, ok in zip(pending, checks) if ok)
+            pending = [name for name, ok in zip(pending, checks) if not ok]
+            if not pending or time.monotonic() >= deadline:
+                break
+            time.sleep(self.health_interval)
+        return healthy
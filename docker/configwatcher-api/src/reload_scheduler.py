@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - Reload Scheduler
+Coalesces reload requests so that bursts of changes cost at most one
+validate + reload per window, and skips the reload entirely for changes
+the runtime API can apply.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from prometheus_client import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+RELOADS = Counter('configwatcher_reloads_total', 'HAProxy reloads executed', ['outcome'])
+RELOADS_AVOIDED = Counter('configwatcher_reloads_avoided_total',
+                          'Reload requests satisfied without their own reload', ['reason'])
+RELOAD_LATENCY = Histogram('configwatcher_reload_duration_seconds',
+                           'Duration of validate + reload runs',
+                           buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
+RELOAD_WAIT = Histogram('configwatcher_reload_wait_seconds',
+                        'Time from a reload request to its completion',
+                        buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
+
+
+class ReloadTicket:
+    """Handle for one reload request; resolves when its batch has run"""
+
+    def __init__(self, reason: str = ''):
+        self.id = uuid.uuid4().hex
+        self.reason = reason
+        self.status = 'pending'
+        self.reload = True
+        self.batch_size = 1
+        self.result: Optional[Dict[str, Any]] = None
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self._event = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._event.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._event.wait(timeout)
+
+    def resolve(self, status: str, result: Dict[str, Any]):
+        self.status = status
+        self.result = result
+        self.finished = time.time()
+        RELOAD_WAIT.observe(self.finished - self.created)
+        self._event.set()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'ticket': self.id,
+            'status': self.status,
+            'reason': self.reason,
+            'reload': self.reload,
+            'batch_size': self.batch_size,
+            'created': datetime.utcfromtimestamp(self.created).isoformat(),
+            'finished': datetime.utcfromtimestamp(self.finished).isoformat() if self.finished else None,
+            'result': self.result,
+        }
+
+
+class ReloadScheduler:
+    """Collects reload requests over a window and runs one validate + reload for all of them.
+
+    Reloads are also spaced at least one window apart, so a request arriving
+    while a reload is running waits for the next window.
+    """
+
+    def __init__(self, validate: Callable[[], Dict[str, Any]], reload: Callable[[], Dict[str, Any]],
+                 window: float = 2.0, apply_runtime: Optional[Callable[[List[Dict[str, Any]]], Dict[str, Any]]] = None,
+                 max_tickets: int = 1000):
+        self.validate = validate
+        self.reload = reload
+        self.window = window
+        self.apply_runtime = apply_runtime
+        self.max_tickets = max_tickets
+        self._tickets: 'OrderedDict[str, ReloadTicket]' = OrderedDict()
+        self._pending: List[ReloadTicket] = []
+        self._deadline = 0.0
+        self._last_reload = 0.0
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self.listeners: List[Callable[[Dict[str, Any], List[ReloadTicket]], None]] = []
+        self._stats = {'requests': 0, 'reloads': 0, 'failed_reloads': 0,
+                       'avoided_coalesced': 0, 'avoided_runtime': 0, 'last_reload_seconds': None}
+
+    def _remember(self, ticket: ReloadTicket):
+        self._tickets[ticket.id] = ticket
+        while len(self._tickets) > self.max_tickets:
+            self._tickets.popitem(last=False)
+
+    def _ensure_thread(self):
+        # Started lazily so each gunicorn worker gets its own thread after fork
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='reload-scheduler', daemon=True)
+            self._thread.start()
+
+    def submit(self, reason: str = '', changes: Optional[List[Dict[str, Any]]] = None) -> ReloadTicket:
+        """Request a reload; runtime-applicable changes are applied without one"""
+        ticket = ReloadTicket(reason)
+        with self._cond:
+            self._stats['requests'] += 1
+            self._remember(ticket)
+
+        if changes and self.apply_runtime is not None:
+            ticket.reload = False
+            try:
+                result = self.apply_runtime(changes)
+            except Exception as e:
+                result = {'success': False, 'error': str(e)}
+            if result.get('success'):
+                with self._cond:
+                    self._stats['avoided_runtime'] += 1
+                RELOADS_AVOIDED.labels(reason='runtime').inc()
+            ticket.resolve('done' if result.get('success') else 'failed', result)
+            return ticket
+
+        with self._cond:
+            if not self._pending:
+                self._deadline = time.monotonic() + self.window
+            else:
+                self._stats['avoided_coalesced'] += 1
+                RELOADS_AVOIDED.labels(reason='coalesced').inc()
+            self._pending.append(ticket)
+            self._ensure_thread()
+            self._cond.notify()
+        return ticket
+
+    def subscribe(self, listener: Callable[[Dict[str, Any], List[ReloadTicket]], None]):
+        """Call listener(result, batch) after every validate + reload run"""
+        self.listeners.append(listener)
+
+    def get(self, ticket_id: str) -> Optional[ReloadTicket]:
+        with self._cond:
+            return self._tickets.get(ticket_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._pending)
+            stats['window_seconds'] = self.window
+            return stats
+
+    def _due(self) -> float:
+        return max(self._deadline, self._last_reload + self.window)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending or time.monotonic() < self._due():
+                    timeout = None if not self._pending else max(self._due() - time.monotonic(), 0)
+                    self._cond.wait(timeout)
+                batch, self._pending = self._pending, []
+            self._execute(batch)
+
+    def _execute(self, batch: List[ReloadTicket]):
+        for ticket in batch:
+            ticket.status = 'running'
+            ticket.batch_size = len(batch)
+        start = time.monotonic()
+        try:
+            validation = self.validate()
+            if not validation.get('valid'):
+                result = {'success': False, 'error': 'Configuration validation failed', 'validation': validation}
+            else:
+                result = self.reload()
+                result['validation'] = validation
+        except Exception as e:
+            logger.error(f"Scheduled reload failed: {e}")
+            result = {'success': False, 'error': str(e)}
+        elapsed = time.monotonic() - start
+
+        RELOAD_LATENCY.observe(elapsed)
+        RELOADS.labels(outcome='success' if result.get('success') else 'failure').inc()
+        with self._cond:
+            self._last_reload = time.monotonic()
+            self._stats['reloads'] += 1
+            self._stats['last_reload_seconds'] = round(elapsed, 3)
+            if not result.get('success'):
+                self._stats['failed_reloads'] += 1
+        logger.info(f"Reload for {len(batch)} request(s) finished in {elapsed:.3f}s: success={result.get('success')}")
+
+        status = 'done' if result.get('success') else 'failed'
+        for ticket in batch:
+            ticket.resolve(status, result)
+        for listener in self.listeners:
+            try:
+                listener(result, batch)
+            except Exception as e:
+                logger.error(f"Reload listener failed: {e}")
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - Node Rotation
+Takes servers out of a backend without cutting traffic: a server is set
+to drain, its current sessions (scur) are watched until they fall to a
+threshold or a deadline passes, and only then is it put in maintenance
+and deleted. New servers can be added at a fraction of their weight and
+ramped up in steps. A cap on the servers draining at once per backend,
+shared between replicas through Redis, keeps a large rollout from
+overloading the servers that remain.
+"""
+
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from backend_batch import BatchError
+from metrics import ROTATION_DRAIN_LATENCY
+
+logger = logging.getLogger(__name__)
+
+MAX_ROTATION_SERVERS = 500
+
+# KEYS: slot set  ARGV: token, now, lease expiry, limit
+ACQUIRE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[4]) then
+    redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+
+class RotationError(Exception):
+    """Raised when a rotation request is rejected before anything is changed"""
+
+
+class SlotTimeout(Exception):
+    """Raised when no drain slot of a backend came free in time"""
+
+
+def parse_rotations(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Validate the request body of a rotation and return its rotations"""
+    rotations = data.get('rotations') if isinstance(data, dict) else None
+    if not isinstance(rotations, list) or not rotations:
+        raise RotationError('rotations must be a non-empty list')
+    seen = set()
+    for rotation in rotations:
+        if not isinstance(rotation, dict) or not isinstance(rotation.get('backend'), str) or not rotation['backend']:
+            raise RotationError('Each rotation needs a backend')
+        remove, add = rotation.setdefault('remove', []), rotation.setdefault('add', [])
+        if not isinstance(remove, list) or not all(isinstance(name, str) and name for name in remove):
+            raise RotationError('remove must be a list of server names')
+        if not isinstance(add, list) or not all(isinstance(s, dict) and all(k in s for k in ('name', 'address', 'port'))
+                                                for s in add):
+            raise RotationError('add must be a list of servers with name, address and port')
+        if not remove and not add:
+            raise RotationError(f"Rotation of {rotation['backend']} neither adds nor removes servers")
+        for name in remove + [s['name'] for s in add]:
+            key = (rotation['backend'], name)
+            if key in seen:
+                raise RotationError(f'Server {key[0]}/{key[1]} appears more than once')
+            seen.add(key)
+    if len(seen) > MAX_ROTATION_SERVERS:
+        raise RotationError(f'At most {MAX_ROTATION_SERVERS} servers per rotation')
+    return rotations
+
+
+class BackendSlots:
+    """At most limit holders per backend, across replicas when there is Redis.
+
+    A slot is a lease: a replica that dies while draining frees it once
+    the lease runs out.
+    """
+
+    def __init__(self, limit: int, redis_client=None, prefix: str = 'configwatcher:rotation:slots'):
+        self.limit = limit
+        self.redis = redis_client
+        self.prefix = prefix
+        self._local: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+        if redis_client is not None:
+            self._acquire = redis_client.register_script(ACQUIRE_SCRIPT)
+
+    def acquire(self, backend: str, lease: float, timeout: float) -> Optional[str]:
+        """Take a slot for up to lease seconds; returns its token, raises SlotTimeout"""
+        if self.redis is None:
+            with self._lock:
+                semaphore = self._local.setdefault(backend, threading.BoundedSemaphore(self.limit))
+            if not semaphore.acquire(timeout=timeout):
+                raise SlotTimeout(f"No drain slot of {backend} came free within {timeout:.0f}s")
+            return None
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+        delay = 0.05
+        while not self._acquire(keys=[f"{self.prefix}:{backend}"],
+                                args=[token, time.time(), time.time() + lease, self.limit]):
+            if time.monotonic() >= deadline:
+                raise SlotTimeout(f"No drain slot of {backend} came free within {timeout:.0f}s")
+            time.sleep(delay)
+            delay = min(delay * 2, 1.0)
+        return token
+
+    def release(self, backend: str, token: Optional[str]):
+        if self.redis is None:
+            self._local[backend].release()
+        else:
+            self.redis.zrem(f"{self.prefix}:{backend}", token)
+
+    def held(self, backend: str) -> int:
+        if self.redis is None:
+            semaphore = self._local.get(backend)
+            return self.limit - semaphore._value if semaphore is not None else 0
+        key = f"{self.prefix}:{backend}"
+        self.redis.zremrangebyscore(key, '-inf', time.time())
+        return self.redis.zcard(key)
+
+
+class RotationEngine:
+    """Drain-then-delete removals and weight ramps over the runtime API.
+
+    apply(operations) applies a backend batch and returns its result;
+    execute(command) runs one checked runtime command; stats() returns a
+    StatsSnapshot, shared by all the drains polling at once, and refresh()
+    drops it once it is older than the poll interval.
+    """
+
+    def __init__(self, apply: Callable[[List[Dict[str, Any]]], Dict[str, Any]],
+                 execute: Callable[[str], Any], stats: Callable[[], Any], refresh: Callable[[], None],
+                 slots: BackendSlots,
+                 workers: int = 16, drain_timeout: float = 60.0, poll_interval: float = 1.0,
+                 slot_timeout: float = 600.0, ramp_steps: int = 1, ramp_interval: float = 10.0):
+        self.apply = apply
+        self.execute = execute
+        self.stats = stats
+        self.refresh = refresh
+        self.slots = slots
+        self.drain_timeout = drain_timeout
+        self.poll_interval = poll_interval
+        self.slot_timeout = slot_timeout
+        self.ramp_steps = ramp_steps
+        self.ramp_interval = ramp_interval
+        # Threads start on first use, so creating this before gunicorn forks is safe
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='rotation')
+
+    def sessions(self, backend: str, server: str) -> Optional[int]:
+        """Current sessions of a server, None if HAProxy does not report it"""
+        snapshot = self.stats()
+        if snapshot.age > self.poll_interval:
+            self.refresh()
+            snapshot = self.stats()
+        value = snapshot.value(backend, server, 'scur')
+        return value if isinstance(value, int) else None
+
+    def _apply(self, operations: List[Dict[str, Any]]):
+        result = self.apply(operations)
+        if not result.get('success'):
+            raise BatchError(result.get('error') or 'Batch failed')
+
+    def retire(self, backend: str, server: str, timeout: Optional[float] = None, threshold: int = 0,
+               force: bool = True) -> Dict[str, Any]:
+        """Drain a server, wait for its sessions to go, then delete it.
+
+        Past the deadline, force shuts the remaining sessions down and deletes
+        the server anyway; without force it is left draining.
+        """
+        timeout = self.drain_timeout if timeout is None else timeout
+        result: Dict[str, Any] = {'backend': backend, 'server': server}
+        start = time.monotonic()
+        try:
+            token = self.slots.acquire(backend, lease=timeout + 60, timeout=self.slot_timeout)
+        except SlotTimeout as e:
+            return dict(result, status='failed', error=str(e))
+        try:
+            result['waited_s'] = round(time.monotonic() - start, 3)
+            self._apply([{'action': 'state', 'backend': backend, 'server': server, 'state': 'drain'}])
+            drain_start = time.monotonic()
+            deadline = drain_start + timeout
+            sessions = result['sessions_at_drain'] = self.sessions(backend, server)
+            while sessions and sessions > threshold and time.monotonic() < deadline:
+                time.sleep(min(self.poll_interval, max(0.0, deadline - time.monotonic())))
+                sessions = self.sessions(backend, server)
+            result['drain_s'] = round(time.monotonic() - drain_start, 3)
+            result['sessions_at_removal'] = sessions
+
+            if sessions and sessions > threshold and not force:
+                ROTATION_DRAIN_LATENCY.labels(outcome='timeout').observe(time.monotonic() - drain_start)
+                return dict(result, status='timeout',
+                            error=f"{sessions} session(s) still open after {timeout:.0f}s; left draining")
+            # No new sessions from here on; whatever is left (up to threshold, or past the deadline) is cut
+            self._apply([{'action': 'state', 'backend': backend, 'server': server, 'state': 'maint'}])
+            if sessions:
+                self.execute(f"shutdown sessions server {backend}/{server}")
+                result['forced'] = True
+            self._apply([{'action': 'remove', 'backend': backend, 'server': server}])
+            outcome = 'forced' if result.get('forced') else 'drained'
+            ROTATION_DRAIN_LATENCY.labels(outcome=outcome).observe(time.monotonic() - drain_start)
+            return dict(result, status='removed')
+        except Exception as e:
+            logger.error(f"Failed to retire {backend}/{server}: {e}")
+            ROTATION_DRAIN_LATENCY.labels(outcome='failed').observe(time.monotonic() - start)
+            return dict(result, status='failed', error=str(e))
+        finally:
+            self.slots.release(backend, token)
+
+    def ramp(self, backend: str, server: Dict[str, Any], steps: int, interval: float) -> Dict[str, Any]:
+        """Raise an added server's weight to its target in steps, interval seconds apart"""
+        target = server.get('weight', 100)
+        result: Dict[str, Any] = {'backend': backend, 'server': server['name'], 'weight': target}
+        try:
+            for step in range(2, steps + 1):
+                time.sleep(interval)
+                self._apply([{'action': 'weight', 'backend': backend, 'server': server['name'],
+                              'weight': max(1, target * step // steps)}])
+            return dict(result, status='added')
+        except Exception as e:
+            logger.error(f"Failed to ramp up {backend}/{server['name']}: {e}")
+            return dict(result, status='failed', error=str(e))
+
+    def rotate(self, rotations: List[Dict[str, Any]], drain_timeout: Optional[float] = None, threshold: int = 0,
+               force: bool = True, ramp_steps: Optional[int] = None,
+               ramp_interval: Optional[float] = None) -> Dict[str, Any]:
+        """Add and remove servers in several backends at once.
+
+        The new servers of every backend are added first, in one batch, so
+        capacity arrives before any is taken away. Then the removals (at most
+        the slot limit per backend at a time) and the weight ramps run in
+        parallel.
+        """
+        steps = max(1, self.ramp_steps if ramp_steps is None else ramp_steps)
+        interval = self.ramp_interval if ramp_interval is None else ramp_interval
+        start = time.monotonic()
+        adds = [{'action': 'add', 'backend': rotation['backend'],
+                 'server': dict(server, weight=max(1, server.get('weight', 100) // steps))}
+                for rotation in rotations for server in rotation['add']]
+        if adds:
+            try:
+                self._apply(adds)
+            except Exception as e:
+                return {'success': False, 'error': f"Failed to add new servers: {e}", 'servers': []}
+
+        tasks = [(self.ramp, rotation['backend'], server, steps, interval)
+                 for rotation in rotations for server in rotation['add']]
+        tasks += [(self.retire, rotation['backend'], name, drain_timeout, threshold, force)
+                  for rotation in rotations for name in rotation['remove']]
+        servers = list(self._executor.map(lambda task: task[0](*task[1:]), tasks))
+        return {
+            'success': all(s['status'] in ('added', 'removed') for s in servers),
+            'added': sum(1 for s in servers if s['status'] == 'added'),
+            'removed': sum(1 for s in servers if s['status'] == 'removed'),
+            'servers': servers,
+            'duration_s': round(time.monotonic() - start, 3)
+        }
+
+    def status(self, backends: List[str]) -> Dict[str, Any]:
+        return {'max_draining': self.slots.limit,
+                'draining': {backend: self.slots.held(backend) for backend in backends}}
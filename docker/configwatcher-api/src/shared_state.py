@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - Shared State Across Replicas
+ConfigWatcher replicas that drive the same HAProxy socket coordinate
+through Redis: writes to a backend happen under a per-backend lock, the
+resulting desired state is stored with a version per backend, and a
+pub/sub notification lets every other replica refresh its local cache.
+Singleton work (the registry watcher) runs only on the elected leader.
+"""
+
+import os
+import json
+import socket
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Delete the key only if we still hold it
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Extend the key only if we still hold it
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class LockTimeout(Exception):
+    """Raised when a shared lock could not be acquired in time"""
+
+
+def default_replica_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def apply_to_desired(servers: Dict[str, Dict[str, Any]], operation: Dict[str, Any]):
+    """Fold one batch operation into a backend's desired server map"""
+    server = operation.get('server')
+    name = server.get('name') if isinstance(server, dict) else server
+    action = operation['action']
+    if action == 'remove':
+        servers.pop(name, None)
+        return
+    entry = servers.setdefault(name, {'name': name})
+    if action == 'add':
+        entry.update({k: v for k, v in server.items() if v is not None})
+        entry.setdefault('state', 'ready')
+    elif action == 'weight':
+        entry['weight'] = operation['weight']
+    elif action == 'state':
+        entry['state'] = operation['state']
+    elif action == 'addr':
+        entry.update(address=operation['address'], port=operation['port'])
+
+
+class LeaderElection:
+    """Lease-based leader election: the holder renews a key with a TTL"""
+
+    def __init__(self, redis_client, name: str, replica_id: Optional[str] = None,
+                 ttl: float = 15.0, prefix: str = 'configwatcher:leader'):
+        self.redis = redis_client
+        self.key = f"{prefix}:{name}"
+        self.replica_id = replica_id or default_replica_id()
+        self.ttl = ttl
+        self._valid_until = 0.0
+
+    def is_leader(self) -> bool:
+        """Acquire or renew the lease; cheap to call in a loop"""
+        if self.redis is None:
+            return True
+        now = time.monotonic()
+        # Renew once a third of the lease has elapsed
+        if now < self._valid_until - self.ttl * 2 / 3:
+            return True
+        ttl_ms = int(self.ttl * 1000)
+        try:
+            held = self.redis.set(self.key, self.replica_id, nx=True, px=ttl_ms) or \
+                self.redis.eval(RENEW_SCRIPT, 1, self.key, self.replica_id, ttl_ms)
+        except Exception as e:
+            logger.warning(f"Leader election for {self.key} failed: {e}")
+            held = False
+        self._valid_until = now + self.ttl if held else 0.0
+        return bool(held)
+
+    def leader(self) -> Optional[str]:
+        if self.redis is None:
+            return self.replica_id
+        value = self.redis.get(self.key)
+        return value.decode() if value else None
+
+    def resign(self):
+        if self.redis is not None and self._valid_until:
+            self.redis.eval(RELEASE_SCRIPT, 1, self.key, self.replica_id)
+        self._valid_until = 0.0
+
+
+class SharedState:
+    """Versioned desired state per backend, shared through Redis.
+
+    Without Redis the locks are process-local and notifications are only
+    delivered to this process, which matches a single-replica deployment.
+    """
+
+    def __init__(self, redis_client=None, prefix: str = 'configwatcher:state',
+                 replica_id: Optional[str] = None, lock_ttl: float = 30.0,
+                 lock_timeout: float = 10.0, result_ttl: int = 86400,
+                 global_channel: Optional[str] = None):
+        self.redis = redis_client
+        self.prefix = prefix
+        self.channel = f"{prefix}:events"
+        # Events for every replica sharing the Redis, whatever its prefix (token revocations)
+        self.global_channel = global_channel
+        self.replica_id = replica_id or default_replica_id()
+        self.lock_ttl = lock_ttl
+        self.lock_timeout = lock_timeout
+        self.result_ttl = result_ttl
+        self.listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self.local_listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self._cache: Dict[str, Tuple[int, Dict[str, Dict[str, Any]]]] = {}
+        self._cache_lock = threading.Lock()
+        self._local_locks: Dict[str, threading.Lock] = {}
+        self._local_versions: Dict[str, int] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._subscribed = threading.Event()
+
+    def _key(self, *parts: str) -> str:
+        return ':'.join((self.prefix,) + parts)
+
+    # Locks
+
+    @contextmanager
+    def lock(self, name: str, timeout: Optional[float] = None) -> Iterator[None]:
+        """Hold a cluster-wide lock; raises LockTimeout if it stays taken"""
+        timeout = self.lock_timeout if timeout is None else timeout
+        if self.redis is None:
+            local = self._local_locks.setdefault(name, threading.Lock())
+            if not local.acquire(timeout=timeout):
+                raise LockTimeout(f"Lock {name} is held elsewhere")
+            try:
+                yield
+            finally:
+                local.release()
+            return
+
+        key = self._key('lock', name)
+        token = f"{self.replica_id}:{threading.get_ident()}:{time.monotonic()}"
+        deadline = time.monotonic() + timeout
+        delay = 0.005
+        while not self.redis.set(key, token, nx=True, px=int(self.lock_ttl * 1000)):
+            if time.monotonic() >= deadline:
+                raise LockTimeout(f"Lock {name} is held elsewhere")
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+        try:
+            yield
+        finally:
+            self.redis.eval(RELEASE_SCRIPT, 1, key, token)
+
+    @contextmanager
+    def backend_locks(self, backends: List[str]) -> Iterator[None]:
+        """Lock several backends, always in sorted order so replicas cannot deadlock"""
+        with self._lock_all(sorted(set(backends))):
+            yield
+
+    @contextmanager
+    def _lock_all(self, names: List[str]) -> Iterator[None]:
+        if not names:
+            yield
+            return
+        with self.lock(f"backend:{names[0]}"):
+            with self._lock_all(names[1:]):
+                yield
+
+    # Desired state
+
+    def get(self, backend: str) -> Tuple[int, Dict[str, Dict[str, Any]]]:
+        """Version and desired servers of a backend, from the local cache when it is warm"""
+        if self._subscribed.is_set():
+            with self._cache_lock:
+                entry = self._cache.get(backend)
+            if entry is not None:
+                return entry
+        entry = self._load(backend)
+        with self._cache_lock:
+            cached = self._cache.get(backend)
+            if cached is None or cached[0] <= entry[0]:
+                self._cache[backend] = entry
+        return entry
+
+    def _load(self, backend: str) -> Tuple[int, Dict[str, Dict[str, Any]]]:
+        if self.redis is None:
+            with self._cache_lock:
+                return self._cache.get(backend, (0, {}))
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.get(self._key('version', backend))
+        pipe.hgetall(self._key('backend', backend))
+        version, servers = pipe.execute()
+        return int(version or 0), {k.decode(): json.loads(v) for k, v in servers.items()}
+
+    def record(self, operations: List[Dict[str, Any]], source: str = 'api') -> Dict[str, int]:
+        """Store the effect of applied operations and notify the other replicas.
+
+        Callers must hold the locks of the touched backends.
+        """
+        by_backend: Dict[str, List[Dict[str, Any]]] = {}
+        for op in operations:
+            by_backend.setdefault(op['backend'], []).append(op)
+
+        versions = {}
+        for backend, ops in by_backend.items():
+            _, current = self._load(backend)
+            servers = {name: dict(entry) for name, entry in current.items()}
+            for op in ops:
+                apply_to_desired(servers, op)
+            touched = {op['server']['name'] if isinstance(op['server'], dict) else op['server'] for op in ops}
+
+            if self.redis is None:
+                version = self._local_versions.get(backend, 0) + 1
+                self._local_versions[backend] = version
+            else:
+                pipe = self.redis.pipeline(transaction=True)
+                for name in touched:
+                    if name in servers:
+                        pipe.hset(self._key('backend', backend), name, json.dumps(servers[name]))
+                    else:
+                        pipe.hdel(self._key('backend', backend), name)
+                pipe.incr(self._key('version', backend))
+                version = pipe.execute()[-1]
+            with self._cache_lock:
+                self._cache[backend] = (version, servers)
+            versions[backend] = version
+            event = {'type': 'backend', 'backend': backend, 'version': version,
+                     'servers': sorted(touched), 'source': source}
+            self.publish(event)
+            self._notify(self.local_listeners, dict(event, replica=self.replica_id))
+        return versions
+
+    # Exactly-once application
+
+    def apply(self, operations: List[Dict[str, Any]], apply_fn: Callable[[List[Dict[str, Any]]], Dict[str, Any]],
+              change_id: Optional[str] = None, source: str = 'api') -> Dict[str, Any]:
+        """Apply operations under the locks of their backends and record the result.
+
+        With a change_id, a change that was already applied (by any replica)
+        returns the stored result instead of touching the socket again.
+        """
+        with self.backend_locks([op['backend'] for op in operations]):
+            if change_id:
+                previous = self._result(change_id)
+                if previous is not None:
+                    return dict(previous, duplicate=True)
+            result = apply_fn(operations)
+            if result.get('success'):
+                result['versions'] = self.record(operations, source)
+            if change_id:
+                self._store_result(change_id, result)
+            return result
+
+    def _result(self, change_id: str) -> Optional[Dict[str, Any]]:
+        if self.redis is None:
+            return None
+        data = self.redis.get(self._key('change', change_id))
+        return json.loads(data) if data else None
+
+    def _store_result(self, change_id: str, result: Dict[str, Any]):
+        if self.redis is not None:
+            self.redis.set(self._key('change', change_id), json.dumps(result), ex=self.result_ttl)
+
+    # Notifications
+
+    def subscribe(self, listener: Callable[[Dict[str, Any]], None]):
+        """Call listener for every event published by another replica"""
+        self.listeners.append(listener)
+
+    def subscribe_local(self, listener: Callable[[Dict[str, Any]], None]):
+        """Call listener for every change recorded by this replica"""
+        self.local_listeners.append(listener)
+
+    def publish(self, event: Dict[str, Any], everywhere: bool = False):
+        """Notify the other replicas of this prefix, or with everywhere those on the global channel too"""
+        event = dict(event, replica=self.replica_id)
+        if self.redis is None:
+            return
+        try:
+            self.redis.publish(self.global_channel if everywhere and self.global_channel else self.channel,
+                               json.dumps(event))
+        except Exception as e:
+            logger.warning(f"Failed to publish state event: {e}")
+
+    @property
+    def subscribed(self) -> bool:
+        """Whether events from other replicas are currently being received"""
+        return self._subscribed.is_set()
+
+    def start(self):
+        """Start the subscriber thread in this process (idempotent, fork-aware)"""
+        if self.redis is None:
+            self._subscribed.set()
+            return
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        self._pid = os.getpid()
+        self._subscribed.clear()
+        self._thread = threading.Thread(target=self._listen, name='shared-state', daemon=True)
+        self._thread.start()
+
+    def _listen(self):
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(*[c for c in (self.channel, self.global_channel) if c])
+                # Anything cached before the subscription may have missed events
+                with self._cache_lock:
+                    self._cache.clear()
+                self._subscribed.set()
+                for message in pubsub.listen():
+                    self._dispatch(json.loads(message['data']))
+            except Exception as e:
+                logger.warning(f"State subscription lost, resubscribing: {e}")
+            finally:
+                self._subscribed.clear()
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+            time.sleep(1)
+
+    def _dispatch(self, event: Dict[str, Any]):
+        if event.get('replica') == self.replica_id:
+            return
+        if event.get('type') == 'backend':
+            with self._cache_lock:
+                cached = self._cache.get(event['backend'])
+                if cached is not None and cached[0] < event['version']:
+                    del self._cache[event['backend']]
+        self._notify(self.listeners, event)
+
+    @staticmethod
+    def _notify(listeners: List[Callable[[Dict[str, Any]], None]], event: Dict[str, Any]):
+        for listener in listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                logger.error(f"State listener failed: {e}")
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'replica': self.replica_id,
+            'shared': self.redis is not None,
+            'subscribed': self._subscribed.is_set(),
+            'cached_backends': len(self._cache),
+        }
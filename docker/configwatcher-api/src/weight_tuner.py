@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - Weight Autotuner
+Sets server weights from live stats instead of the static 'weight 100'.
+Each round reads 'show stat', smooths every server's response time
+(rtime, or ttime without HTTP), queue depth (qcur) and error rate into a
+cost, and moves weight from servers that cost more than the backend's
+average to those that cost less, until their costs are even. Weights
+move at most max_step per round and only by more than the hysteresis
+band, so noise does not make them flap (and, with 'hash-type consistent',
+few keys move at a time). A server that saturates is the exception: when
+its last, unsmoothed response time or queue spikes far above the others'
+or its errors jump, its weight is cut at once, past max_step and the band.
+Changes are pushed per backend as one batch of 'set server ... weight'
+commands, or only reported in dry-run mode.
+"""
+
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+from statistics import median
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from metrics import WEIGHT_TUNER_CHANGES
+
+logger = logging.getLogger(__name__)
+
+# Counters whose increase, per new session (stot), is the error rate
+ERROR_FIELDS = ('hrsp_5xx', 'eresp', 'econ')
+# Each queued request costs as much as one more response time
+QUEUE_PENALTY = 1.0
+# A 10% error rate doubles a server's cost
+ERROR_PENALTY = 10.0
+# How far one round goes toward even costs (an exponent on the cost ratio). Stats lag
+# behind weight changes, so larger values overshoot and oscillate (see weight_replay.py)
+ADJUSTMENT_GAIN = 0.25
+# A server is saturated when its unsmoothed response time or queue over the last round is this
+# many times the backend's median (a queue of at least 1), or its error rate reaches
+# SATURATION_ERROR_RATE. Busy servers near capacity stay well below that; saturated ones do not
+SATURATION_RATIO = 10.0
+SATURATION_ERROR_RATE = 0.05
+# ...and its weight is then multiplied by this each round, whatever max_step allows
+SATURATION_CUT = 0.5
+# HAProxy accepts weights 0-256; 0 would take the server out
+DEFAULT_BOUNDS = (10, 256)
+
+
+def parse_bounds(spec: str) -> Dict[str, Tuple[int, int]]:
+    """'ddc_nodes_http=20-200,ddc_nodes_grpc' -> {backend: (min weight, max weight)}"""
+    bounds = {}
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        backend, sep, weights = item.partition('=')
+        low, _, high = weights.partition('-')
+        try:
+            low, high = (int(low), int(high)) if sep else DEFAULT_BOUNDS
+        except ValueError:
+            low = high = None
+        if not backend.strip() or low is None or not 1 <= low <= high <= 256:
+            raise ValueError(f"Tuned backend '{item}' must look like backend[=min-max] with 1 <= min <= max <= 256")
+        bounds[backend.strip()] = (low, high)
+    return bounds
+
+
+def _eligible(row: Dict[str, Any]) -> bool:
+    """Active servers taking traffic; backups, drained and down servers keep their weight"""
+    return not row.get('bck') and str(row.get('status', '')).startswith('UP') and (row.get('weight') or 0) > 0
+
+
+class WeightTuner:
+    """Load-aware weights for the backends in bounds.
+
+    stats() returns a StatsSnapshot; apply(operations) applies one backend
+    batch and returns its result. The smoothed per-server state lives in
+    this process, so only one replica (should_run) tunes at a time.
+    """
+
+    def __init__(self, stats: Callable[[], Any], apply: Callable[[List[Dict[str, Any]]], Dict[str, Any]],
+                 bounds: Dict[str, Tuple[int, int]], base_weight: int = 100, interval: float = 10.0,
+                 alpha: float = 0.3, hysteresis: float = 0.1, max_step: float = 0.25, dry_run: bool = True,
+                 should_run: Optional[Callable[[], bool]] = None):
+        self.stats = stats
+        self.apply = apply
+        self.bounds = bounds
+        self.base_weight = base_weight
+        self.interval = interval
+        self.alpha = alpha
+        self.hysteresis = hysteresis
+        self.max_step = max_step
+        self.dry_run = dry_run
+        self.should_run = should_run
+        self.last: Optional[Dict[str, Any]] = None
+        self._servers: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+
+    def _smooth(self, previous: Optional[float], value: Optional[float]) -> Optional[float]:
+        if value is None:
+            return previous
+        if previous is None:
+            return float(value)
+        return previous + self.alpha * (value - previous)
+
+    def observe(self, snapshot):
+        """Fold one stats snapshot into the smoothed per-server state"""
+        seen = set()
+        for backend in self.bounds:
+            for row in snapshot.servers(backend):
+                key = (backend, row['svname'])
+                seen.add(key)
+                # rtime/ttime are averages over the last 1024 requests, 0 or absent without traffic
+                latency = row.get('rtime') or row.get('ttime') or None
+                sessions = row.get('stot') or 0
+                errors = sum(row.get(field) or 0 for field in ERROR_FIELDS)
+                queue = row.get('qcur') or 0
+                state = self._servers.get(key)
+                if state is None:
+                    self._servers[key] = {'latency': latency and float(latency), 'queue': float(queue),
+                                          'error_rate': 0.0, 'stot': sessions, 'errors': errors,
+                                          'last': {'latency': latency, 'queue': queue, 'error_rate': 0.0}}
+                    continue
+                new_sessions, new_errors = sessions - state['stot'], errors - state['errors']
+                error_rate = 0.0
+                # Counters restart from zero when HAProxy reloads; skip that interval
+                if new_sessions > 0 and new_errors >= 0:
+                    error_rate = min(1.0, new_errors / new_sessions)
+                    state['error_rate'] = self._smooth(state['error_rate'], error_rate)
+                state['latency'] = self._smooth(state['latency'], latency)
+                state['queue'] = self._smooth(state['queue'], queue)
+                state['stot'], state['errors'] = sessions, errors
+                # Unsmoothed, for spotting saturation within one round
+                state['last'] = {'latency': latency or state['last']['latency'], 'queue': queue,
+                                 'error_rate': error_rate}
+        for key in set(self._servers) - seen:
+            del self._servers[key]
+
+    def cost(self, state: Dict[str, Any]) -> Optional[float]:
+        if state['latency'] is None:
+            return None
+        return (max(state['latency'], 1.0) * (1 + QUEUE_PENALTY * state['queue'])
+                * (1 + ERROR_PENALTY * state['error_rate']))
+
+    def saturated(self, backend: str, rows: List[Dict[str, Any]]) -> set:
+        """Servers whose last round shows a response time, queue or error spike next to the rest"""
+        last = {row['svname']: self._servers[(backend, row['svname'])]['last'] for row in rows
+                if (backend, row['svname']) in self._servers}
+        latencies = [state['latency'] for state in last.values() if state['latency']]
+        if not latencies:
+            return set()
+        typical_latency = median(latencies)
+        typical_queue = max(1.0, median(state['queue'] for state in last.values()))
+        return {name for name, state in last.items()
+                if state['error_rate'] >= SATURATION_ERROR_RATE
+                or (state['latency'] or 0) >= SATURATION_RATIO * typical_latency
+                or state['queue'] >= SATURATION_RATIO * typical_queue}
+
+    def plan(self, snapshot) -> Dict[str, List[Dict[str, Any]]]:
+        """Weight decisions per backend from the current state and weights"""
+        decisions = {}
+        for backend, (low, high) in self.bounds.items():
+            rows = [row for row in snapshot.servers(backend) if _eligible(row)]
+            costs = {row['svname']: self.cost(self._servers[(backend, row['svname'])]) for row in rows
+                     if (backend, row['svname']) in self._servers}
+            known = [c for c in costs.values() if c is not None]
+            if len(rows) < 2 or not known:
+                continue
+            saturated = self.saturated(backend, rows)
+            # Servers without traffic yet are treated as typical
+            typical = median(known)
+            scaled = {row['svname']: row['weight'] * (typical / (costs.get(row['svname']) or typical))
+                      ** ADJUSTMENT_GAIN for row in rows}
+            # Weights average base_weight, so they neither creep up to the bounds nor down to them
+            scale = self.base_weight * len(scaled) / sum(scaled.values())
+            backend_decisions = []
+            for row in rows:
+                name, current = row['svname'], row['weight']
+                target = scaled[name] * scale
+                step = max(1.0, current * self.max_step)
+                weight = round(min(max(target, current - step, low), current + step, high))
+                # The band applies to where the server should go, the step to how far it moves now
+                change = weight != current and abs(target - current) >= max(1.0, current * self.hysteresis)
+                if name in saturated and current > low:
+                    # Waiting for the smoothed cost to catch up would keep it saturated for rounds
+                    weight = min(weight if change else current, max(low, round(current * SATURATION_CUT)))
+                    change = True
+                state = self._servers.get((backend, name), {})
+                backend_decisions.append({
+                    'server': name,
+                    'current': current,
+                    'target': round(min(max(target, low), high)),
+                    'weight': weight if change else current,
+                    'change': change,
+                    'saturated': name in saturated,
+                    'latency_ms': state.get('latency') and round(state['latency'], 1),
+                    'queue': round(state.get('queue') or 0, 2),
+                    'error_rate': round(state.get('error_rate') or 0, 4)
+                })
+            decisions[backend] = backend_decisions
+        return decisions
+
+    def tick(self, dry_run: Optional[bool] = None) -> Dict[str, Any]:
+        """One round: observe, plan and (unless dry-run) apply"""
+        dry_run = self.dry_run if dry_run is None else dry_run
+        with self._lock:
+            snapshot = self.stats()
+            self.observe(snapshot)
+            decisions = self.plan(snapshot)
+        backends = {}
+        for backend, backend_decisions in decisions.items():
+            operations = [{'action': 'weight', 'backend': backend, 'server': d['server'], 'weight': d['weight']}
+                          for d in backend_decisions if d['change']]
+            report = {'servers': backend_decisions, 'changes': len(operations)}
+            if operations and not dry_run:
+                result = self.apply(operations)
+                report['applied'] = bool(result.get('success'))
+                if not report['applied']:
+                    report['error'] = result.get('error')
+                    logger.warning(f"Weight changes for {backend} failed: {report['error']}")
+            if operations and (dry_run or report['applied']):
+                WEIGHT_TUNER_CHANGES.labels(backend=backend, mode='dry_run' if dry_run else 'applied') \
+                    .inc(len(operations))
+            backends[backend] = report
+        self.last = {'time': datetime.utcnow().isoformat(), 'dry_run': dry_run, 'backends': backends}
+        return self.last
+
+    def start(self):
+        """Tune every interval in this process (idempotent, fork-aware)"""
+        if not self.bounds or not self.interval:
+            return
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='weight-tuner', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                if self.should_run is None or self.should_run():
+                    self.tick()
+                elif self._servers:
+                    # Another replica tunes now; start afresh if this one takes over again
+                    with self._lock:
+                        self._servers.clear()
+            except Exception as e:
+                logger.error(f"Weight tuning failed: {e}")
+            time.sleep(self.interval)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'enabled': bool(self.bounds and self.interval),
+            'dry_run': self.dry_run,
+            'interval': self.interval,
+            'backends': {backend: {'min_weight': low, 'max_weight': high}
+                         for backend, (low, high) in self.bounds.items()},
+            'last': self.last
+        }
@@ -11,9 +11,11 @@ set -euo pipefail
 ZONE="${ZONE:-eu}"
 API_PORT="${API_PORT:-8080}"
 WORKERS="${WORKERS:-4}"
+SERVER_MODE="${SERVER_MODE:-sync}"
 LOG_LEVEL="${LOG_LEVEL:-info}"
 HAPROXY_CONFIG_PATH="${HAPROXY_CONFIG_PATH:-/etc/haproxy/haproxy.cfg}"
 HAPROXY_SOCKET="${HAPROXY_SOCKET:-/var/run/haproxy.sock}"
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/configwatcher-metrics}"
 
 # Colors for logging
 RED='\033[0;31m'
@@ -111,6 +113,23 @@ EOF
     fi
 }
 
+# Move audit records from the old Redis lists into the audit stream
+migrate_audit_log() {
+    log "Migrating legacy audit lists..."
+    
+    if python3 /app/src/audit_log.py migrate; then
+        success "Audit log migration complete"
+    else
+        warning "Audit log migration failed"
+    fi
+}
+
+# Gunicorn workers write metric samples here; stale files from a previous run would be summed in
+setup_metrics() {
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+}
+
 # Setup logging
 setup_logging() {
     log "Setting up logging..."
@@ -222,6 +241,8 @@ main() {
     wait_for_dependencies
     init_configuration
     setup_logging
+    setup_metrics
+    migrate_audit_log
     
     # Start background services
     start_monitoring
@@ -230,22 +251,35 @@ main() {
     log "Starting ConfigWatcher API server..."
     cd /app
     
+    # sync: one request per worker; async: an event loop per worker serving
+    # status and stats natively, with the rest handed to Flask on a thread pool
+    if [[ "$SERVER_MODE" == "async" ]]; then
+        worker_class="aiohttp.GunicornWebWorker"
+        app_module="async_app:create_app"
+    else
+        worker_class="sync"
+        app_module="src.app:app"
+    fi
+    log "Serving mode: $SERVER_MODE ($worker_class)"
+    
     # Use gunicorn for production
     exec gunicorn \
         --bind 0.0.0.0:$API_PORT \
         --workers $WORKERS \
-        --worker-class sync \
+        --worker-class $worker_class \
         --timeout 120 \
         --keep-alive 2 \
         --max-requests 1000 \
         --max-requests-jitter 100 \
         --preload \
+        --config /app/gunicorn.conf.py \
+        --pythonpath /app/src \
         --log-level $LOG_LEVEL \
         --access-logfile /app/logs/access.log \
         --error-logfile /app/logs/error.log \
         --capture-output \
         --enable-stdio-inheritance \
-        src.app:app
+        $app_module
 }
 
 # Run main function
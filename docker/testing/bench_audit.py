@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - Audit Log Memory Benchmark
+Writes the same events to the legacy lpush list and to the audit stream
+and compares the Redis memory each one holds, then times filtered queries.
+Needs a real Redis: it uses MEMORY USAGE and INFO, and deletes its own keys
+(prefix configwatcher:bench) afterwards.
+
+Usage:
+    python bench_audit.py --redis-url redis://localhost:6379/15 --events 1000000
+"""
+
+import os
+import sys
+import argparse
+import json
+import random
+import time
+
+import redis
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'configwatcher-api', 'src'))
+
+from audit_log import AuditLog  # noqa: E402
+
+PREFIX = 'configwatcher:bench'
+
+
+def generate_events(count: int, backends: int, servers: int):
+    rng = random.Random(42)
+    for i in range(count):
+        backend = f"backend_{rng.randrange(backends)}"
+        server = f"node_{rng.randrange(servers)}"
+        action = rng.choice(('add', 'remove', 'weight'))
+        yield 'config_change', {'action': action, 'backend': backend, 'server': {'name': server}}, 'eu'
+
+
+def used_memory(client) -> int:
+    return client.info('memory')['used_memory']
+
+
+def key_memory(client, pattern: str) -> int:
+    total = 0
+    for key in client.scan_iter(match=pattern, count=1000):
+        total += client.memory_usage(key, samples=0) or 0
+    return total
+
+
+def cleanup(client):
+    for key in client.scan_iter(match=f"{PREFIX}:*", count=1000):
+        client.delete(key)
+
+
+def bench_list(client, count: int, backends: int, servers: int) -> int:
+    key = f"{PREFIX}:legacy:config_changes"
+    pipe = client.pipeline(transaction=False)
+    for i, (_, data, zone) in enumerate(generate_events(count, backends, servers), 1):
+        # The shape app.py wrote before the audit log existed
+        pipe.lpush(key, json.dumps(dict(data, timestamp='2024-01-15T10:30:00.000000', zone=zone)))
+        if i % 1000 == 0:
+            pipe.execute()
+    pipe.execute()
+    return key_memory(client, key)
+
+
+def bench_stream(client, count: int, backends: int, servers: int, maxlen: int) -> AuditLog:
+    audit = AuditLog(client, prefix=f"{PREFIX}:audit", maxlen=maxlen)
+    audit.record_many(generate_events(count, backends, servers))
+    return audit
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Audit log memory benchmark')
+    parser.add_argument('--redis-url', default='redis://localhost:6379/15')
+    parser.add_argument('--events', type=int, default=1000000)
+    parser.add_argument('--backends', type=int, default=20)
+    parser.add_argument('--servers', type=int, default=500)
+    parser.add_argument('--maxlen', type=int, default=100000, help='audit stream cap (AUDIT_MAXLEN)')
+    args = parser.parse_args()
+
+    client = redis.from_url(args.redis_url)
+    cleanup(client)
+    print(f"{args.events} events, {args.backends} backends, {args.servers} servers")
+
+    start = time.perf_counter()
+    list_bytes = bench_list(client, args.events, args.backends, args.servers)
+    print(f"{'lpush list (unbounded)':<34} {list_bytes / 2**20:9.1f} MiB "
+          f"{list_bytes / args.events:7.1f} B/event  {time.perf_counter() - start:6.1f}s")
+    cleanup(client)
+
+    for maxlen in (args.events, args.maxlen):
+        before = used_memory(client)
+        start = time.perf_counter()
+        audit = bench_stream(client, args.events, args.backends, args.servers, maxlen)
+        elapsed = time.perf_counter() - start
+        stream_bytes = key_memory(client, audit.stream)
+        index_bytes = key_memory(client, f"{audit.prefix}:index:*")
+        kept = client.xlen(audit.stream)
+        label = f"stream MAXLEN ~{maxlen}"
+        print(f"{label:<34} {(stream_bytes + index_bytes) / 2**20:9.1f} MiB "
+              f"{(stream_bytes + index_bytes) / kept:7.1f} B/event  {elapsed:6.1f}s  "
+              f"(events {stream_bytes / 2**20:.1f} MiB, indexes {index_bytes / 2**20:.1f} MiB, "
+              f"{kept} kept, used_memory +{(used_memory(client) - before) / 2**20:.1f} MiB)")
+
+        for label, kwargs in (('latest 100', {}),
+                              ('backend filter', {'backend': 'backend_3'}),
+                              ('server filter', {'server': 'node_7'}),
+                              ('backend+server filter', {'backend': 'backend_3', 'server': 'node_7'})):
+            rounds = 20
+            start = time.perf_counter()
+            for _ in range(rounds):
+                page = audit.query(limit=100, **kwargs)
+            elapsed = (time.perf_counter() - start) / rounds
+            print(f"    query {label:<24} {elapsed * 1000:8.2f} ms  ({len(page['events'])} events)")
+        cleanup(client)
+
+
+if __name__ == '__main__':
+    main()
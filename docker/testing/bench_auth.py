@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - Authentication Overhead Benchmark
+Measures the per-request cost of authenticating a request: a full HS256
+jwt.decode (the old token_required), a cached token, an API key, and the
+whole Flask request path with each of them.
+
+Usage:
+    python bench_auth.py --requests 100000
+    python bench_auth.py --redis-url redis://localhost:6379/15   # include revocation checks
+"""
+
+import os
+import sys
+import argparse
+import time
+from datetime import datetime, timedelta
+
+import jwt
+from flask import Flask, request
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'configwatcher-api', 'src'))
+
+from auth import Authenticator  # noqa: E402
+
+SECRET = 'configwatcher-bench-secret-0123456789'
+API_KEY = 'bench-api-key'
+
+
+def timed(label: str, func, requests: int):
+    start = time.perf_counter()
+    for _ in range(requests):
+        user, error = func()
+    elapsed = time.perf_counter() - start
+    assert error is None, error
+    print(f"{label:<40} {elapsed / requests * 1e6:8.2f} us/request")
+    return elapsed / requests
+
+
+def legacy_authenticate(header: str):
+    """token_required before the cache: decode and verify on every request"""
+    token = header[7:] if header.startswith('Bearer ') else header
+    return jwt.decode(token, SECRET, algorithms=['HS256'])['user'], None
+
+
+def flask_app(authenticate) -> Flask:
+    app = Flask(__name__)
+
+    @app.route('/stats')
+    def stats():
+        user, error = authenticate(request.headers.get('Authorization'), request.headers.get('X-API-Key'))
+        if error:
+            return {'message': error}, 401
+        return {'user': user}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark per-request authentication overhead')
+    parser.add_argument('--requests', type=int, default=100000)
+    parser.add_argument('--redis-url', help='check revocations in this Redis on cache misses')
+    args = parser.parse_args()
+
+    redis_client = None
+    if args.redis_url:
+        import redis
+        redis_client = redis.from_url(args.redis_url)
+    token = jwt.encode({'user': 'admin', 'exp': datetime.utcnow() + timedelta(hours=24)}, SECRET)
+    header = f"Bearer {token}"
+
+    uncached = Authenticator(SECRET, redis_client, cache_size=0)
+    cached = Authenticator(SECRET, redis_client, api_keys=[API_KEY])
+    cached.authenticate(header)
+
+    print(f"{args.requests} requests, revocation store: {args.redis_url or 'process-local'}")
+    before = timed('jwt.decode per request (before)', lambda: legacy_authenticate(header), args.requests)
+    timed('Authenticator, cache disabled', lambda: uncached.authenticate(header), args.requests)
+    after = timed('Authenticator, cached token', lambda: cached.authenticate(header), args.requests)
+    timed('Authenticator, API key', lambda: cached.authenticate(None, API_KEY), args.requests)
+    print(f"{'cached token speedup':<40} {before / after:8.1f}x")
+
+    # The same, inside a minimal Flask request so the saving is seen in proportion
+    rounds = max(1, args.requests // 10)
+    for label, authenticate, headers in (
+            ('Flask request, jwt.decode (before)', lambda h, k: legacy_authenticate(h), {'Authorization': header}),
+            ('Flask request, cached token', cached.authenticate, {'Authorization': header}),
+            ('Flask request, API key', cached.authenticate, {'X-API-Key': API_KEY})):
+        client = flask_app(authenticate).test_client()
+        start = time.perf_counter()
+        for _ in range(rounds):
+            response = client.get('/stats', headers=headers)
+        assert response.status_code == 200, response.get_json()
+        print(f"{label:<40} {(time.perf_counter() - start) / rounds * 1e6:8.2f} us/request")
+
+
+if __name__ == '__main__':
+    main()
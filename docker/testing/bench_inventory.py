@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - Container Inventory Check and Benchmark
+Drives the container inventory with a fake Docker daemon: random creates,
+stops, renames, network changes and removals, with the events stream
+dropped part way through. Checks that the inventory ends up matching a
+fresh inspect of every container, then compares Docker API calls and
+latency of the old per-request listing with inventory reads.
+
+Usage:
+    python bench_inventory.py --containers 500 --changes 2000 --latency 0.002
+"""
+
+import os
+import sys
+import argparse
+import random
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'configwatcher-api', 'src'))
+
+from fake_docker import FakeDockerClient  # noqa: E402
+from container_inventory import ContainerInventory, _from_inspect, zones_of  # noqa: E402
+
+ZONES = ('eu', 'us')
+
+
+def network(zone: str) -> str:
+    return f'docker_{zone}_zone'
+
+
+def expected_view(api):
+    """What the inventory should hold, from a fresh inspect of everything"""
+    view = {}
+    for summary in api.containers(all=True):
+        record = _from_inspect(api.inspect_container(summary['Id']))
+        view[record['id']] = (record['name'], record['status'], sorted(zones_of(record)),
+                              sorted((n, i['IPAddress']) for n, i in record['networks'].items()))
+    return view
+
+
+def inventory_view(inventory: ContainerInventory):
+    return {r['id']: (r['name'], r['status'], sorted(zones_of(r)),
+                      sorted((n, i['IPAddress']) for n, i in r['networks'].items()))
+            for r in inventory.containers()}
+
+
+def churn(api, names, free_ips, changes: int, rng: random.Random, on_halfway):
+    counter = len(names)
+    for i in range(changes):
+        if i == changes // 2:
+            on_halfway()
+        op = rng.random()
+        if op < 0.3 or not names:
+            zone = rng.choice(ZONES)
+            if free_ips[zone]:
+                counter += 1
+                name = f'{zone}-backend-{counter}'
+                api.run(name, networks={network(zone): free_ips[zone].pop()})
+                names.append(name)
+        elif op < 0.5:
+            name = names.pop(rng.randrange(len(names)))
+            attrs = api.inspect_container(name)
+            for net, info in attrs['NetworkSettings']['Networks'].items():
+                free_ips[net.split('_')[1]].append(info['IPAddress'])
+            api.remove(name)
+        elif op < 0.65:
+            api.stop(rng.choice(names))
+        elif op < 0.75:
+            api.start(rng.choice(names))
+        elif op < 0.85:
+            index = rng.randrange(len(names))
+            counter += 1
+            new_name = f"{names[index].rsplit('-', 1)[0]}-{counter}"
+            api.rename(names[index], new_name)
+            names[index] = new_name
+        elif op < 0.95:
+            name = rng.choice(names)
+            nets = api.inspect_container(name)['NetworkSettings']['Networks']
+            zone = rng.choice(ZONES)
+            if network(zone) in nets:
+                free_ips[zone].append(nets[network(zone)]['IPAddress'])
+                api.disconnect(name, network(zone))
+            elif free_ips[zone]:
+                api.connect(name, network(zone), free_ips[zone].pop())
+        else:
+            api.exec_(rng.choice(names))
+
+
+def wait_until(predicate, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return predicate()
+
+
+def old_listing(api, zone: str) -> int:
+    """DockerManager.list_zone_containers before the inventory: containers.list(all=True)
+    inspects every container, and container.image.tags fetches every image"""
+    found = 0
+    for summary in api.containers(all=True):
+        attrs = api.inspect_container(summary['Id'])
+        api._request('inspect_image')
+        if f'{zone}-backend' in attrs['Name'] or f'{zone}_zone' in str(attrs['NetworkSettings']):
+            found += 1
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check and benchmark the container inventory')
+    parser.add_argument('--containers', type=int, default=500)
+    parser.add_argument('--changes', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.002, help='Seconds added to every fake API call')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    client = FakeDockerClient()
+    api = client.api
+    free_ips = {zone: [f"10.{i + 1}.{n // 250}.{n % 250 + 2}" for n in range(4 * args.containers)]
+                for i, zone in enumerate(ZONES)}
+    names = []
+    for n in range(args.containers):
+        zone = ZONES[n % len(ZONES)]
+        names.append(f'{zone}-backend-{n}')
+        api.run(names[-1], networks={network(zone): free_ips[zone].pop()})
+
+    inventory = ContainerInventory(client, retry_interval=0.1)
+    inventory.start()
+    if not wait_until(lambda: inventory.watching, 5):
+        sys.exit('Inventory never started following the events stream')
+
+    def reconnect():
+        # The second half of the changes must arrive as events, not through the resync listing
+        syncs = inventory.syncs
+        api.break_streams()
+        if not wait_until(lambda: inventory.watching and inventory.syncs > syncs, 5):
+            sys.exit('Inventory did not resubscribe after the events stream broke')
+
+    start = time.perf_counter()
+    churn(api, names, free_ips, args.changes, rng, on_halfway=reconnect)
+    churned = time.perf_counter() - start
+    settled = wait_until(lambda: inventory.watching and inventory_view(inventory) == expected_view(api), 10)
+
+    stats = inventory.stats()
+    print(f"{len(names)} containers after {args.changes} changes ({churned:.2f}s), "
+          f"{stats['events']} events applied, {stats['syncs']} full listings")
+    zone_ips_ok = all(inventory.zone_ips(zone) == {i['IPAddress'] for r in inventory.containers()
+                                                    for n, i in r['networks'].items() if f'{zone}_zone' in n}
+                      for zone in ZONES)
+    if not settled or not zone_ips_ok:
+        print("FAIL: inventory does not match the daemon")
+        sys.exit(1)
+    print("OK: inventory matches a fresh inspect of every container")
+
+    api.latency = args.latency
+    rounds = 5
+    before = sum(api.calls.values())
+    start = time.perf_counter()
+    for _ in range(rounds):
+        old_listing(api, 'eu')
+    old_time = (time.perf_counter() - start) / rounds
+    old_calls = (sum(api.calls.values()) - before) / rounds
+
+    before = sum(api.calls.values())
+    start = time.perf_counter()
+    for _ in range(rounds):
+        inventory.containers(zone='eu')
+    new_time = (time.perf_counter() - start) / rounds
+    new_calls = (sum(api.calls.values()) - before) / rounds
+
+    print(f"{'list zone containers':<24} {'API calls':>10} {'ms':>10}")
+    print(f"{'per-request listing':<24} {old_calls:>10.0f} {old_time * 1000:>10.2f}")
+    print(f"{'inventory':<24} {new_calls:>10.0f} {new_time * 1000:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
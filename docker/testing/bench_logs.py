@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - Log Ingestion Benchmark
+Generates HAProxy httplog lines, as HAProxy sends them to syslog, and
+measures how many lines per second the log analytics take on one core:
+
+- parse: batches of lines straight into LogAnalytics
+- udp: a separate process sends the lines as syslog datagrams to a
+  LogIngestor reading a UDP socket, at --rate lines/s; lines the socket
+  dropped show as missing
+
+Percentiles from the sketches are checked against exact ones.
+
+Usage:
+    python bench_logs.py --lines 1000000
+    python bench_logs.py --mode udp --rate 50000 --seconds 10
+    python bench_logs.py --write /tmp/haproxy.log --lines 100000
+"""
+
+import os
+import sys
+import time
+import random
+import socket
+import argparse
+import multiprocessing
+from typing import List
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'configwatcher-api', 'src'))
+
+from log_ingest import LogAnalytics, LogIngestor  # noqa: E402
+
+BACKENDS = {
+    'ddc_nodes_http': [f'node{i}' for i in range(1, 9)],
+    'ddc_nodes_grpc': [f'node{i}_grpc' for i in range(1, 5)],
+    'configwatcher_backend': ['configwatcher1', 'configwatcher2'],
+}
+PATHS = ['/api/v1/nodes', '/api/v1/nodes/{id}', '/api/v1/blocks/{id}', '/health', '/api/v1/storage/{id}/chunks',
+         '/ddc.v1.Storage/Get', '/ddc.v1.Storage/Put', '/config', '/stats', '/api/v1/search']
+STATUSES = [200] * 90 + [201] * 3 + [304] * 2 + [404] * 3 + [500, 503]
+
+
+def generate(count: int, seed: int = 42) -> List[str]:
+    """Lines with log-normal response times; node3 and one path are slower"""
+    rng = random.Random(seed)
+    backends = list(BACKENDS.items())
+    lines = []
+    for i in range(count):
+        backend, servers = backends[0] if rng.random() < 0.8 else rng.choice(backends[1:])
+        server = rng.choice(servers)
+        path = rng.choice(PATHS).replace('{id}', str(rng.randrange(100000)))
+        tr = int(rng.lognormvariate(3, 0.8) * (4 if server == 'node3' else 1) * (10 if 'search' in path else 1))
+        tw, tc = rng.randrange(3), rng.randrange(1, 4)
+        ta = tr + tw + tc + rng.randrange(3)
+        status = rng.choice(STATUSES)
+        second = i // 1000
+        lines.append(
+            f"<134>Oct 16 12:{second // 60 % 60:02d}:{second % 60:02d} haproxy-eu[7]: "
+            f"10.1.{rng.randrange(256)}.{rng.randrange(256)}:{rng.randrange(1024, 65535)} "
+            f"[16/Oct/2026:12:{second // 60 % 60:02d}:{second % 60:02d}.{i % 1000:03d}] http_frontend "
+            f"{backend}/{server} 0/{tw}/{tc}/{tr}/{ta} {status} {rng.randrange(200, 20000)} - - ---- "
+            f"{rng.randrange(100)}/{rng.randrange(100)}/{rng.randrange(50)}/{rng.randrange(20)}/0 0/0 "
+            f"\"GET {path}?limit=10 HTTP/1.1\"")
+    return lines
+
+
+def exact_percentile(values: List[int], q: float) -> int:
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))]
+
+
+def check_accuracy(lines: List[str], analytics: LogAnalytics):
+    backend = 'ddc_nodes_http'
+    totals = [int(line.split(f' {backend}/')[1].split(' ')[1].split('/')[4]) for line in lines if f' {backend}/' in line]
+    summary = analytics.snapshot().summary(backend=backend)['backends'][backend]
+    for q in (0.5, 0.99, 0.999):
+        exact, estimate = exact_percentile(totals, q), summary['latency_ms'][f'p{q * 100:g}']
+        print(f"  {backend} p{q * 100:g}: exact {exact} ms, sketch {estimate} ms "
+              f"({(estimate - exact) / max(exact, 1) * 100:+.1f}%)")
+
+
+def bench_parse(args):
+    lines = generate(args.lines)
+    analytics = LogAnalytics(window=3600)
+    batch = 1024
+    start = time.process_time()
+    for i in range(0, len(lines), batch):
+        analytics.ingest(lines[i:i + batch])
+    elapsed = time.process_time() - start
+    print(f"parse: {len(lines)} lines in {elapsed:.2f}s CPU, {len(lines) / elapsed:,.0f} lines/s on one core")
+    window = analytics.snapshot()
+    print(f"  {window.lines} lines, {window.unparsed} unparsed, {len(window.servers)} servers")
+    check_accuracy(lines, analytics)
+    summary = window.summary(top=3)
+    for path in summary['slow_paths']:
+        print(f"  slow path {path['path']}: {path['slow_requests']} slow requests, mean {path['mean_ms']} ms")
+
+
+def send(port: int, lines: List[str], rate: float):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    encoded = [line.encode() for line in lines]
+    start = time.perf_counter()
+    for i in range(0, len(encoded), 100):
+        # Pace in steps of 100 lines
+        delay = start + i / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        for datagram in encoded[i:i + 100]:
+            sock.sendto(datagram, ('127.0.0.1', port))
+
+
+def bench_udp(args):
+    count = int(args.rate * args.seconds)
+    lines = generate(count)
+    analytics = LogAnalytics(window=3600)
+    ingestor = LogIngestor(analytics, udp=f'127.0.0.1:{args.port}', publish_interval=3600)
+    ingestor.start()
+    sender = multiprocessing.Process(target=send, args=(args.port, lines, args.rate))
+    cpu = time.process_time()
+    start = time.perf_counter()
+    sender.start()
+    sender.join()
+    # Let the reader finish what is queued in the socket buffer
+    previous = -1
+    while ingestor.status()['lines']['parsed'] != previous:
+        previous = ingestor.status()['lines']['parsed']
+        time.sleep(0.2)
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+    received = sum(ingestor.status()['lines'].values())
+    print(f"udp: sent {count} lines at {count / elapsed:,.0f} lines/s, received {received} "
+          f"({count - received} dropped by the socket), reader CPU {cpu / elapsed * 100:.0f}% of one core")
+    check_accuracy(lines, analytics)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark HAProxy log ingestion')
+    parser.add_argument('--mode', choices=('parse', 'udp'), default='parse')
+    parser.add_argument('--lines', type=int, default=500000, help='Lines to parse (parse mode)')
+    parser.add_argument('--rate', type=float, default=50000, help='Lines per second to send (udp mode)')
+    parser.add_argument('--seconds', type=float, default=10, help='How long to send (udp mode)')
+    parser.add_argument('--port', type=int, default=15140)
+    parser.add_argument('--write', help='Only write the generated lines to this file, e.g. to test file ingestion')
+    args = parser.parse_args()
+
+    if args.write:
+        with open(args.write, 'w') as f:
+            f.writelines(line + '\n' for line in generate(args.lines))
+        print(f"Wrote {args.lines} lines to {args.write}")
+    elif args.mode == 'parse':
+        bench_parse(args)
+    else:
+        bench_udp(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - Map Update Benchmark
+Times the map manager against the fake HAProxy socket, run in its own
+process: a full replace of a large map and of a large ACL (prepare, load,
+commit), then single-entry and bulk updates of the loaded map. Each update
+is timed until HAProxy has it (runtime) and until the file is written too.
+
+Usage:
+    python bench_maps.py --entries 100000 --updates 200
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import multiprocessing
+from statistics import median
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'configwatcher-api', 'src'))
+
+from fake_haproxy import FakeHAProxy, serve  # noqa: E402
+from haproxy_runtime import RuntimeClient  # noqa: E402
+from haproxy_maps import MapManager  # noqa: E402
+
+
+def run_fake(socket_path: str, directory: str):
+    haproxy = FakeHAProxy()
+    haproxy.add_patterns(os.path.join(directory, 'tenants.map'), 'map')
+    haproxy.add_patterns(os.path.join(directory, 'blocked.acl'), 'acl')
+    serve(socket_path, haproxy)
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark map and ACL updates through the runtime API')
+    parser.add_argument('--entries', type=int, default=100000)
+    parser.add_argument('--updates', type=int, default=200, help='Single-entry updates to time')
+    parser.add_argument('--bulk', type=int, default=1000, help='Entries per bulk update')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bench-maps-')
+    for filename in ('tenants.map', 'blocked.acl'):
+        open(os.path.join(directory, filename), 'w').close()
+    socket_path = os.path.join(directory, 'haproxy.sock')
+    fake = multiprocessing.Process(target=run_fake, args=(socket_path, directory), daemon=True)
+    fake.start()
+    while not os.path.exists(socket_path):
+        time.sleep(0.05)
+    manager = MapManager(RuntimeClient(socket_path), directory)
+
+    tenants = {f'tenant-{i:06d}': f'ddc_nodes_{"grpc" if i % 4 == 0 else "http"}' for i in range(args.entries)}
+    result = manager.replace('tenants', tenants)
+    print(f"replace map of {args.entries} entries: runtime {result['runtime_ms']:.0f} ms, "
+          f"with file {result['duration_ms']:.0f} ms")
+    sources = [f'10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}' for i in range(args.entries)]
+    result = manager.replace('blocked', sources)
+    print(f"replace ACL of {args.entries} patterns: runtime {result['runtime_ms']:.0f} ms, "
+          f"with file {result['duration_ms']:.0f} ms (one command per pattern)")
+
+    runtime, total = [], []
+    for i in range(args.updates):
+        key = f'tenant-{i * 7919 % args.entries:06d}'
+        result = manager.update('tenants', {key: 'ddc_nodes_grpc' if i % 2 else 'ddc_nodes_http'})
+        runtime.append(result['runtime_ms'])
+        total.append(result['duration_ms'])
+    print(f"single-entry updates: runtime p50 {median(runtime):.2f} ms p99 {percentile(runtime, 0.99):.2f} ms; "
+          f"with file p50 {median(total):.1f} ms p99 {percentile(total, 0.99):.1f} ms")
+
+    bulk = {f'new-{i}': 'ddc_nodes_http' for i in range(args.bulk)}
+    result = manager.update('tenants', bulk, delete=[f'tenant-{i:06d}' for i in range(args.bulk)])
+    print(f"bulk update (+{result['added']} -{result['deleted']}): runtime {result['runtime_ms']:.1f} ms, "
+          f"with file {result['duration_ms']:.1f} ms")
+    print(f"HAProxy has {manager.loaded()[os.path.join(directory, 'tenants.map')]} entries, "
+          f"the file {manager.get('tenants')['count']}")
+
+
+if __name__ == '__main__':
+    main()
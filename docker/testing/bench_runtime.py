@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - Runtime API Benchmark
+Compares per-command socat subprocesses with the pooled runtime client
+against the fake HAProxy socket.
+
+Usage:
+    python bench_runtime.py --commands 2000
+"""
+
+import os
+import sys
+import argparse
+import shutil
+import subprocess
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'configwatcher-api', 'src'))
+
+from fake_haproxy import FakeHAProxy, serve  # noqa: E402
+from haproxy_runtime import RuntimeClient  # noqa: E402
+
+
+def report(label: str, count: int, elapsed: float):
+    print(f"{label:<32} {count:>7} cmds {elapsed:8.3f}s {count / elapsed:>10.0f} cmds/s "
+          f"{elapsed / count * 1e6:>9.1f} us/cmd")
+
+
+def bench_socat(socket_path: str, count: int):
+    start = time.perf_counter()
+    for i in range(count):
+        subprocess.run(['sh', '-c', f'echo "show info" | socat stdio {socket_path}'],
+                       capture_output=True, text=True)
+    report('socat subprocess', count, time.perf_counter() - start)
+
+
+def bench_client(client: RuntimeClient, count: int):
+    start = time.perf_counter()
+    for i in range(count):
+        client.execute('show info')
+    report('pooled client (1 cmd/trip)', count, time.perf_counter() - start)
+
+
+def bench_pipeline(client: RuntimeClient, count: int, batch: int):
+    commands = [f"add server ddc_nodes_http/bench{i} 10.9.{i // 250}.{i % 250}:80 weight 100"
+                for i in range(count)]
+    start = time.perf_counter()
+    for i in range(0, count, batch):
+        client.execute_checked(commands[i:i + batch])
+    report(f'pooled client ({batch} cmds/trip)', count, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the HAProxy runtime API client')
+    parser.add_argument('--commands', type=int, default=2000)
+    parser.add_argument('--socat-commands', type=int, default=200)
+    parser.add_argument('--batch', type=int, default=100)
+    args = parser.parse_args()
+
+    socket_path = os.path.join(tempfile.mkdtemp(), 'haproxy.sock')
+    haproxy = FakeHAProxy()
+    haproxy.add_backend('ddc_nodes_http', 3)
+    server = serve(socket_path, haproxy, background=True)
+
+    if shutil.which('socat'):
+        bench_socat(socket_path, args.socat_commands)
+    else:
+        print('socat not installed; skipping subprocess baseline')
+
+    client = RuntimeClient(socket_path)
+    bench_client(client, args.commands)
+    bench_pipeline(client, args.commands, args.batch)
+    client.close()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
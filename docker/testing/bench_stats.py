@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - Stats Parsing Benchmark
+Measures 'show stat' parsing throughput and cached lookups on a generated
+dump with 10k servers.
+
+Usage:
+    python bench_stats.py --servers 10000
+"""
+
+import os
+import sys
+import argparse
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'configwatcher-api', 'src'))
+
+from fake_haproxy import FakeHAProxy  # noqa: E402
+from haproxy_stats import StatsCache, parse_stat_csv, parse_stat_typed  # noqa: E402
+
+
+def timed(label: str, func, rounds: int, rows: int):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        result = func()
+    elapsed = (time.perf_counter() - start) / rounds
+    print(f"{label:<28} {elapsed * 1000:9.2f} ms/dump {rows / elapsed:>12.0f} rows/s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark HAProxy stats parsing')
+    parser.add_argument('--servers', type=int, default=10000)
+    parser.add_argument('--backends', type=int, default=10)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    haproxy = FakeHAProxy()
+    for b in range(args.backends):
+        haproxy.add_backend(f"backend_{b}", args.servers // args.backends)
+    csv_dump = haproxy.handle('show stat')
+    typed_dump = haproxy.handle('show stat typed')
+    rows = csv_dump.count('\n') - 1
+    print(f"'show stat' dump: {rows} rows, {len(csv_dump) / 1024:.0f} KiB")
+
+    timed('parse show stat (csv)', lambda: parse_stat_csv(csv_dump), args.rounds, rows)
+    timed('parse show stat typed', lambda: parse_stat_typed(typed_dump), args.rounds, rows)
+
+    cache = StatsCache(lambda: csv_dump, ttl=60)
+    cache.get()
+    lookups = 100000
+    start = time.perf_counter()
+    for i in range(lookups):
+        cache.get().value(f"backend_{i % args.backends}", f"node{i % 100 + 1}", 'scur')
+    elapsed = time.perf_counter() - start
+    print(f"{'cached (proxy, server) lookup':<28} {elapsed / lookups * 1e6:9.2f} us/lookup")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - Fake Docker Engine
+In-memory stand-in for the parts of the Docker Engine API the ConfigWatcher
+container inventory uses: the container list, container inspect and the
+events stream. Containers are changed through helper methods that emit the
+same events a real daemon would, in the same order.
+
+Usage:
+    from fake_docker import FakeDockerClient
+    client = FakeDockerClient(latency=0.002)
+    client.api.run('eu-backend-1', networks={'docker_eu_zone': '10.1.0.50'})
+"""
+
+import copy
+import queue
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+try:
+    from docker.errors import NotFound
+except ImportError:
+    class NotFound(Exception):
+        pass
+
+
+class StreamBroken(ConnectionError):
+    pass
+
+
+class FakeEventStream:
+    """Blocking iterator over decoded events, like docker's CancellableStream"""
+
+    _CLOSED = object()
+    _BROKEN = object()
+
+    def __init__(self, filters: Optional[Dict[str, List[str]]] = None):
+        self.types = set((filters or {}).get('type') or [])
+        self._queue: queue.Queue = queue.Queue()
+
+    def push(self, event: Dict[str, Any]):
+        if not self.types or event['Type'] in self.types:
+            self._queue.put(event)
+
+    def close(self):
+        self._queue.put(self._CLOSED)
+
+    def break_(self):
+        self._queue.put(self._BROKEN)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Dict[str, Any]:
+        event = self._queue.get()
+        if event is self._CLOSED:
+            raise StopIteration
+        if event is self._BROKEN:
+            raise StreamBroken('Connection reset by fake daemon')
+        return event
+
+
+class FakeDockerAPI:
+    """The low-level client (docker.APIClient) subset, backed by a dict of containers"""
+
+    def __init__(self, latency: float = 0.0):
+        # Added to every request, to compare call counts in wall time
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self._containers: Dict[str, Dict[str, Any]] = {}
+        self._networks: Dict[str, str] = {}
+        self._history: List[Dict[str, Any]] = []
+        self._streams: List[FakeEventStream] = []
+        self._lock = threading.Lock()
+
+    def _request(self, name: str):
+        self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    # Engine API
+
+    def containers(self, all: bool = False) -> List[Dict[str, Any]]:
+        self._request('containers')
+        with self._lock:
+            return [self._summary(attrs) for attrs in self._containers.values()
+                    if all or attrs['State']['Running']]
+
+    def inspect_container(self, container: str) -> Dict[str, Any]:
+        self._request('inspect_container')
+        with self._lock:
+            return copy.deepcopy(self._find(container))
+
+    def events(self, since: Optional[float] = None, decode: bool = False,
+               filters: Optional[Dict[str, List[str]]] = None) -> FakeEventStream:
+        self._request('events')
+        stream = FakeEventStream(filters)
+        with self._lock:
+            if since is not None:
+                for event in self._history:
+                    if event['time'] >= since:
+                        stream.push(event)
+            self._streams.append(stream)
+        return stream
+
+    # Changes, each emitting the daemon's events
+
+    def run(self, name: str, image: str = 'nginx:alpine', networks: Optional[Dict[str, str]] = None,
+            environment: Optional[List[str]] = None) -> str:
+        container_id = uuid.uuid4().hex + uuid.uuid4().hex
+        now = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        with self._lock:
+            self._containers[container_id] = {
+                'Id': container_id,
+                'Name': f'/{name}',
+                'Created': now,
+                'State': {'Status': 'created', 'Running': False, 'StartedAt': '0001-01-01T00:00:00Z'},
+                'Config': {'Image': image, 'Env': list(environment or [])},
+                'NetworkSettings': {'Networks': {}},
+                'Mounts': []
+            }
+            self._emit('container', 'create', container_id, {'name': name, 'image': image})
+        for network, ip in (networks or {}).items():
+            self.connect(name, network, ip)
+        self.start(name)
+        return container_id
+
+    def start(self, name: str):
+        with self._lock:
+            attrs = self._find(name)
+            attrs['State'].update(Status='running', Running=True,
+                                  StartedAt=datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ'))
+            self._emit('container', 'start', attrs['Id'], {'name': name})
+
+    def stop(self, name: str):
+        with self._lock:
+            attrs = self._find(name)
+            attrs['State'].update(Status='exited', Running=False)
+            self._emit('container', 'die', attrs['Id'], {'name': name, 'exitCode': '0'})
+            self._emit('container', 'stop', attrs['Id'], {'name': name})
+
+    def remove(self, name: str):
+        with self._lock:
+            attrs = self._find(name)
+            for network in list(attrs['NetworkSettings']['Networks']):
+                self._disconnect(attrs, network)
+            del self._containers[attrs['Id']]
+            self._emit('container', 'destroy', attrs['Id'], {'name': name})
+
+    def rename(self, name: str, new_name: str):
+        with self._lock:
+            attrs = self._find(name)
+            attrs['Name'] = f'/{new_name}'
+            self._emit('container', 'rename', attrs['Id'], {'name': new_name, 'oldName': f'/{name}'})
+
+    def connect(self, name: str, network: str, ip: str):
+        with self._lock:
+            attrs = self._find(name)
+            network_id = self._networks.setdefault(network, uuid.uuid4().hex)
+            attrs['NetworkSettings']['Networks'][network] = {
+                'NetworkID': network_id, 'IPAddress': ip, 'IPPrefixLen': 24,
+                'IPAMConfig': {'IPv4Address': ip}
+            }
+            self._emit('network', 'connect', network_id, {'container': attrs['Id'], 'name': network})
+
+    def disconnect(self, name: str, network: str):
+        with self._lock:
+            self._disconnect(self._find(name), network)
+
+    def exec_(self, name: str):
+        """An event the inventory has to ignore"""
+        with self._lock:
+            attrs = self._find(name)
+            self._emit('container', 'exec_start: sh', attrs['Id'], {'name': name})
+
+    def break_streams(self):
+        """Drop every open events connection, as a daemon restart would"""
+        with self._lock:
+            streams, self._streams = self._streams, []
+        for stream in streams:
+            stream.break_()
+
+    # Helpers
+
+    def _disconnect(self, attrs: Dict[str, Any], network: str):
+        if attrs['NetworkSettings']['Networks'].pop(network, None) is not None:
+            self._emit('network', 'disconnect', self._networks[network], {'container': attrs['Id'], 'name': network})
+
+    def _find(self, container: str) -> Dict[str, Any]:
+        attrs = self._containers.get(container)
+        if attrs is not None:
+            return attrs
+        for attrs in self._containers.values():
+            if attrs['Name'] == f'/{container}' or attrs['Id'].startswith(container):
+                return attrs
+        raise NotFound(f'No such container: {container}')
+
+    def _emit(self, kind: str, action: str, actor_id: str, attributes: Dict[str, str]):
+        now = time.time()
+        event = {'Type': kind, 'Action': action, 'Actor': {'ID': actor_id, 'Attributes': attributes},
+                 'scope': 'local', 'time': int(now), 'timeNano': int(now * 1e9)}
+        self._history.append(event)
+        for stream in self._streams:
+            stream.push(event)
+
+    @staticmethod
+    def _summary(attrs: Dict[str, Any]) -> Dict[str, Any]:
+        created = datetime.strptime(attrs['Created'][:19], '%Y-%m-%dT%H:%M:%S').replace(tzinfo=timezone.utc)
+        return {
+            'Id': attrs['Id'],
+            'Names': [attrs['Name']],
+            'Image': attrs['Config']['Image'],
+            'Created': int(created.timestamp()),
+            'State': attrs['State']['Status'],
+            'Status': 'Up' if attrs['State']['Running'] else 'Exited (0)',
+            'NetworkSettings': copy.deepcopy(attrs['NetworkSettings']),
+            'Mounts': copy.deepcopy(attrs['Mounts'])
+        }
+
+
+class FakeDockerClient:
+    """docker.DockerClient stand-in; only .api is implemented"""
+
+    def __init__(self, latency: float = 0.0):
+        self.api = FakeDockerAPI(latency)
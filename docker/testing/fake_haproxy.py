@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - Fake HAProxy Runtime API
+Local stand-in for the HAProxy stats socket (Unix or TCP) used to exercise
+and benchmark the ConfigWatcher runtime client without a real HAProxy.
+
+Usage:
+    python fake_haproxy.py --socket /tmp/fake-haproxy.sock
+    python fake_haproxy.py --socket 127.0.0.1:9999 --servers 10000
+"""
+
+import os
+import argparse
+import socket
+import socketserver
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+# Column layout of 'show stat' (subset of HAProxy's, in HAProxy order)
+STAT_FIELDS = [
+    'pxname', 'svname', 'qcur', 'qmax', 'scur', 'smax', 'slim', 'stot',
+    'bin', 'bout', 'dreq', 'dresp', 'ereq', 'econ', 'eresp', 'wretr',
+    'wredis', 'status', 'weight', 'act', 'bck', 'chkfail', 'chkdown',
+    'lastchg', 'downtime', 'qlimit', 'pid', 'iid', 'sid', 'throttle',
+    'lbtot', 'tracked', 'type', 'rate', 'rate_lim', 'rate_max',
+    'check_status', 'check_code', 'check_duration', 'hrsp_1xx', 'hrsp_2xx',
+    'hrsp_3xx', 'hrsp_4xx', 'hrsp_5xx', 'hrsp_other', 'hanafail',
+    'req_rate', 'req_rate_max', 'req_tot', 'cli_abrt', 'srv_abrt',
+    'comp_in', 'comp_out', 'comp_byp', 'comp_rsp', 'lastsess', 'last_chk',
+    'last_agt', 'qtime', 'ctime', 'rtime', 'ttime',
+]
+
+
+class FakeServer:
+    """State of one server in a fake backend"""
+
+    def __init__(self, name: str, address: str, port: int, weight: int = 1, backup: bool = False):
+        self.name = name
+        self.address = address
+        self.port = port
+        self.weight = weight
+        self.backup = backup
+        self.state = 'ready'
+        self.stats: Dict[str, int] = {}
+
+    @property
+    def status(self) -> str:
+        if self.state == 'maint':
+            return 'MAINT'
+        if self.state == 'drain':
+            return 'DRAIN'
+        return 'UP'
+
+
+class FakePatterns:
+    """A map or ACL file with its versions: 'prepare' starts one, 'commit' makes it current"""
+
+    def __init__(self, path: str, kind: str, ident: int):
+        self.path = path
+        self.kind = kind
+        self.ident = ident
+        self.current = 0
+        self.next = 0
+        self.versions: Dict[int, 'OrderedDict[str, str]'] = {0: OrderedDict()}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith('#'):
+                        key, _, value = line.partition(' ')
+                        self.versions[0].setdefault(key, value.strip())
+
+    @property
+    def entries(self) -> 'OrderedDict[str, str]':
+        return self.versions[self.current]
+
+
+class FakeHAProxy:
+    """In-memory model of the parts of HAProxy the runtime API touches"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.backends: Dict[str, 'OrderedDict[str, FakeServer]'] = OrderedDict()
+        self.patterns: Dict[str, FakePatterns] = OrderedDict()
+        self.commands_seen = 0
+
+    def add_backend(self, name: str, servers: int = 0, address_prefix: str = '10.1'):
+        """Create a backend, optionally pre-populated with generated servers"""
+        backend = self.backends.setdefault(name, OrderedDict())
+        for i in range(servers):
+            server_name = f"node{i + 1}"
+            address = f"{address_prefix}.{(i // 250) % 256}.{i % 250 + 1}"
+            backend[server_name] = FakeServer(server_name, address, 80, weight=100)
+        return backend
+
+    def add_patterns(self, path: str, kind: str = 'map') -> FakePatterns:
+        """Load a map or ACL file, as if the config referenced it"""
+        return self.patterns.setdefault(path, FakePatterns(path, kind, -len(self.patterns) - 1))
+
+    # Command handling
+
+    def handle(self, line: str) -> str:
+        """Execute one CLI command and return its output"""
+        self.commands_seen += 1
+        line, _, payload = line.partition('\n')
+        words = line.split()
+        if not words:
+            return ''
+        if words[-1] == '<<':
+            # The payload travels as one last word
+            words[-1] = payload
+        handler = self._dispatch(words)
+        if handler is None:
+            return 'Unknown command. Please enter one of the following commands only :\n  help'
+        with self.lock:
+            return handler(words)
+
+    def _dispatch(self, words: List[str]):
+        key = ' '.join(words[:2])
+        return {
+            'show stat': self._show_stat,
+            'show info': self._show_info,
+            'show servers': self._show_servers_state,
+            'add server': self._add_server,
+            'del server': self._del_server,
+            'set server': self._set_server,
+            'enable server': self._enable_server,
+            'disable server': self._disable_server,
+            'shutdown sessions': self._shutdown_sessions,
+            'show map': self._show_patterns,
+            'show acl': self._show_patterns,
+            'add map': self._add_pattern,
+            'add acl': self._add_pattern,
+            'del map': self._del_pattern,
+            'del acl': self._del_pattern,
+            'set map': self._set_map,
+            'prepare map': self._prepare_patterns,
+            'prepare acl': self._prepare_patterns,
+            'commit map': self._commit_patterns,
+            'commit acl': self._commit_patterns,
+            'clear map': self._clear_patterns,
+            'clear acl': self._clear_patterns,
+        }.get(key)
+
+    def _lookup(self, target: str):
+        if '/' not in target:
+            return None, None, "Require 'backend/server'."
+        backend_name, server_name = target.split('/', 1)
+        backend = self.backends.get(backend_name)
+        if backend is None:
+            return None, None, 'No such backend.'
+        return backend, server_name, None
+
+    def _show_stat(self, words: List[str]) -> str:
+        if words[2:3] == ['typed']:
+            return self._show_stat_typed()
+        lines = ['# ' + ','.join(STAT_FIELDS)]
+        for pxname, servers in self.backends.items():
+            for server in servers.values():
+                row = dict(server.stats)
+                row.update({
+                    'pxname': pxname, 'svname': server.name, 'status': server.status,
+                    'weight': server.weight if server.state == 'ready' else 0,
+                    'act': 0 if server.backup else 1, 'bck': 1 if server.backup else 0,
+                    'type': 2, 'check_status': 'L7OK', 'check_code': 200,
+                })
+                lines.append(','.join(str(row.get(field, '')) for field in STAT_FIELDS))
+            weight = sum(s.weight for s in servers.values() if s.state == 'ready' and not s.backup)
+            lines.append(','.join(str({
+                'pxname': pxname, 'svname': 'BACKEND', 'status': 'UP' if servers else 'DOWN',
+                'weight': weight, 'type': 1,
+                'scur': sum(s.stats.get('scur', 0) for s in servers.values()),
+            }.get(field, '')) for field in STAT_FIELDS))
+        return '\n'.join(lines) + '\n'
+
+    def _show_stat_typed(self) -> str:
+        header, *rows = self._show_stat(['show', 'stat']).splitlines()
+        lines = []
+        for obj_id, row in enumerate(rows):
+            values = row.split(',')
+            obj_type = {'BACKEND': 'B', 'FRONTEND': 'F'}.get(values[1], 'S')
+            for pos, (field, value) in enumerate(zip(STAT_FIELDS, values)):
+                if value:
+                    vtype = 'u64' if value.isdigit() else 'str'
+                    lines.append(f"{obj_type}.0.{obj_id}.{pos}.{field}.1:MGP:{vtype}:{value}")
+        return '\n'.join(lines)
+
+    def _show_info(self, words: List[str]) -> str:
+        servers = sum(len(s) for s in self.backends.values())
+        return '\n'.join([
+            'Name: HAProxy', 'Version: 2.8.0-fake', f'Pid: {os.getpid()}',
+            'Nbthread: 2', 'Maxconn: 4096', f'CurrConns: 0', f'Servers: {servers}',
+        ])
+
+    def _show_servers_state(self, words: List[str]) -> str:
+        lines = ['1', '# be_name srv_name srv_addr srv_port srv_admin_state srv_uweight']
+        backends = self.backends
+        if len(words) > 3:
+            if words[3] not in self.backends:
+                return "Can't find backend."
+            backends = {words[3]: self.backends[words[3]]}
+        for pxname, servers in backends.items():
+            for s in servers.values():
+                admin = {'ready': 0, 'maint': 1, 'drain': 8}[s.state]
+                lines.append(f"{pxname} {s.name} {s.address} {s.port} {admin} {s.weight}")
+        return '\n'.join(lines)
+
+    def _add_server(self, words: List[str]) -> str:
+        if len(words) < 4:
+            return "'add server' expects <backend>/<server> <address>[:<port>] [args]*"
+        backend, server_name, error = self._lookup(words[2])
+        if error:
+            return error
+        if server_name in backend:
+            return 'Already exists a server with the same name in backend.'
+        address, _, port = words[3].partition(':')
+        weight, backup = 1, False
+        args = words[4:]
+        for i, arg in enumerate(args):
+            if arg == 'weight' and i + 1 < len(args):
+                weight = int(args[i + 1])
+            elif arg == 'backup':
+                backup = True
+        backend[server_name] = FakeServer(server_name, address, int(port or 0), weight, backup)
+        # Dynamic servers start in maintenance, like real HAProxy
+        backend[server_name].state = 'maint'
+        return 'New server registered.'
+
+    def _del_server(self, words: List[str]) -> str:
+        backend, server_name, error = self._lookup(words[2] if len(words) > 2 else '')
+        if error:
+            return error
+        server = backend.get(server_name)
+        if server is None:
+            return 'No such server.'
+        if server.state != 'maint':
+            return 'Only servers in maintenance mode can be deleted.'
+        if server.stats.get('scur'):
+            return 'Server still has connections attached to it, cannot remove it.'
+        del backend[server_name]
+        return 'Server deleted.'
+
+    def _shutdown_sessions(self, words: List[str]) -> str:
+        if words[2:3] != ['server']:
+            return "'shutdown sessions' only supports 'server'."
+        backend, server_name, error = self._lookup(words[3] if len(words) > 3 else '')
+        if error:
+            return error
+        server = backend.get(server_name)
+        if server is None:
+            return 'No such server.'
+        server.stats['scur'] = 0
+        return ''
+
+    def _set_server(self, words: List[str]) -> str:
+        backend, server_name, error = self._lookup(words[2] if len(words) > 2 else '')
+        if error:
+            return error
+        server = backend.get(server_name)
+        if server is None:
+            return 'No such server.'
+        if len(words) < 5:
+            return "'set server <srv>' only supports 'agent', 'health', 'state', 'weight', 'addr' ..."
+        field, value = words[3], words[4]
+        if field == 'weight':
+            server.weight = int(value.rstrip('%'))
+        elif field == 'state':
+            if value not in ('ready', 'drain', 'maint'):
+                return "'set server <srv> state' expects 'ready', 'drain' and 'maint'."
+            server.state = value
+        elif field == 'addr':
+            old = server.address
+            server.address = value
+            if len(words) > 6 and words[5] == 'port':
+                server.port = int(words[6])
+            return f"IP changed from '{old}' to '{value}' by 'stats socket command'"
+        else:
+            return f"'set server <srv>' does not support '{field}'."
+        return ''
+
+    # Maps and ACLs: <verb> map|acl [@<version>] <file> [args]
+
+    def _patterns(self, words: List[str]):
+        """(patterns, version, args, error)"""
+        kind, args = words[1], words[2:]
+        version = None
+        if args and args[0].startswith('@'):
+            version, args = int(args[0][1:]), args[1:]
+        patterns = self.patterns.get(args[0]) if args else None
+        if patterns is None or patterns.kind != kind:
+            name = 'map' if kind == 'map' else 'ACL'
+            return None, None, None, f'Unknown {name} identifier. Please use #<id> or <file>.'
+        if version is not None and not patterns.current <= version <= patterns.next:
+            return None, None, None, 'Version number is out of range.'
+        return patterns, version, args[1:], None
+
+    def _show_patterns(self, words: List[str]) -> str:
+        if len(words) < 3:
+            lines = ['# id (file) description']
+            for p in self.patterns.values():
+                if p.kind == words[1]:
+                    lines.append(f"{p.ident} ({p.path}) pattern loaded from file '{p.path}' used by {p.kind}. "
+                                 f"curr_ver={p.current} next_ver={p.next} entry_cnt={len(p.entries)}")
+            return '\n'.join(lines)
+        patterns, version, _, error = self._patterns(words)
+        if error:
+            return error
+        entries = patterns.versions.get(patterns.current if version is None else version, {})
+        return '\n'.join(f'0x{id(key):x} {key} {value}'.rstrip() for key, value in entries.items())
+
+    def _add_pattern(self, words: List[str]) -> str:
+        patterns, version, args, error = self._patterns(words)
+        if error:
+            return error
+        entries = patterns.versions.setdefault(patterns.current if version is None else version, OrderedDict())
+        if patterns.kind == 'acl':
+            if len(args) != 1 or '\n' in args[0]:
+                return "'add acl' expects two parameters: ACL identifier and pattern."
+            lines = args
+        elif len(args) == 1:
+            lines = [line.strip() for line in args[0].splitlines() if line.strip()]
+        else:
+            lines = [' '.join(args)]
+        for line in lines:
+            key, _, value = line.partition(' ')
+            if patterns.kind == 'map' and not value:
+                return "'add map' expects three parameters (map identifier, key and value) or a payload."
+            entries.setdefault(key, value)
+        return ''
+
+    def _del_pattern(self, words: List[str]) -> str:
+        patterns, version, args, error = self._patterns(words)
+        if error:
+            return error
+        if patterns.entries.pop(args[0] if args else '', None) is None:
+            return 'Key not found.'
+        return ''
+
+    def _set_map(self, words: List[str]) -> str:
+        patterns, version, args, error = self._patterns(words)
+        if error:
+            return error
+        if len(args) < 2:
+            return "'set map' expects three parameters: map identifier, key and value."
+        if args[0] not in patterns.entries:
+            return 'entry not found.'
+        patterns.entries[args[0]] = ' '.join(args[1:])
+        return ''
+
+    def _prepare_patterns(self, words: List[str]) -> str:
+        patterns, version, args, error = self._patterns(words)
+        if error:
+            return error
+        patterns.next += 1
+        patterns.versions[patterns.next] = OrderedDict()
+        return f'New version created: {patterns.next}'
+
+    def _commit_patterns(self, words: List[str]) -> str:
+        patterns, version, args, error = self._patterns(words)
+        if error:
+            return error
+        if version is None or version == patterns.current:
+            return "'commit' expects a version number newer than the current one."
+        patterns.current = version
+        for older in [v for v in patterns.versions if v < version]:
+            del patterns.versions[older]
+        return ''
+
+    def _clear_patterns(self, words: List[str]) -> str:
+        patterns, version, args, error = self._patterns(words)
+        if error:
+            return error
+        patterns.versions[patterns.current if version is None else version] = OrderedDict()
+        return ''
+
+    def _enable_server(self, words: List[str]) -> str:
+        return self._set_server(words[:3] + ['state', 'ready'])
+
+    def _disable_server(self, words: List[str]) -> str:
+        return self._set_server(words[:3] + ['state', 'maint'])
+
+
+class _CLIHandler(socketserver.StreamRequestHandler):
+    """Speaks the HAProxy CLI protocol: one-shot by default, interactive after 'prompt'"""
+
+    def handle(self):
+        haproxy: FakeHAProxy = self.server.haproxy
+        interactive = False
+        for raw in self.rfile:
+            line = raw.decode(errors='replace').strip()
+            if line.endswith('<<'):
+                # Payload lines follow, up to an empty line
+                payload = []
+                for raw_payload in self.rfile:
+                    if not raw_payload.strip():
+                        break
+                    payload.append(raw_payload.decode(errors='replace').rstrip('\n'))
+                line += '\n' + '\n'.join(payload)
+            if line == 'quit':
+                return
+            if line == 'prompt':
+                interactive = not interactive
+                if interactive:
+                    self.wfile.write(b'\n> ')
+                    self.wfile.flush()
+                    continue
+                return
+            # Non-interactive mode accepts several commands separated by ';'
+            outputs = [haproxy.handle(cmd.strip()) for cmd in line.split(';')]
+            for output in outputs:
+                if output:
+                    self.wfile.write(output.rstrip('\n').encode() + b'\n')
+            if interactive:
+                self.wfile.write(b'\n> ')
+                self.wfile.flush()
+            else:
+                self.wfile.write(b'\n')
+                return
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve(address: str, haproxy: Optional[FakeHAProxy] = None, background: bool = False):
+    """Serve the fake runtime API on a Unix path or 'host:port'"""
+    if not address.startswith('/') and ':' in address:
+        host, port = address.rsplit(':', 1)
+        server = _TCPServer((host, int(port)), _CLIHandler)
+    else:
+        if os.path.exists(address):
+            os.unlink(address)
+        server = _UnixServer(address, _CLIHandler)
+    server.haproxy = haproxy or FakeHAProxy()
+    if background:
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+    else:
+        server.serve_forever()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake HAProxy runtime API socket')
+    parser.add_argument('--socket', default='/tmp/fake-haproxy.sock', help='Unix socket path or host:port')
+    parser.add_argument('--backend', default='ddc_nodes_http', help='Backend to create')
+    parser.add_argument('--servers', type=int, default=3, help='Servers to pre-populate')
+    args = parser.parse_args()
+
+    haproxy = FakeHAProxy()
+    haproxy.add_backend(args.backend, args.servers)
+    print(f"Fake HAProxy runtime API listening on {args.socket}")
+    try:
+        serve(args.socket, haproxy)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
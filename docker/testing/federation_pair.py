@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - Two-Zone Federation Check
+Runs an EU and a US ConfigWatcher locally, each on its own fake HAProxy
+socket, and drives federated changes through the EU one:
+
+1. With the US zone down, EU applies changes alone.
+2. US starts and pulls exactly the change sets it missed.
+3. Changes published in EU are acknowledged by both zones in one round.
+4. US is paused while EU publishes, and catches up once it resumes.
+
+After each step both fake HAProxies must hold the same servers.
+
+Usage:
+    python federation_pair.py --changes 20
+"""
+
+import os
+import sys
+import time
+import signal
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+import requests
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fake_haproxy import FakeHAProxy, serve  # noqa: E402
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'configwatcher-api', 'src')
+CONFIGS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'configs', 'haproxy')
+API_KEY = 'federation-check-key'
+BACKEND = 'ddc_nodes_http'
+
+
+class Zone:
+    def __init__(self, name: str, port: int, workdir: str, peers: str):
+        self.name = name
+        self.port = port
+        self.url = f'http://127.0.0.1:{port}'
+        self.haproxy = FakeHAProxy()
+        self.haproxy.add_backend(BACKEND, 3)
+        self.socket = os.path.join(workdir, f'{name}.sock')
+        self.server = serve(self.socket, self.haproxy, background=True)
+        config = os.path.join(workdir, f'haproxy-{name}.cfg')
+        shutil.copy(os.path.join(CONFIGS, f'haproxy-{name}.cfg'), config)
+        self.env = dict(os.environ, ZONE=name, API_PORT=str(port), API_KEY=API_KEY,
+                        HAPROXY_SOCKET=self.socket, HAPROXY_CONFIG_PATH=config,
+                        CONFIG_STORE_DIR=os.path.join(workdir, f'{name}-versions'),
+                        # No Redis: each instance keeps its change log and vector in memory
+                        REDIS_URL='redis://127.0.0.1:1/0', BLOCKCHAIN_RPC='http://127.0.0.1:1',
+                        FEDERATION_PEERS=peers, FEDERATION_TIMEOUT='1', FEDERATION_SYNC_INTERVAL='1')
+        self.process = None
+        self.log = open(os.path.join(workdir, f'{name}.log'), 'w')
+
+    def start(self):
+        self.process = subprocess.Popen([sys.executable, 'app.py'], cwd=SRC, env=self.env,
+                                        stdout=self.log, stderr=subprocess.STDOUT)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                if requests.get(f'{self.url}/health/live', timeout=1).status_code == 200:
+                    # Background workers start on the first request
+                    self.get('/federation')
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        sys.exit(f'{self.name} ConfigWatcher did not start; see {self.log.name}')
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait(10)
+
+    def get(self, path: str):
+        return requests.get(f'{self.url}{path}', headers={'X-API-Key': API_KEY}, timeout=10).json()
+
+    def post(self, path: str, body=None):
+        response = requests.post(f'{self.url}{path}', json=body or {}, headers={'X-API-Key': API_KEY}, timeout=30)
+        return response.status_code, response.json()
+
+    def servers(self):
+        with self.haproxy.lock:
+            return {name: (s.address, s.port, s.weight, s.state)
+                    for name, s in self.haproxy.backends[BACKEND].items()}
+
+
+def change(i: int):
+    """Add a server, then alternately reweight and drain it"""
+    name = f'fed{i // 3}'
+    if i % 3 == 0:
+        return [{'action': 'add', 'backend': BACKEND,
+                 'server': {'name': name, 'address': f'10.9.0.{i // 3 + 1}', 'port': 80, 'weight': 50}}]
+    if i % 3 == 1:
+        return [{'action': 'weight', 'backend': BACKEND, 'server': name, 'weight': 10 + i}]
+    return [{'action': 'state', 'backend': BACKEND, 'server': name, 'state': 'drain'}]
+
+
+def wait_until(predicate, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.1)
+    return predicate()
+
+
+def check(label: str, ok: bool):
+    print(f"{'OK' if ok else 'FAIL'}: {label}")
+    if not ok:
+        raise SystemExit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check federation between two local ConfigWatchers')
+    parser.add_argument('--changes', type=int, default=20, help='Change sets per step')
+    parser.add_argument('--base-port', type=int, default=18080)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='federation-')
+    peers = f'eu=http://127.0.0.1:{args.base_port},us=http://127.0.0.1:{args.base_port + 1}'
+    eu = Zone('eu', args.base_port, workdir, peers)
+    us = Zone('us', args.base_port + 1, workdir, peers)
+    n = 0
+    try:
+        eu.start()
+        for _ in range(args.changes):
+            status, result = eu.post('/federation/publish', {'operations': change(n)})
+            n += 1
+            if status != 200 or result['zones']['us']['status'] != 'unreachable':
+                check(f'publish {n} with US down: {status} {result}', False)
+        check(f'{args.changes} changes applied in EU with US down', len(eu.servers()) == 3 + (n + 2) // 3)
+
+        us.start()
+        caught_up = wait_until(lambda: us.servers() == eu.servers(), 15)
+        vector = us.get('/federation')['vector']
+        check(f"US caught up by pulling the {vector.get('eu')} change sets it missed", caught_up
+              and vector.get('eu') == n)
+
+        timings = []
+        for _ in range(args.changes):
+            start = time.perf_counter()
+            status, result = eu.post('/federation/publish', {'operations': change(n), 'message': 'rollout'})
+            timings.append(time.perf_counter() - start)
+            n += 1
+            if status != 200 or not result['success']:
+                check(f'publish {n}: {status} {result}', False)
+        timings.sort()
+        check(f'{args.changes} rollouts acknowledged by both zones, median {timings[len(timings) // 2] * 1000:.1f} ms',
+              us.servers() == eu.servers())
+
+        us.process.send_signal(signal.SIGSTOP)
+        missed = max(2, args.changes // 4)
+        for _ in range(missed):
+            status, result = eu.post('/federation/publish', {'operations': change(n)})
+            n += 1
+            if result['zones']['us']['status'] != 'unreachable':
+                check(f'publish {n} with US paused: {result}', False)
+        us.process.send_signal(signal.SIGCONT)
+        status, result = eu.post('/federation/publish', {'operations': change(n)})
+        n += 1
+        converged = wait_until(lambda: us.servers() == eu.servers(), 15)
+        ack = result['zones']['us']
+        check(f"US caught up after a pause (last push: {ack['status']}, {ack.get('caught_up', 0)} missed "
+              f"change sets sent with it), "
+              f"vectors EU {eu.get('/federation')['vector']} US {us.get('/federation')['vector']}",
+              converged and us.get('/federation')['vector'].get('eu') == n)
+    finally:
+        for zone in (eu, us):
+            if zone.process is not None and zone.process.poll() is None:
+                zone.process.send_signal(signal.SIGCONT)
+            zone.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""
+Load test for the ConfigWatcher API status and stats endpoints.
+Run it once against each serving mode and compare:
+
+    SERVER_MODE=sync  ./start-configwatcher.sh    # or: gunicorn ... app:app
+    SERVER_MODE=async ./start-configwatcher.sh    # or: gunicorn ... async_app:create_app
+
+    locust -f locust_configwatcher.py --host http://localhost:9080 \
+        --headless -u 2000 -r 200 -t 2m --csv configwatcher-sync
+"""
+
+import os
+
+from locust import HttpUser, task, between
+
+BACKEND = os.getenv('LOCUST_BACKEND', 'ddc_nodes_http')
+
+
+class ConfigWatcherUser(HttpUser):
+    wait_time = between(0.5, 1.5)
+
+    def on_start(self):
+        """Log in once per user"""
+        response = self.client.post("/auth/token", json={'username': 'admin', 'password': 'admin'})
+        self.client.headers['Authorization'] = f"Bearer {response.json()['token']}"
+
+    @task(3)
+    def stats(self):
+        self.client.get("/stats")
+
+    @task(2)
+    def backend_servers(self):
+        self.client.get(f"/backends/{BACKEND}/servers", name="/backends/[backend]/servers")
+
+    @task(2)
+    def health(self):
+        self.client.get("/api/v1/health")
+
+    @task(1)
+    def process_info(self):
+        self.client.get("/stats/info")
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+
+"""
+DDC HAProxy Infrastructure - Weight Autotuner Replay
+Runs the weight autotuner against a recorded trace of 'show stat' dumps and
+estimates the p99 response time it would have given, next to the p99 under
+the weights the trace was recorded with. Nothing touches a live HAProxy.
+
+Each server is modelled as an M/M/1 queue. Its capacity in every interval is
+fitted from the recording: capacity = rate + 1000 / rtime. The total request
+rate of the backend is then split by weight. With the tuned weights the
+model produces the stats the tuner would have seen next, so it runs closed
+loop, as it would in production. A server given more than its capacity counts
+as answering in --saturated-ms. A server that was saturated in the recording
+does not show its capacity, so such stretches only tell that it was overloaded.
+
+Usage:
+    # Record a live backend every 10 seconds for an hour
+    python weight_replay.py record --socket /var/run/haproxy.sock --interval 10 --count 360 --out trace.jsonl
+    # Or generate a trace: 8 servers, one of which slows down for a while
+    python weight_replay.py generate --out trace.jsonl
+    python weight_replay.py replay --trace trace.jsonl --backend ddc_nodes_http
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+from typing import Dict, List, Tuple
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'configwatcher-api', 'src'))
+
+from haproxy_runtime import RuntimeClient  # noqa: E402
+from haproxy_stats import parse_stat_csv  # noqa: E402
+from weight_tuner import WeightTuner  # noqa: E402
+
+FIELDS = ('pxname', 'svname', 'qcur', 'scur', 'stot', 'econ', 'eresp', 'status', 'weight', 'act', 'bck',
+          'rate', 'hrsp_5xx', 'rtime', 'ttime')
+
+
+def stat_csv(backend: str, rows: List[Dict]) -> str:
+    lines = ['# ' + ','.join(FIELDS)]
+    for row in rows:
+        row = dict(row, pxname=backend, status='UP', act=1, bck=0)
+        lines.append(','.join(str(row.get(field, '')) for field in FIELDS))
+    return '\n'.join(lines) + '\n'
+
+
+def queue_model(arrivals: float, capacity: float, saturated_ms: float) -> Tuple[float, float]:
+    """Mean response time (ms) and queue length of an M/M/1 server"""
+    if arrivals >= capacity:
+        return saturated_ms, arrivals
+    utilization = arrivals / capacity
+    return min(1000 / (capacity - arrivals), saturated_ms), utilization ** 2 / (1 - utilization)
+
+
+def p99(servers: List[Tuple[float, float, float]], saturated_ms: float) -> float:
+    """99th percentile (ms) of a mix of (requests, capacity, arrivals) servers.
+
+    Response times of an M/M/1 server are exponential with rate capacity - arrivals.
+    """
+    total = sum(requests for requests, _, _ in servers)
+
+    def slower_than(t: float) -> float:
+        share = 0.0
+        for requests, capacity, arrivals in servers:
+            if arrivals >= capacity:
+                share += requests if t < saturated_ms else 0.0
+            else:
+                share += requests * math.exp(-(capacity - arrivals) * t / 1000)
+        return share / total
+
+    low, high = 0.0, saturated_ms
+    if slower_than(high) > 0.01:
+        return saturated_ms
+    for _ in range(60):
+        middle = (low + high) / 2
+        low, high = (middle, high) if slower_than(middle) > 0.01 else (low, middle)
+    return high
+
+
+def load_trace(path: str, backend: str) -> List[Tuple[float, Dict[str, Dict]]]:
+    """[(time, {server: row})] of the active servers of one backend"""
+    trace = []
+    with open(path) as f:
+        for line in f:
+            entry = json.loads(line)
+            snapshot = parse_stat_csv(entry['stat'])
+            rows = {row['svname']: row for row in snapshot.servers(backend)
+                    if not row.get('bck') and str(row.get('status', '')).startswith('UP')}
+            if rows:
+                trace.append((entry['time'], rows))
+    return trace
+
+
+def record(args):
+    client = RuntimeClient(args.socket)
+    with open(args.out, 'w') as f:
+        for i in range(args.count):
+            f.write(json.dumps({'time': time.time(), 'stat': client.execute('show stat')}) + '\n')
+            f.flush()
+            if i + 1 < args.count:
+                time.sleep(args.interval)
+    print(f"Recorded {args.count} snapshots to {args.out}")
+
+
+def generate(args):
+    """Servers of uneven capacity under a varying load, with static weights; one slows down midway"""
+    rng = random.Random(args.seed)
+    capacities = [rng.choice((200, 300, 400)) for _ in range(args.servers)]
+    stot = [0] * args.servers
+    errors = [0] * args.servers
+    with open(args.out, 'w') as f:
+        for step in range(args.steps):
+            load = args.load * sum(capacities) * (1 + 0.15 * math.sin(2 * math.pi * step / args.steps))
+            rows = []
+            for i, capacity in enumerate(capacities):
+                if i == 0 and args.steps // 3 <= step < 2 * args.steps // 3:
+                    capacity *= args.degraded
+                arrivals = load / args.servers
+                rtime, queue = queue_model(arrivals, capacity, args.saturated_ms)
+                stot[i] += int(arrivals * args.interval)
+                errors[i] += int(arrivals * args.interval * (0.02 if arrivals >= capacity else 0.0005))
+                rows.append({'svname': f'node{i + 1}', 'qcur': int(queue), 'scur': int(arrivals * rtime / 1000),
+                             'stot': stot[i], 'hrsp_5xx': errors[i], 'weight': 100, 'rate': int(arrivals),
+                             # rtime is an average over 1024 requests, so it is noisy
+                             'rtime': max(1, int(rtime * rng.uniform(0.85, 1.15))), 'ttime': int(rtime) + 2})
+            f.write(json.dumps({'time': step * args.interval, 'stat': stat_csv(args.backend, rows)}) + '\n')
+    print(f"Generated {args.steps} snapshots of {args.servers} servers (capacities {capacities}) to {args.out}")
+
+
+def replay(args):
+    trace = load_trace(args.trace, args.backend)
+    if len(trace) < 2:
+        sys.exit(f"Need at least two snapshots of {args.backend} in {args.trace}")
+
+    weights = {name: row.get('weight') or 100 for name, row in trace[0][1].items()}
+    current = {'rows': {}}
+    tuner = WeightTuner(
+        stats=lambda: parse_stat_csv(stat_csv(args.backend, list(current['rows'].values()))),
+        apply=lambda operations: weights.update({op['server']: op['weight'] for op in operations}) or
+        {'success': True},
+        bounds={args.backend: (args.min_weight, args.max_weight)},
+        alpha=args.alpha, hysteresis=args.hysteresis, max_step=args.max_step, dry_run=False)
+
+    # [(some server saturated, mix of the interval)]
+    recorded, tuned = [], []
+    stot: Dict[str, float] = {}
+    errors: Dict[str, float] = {}
+    changes = 0
+    previous_time, previous_rows = trace[0]
+    for now, rows in trace[1:]:
+        elapsed = max(now - previous_time, 1e-9)
+        servers = {}
+        for name, row in rows.items():
+            before = previous_rows.get(name, {})
+            sessions = max(0, (row.get('stot') or 0) - (before.get('stot') or 0))
+            arrivals = row.get('rate') if row.get('rate') is not None else sessions / elapsed
+            rtime = row.get('rtime') or row.get('ttime') or 1
+            failed = max(0, (row.get('hrsp_5xx') or 0) - (before.get('hrsp_5xx') or 0))
+            # Capacity and error rate are properties of the server, whatever load it was given
+            servers[name] = (arrivals + 1000 / rtime, failed / sessions if sessions else 0.0, arrivals,
+                             row.get('weight') or 0)
+        load = sum(arrivals for _, _, arrivals, _ in servers.values())
+        total_weight = sum(weights.get(name, 100) for name in servers)
+        recorded_mix, tuned_mix, tuned_rows = [], [], {}
+        # A recording shows saturation as answers at about --saturated-ms, not as a capacity
+        recorded_saturated = any((row.get('rtime') or row.get('ttime') or 0) >= 0.8 * args.saturated_ms
+                                 for row in rows.values())
+        for name, (capacity, error_rate, arrivals, _) in servers.items():
+            recorded_mix.append((arrivals * elapsed, capacity, arrivals))
+            weight = weights.setdefault(name, 100)
+            share = load * weight / total_weight
+            tuned_mix.append((share * elapsed, capacity, share))
+            rtime, queue = queue_model(share, capacity, args.saturated_ms)
+            stot[name] = stot.get(name, 0) + share * elapsed
+            errors[name] = errors.get(name, 0) + share * elapsed * error_rate
+            tuned_rows[name] = {'svname': name, 'qcur': int(queue), 'stot': int(stot[name]),
+                                'hrsp_5xx': int(errors[name]), 'weight': weight, 'rate': int(share),
+                                'rtime': max(1, int(rtime))}
+        recorded.append((recorded_saturated, recorded_mix))
+        tuned.append((any(share >= capacity for _, capacity, share in tuned_mix), tuned_mix))
+        current['rows'] = tuned_rows
+        report = tuner.tick()
+        changes += sum(b['changes'] for b in report['backends'].values())
+        previous_time, previous_rows = now, rows
+
+    def summary(intervals):
+        per_interval = [p99(mix, args.saturated_ms) for _, mix in intervals]
+        overall = p99([server for _, mix in intervals for server in mix], args.saturated_ms)
+        saturated = sum(1 for saturated, _ in intervals if saturated)
+        return overall, sorted(per_interval)[len(per_interval) // 2], max(per_interval), saturated
+
+    print(f"{len(trace)} snapshots of {args.backend}, {len(trace[0][1])} servers; "
+          f"{changes} weight changes by the tuner")
+    print(f"{'':12} {'p99 overall':>12} {'median p99':>12} {'worst p99':>12} {'saturated':>10}  "
+          f"(ms, per interval; intervals with a saturated server)")
+    for label, intervals in (('recorded', recorded), ('tuned', tuned)):
+        overall, typical, worst, saturated = summary(intervals)
+        print(f"{label:12} {overall:12.1f} {typical:12.1f} {worst:12.1f} {saturated:10d}")
+    print('final weights: ' + ', '.join(f"{name}={weight}" for name, weight in sorted(weights.items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay the weight autotuner against recorded stats')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    rec = commands.add_parser('record', help="Record 'show stat' from a live HAProxy")
+    rec.add_argument('--socket', default='/var/run/haproxy.sock')
+    rec.add_argument('--interval', type=float, default=10)
+    rec.add_argument('--count', type=int, default=360)
+    rec.add_argument('--out', required=True)
+
+    gen = commands.add_parser('generate', help='Write a synthetic trace')
+    gen.add_argument('--out', required=True)
+    gen.add_argument('--backend', default='ddc_nodes_http')
+    gen.add_argument('--servers', type=int, default=8)
+    gen.add_argument('--steps', type=int, default=360)
+    gen.add_argument('--interval', type=float, default=10)
+    gen.add_argument('--load', type=float, default=0.5, help='Mean load as a fraction of total capacity')
+    gen.add_argument('--degraded', type=float, default=0.4, help='Capacity left to the slowed-down server')
+    gen.add_argument('--saturated-ms', type=float, default=5000)
+    gen.add_argument('--seed', type=int, default=42)
+
+    rep = commands.add_parser('replay', help='Estimate p99 with recorded and with tuned weights')
+    rep.add_argument('--trace', required=True)
+    rep.add_argument('--backend', default='ddc_nodes_http')
+    rep.add_argument('--min-weight', type=int, default=10)
+    rep.add_argument('--max-weight', type=int, default=256)
+    rep.add_argument('--alpha', type=float, default=0.3)
+    rep.add_argument('--hysteresis', type=float, default=0.1)
+    rep.add_argument('--max-step', type=float, default=0.25)
+    rep.add_argument('--saturated-ms', type=float, default=5000)
+
+    args = parser.parse_args()
+    {'record': record, 'generate': generate, 'replay': replay}[args.command](args)
+
+
+if __name__ == '__main__':
+    main()
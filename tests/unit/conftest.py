@@ -0,0 +1,6 @@
+import os
+import sys
+
+DOCKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'docker')
+sys.path.insert(0, os.path.join(DOCKER, 'configwatcher-api', 'src'))
+sys.path.insert(0, os.path.join(DOCKER, 'testing'))
@@ -0,0 +1,57 @@
+import json
+
+import fakeredis
+import pytest
+
+from audit_log import AuditLog, migrate_lists
+
+
+def events(redis_client, audit):
+    return [(fields[b'kind'].decode(), json.loads(fields[b'data']))
+            for _, fields in redis_client.xrange(audit.stream)]
+
+
+def test_migrates_entries_that_are_not_objects():
+    redis_client = fakeredis.FakeRedis()
+    audit = AuditLog(redis_client)
+    redis_client.lpush('config_changes', json.dumps({'action': 'add', 'backend': 'app', 'timestamp': 1000}),
+                       json.dumps([1, 2]), 'not json', json.dumps({'action': 'remove', 'timestamp': 'soon'}))
+
+    counts = migrate_lists(redis_client, audit)
+
+    assert counts['config_change'] == 4
+    assert {'raw': '[1, 2]'} in [data for _, data in events(redis_client, audit)]
+    assert not redis_client.keys('config_changes*')
+
+
+def test_lists_left_by_a_failed_migration_are_migrated_again():
+    redis_client = fakeredis.FakeRedis()
+    audit = AuditLog(redis_client)
+    redis_client.lpush('blockchain_syncs', json.dumps({'block': 1, 'timestamp': 1000}))
+    redis_client.lpush('blockchain_syncs', json.dumps({'block': 2, 'timestamp': 2000}))
+    pipeline = redis_client.pipeline
+
+    def broken_pipeline(**kwargs):
+        raise ConnectionError('connection lost')
+
+    redis_client.pipeline = broken_pipeline
+    with pytest.raises(ConnectionError):
+        migrate_lists(redis_client, audit)
+    redis_client.pipeline = pipeline
+    assert redis_client.keys('blockchain_syncs:migrating*')
+
+    counts = migrate_lists(redis_client, audit)
+
+    assert counts['blockchain_sync'] == 2
+    assert [data['block'] for _, data in events(redis_client, audit)] == [1, 2]
+    assert not redis_client.keys('blockchain_syncs*')
+
+
+def test_one_replica_migrates_at_a_time():
+    redis_client = fakeredis.FakeRedis()
+    audit = AuditLog(redis_client)
+    redis_client.lpush('container_operations', json.dumps({'operation': 'create'}))
+    redis_client.set(f'{audit.prefix}:migrate-lock', 'other', ex=60)
+
+    assert migrate_lists(redis_client, audit)['container_operation'] == 0
+    assert redis_client.llen('container_operations') == 1
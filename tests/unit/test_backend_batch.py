@@ -0,0 +1,87 @@
+from contextlib import contextmanager
+
+from backend_batch import apply_batch
+from fake_haproxy import FakeHAProxy
+
+
+class FakeRuntime:
+    """Runtime client over a FakeHAProxy that records every round trip and can reject commands"""
+
+    def __init__(self, haproxy, reject=None):
+        self.haproxy = haproxy
+        self.reject = reject or {}
+        self.round_trips = []
+
+    @contextmanager
+    def session(self):
+        yield self
+
+    def execute(self, commands):
+        self.round_trips.append(list(commands))
+        return [self.reject.get(command) or self.haproxy.handle(command) for command in commands]
+
+
+def servers(haproxy):
+    return {name: (s.state, s.weight) for name, s in haproxy.backends['web'].items()}
+
+
+def test_failed_add_skips_its_later_steps():
+    haproxy = FakeHAProxy()
+    haproxy.add_backend('web', 2)
+    runtime = FakeRuntime(haproxy, reject={'add server web/node3 10.9.0.3:80 weight 50': 'Invalid address.'})
+    before = servers(haproxy)
+
+    result = apply_batch(runtime, [
+        {'action': 'weight', 'backend': 'web', 'server': 'node1', 'weight': 10},
+        {'action': 'add', 'backend': 'web', 'server': {'name': 'node3', 'address': '10.9.0.3', 'port': 80,
+                                                      'weight': 50}},
+    ])
+
+    assert not result['success']
+    assert result['failed_command'].startswith('add server web/node3')
+    sent = [command for round_trip in runtime.round_trips for command in round_trip]
+    assert 'set server web/node3 state ready' not in sent
+    assert 'set server web/node3 state maint' not in sent
+    assert servers(haproxy) == before
+
+
+def test_deletions_run_last_and_are_not_rebuilt():
+    haproxy = FakeHAProxy()
+    haproxy.add_backend('web', 3)
+    haproxy.backends['web']['node2'].stats['scur'] = 4
+    runtime = FakeRuntime(haproxy)
+
+    result = apply_batch(runtime, [
+        {'action': 'remove', 'backend': 'web', 'server': 'node1'},
+        {'action': 'remove', 'backend': 'web', 'server': 'node2'},
+        {'action': 'weight', 'backend': 'web', 'server': 'node3', 'weight': 10},
+    ])
+
+    assert not result['success']
+    assert result['failed_command'] == 'del server web/node2'
+    assert runtime.round_trips[-2] == ['del server web/node1', 'del server web/node2']
+    assert not any(command.startswith('add server') for command in runtime.round_trips[-1])
+    assert result['not_restored'] == ['web/node1']
+    assert servers(haproxy) == {'node2': ('ready', 100), 'node3': ('ready', 100)}
+
+
+def test_batch_applies_in_rounds():
+    haproxy = FakeHAProxy()
+    haproxy.add_backend('web', 2)
+    runtime = FakeRuntime(haproxy)
+
+    result = apply_batch(runtime, [
+        {'action': 'add', 'backend': 'web', 'server': {'name': 'node3', 'address': '10.9.0.3', 'port': 80,
+                                                      'weight': 50}},
+        {'action': 'remove', 'backend': 'web', 'server': 'node1'},
+        {'action': 'state', 'backend': 'web', 'server': 'node2', 'state': 'drain'},
+    ])
+
+    assert result == {'success': True, 'operations': 3, 'commands': 5}
+    assert runtime.round_trips[1:] == [
+        ['add server web/node3 10.9.0.3:80 weight 50', 'set server web/node1 state maint',
+         'set server web/node2 state drain'],
+        ['set server web/node3 state ready'],
+        ['del server web/node1'],
+    ]
+    assert servers(haproxy) == {'node2': ('drain', 100), 'node3': ('ready', 50)}
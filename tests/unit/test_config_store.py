@@ -0,0 +1,26 @@
+from config_delivery import ConfigPublisher
+from config_store import ConfigStore
+
+EU = "global\n    maxconn 100\n\nbackend app\n    server eu1 10.1.0.1:80\n"
+US = "global\n    maxconn 100\n\nbackend app\n    server us1 10.2.0.1:80\n"
+
+
+def test_versions_record_their_zone(tmp_path):
+    eu, us = ConfigStore(str(tmp_path), zone='eu'), ConfigStore(str(tmp_path), zone='us')
+    eu_version, _ = eu.commit(EU, path='/etc/haproxy/haproxy.cfg')
+    us_version, _ = us.commit(US, path='/etc/haproxy/haproxy.cfg')
+
+    assert (eu_version['zone'], us_version['zone']) == ('eu', 'us')
+    assert eu.owns(eu_version) and not eu.owns(us_version)
+    assert ConfigStore(str(tmp_path)).owns(us_version)
+
+
+def test_delta_is_never_against_another_zone(tmp_path):
+    eu, us = ConfigStore(str(tmp_path), zone='eu'), ConfigStore(str(tmp_path), zone='us')
+    eu.commit(EU)
+    us_version, _ = us.commit(US)
+    publisher = ConfigPublisher(lambda: (EU, 'x' * 64, 0.0, None), eu, zone='eu')
+
+    document = publisher._document(EU, 'x' * 64, 0.0, None, since=str(us_version['version']))
+
+    assert document and b'"since_unknown": true' in document and b'"full": true' in document
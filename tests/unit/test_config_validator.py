@@ -0,0 +1,38 @@
+from config_validator import ConfigValidator
+
+CONFIG = """defaults
+    mode http
+    errorfile 503 /nonexistent/errors/503.http
+
+frontend web
+    bind *:443 ssl crt /nonexistent/haproxy.pem
+    default_backend app
+
+backend app
+    server node1 10.0.0.1:80
+"""
+
+
+def test_strict_mode_rejects_missing_files():
+    result = ConfigValidator(haproxy_bin='/nonexistent/haproxy').validate(CONFIG)
+
+    assert not result['valid']
+    assert result['stage'] == 'precheck'
+    assert [issue['level'] for issue in result['issues']] == ['error', 'error']
+
+
+def test_remote_mode_warns_and_skips_haproxy():
+    result = ConfigValidator(haproxy_bin='/nonexistent/haproxy', mode='remote').validate(CONFIG)
+
+    assert result['valid']
+    assert result['stage'] == 'precheck'
+    assert {issue['level'] for issue in result['issues']} == {'warning'}
+    assert "haproxy -c skipped: '/nonexistent/haproxy' is not installed here" in [
+        issue['message'] for issue in result['issues']]
+
+
+def test_remote_mode_still_rejects_broken_configs():
+    result = ConfigValidator(mode='remote').validate(CONFIG.replace('default_backend app', 'default_backend ap'))
+
+    assert not result['valid']
+    assert "default_backend references unknown backend 'ap'" in result['errors']
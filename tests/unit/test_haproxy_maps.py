@@ -0,0 +1,33 @@
+import pytest
+
+from haproxy_maps import MapError, MapManager
+
+
+class FakeRuntime:
+    def __init__(self):
+        self.commands = []
+
+    def execute_checked(self, commands):
+        self.commands += commands
+        return [''] * len(commands)
+
+
+@pytest.fixture
+def manager(tmp_path):
+    for filename in ('hosts.map', 'tenants.map', 'blocked.map'):
+        (tmp_path / filename).write_text('')
+    return MapManager(FakeRuntime(), str(tmp_path), backends=lambda: ['ddc_nodes_http', 'ddc_nodes_grpc'])
+
+
+def test_routing_maps_only_take_backends_of_the_config(manager):
+    with pytest.raises(MapError, match='ddc_nodes_gprc'):
+        manager.update('hosts', {'acme.example.com': 'ddc_nodes_gprc'})
+    with pytest.raises(MapError, match='missing'):
+        manager.replace('tenants', {'acme': 'ddc_nodes_http', 'beta': 'missing'})
+    assert not manager.runtime.commands and not manager.get('tenants')['entries']
+
+    assert manager.update('hosts', {'acme.example.com': 'ddc_nodes_grpc'})['added'] == 1
+
+
+def test_other_maps_take_any_value(manager):
+    assert manager.update('blocked', {'10.0.0.1': 'anything'})['added'] == 1
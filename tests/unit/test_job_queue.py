@@ -0,0 +1,72 @@
+import threading
+import time
+
+import pytest
+
+from job_queue import JobQueue, new_job
+
+fakeredis = pytest.importorskip('fakeredis')
+
+
+def start_workers(queue, *consumers):
+    # Distinct consumers, as if the queues lived in separate gunicorn workers
+    for consumer in consumers:
+        threading.Thread(target=queue._work, args=(consumer,), daemon=True).start()
+
+
+def test_job_longer_than_heartbeat_ttl_runs_once():
+    redis_client = fakeredis.FakeRedis()
+    runs, running, overlap = [], [0], [0]
+    lock = threading.Lock()
+
+    def slow(payload):
+        with lock:
+            runs.append(payload)
+            running[0] += 1
+            overlap[0] = max(overlap[0], running[0])
+        time.sleep(6)
+        with lock:
+            running[0] -= 1
+        return {'success': True}
+
+    queues = [JobQueue(redis_client, workers=1, heartbeat_ttl=2) for _ in range(2)]
+    for i, queue in enumerate(queues):
+        queue.register('slow', slow)
+        start_workers(queue, f'replica{i}:0')
+
+    # Straight into the store: submit() would start workers named after this one process
+    job = queues[0].store.enqueue(new_job('slow', {'n': 1}))
+    finished = queues[1].wait(job['id'], timeout=15)
+
+    assert finished['status'] == 'done'
+    assert finished['attempts'] == 1
+    assert len(runs) == 1
+    assert overlap[0] == 1
+
+
+def test_memory_queue_runs_jobs():
+    queue = JobQueue(workers=1)
+    queue.register('echo', lambda payload: {'success': True, 'echo': payload})
+    job = queue.submit('echo', {'a': 1})
+    finished = queue.wait(job['id'], timeout=5)
+    assert finished['status'] == 'done'
+    assert finished['result']['echo'] == {'a': 1}
+
+
+def test_zones_sharing_redis_keep_their_own_jobs():
+    redis_client = fakeredis.FakeRedis()
+    ran = {'eu': [], 'us': []}
+    queues = {}
+    for zone in ran:
+        queues[zone] = JobQueue(redis_client, workers=1, prefix=f'configwatcher:jobs:{zone}')
+        queues[zone].register('reload', lambda payload, zone=zone: ran[zone].append(payload) or {'success': True})
+
+    eu = queues['eu'].store.enqueue(new_job('reload', {'zone': 'eu'}), dedupe_key='reload')
+    us = queues['us'].store.enqueue(new_job('reload', {'zone': 'us'}), dedupe_key='reload')
+    assert eu['id'] != us['id']
+
+    start_workers(queues['us'], 'us-replica:0')
+    assert queues['us'].wait(us['id'], timeout=5)['status'] == 'done'
+    start_workers(queues['eu'], 'eu-replica:0')
+    assert queues['eu'].wait(eu['id'], timeout=5)['status'] == 'done'
+    assert ran == {'eu': [{'zone': 'eu'}], 'us': [{'zone': 'us'}]}
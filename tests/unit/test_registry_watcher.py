@@ -0,0 +1,90 @@
+import threading
+import time
+
+import fakeredis
+
+from blockchain_monitor import RegistryEvent, RegistryWatcher, server_name_for
+
+
+class ListSource:
+    def __init__(self, events):
+        self.events = list(events)
+
+    def poll(self):
+        events, self.events = self.events, []
+        return events
+
+    def reset(self, start_block=0):
+        pass
+
+
+class FakeBackend:
+    """Live servers of one backend, with an apply that fails a set number of times"""
+
+    def __init__(self, failures=0):
+        self.servers = {}
+        self.failures = failures
+        self.calls = 0
+
+    def execute(self, command):
+        lines = ['1', '# be_id be_name srv_id srv_name srv_addr srv_op_state srv_admin_state srv_uweight '
+                      'srv_iweight srv_time_since_last_change srv_check_status srv_check_result '
+                      'srv_check_health srv_check_state srv_agent_state bk_f_forced_id srv_f_forced_id '
+                      'srv_fqdn srv_port']
+        for name, (address, port) in self.servers.items():
+            lines.append(f'1 ddc_nodes_http 1 {name} {address} 2 0 1 1 0 1 0 0 0 0 0 0 - {port}')
+        return '\n'.join(lines)
+
+    def apply(self, operations):
+        self.calls += 1
+        if self.failures:
+            self.failures -= 1
+            return {'success': False, 'error': 'Timed out waiting for the backend lock'}
+        for op in operations:
+            if op['action'] == 'add':
+                self.servers[op['server']['name']] = (op['server']['address'], op['server']['port'])
+            elif op['action'] == 'remove':
+                self.servers.pop(op['server'], None)
+        return {'success': True}
+
+
+def follow(watcher, **kwargs):
+    threading.Thread(target=watcher.follow, kwargs=dict(interval=0.01, **kwargs), daemon=True).start()
+
+
+def wait_for(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def added(address):
+    return RegistryEvent('NodeAdded', 10, 0, {'address': address, 'port': 8080, 'grpcPort': 9090, 'zone': 'eu'})
+
+
+def test_failed_apply_is_retried_without_new_events():
+    backend = FakeBackend(failures=2)
+    watcher = RegistryWatcher(ListSource([added('10.0.0.1')]), backend, zone='eu', apply=backend.apply)
+    follow(watcher, reconcile_interval=3600)
+    assert wait_for(lambda: server_name_for('10.0.0.1') in backend.servers)
+    assert backend.calls == 3
+
+
+def test_servers_dropped_by_a_reload_are_restored():
+    backend = FakeBackend()
+    watcher = RegistryWatcher(ListSource([added('10.0.0.1')]), backend, zone='eu', apply=backend.apply)
+    follow(watcher, reconcile_interval=0.1)
+    assert wait_for(lambda: backend.servers)
+    # A reload drops dynamic servers; no chain event follows
+    backend.servers.clear()
+    assert wait_for(lambda: server_name_for('10.0.0.1') in backend.servers)
+
+
+def test_zones_sharing_redis_keep_their_own_snapshot():
+    redis_client = fakeredis.FakeRedis()
+    eu = RegistryWatcher(ListSource([added('10.0.0.1')]), FakeBackend(), zone='eu', redis_client=redis_client)
+    eu.refresh()
+    us = RegistryWatcher(ListSource([]), FakeBackend(), zone='us', redis_client=redis_client)
+    assert us.registry.zone == 'us' and not us.registry.node_list()
+    assert RegistryWatcher(ListSource([]), FakeBackend(), zone='eu', redis_client=redis_client).registry.node_list()
@@ -0,0 +1,51 @@
+import time
+
+import fakeredis
+
+from shared_state import SharedState
+
+
+def zones(redis_client):
+    return {zone: SharedState(redis_client, prefix=f'configwatcher:state:{zone}', replica_id=f'{zone}-1',
+                              global_channel='configwatcher:state:events')
+            for zone in ('eu', 'us')}
+
+
+def test_zones_keep_their_own_desired_state_and_results():
+    states = zones(fakeredis.FakeRedis())
+    add = {'action': 'add', 'backend': 'ddc_nodes_http',
+           'server': {'name': 'node9', 'address': '10.1.0.9', 'port': 80}}
+    applied = []
+
+    def apply(operations):
+        applied.append(operations)
+        return {'success': True}
+
+    states['eu'].apply([add], apply, change_id='same-key')
+    result = states['us'].apply([add], apply, change_id='same-key')
+
+    assert not result.get('duplicate')
+    assert len(applied) == 2
+    assert 'node9' in states['eu'].get('ddc_nodes_http')[1]
+    states['eu'].apply([{'action': 'remove', 'backend': 'ddc_nodes_http', 'server': 'node9'}], apply)
+    assert 'node9' not in states['eu'].get('ddc_nodes_http')[1]
+    assert 'node9' in states['us'].get('ddc_nodes_http')[1]
+
+
+def test_only_global_events_cross_zones():
+    redis_client = fakeredis.FakeRedis()
+    states = zones(redis_client)
+    received = []
+    states['us'].subscribe(received.append)
+    states['us'].start()
+    deadline = time.monotonic() + 5
+    while not states['us'].subscribed and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    states['eu'].publish({'type': 'backend', 'backend': 'ddc_nodes_http', 'version': 1})
+    states['eu'].publish({'type': 'token_revoked', 'token': 'ab'}, everywhere=True)
+    while not received and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.2)
+
+    assert [event['type'] for event in received] == ['token_revoked']
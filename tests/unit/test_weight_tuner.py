@@ -0,0 +1,46 @@
+from haproxy_stats import parse_stat_csv
+from weight_tuner import WeightTuner
+
+FIELDS = ('pxname', 'svname', 'qcur', 'stot', 'hrsp_5xx', 'status', 'weight', 'act', 'bck', 'rtime')
+
+
+def snapshot(servers):
+    lines = ['# ' + ','.join(FIELDS)]
+    for name, (rtime, qcur, stot, weight) in servers.items():
+        row = {'pxname': 'app', 'svname': name, 'qcur': qcur, 'stot': stot, 'hrsp_5xx': 0, 'status': 'UP',
+               'weight': weight, 'act': 1, 'bck': 0, 'rtime': rtime}
+        lines.append(','.join(str(row[field]) for field in FIELDS))
+    return parse_stat_csv('\n'.join(lines) + '\n')
+
+
+def tuner():
+    return WeightTuner(stats=None, apply=None, bounds={'app': (10, 256)})
+
+
+def test_saturated_server_is_cut_past_max_step():
+    weights = tuner()
+    for i in range(1, 6):
+        weights.observe(snapshot({f'node{n}': (20, 0, 1000 * i, 100) for n in range(1, 5)}))
+    stats = snapshot({'node1': (5000, 300, 6000, 100), 'node2': (20, 0, 6000, 100),
+                      'node3': (20, 0, 6000, 100), 'node4': (20, 0, 6000, 100)})
+    weights.observe(stats)
+
+    decisions = {d['server']: d for d in weights.plan(stats)['app']}
+
+    assert decisions['node1']['saturated']
+    assert decisions['node1']['weight'] == 50
+    assert not any(decisions[name]['saturated'] for name in ('node2', 'node3', 'node4'))
+
+
+def test_busy_server_moves_by_max_step():
+    weights = tuner()
+    for i in range(1, 6):
+        weights.observe(snapshot({f'node{n}': (20, 0, 1000 * i, 100) for n in range(1, 5)}))
+    stats = snapshot({'node1': (80, 4, 6000, 100), 'node2': (20, 0, 6000, 100),
+                      'node3': (20, 0, 6000, 100), 'node4': (20, 0, 6000, 100)})
+    weights.observe(stats)
+
+    decisions = {d['server']: d for d in weights.plan(stats)['app']}
+
+    assert not decisions['node1']['saturated']
+    assert decisions['node1']['weight'] >= 75